@@ -0,0 +1,278 @@
+"""
+answer_cache.py - Persistenter Antwort-Cache für häufig gestellte Fragen
+
+Viele Gemeinden stellen immer wieder dieselben Fragen. Statt für jede davon
+einen vollständigen Assistants-Run (10-30 Sekunden) zu bezahlen, werden
+Antworten in einer lokalen SQLite-Datenbank abgelegt.
+
+Der Schlüssel besteht aus der Assistant-ID und der normalisierten Frage
+(Groß-/Kleinschreibung, Leerzeichen, Umlaute). Einträge verfallen nach einer
+TTL, bei Überschreiten der Maximalgröße werden die am längsten nicht
+genutzten Einträge entfernt (LRU).
+
+Je Antwort werden die zitierten Dateien des Vector Stores gespeichert. Nach
+einem Abgleich (vector_store_sync.py) entfernt invalidate_files nur die
+Antworten, die sich auf ersetzte oder gelöschte Dateien stützen; alle anderen
+bleiben erhalten.
+
+Cache von Hand komplett invalidieren:
+    python answer_cache.py --invalidate [--assistant asst_...]
+
+Die Invalidierung betrifft auch den semantischen Cache (semantic_cache.py) in
+derselben Datenbank und erhöht dort einen Generationszähler; laufende Prozesse
+laden ihre Embedding-Matrizen daraufhin neu.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Standardpfad der Cache-Datenbank (über Umgebungsvariable anpassbar)
+DEFAULT_CACHE_PATH = os.getenv("KIRCHENRECHT_CACHE_DB", "answer_cache.sqlite3")
+
+# Standard-Lebensdauer eines Eintrags: 7 Tage
+DEFAULT_TTL_SECONDS = int(os.getenv("KIRCHENRECHT_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Maximale Anzahl Einträge, bevor LRU-Verdrängung greift
+DEFAULT_MAX_ENTRIES = int(os.getenv("KIRCHENRECHT_CACHE_MAX_ENTRIES", "1000"))
+
+UMLAUT_MAP = str.maketrans({
+    "ä": "ae",
+    "ö": "oe",
+    "ü": "ue",
+    "ß": "ss",
+})
+
+
+def normalize_question(question):
+    """
+    Normalisiert eine Frage für den Cache-Schlüssel.
+
+    Groß-/Kleinschreibung, Umlaute, Mehrfach-Leerzeichen und abschließende
+    Satzzeichen werden vereinheitlicht, damit "Was sind die Aufgaben des
+    Presbyteriums?" und "was sind die  aufgaben des presbyteriums" treffen.
+    """
+    text = question.casefold().translate(UMLAUT_MAP)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+def init_meta(conn):
+    """Legt die Tabelle mit dem Generationszähler der Invalidierungen an."""
+    conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+
+def add_file_ids_column(conn, table):
+    """Ergänzt die Spalte mit den zitierten Dateien (JSON-Liste) in älteren Datenbanken."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if "file_ids" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN file_ids TEXT NOT NULL DEFAULT '[]'")
+
+
+def bump_generation(conn):
+    """Erhöht den Generationszähler, damit alle Prozesse ihre semantischen Matrizen neu laden."""
+    conn.execute(
+        """
+        INSERT INTO cache_meta (name, value) VALUES ('generation', 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1
+        """
+    )
+
+
+def cache_generation(conn):
+    """Anzahl der bisherigen Invalidierungen (ändert sich bei jeder AnswerCache.invalidate)."""
+    row = conn.execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()
+    return row[0] if row else 0
+
+
+def cache_key(assistant_id, question):
+    """Bildet den Cache-Schlüssel aus Assistant-ID und normalisierter Frage."""
+    raw = f"{assistant_id}\x00{normalize_question(question)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """SQLite-basierter Antwort-Cache mit TTL und LRU-Verdrängung."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            init_meta(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    assistant_id TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    file_ids TEXT NOT NULL DEFAULT '[]'
+                )
+            """)
+            add_file_ids_column(conn, "answers")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_access ON answers(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_assistant ON answers(assistant_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, assistant_id, question):
+        """
+        Sucht eine gecachte Antwort.
+
+        Returns:
+            Dict mit "question", "answer", "created_at" und "hits" oder None
+        """
+        key = cache_key(assistant_id, question)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT question, answer, created_at, hits FROM answers WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.ttl_seconds:
+                conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                "UPDATE answers SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                (now, key)
+            )
+        return {"question": row[0], "answer": row[1], "created_at": row[2], "hits": row[3] + 1}
+
+    def age(self, assistant_id, question):
+        """Alter eines Eintrags in Sekunden (ohne ihn als Zugriff zu zählen) oder None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT created_at FROM answers WHERE key = ?", (cache_key(assistant_id, question),)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return None
+        return time.time() - row[0]
+
+    def put(self, assistant_id, question, answer, file_ids=()):
+        """
+        Speichert eine Antwort und verdrängt bei Bedarf alte Einträge.
+
+        Args:
+            file_ids: Dateien des Vector Stores, auf die sich die Antwort stützt (für invalidate_files)
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO answers
+                    (key, assistant_id, question, answer, created_at, last_access, hits, file_ids)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+                """,
+                (cache_key(assistant_id, question), assistant_id, question, answer, now, now,
+                 json.dumps(sorted(set(file_ids))))
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            """
+            DELETE FROM answers WHERE key IN (
+                SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        )
+
+    def invalidate(self, assistant_id=None):
+        """
+        Entfernt Einträge beider Caches, z.B. wenn sich der Inhalt des Vector Stores geändert hat.
+
+        Exakte und semantische Einträge werden in einer Transaktion gelöscht; der
+        Generationszähler sorgt dafür, dass alle Prozesse ihre Matrizen neu laden.
+
+        Args:
+            assistant_id: Nur Einträge dieses Assistants entfernen (None = alle)
+
+        Returns:
+            Anzahl entfernter Einträge
+        """
+        where, params = ("", ()) if assistant_id is None else (" WHERE assistant_id = ?", (assistant_id,))
+        with self._lock, self._connect() as conn:
+            removed = conn.execute("DELETE FROM answers" + where, params).rowcount
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'semantic_entries'").fetchone():
+                removed += conn.execute("DELETE FROM semantic_entries" + where, params).rowcount
+            bump_generation(conn)
+        return removed
+
+    def invalidate_files(self, file_ids):
+        """
+        Entfernt die Einträge beider Caches, die sich auf eine der Dateien stützen.
+
+        Aufruf nach einem Abgleich des Vector Stores mit den ersetzten und gelöschten
+        Dateien; Antworten ohne diese Quellen bleiben erhalten.
+
+        Returns:
+            Anzahl entfernter Einträge
+        """
+        file_ids = sorted(set(file_ids))
+        if not file_ids:
+            return 0
+        placeholders = ", ".join("?" * len(file_ids))
+        removed = 0
+        with self._lock, self._connect() as conn:
+            tables = ["answers"]
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'semantic_entries'").fetchone():
+                tables.append("semantic_entries")
+            for table in tables:
+                removed += conn.execute(
+                    f"""
+                    DELETE FROM {table} WHERE EXISTS (
+                        SELECT 1 FROM json_each({table}.file_ids) WHERE json_each.value IN ({placeholders})
+                    )
+                    """,
+                    file_ids
+                ).rowcount
+            if removed:
+                bump_generation(conn)
+        return removed
+
+    def stats(self):
+        """Liefert Anzahl Einträge und Summe der Treffer."""
+        with self._connect() as conn:
+            entries, hits = conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM answers").fetchone()
+        return {"entries": entries, "hits": hits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verwaltung des Antwort-Caches")
+    parser.add_argument("--db", default=DEFAULT_CACHE_PATH, help="Pfad der Cache-Datenbank")
+    parser.add_argument("--invalidate", action="store_true", help="Cache-Einträge entfernen")
+    parser.add_argument("--assistant", help="Nur Einträge dieses Assistants entfernen")
+    args = parser.parse_args()
+
+    cache = AnswerCache(args.db)
+    if args.invalidate:
+        removed = cache.invalidate(args.assistant)
+        print(f"🗑️  {removed} Cache-Einträge entfernt.")
+    stats = cache.stats()
+    print(f"📦 Einträge: {stats['entries']} | Treffer gesamt: {stats['hits']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+api_client.py - Client für die HTTP-API der Kirchenrechts-App (api_server.py)
+
+Bietet dieselbe Schnittstelle wie qa_service.QuestionService (answer mit
+emit-Callback), sodass die Streamlit-Oberfläche mit KIRCHENRECHT_API_URL als
+dünner Client gegen einen separat skalierten API-Dienst laufen kann. Die
+Antwort wird per Server-Sent Events tokenweise empfangen.
+
+Beispiel:
+    client = ApiClient("http://localhost:8000")
+    conversation = Conversation()
+    result = client.answer(conversation, "Wie lange dauert die Amtszeit des Kirchenvorstandes?")
+"""
+
+import json
+import os
+import threading
+
+import httpx
+
+from qa_service import Conversation, ConversationBusy
+
+# API-Schlüssel, falls der Server einen verlangt (KIRCHENRECHT_API_KEY wie beim Server)
+API_KEY = os.getenv("KIRCHENRECHT_API_KEY")
+
+# Zeitlimits in Sekunden: Verbindungsaufbau und Pause zwischen zwei Ereignissen
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 300.0
+
+
+class ApiError(RuntimeError):
+    """Die HTTP-API hat die Anfrage abgelehnt."""
+
+
+def iter_sse(lines):
+    """
+    Zerlegt einen Server-Sent-Events-Stream in (Ereignis, Daten)-Tupel.
+
+    Args:
+        lines: Iterator über die Zeilen der Antwort (ohne Zeilenende)
+    """
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].lstrip())
+    if data:
+        yield event, "\n".join(data)
+
+
+class ApiClient:
+    """Stellt Fragen über die HTTP-API (thread-sicher, ein Objekt pro Prozess genügt)."""
+
+    def __init__(self, base_url, api_key=API_KEY):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+        )
+
+    def _raise_for_status(self, response):
+        if response.status_code < 400:
+            return
+        response.read()
+        try:
+            message = response.json().get("error", response.text)
+        except ValueError:
+            message = response.text
+        if response.status_code == 409:
+            raise ConversationBusy(message)
+        raise ApiError(f"HTTP {response.status_code}: {message}")
+
+    def assistants(self):
+        """Verfügbare Assistants (Name -> Modell und Beschreibung)."""
+        response = self._client.get("/v1/assistants")
+        self._raise_for_status(response)
+        return response.json()["assistants"]
+
+    def open_conversation(self, conversation_id=None):
+        """Setzt eine Unterhaltung des Servers fort (Verlauf lokal gespiegelt) oder beginnt eine neue."""
+        if conversation_id:
+            response = self._client.get(f"/v1/conversations/{conversation_id}")
+            if response.status_code != 404:
+                self._raise_for_status(response)
+                return Conversation(conversation_id, response.json()["messages"])
+        return Conversation()
+
+    def answer(self, conversation, question, assistant_name=None, emit=None, standalone=False):
+        """
+        Beantwortet eine Frage über die API (blockierend, Ereignisse per emit).
+
+        Die Historie wird nur mitgeschickt, wenn der Server die Unterhaltung nicht
+        kennt (z.B. anderer Worker oder Neustart).
+
+        Returns:
+            Ergebnis-Dict wie qa_service.QuestionService.answer
+        """
+        emit = emit or (lambda kind, value=None: None)
+        body = {"question": question, "assistant": assistant_name, "conversation_id": conversation.id}
+        if standalone:
+            body["standalone"] = True
+        if not conversation.messages:
+            # Neue Unterhaltung: der Server legt sie unter derselben ID an
+            body["history"] = []
+        result = self._stream(body, emit)
+        if result is None:
+            # Anderer Worker oder Neustart: Verlauf mitschicken
+            body["history"] = [{"role": m["role"], "content": m["content"]} for m in conversation.messages]
+            result = self._stream(body, emit)
+
+        conversation.append("user", question)
+        if result["status"] == "completed" and result["answer"]:
+            conversation.append("assistant", result["answer"])
+        return result
+
+    def _stream(self, body, emit):
+        """Eine Anfrage mit SSE; None, wenn der Server die Unterhaltung nicht kennt."""
+        with self._client.stream(
+            "POST", "/v1/questions", json=dict(body, stream=True), headers={"Accept": "text/event-stream"}
+        ) as response:
+            if response.status_code == 404 and "history" not in body:
+                return None
+            self._raise_for_status(response)
+            for event, data in iter_sse(response.iter_lines()):
+                value = json.loads(data)
+                if event == "done":
+                    return value
+                if event == "error":
+                    raise ApiError(value.get("error", "Unbekannter Fehler"))
+                emit(event, value)
+        raise ApiError("Der Ereignisstrom endete ohne Ergebnis")
+
+    def close(self):
+        self._client.close()
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_api_client(base_url):
+    """Liefert den prozessweit geteilten Client für base_url (Connection-Pool über alle Sitzungen)."""
+    with _lock:
+        if base_url not in _clients:
+            _clients[base_url] = ApiClient(base_url)
+        return _clients[base_url]
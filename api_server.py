@@ -0,0 +1,290 @@
+"""
+api_server.py - HTTP-API der Kirchenrechts-App (JSON und Server-Sent Events)
+
+Stellt den Frage-Antwort-Dienst (qa_service.py) ohne Browser-Sitzung bereit,
+z.B. für das Intranet oder die Anbindung an die Software eines Gemeindebüros.
+Läuft als ASGI-Anwendung (Starlette) unter uvicorn mit mehreren Workern.
+
+Endpunkte:
+    GET    /v1/health                        Lebenszeichen
+    GET    /v1/assistants                    Verfügbare Assistants
+    POST   /v1/questions                     Frage stellen (JSON oder SSE, siehe unten)
+    GET    /v1/questions/{id}                Ergebnis einer beantworteten Frage
+    GET    /v1/questions/{id}/sources        Aufgelöste Quellenangaben der Antwort (citations.py)
+    GET    /v1/conversations/{id}            Verlauf einer Unterhaltung (?before=&limit= seitenweise)
+    DELETE /v1/conversations/{id}            Unterhaltung verwerfen
+    GET    /metrics                          Telemetrie im Prometheus-Format
+
+POST /v1/questions erwartet {"question": ..., "assistant": ..., "conversation_id": ...}
+und optional "standalone": true für Fragen, die nicht vom Verlauf abhängen (Antwort-Cache
+auch in einer laufenden Unterhaltung).
+Mit "stream": true oder "Accept: text/event-stream" kommen Statusmeldungen und
+Tokens als Server-Sent Events (event: delta, tool, queued, ...), das Ergebnis als
+event: done. Ohne conversation_id wird eine neue Unterhaltung angelegt.
+Unterhaltungen und Ergebnisse liegen im Unterhaltungsspeicher
+(conversation_store.py), den sich alle Worker teilen. Ist eine Unterhaltung dort
+unbekannt, antwortet die API mit 404, sofern der Client nicht den bisherigen
+Verlauf als "history" mitschickt.
+
+Starten:
+    python api_server.py --port 8000 --workers 4
+
+Mit KIRCHENRECHT_API_KEY verlangt die API "Authorization: Bearer <Schlüssel>".
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import hmac
+import json
+import logging
+import os
+import threading
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from qa_service import ConversationBusy
+from resources import get_question_service
+from routing import AUTO_ROUTING
+
+# Adresse und Anzahl der Worker-Prozesse für uvicorn
+API_HOST = os.getenv("KIRCHENRECHT_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("KIRCHENRECHT_API_PORT", "8000"))
+API_WORKERS = int(os.getenv("KIRCHENRECHT_API_WORKERS", "2"))
+
+# Optionaler API-Schlüssel (Bearer-Token); nicht gesetzt = ohne Anmeldung (nur im internen Netz!)
+API_KEY = os.getenv("KIRCHENRECHT_API_KEY")
+
+# Maximale Länge einer Frage in Zeichen
+MAX_QUESTION_CHARS = 4_000
+
+# Threads je Worker, in denen Fragen gleichzeitig beantwortet werden
+ANSWER_THREADS = int(os.getenv("KIRCHENRECHT_API_THREADS", "64"))
+
+# HTTP-Status je Ergebnis (alles andere: 200)
+STATUS_CODES = {"rejected": 429, "error": 502, "failed": 502, "cancelled": 504, "expired": 504}
+
+_executor = None
+_executor_lock = threading.Lock()
+_DONE = object()
+
+
+def get_executor():
+    """Thread-Pool des Workers für die blockierende Pipeline (einmal pro Prozess)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=ANSWER_THREADS, thread_name_prefix="kirchenrecht-api"
+            )
+        return _executor
+
+
+def error_response(status_code, message):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def sse(event, value):
+    """Formatiert ein Server-Sent Event mit JSON-Daten."""
+    return f"event: {event}\ndata: {json.dumps(value, ensure_ascii=False)}\n\n"
+
+
+class ApiKeyMiddleware(BaseHTTPMiddleware):
+    """Prüft den Bearer-Token, falls KIRCHENRECHT_API_KEY gesetzt ist."""
+
+    async def dispatch(self, request, call_next):
+        if API_KEY and request.url.path != "/v1/health":
+            supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+            if not hmac.compare_digest(supplied.encode("utf-8"), API_KEY.encode("utf-8")):
+                return error_response(401, "Ungültiger oder fehlender API-Schlüssel")
+        return await call_next(request)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def list_assistants(request):
+    assistants = get_question_service().assistants()
+    return JSONResponse({"assistants": {
+        name: {"model": config.get("model"), "description": config.get("description")}
+        for name, config in assistants.items()
+    }})
+
+
+def parse_question(body, service):
+    """
+    Prüft den Rumpf von POST /v1/questions.
+
+    Returns:
+        Tuple aus Frage, Assistant-Name und Unterhaltung
+
+    Raises:
+        ValueError: Ungültige Angaben (400)
+        LookupError: Unbekannte Unterhaltung ohne mitgeschickten Verlauf (404)
+    """
+    question = body.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("'question' fehlt oder ist leer")
+    if len(question) > MAX_QUESTION_CHARS:
+        raise ValueError(f"'question' ist länger als {MAX_QUESTION_CHARS} Zeichen")
+    assistant_name = body.get("assistant")
+    if assistant_name is not None and assistant_name not in service.assistants():
+        if assistant_name not in ("auto", AUTO_ROUTING):
+            raise ValueError(f"Unbekannter Assistant: {assistant_name}")
+        assistant_name = AUTO_ROUTING
+
+    conversation_id = body.get("conversation_id")
+    history = body.get("history")
+    conversation = service.conversations.get(conversation_id) if conversation_id else None
+    if conversation is None:
+        if conversation_id and history is None:
+            raise LookupError(f"Unbekannte Unterhaltung: {conversation_id}")
+        if history is not None and not (
+            isinstance(history, list)
+            and all(isinstance(m, dict) and m.get("role") in ("user", "assistant")
+                    and isinstance(m.get("content"), str) for m in history)
+        ):
+            raise ValueError("'history' muss eine Liste von {role, content} sein")
+        conversation = service.conversations.create(conversation_id, history)
+    return question.strip(), assistant_name, conversation
+
+
+async def ask_question(request):
+    service = get_question_service()
+    try:
+        body = await request.json()
+    except ValueError:
+        return error_response(400, "Rumpf ist kein gültiges JSON")
+    if not isinstance(body, dict):
+        return error_response(400, "Rumpf muss ein JSON-Objekt sein")
+    try:
+        question, assistant_name, conversation = parse_question(body, service)
+    except ValueError as e:
+        return error_response(400, str(e))
+    except LookupError as e:
+        return error_response(404, str(e))
+    if conversation.lock.locked():
+        return error_response(409, "In dieser Unterhaltung wird gerade eine Frage beantwortet")
+
+    loop = asyncio.get_running_loop()
+    answer = functools.partial(service.answer, standalone=bool(body.get("standalone")))
+    wants_stream = body.get("stream") or "text/event-stream" in request.headers.get("accept", "")
+    if not wants_stream:
+        try:
+            result = await loop.run_in_executor(
+                get_executor(), answer, conversation, question, assistant_name
+            )
+        except ConversationBusy as e:
+            return error_response(409, str(e))
+        return JSONResponse(result, status_code=STATUS_CODES.get(result["status"], 200))
+
+    events = asyncio.Queue()
+
+    def emit(kind, value=None):
+        loop.call_soon_threadsafe(events.put_nowait, (kind, value))
+
+    future = loop.run_in_executor(get_executor(), answer, conversation, question, assistant_name, emit)
+    future.add_done_callback(lambda _: events.put_nowait(_DONE))
+
+    async def stream():
+        # Die Frage läuft auch bei Verbindungsabbruch zu Ende und landet im Verlauf
+        yield sse("conversation", {"conversation_id": conversation.id})
+        while True:
+            item = await events.get()
+            if item is _DONE:
+                break
+            yield sse(*item)
+        try:
+            yield sse("done", future.result())
+        except Exception as e:
+            logging.error(f"Frage über die API fehlgeschlagen: {e}")
+            yield sse("error", {"error": str(e)})
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def get_question(request):
+    result = get_question_service().result(request.path_params["question_id"])
+    if result is None:
+        return error_response(404, "Unbekannte Frage")
+    return JSONResponse(result)
+
+
+async def get_sources(request):
+    result = get_question_service().result(request.path_params["question_id"])
+    if result is None:
+        return error_response(404, "Unbekannte Frage")
+    return JSONResponse({"question_id": result["question_id"], "sources": result["sources"],
+                         "annotations": result.get("annotations", [])})
+
+
+async def get_conversation(request):
+    conversation = get_question_service().conversations.get(request.path_params["conversation_id"])
+    if conversation is None:
+        return error_response(404, "Unbekannte Unterhaltung")
+    try:
+        before, limit = (
+            int(request.query_params[name]) if name in request.query_params else None
+            for name in ("before", "limit")
+        )
+    except ValueError:
+        return error_response(400, "'before' und 'limit' müssen ganze Zahlen sein")
+    if limit is not None and limit < 1:
+        return error_response(400, "'limit' muss mindestens 1 sein")
+    return JSONResponse(conversation.to_dict(before, limit))
+
+
+async def delete_conversation(request):
+    if not get_question_service().conversations.drop(request.path_params["conversation_id"]):
+        return error_response(404, "Unbekannte Unterhaltung")
+    return JSONResponse({"deleted": True})
+
+
+async def metrics(request):
+    return PlainTextResponse(
+        get_question_service().telemetry.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+
+def create_app():
+    return Starlette(
+        routes=[
+            Route("/v1/health", health),
+            Route("/v1/assistants", list_assistants),
+            Route("/v1/questions", ask_question, methods=["POST"]),
+            Route("/v1/questions/{question_id}", get_question),
+            Route("/v1/questions/{question_id}/sources", get_sources),
+            Route("/v1/conversations/{conversation_id}", get_conversation),
+            Route("/v1/conversations/{conversation_id}", delete_conversation, methods=["DELETE"]),
+            Route("/metrics", metrics),
+        ],
+        middleware=[Middleware(ApiKeyMiddleware)]
+    )
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="HTTP-API der Kirchenrechts-App")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Anzahl der Worker-Prozesse")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not API_KEY and args.host not in ("127.0.0.1", "localhost"):
+        logging.warning("KIRCHENRECHT_API_KEY ist nicht gesetzt - die API ist ohne Anmeldung erreichbar.")
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,28 +11,26 @@ Starten mit: streamlit run app.py
 import streamlit as st
 import time
 import logging # Füge logging hinzu
-from openai import OpenAI
-from dotenv import load_dotenv
 import os
-import json
 from typing import Optional
 
-# Lade Umgebungsvariablen aus .env-Datei
-load_dotenv()
+import chat_ui
+from faq_warmup import SIDEBAR_EXAMPLES, load_faq
+from qa_service import FALLBACK_ASSISTANTS, should_use_live_data
+from resources import CONFIG_FILE, ensure_env, get_admission_queue, get_caches, get_site_mirror, load_assistants
+from routing import AUTO_ROUTING
+from telemetry import get_registry, start_metrics_server
 
-# Live-Datenabruf-Logik wurde in den Hauptverarbeitungsblock integriert
-# Der redundante Block wurde entfernt, um doppelte Ausführungen zu verhindern
+# Zeitpunkt des Rerun-Starts (für die Messung der Rerun-Kosten)
+RERUN_STARTED = time.perf_counter()
 
-# Schlüsselwörter für Live-Datenabruf
-LIVE_DATA_KEYWORDS = ["KDO", "KGO", "Besoldung", "Entgelt", "Amtsblätter"]
+# Lade Umgebungsvariablen aus .env-Datei (einmal pro Prozess)
+ensure_env()
 
-def should_use_live_data(query):
-    """Prüft, ob die Anfrage Live-Daten erfordert."""
-    return any(keyword.lower() in query.lower() for keyword in LIVE_DATA_KEYWORDS)
-
-# Initialisiere den OpenAI-Client
-# Der API-Key wird automatisch aus der Umgebungsvariable OPENAI_API_KEY geladen
-client = OpenAI()
+# Live-Datenabruf-Logik wurde in den Hauptverarbeitungsblock integriert
+# Der redundante Block wurde entfernt, um doppelte Ausführungen zu verhindern
+# Die Verarbeitung einer Frage liegt in qa_service.py (auch für die HTTP-API, api_server.py);
+# diese Oberfläche rendert nur deren Ereignisse (chat_ui.py)
 
 # Konfiguriere das Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -40,28 +38,31 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Define Assistant ID globally
 ASSISTANT_ID = "asst_er72T8D7D8xth2HaM0mjxi5m"  # Hier deine Assistant-ID einfügen
 
+# Semantischer Cache (einmal pro Prozess aufgebaut) für die Cache-Statistik
+semantic_cache = get_caches()[1]
+
+# Messwerte je Phase und Assistant; Prometheus-Endpunkt, falls KIRCHENRECHT_METRICS_PORT gesetzt ist
+telemetry = get_registry()
+start_metrics_server()
+ADMIN_MODE = os.getenv("KIRCHENRECHT_ADMIN") == "1"
+
+# Bezeichnungen der Einträge im Änderungs-Feed des Spiegels
+CHANGE_LABELS = {"added": "neu", "changed": "geändert", "removed": "entfernt"}
+
 # Konfiguration
 # Lade Assistant-Konfigurationen aus JSON-Datei
 def load_assistant_config():
-    """Lädt die Assistant-Konfiguration aus der JSON-Datei"""
-    config_file = "assistant_config.json"
+    """Lädt die Assistant-Konfiguration (prozessweit gecacht, Neuladen bei Dateiänderung)"""
+    config_file = CONFIG_FILE
     
     # Fallback-Konfiguration, falls keine JSON-Datei existiert
-    fallback_config = {
-        "GPT-4o (Standard - Beste Qualität)": {
-            "id": "asst_er72T8D7D8xth2HaM0mjxi5m",
-            "description": "Höchste Qualität, aber längere Antwortzeiten (10-30 Sekunden)",
-            "model": "gpt-4o"
-        }
-    }
-    
+    fallback_config = FALLBACK_ASSISTANTS
+
     try:
-        if os.path.exists(config_file):
-            with open(config_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        else:
-            st.warning(f"⚠️ Keine {config_file} gefunden. Verwende Standard-Konfiguration.")
-            return fallback_config
+        return load_assistants(config_file)
+    except FileNotFoundError:
+        st.warning(f"⚠️ Keine {config_file} gefunden. Verwende Standard-Konfiguration.")
+        return fallback_config
     except Exception as e:
         st.error(f"❌ Fehler beim Laden der Assistant-Konfiguration: {e}")
         return fallback_config
@@ -136,32 +137,37 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Session State initialisieren
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "conversation" not in st.session_state:
+    st.session_state.conversation = chat_ui.open_conversation()
+conversation = st.session_state.conversation
 if "selected_assistant" not in st.session_state:
     st.session_state.selected_assistant = DEFAULT_ASSISTANT
 
-# Chat-Historie anzeigen
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Chat-Historie anzeigen (ältere Nachrichten seitenweise)
+chat_ui.show_history(conversation)
 
 # Modellauswahl
 if len(ASSISTANTS) > 1:
     st.selectbox(
         "🤖 Wählen Sie ein AI-Modell:",
-        options=list(ASSISTANTS.keys()),
+        options=[AUTO_ROUTING] + list(ASSISTANTS.keys()),
         key="selected_assistant",
         help="Verschiedene Modelle bieten unterschiedliche Geschwindigkeiten und Qualitäten"
     )
-    st.caption(ASSISTANTS[st.session_state.selected_assistant]["description"])
-    
-    # Zeige Modell-Details in einem Expander
-    with st.expander("📊 Modell-Details"):
-        selected = ASSISTANTS[st.session_state.selected_assistant]
-        st.write(f"**Modell:** {selected['model']}")
-        st.write(f"**Assistant ID:** `{selected['id']}`")
-        st.write(f"**Beschreibung:** {selected['description']}")
+    if st.session_state.selected_assistant == AUTO_ROUTING:
+        st.caption(
+            "Wählt pro Frage ein Modell: einfache Fragen an das schnellste, "
+            "komplexe an das gründlichste - anhand gemessener Antwortzeiten und Fehlerquoten"
+        )
+    else:
+        st.caption(ASSISTANTS[st.session_state.selected_assistant]["description"])
+
+        # Zeige Modell-Details in einem Expander
+        with st.expander("📊 Modell-Details"):
+            selected = ASSISTANTS[st.session_state.selected_assistant]
+            st.write(f"**Modell:** {selected['model']}")
+            st.write(f"**Assistant ID:** `{selected['id']}`")
+            st.write(f"**Beschreibung:** {selected['description']}")
 else:
     st.info("ℹ️ Aktuell ist nur ein Modell verfügbar. Weitere Modelle können über `create_multi_model_assistants.py` hinzugefügt werden.")
 
@@ -183,152 +189,17 @@ with st.form(key="question_form", clear_on_submit=True):
             help="Klicken Sie hier oder drücken Sie Ctrl+Enter zum Senden"
         )
 
-# Verarbeitung der Frage
+# Verarbeitung der Frage als Job im Hintergrund (Streaming, Cache, Ratenbegrenzung usw. im Frage-Antwort-Dienst)
 if submit_button and question:
-    # Füge die Benutzerfrage zur Historie hinzu
-    st.session_state.messages.append({"role": "user", "content": question})
-    with st.chat_message("user"):
-        st.markdown(question)
-
-    # Zeige den Assistant-Response Container
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        status_container = st.container()
-
-        try:
-            # Hole die Assistant-Konfiguration
-            assistant_config = ASSISTANTS[st.session_state.selected_assistant]
-            assistant_id = assistant_config["id"]
-
-            # Erstelle die vollständige Chat-Historie für den Assistant
-            full_history = [
-                {"role": message["role"], "content": message["content"]}
-                for message in st.session_state.messages
-            ]
-
-            # Phase 1: Thread erstellen
-            logging.info("Starte neue Konversation...")
-            with st.spinner("🚀 Neue Konversation wird gestartet..."):
-                thread = client.beta.threads.create()
-                logging.info(f"✅ Konversation erfolgreich gestartet: Thread ID {thread.id}")
-
-            # Phase 2: Nachricht senden
-            logging.info("Übermittle Frage an Assistenten...")
-            with st.spinner("📝 Ihre Frage wird an den Assistenten übermittelt..."):
-                client.beta.threads.messages.create(
-                    thread_id=thread.id,
-                    role="user",
-                    content=json.dumps(full_history)  # Sende die gesamte Historie als JSON
-                )
-                logging.info("✅ Frage erfolgreich übermittelt.")
-
-            # Phase 3: Assistant-Verarbeitung starten
-            logging.info(f"Aktiviere {st.session_state.selected_assistant} Assistenten...")
-            with st.spinner(f"🤖 {st.session_state.selected_assistant} wird aktiviert..."):
-                run = client.beta.threads.runs.create(
-                    thread_id=thread.id,
-                    assistant_id=assistant_id
-                )
-                logging.info(f"✅ Assistent wurde aktiviert: Run ID {run.id}")
-
-            # Phase 4: Antwort-Generierung
-            status_placeholder = st.empty()
-            elapsed_time = 0
-
-            while run.status not in ["completed", "failed", "cancelled", "expired"]:
-                elapsed_time += 0.5
-
-                # Dynamische Status-Updates basierend auf der verstrichenen Zeit
-                if should_use_live_data(question):
-                    if elapsed_time < 3:
-                        status_text = "🔍 Durchsuche kirchenrecht-ekhn.de..."
-                    elif elapsed_time < 8:
-                        status_text = "📚 Analysiere Live-Daten..."
-                    else:
-                        status_text = f"⏳ Live-Datenabruf läuft... ({int(elapsed_time)}s)"
-                else:
-                    if elapsed_time < 3:
-                        status_text = "🔍 Assistent analysiert Ihre Frage..."
-                    elif elapsed_time < 8:
-                        status_text = "📚 Relevante Kirchenrechts-Dokumente werden durchsucht..."
-                    elif elapsed_time < 15:
-                        status_text = "✍️ Assistent formuliert eine präzise Antwort..."
-                    else:
-                        status_text = f"⏳ Verarbeitung läuft... ({int(elapsed_time)}s) - Komplexe Anfragen können bis zu 30s dauern"
-
-                status_placeholder.info(status_text)
-                logging.debug(f"Run-Status-Update: {status_text} | Current Run ID: {run.id}, Status: {run.status}")
-                time.sleep(0.5)
-                run = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-            
-            logging.info(f"Run beendet mit Status: {run.status}")
-
-            # Status-Container leeren
-            status_placeholder.empty()
-
-            # Prüfe ob der Run erfolgreich war
-            if run.status == "completed":
-                # Phase 5: Antwort abrufen
-                with st.spinner("💬 Antwort wird abgerufen..."):
-                    messages = client.beta.threads.messages.list(thread_id=thread.id)
-                    assistant_message = messages.data[0].content[0].text.value
-                    logging.info("Antwort erfolgreich abgerufen.")
-
-                # Antwort anzeigen
-                message_placeholder.markdown(assistant_message)
-                logging.debug(f"Angezeigte Assistenten-Nachricht: {assistant_message[:50]}...")
-
-                # Füge die Antwort zur Historie hinzu, falls nicht bereits vorhanden
-                if not any(msg['content'] == assistant_message for msg in st.session_state.messages):
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": assistant_message
-                    })
-                    logging.info("Assistenten-Nachricht zur Session State Historie hinzugefügt.")
-                else:
-                    logging.info("Assistenten-Nachricht ist bereits in der Historie, füge sie nicht erneut hinzu.")
-
-                # Quellen anzeigen
-                if "sources" in messages.data[0].content[0]:
-                    sources = messages.data[0].content[0].sources
-                    st.markdown("### Quellen")
-                    for source in sources:
-                        st.markdown(f"- [{source['title']}]({source['url']})")
-                    logging.info("Quellen angezeigt.")
-
-                # Live-Data Status aktualisieren
-                if should_use_live_data(question):
-                    st.session_state.live_data_fetched = True
-                    logging.info("Live-Datenabruf Status aktualisiert.")
-            else:
-                # Fehlerbehandlung für fehlgeschlagene Runs
-                logging.error(f"Assistent konnte Anfrage nicht verarbeiten. Status: {run.status}")
-                status_container.empty()
-                error_msg = f"❌ Der Assistent konnte die Anfrage nicht verarbeiten. Status: {run.status}"
-                message_placeholder.error(error_msg)
-
-                if run.status == "failed" and run.last_error:
-                    logging.error(f"Fehlerdetails des Runs: {run.last_error.message}")
-                    st.error(f"Fehlerdetails: {run.last_error.message}")
-
-        except Exception as e:
-            # Allgemeine Fehlerbehandlung
-            logging.critical(f"Kritischer Fehler aufgetreten: {str(e)}", exc_info=True)
-            error_message = f"❌ Ein Fehler ist aufgetreten: {str(e)}"
-            message_placeholder.error(error_message)
-
-            # Detaillierte Fehlerhinweise
-            with st.expander("🔧 Fehlerdiagnose"):
-                st.write("**Mögliche Ursachen:**")
-                st.write("1. **API-Key fehlt oder ist ungültig**: Überprüfen Sie die `.env`-Datei")
-                st.write("2. **Assistant ID ist falsch**: Vergewissern Sie sich, dass die Assistant ID korrekt ist")
-                st.write("3. **Keine Internetverbindung**: Prüfen Sie Ihre Netzwerkverbindung")
-                st.write("4. **API-Limits erreicht**: Überprüfen Sie Ihr OpenAI-Dashboard")
-                st.write("\n**Fehlermeldung:**")
-                st.code(str(e))
+    chat_ui.submit(conversation, question, st.session_state.selected_assistant)
+
+# Beispielfrage aus der Sidebar: sofort aus dem vorab befüllten Cache, auch mitten in einer Unterhaltung
+example_question = chat_ui.pop_example()
+if example_question:
+    chat_ui.submit(conversation, example_question, st.session_state.selected_assistant, standalone=True)
+
+# Platz für laufende Fragen; gefüllt wird er erst am Ende des Skripts
+jobs_area = st.container()
 
 # Sidebar mit zusätzlichen Informationen
 with st.sidebar:
@@ -336,18 +207,11 @@ with st.sidebar:
     
     # Beispielfragen
     st.subheader("📝 Beispielfragen")
-    example_questions = [
-        "Darf eine Pfarrerin das Abendmahl ohne Ordination spenden?",
-        "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?",
-        "Wie ist das Verfahren bei Amtspflichtverletzungen geregelt?",
-        "Was sind die Aufgaben des Presbyteriums?",
-        "Welche Rechte hat die Gemeindeversammlung?"
-    ]
+    # Die ersten Einträge der FAQ-Liste; ihre Antworten liegen vorab im Cache (faq_warmup.py)
+    example_questions = load_faq()[:SIDEBAR_EXAMPLES]
     
     for eq in example_questions:
-        if st.button(eq, key=eq):
-            st.session_state.messages.append({"role": "user", "content": eq})
-            st.rerun()
+        st.button(eq, key=eq, on_click=chat_ui.choose_example, args=(eq,))
     
     # Hinweise
     st.subheader("💡 Hinweise")
@@ -363,11 +227,82 @@ with st.sidebar:
     
     # Kosten-Tracker (optional)
     st.subheader("💰 Nutzung")
-    st.write(f"Anzahl Fragen in dieser Sitzung: {len([m for m in st.session_state.messages if m['role'] == 'user'])}")
+    st.write(f"Anzahl Fragen in dieser Sitzung: {conversation.question_count()}")
+
+    # Kennzahlen des semantischen Caches
+    with st.expander("⚡ Cache-Statistik"):
+        cache_metrics = semantic_cache.metrics()
+        st.write(f"Semantische Trefferquote: {cache_metrics['hit_rate']:.0%} "
+                 f"({cache_metrics['hits']} von {cache_metrics['lookups']} Anfragen)")
+        st.write(f"Gespeicherte Fragen: {cache_metrics['entries']} | Schwellwert: {cache_metrics['threshold']}")
+        if cache_metrics["similarity_histogram"]:
+            st.bar_chart({
+                f"{bin_start:.2f}": count
+                for bin_start, count in cache_metrics["similarity_histogram"].items()
+            })
+
+    # Stand des lokalen Spiegels von kirchenrecht-ekhn.de (site_mirror.py)
+    site_mirror = get_site_mirror()
+    if site_mirror is not None:
+        with st.expander("📡 Live-Daten (kirchenrecht-ekhn.de)"):
+            last_crawl = site_mirror.last_crawl()
+            mirror_stats = site_mirror.stats()
+            if last_crawl:
+                st.write(
+                    f"Stand: {time.strftime('%d.%m.%Y %H:%M', time.localtime(last_crawl['finished_at']))} "
+                    f"({mirror_stats['pages']} Seiten gespiegelt)"
+                )
+            for change in reversed(site_mirror.changes(max(0, mirror_stats["last_change_id"] - 5))):
+                st.caption(
+                    f"{time.strftime('%d.%m. %H:%M', time.localtime(change['detected_at']))} "
+                    f"{CHANGE_LABELS.get(change['kind'], change['kind'])}: {change['url']}"
+                )
+
+    # Admin-Panel mit Antwortzeiten je Phase und Token-Verbrauch (nur mit ?admin=1 oder KIRCHENRECHT_ADMIN=1)
+    if ADMIN_MODE or st.query_params.get("admin") == "1":
+        with st.expander("📈 Telemetrie (Admin)"):
+            summary = telemetry.summary()
+            if summary:
+                st.dataframe(summary, hide_index=True)
+            else:
+                st.write("Noch keine Messwerte in diesem Prozess.")
+            cache_hits = telemetry.cache_hits()
+            st.write(
+                f"Cache-Treffer: {cache_hits.get('exact', 0)} exakt, {cache_hits.get('semantic', 0)} semantisch, "
+                f"{cache_hits.get('legal_index', 0)} aus dem Rechtsindex, "
+                f"{cache_hits.get('coalesced', 0)} an laufende Runs angehängt"
+            )
+            hedge_stats = telemetry.hedge_stats()
+            if hedge_stats["outcomes"]:
+                st.write(
+                    f"Hedging: {hedge_stats['outcomes'].get('hedge_won', 0)}× zweiter Assistant schneller, "
+                    f"{hedge_stats['outcomes'].get('primary_won', 0)}× primärer - "
+                    f"Zusatzkosten {hedge_stats['extra_cost']:.4f} USD"
+                )
+            job_stats = chat_ui.get_job_queue().stats()
+            st.write(
+                f"Hintergrund-Jobs: {job_stats['running']} laufend, {job_stats['waiting']} wartend, "
+                f"{job_stats['completed']} von {job_stats['submitted']} beantwortet, "
+                f"{job_stats['orphaned']} verwaist abgebrochen"
+            )
+            admission = get_admission_queue()
+            if admission is not None:
+                for model, stats in admission.stats().items():
+                    st.write(
+                        f"Ratenbegrenzung {model}: {stats['admitted']} zugelassen, {stats['waiting']} wartend, "
+                        f"{stats['rejected']} abgewiesen - Wartezeit Ø {stats['mean_wait']:.1f} s, "
+                        f"max. {stats['max_wait']:.1f} s"
+                    )
+            st.download_button(
+                "Prometheus-Export",
+                data=telemetry.render_prometheus(),
+                file_name="kirchenrecht_metrics.txt",
+                mime="text/plain"
+            )
     
     # Reset-Button
     if st.button("🔄 Neue Unterhaltung"):
-        st.session_state.messages = []
+        st.session_state.conversation = chat_ui.open_conversation(resume=False)
         st.rerun()
 
 # Footer
@@ -385,22 +320,15 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Initialisiere den OpenAI-Client
-# Der API-Key wird automatisch aus der Umgebungsvariable OPENAI_API_KEY geladen
-client = OpenAI()
-
-# Konfiguriere das Logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
 # Live-Datenabruf von kirchenrecht-ekhn.de
 if "live_data_fetched" not in st.session_state:
     st.session_state.live_data_fetched = False
 
-# Schlüsselwörter für Live-Datenabruf
-LIVE_DATA_KEYWORDS = ["KDO", "KGO", "Besoldung", "Entgelt", "Amtsblätter"]
-
-def should_use_live_data(query):
-    """Prüft, ob die Anfrage Live-Daten erfordert."""
-    return any(keyword.lower() in query.lower() for keyword in LIVE_DATA_KEYWORDS)
+logging.debug(f"Rerun abgeschlossen in {(time.perf_counter() - RERUN_STARTED) * 1000:.1f} ms")
 
-# Define Assistant ID globally
\ No newline at end of file
+# Laufende Fragen anzeigen, bis sie beantwortet sind (ein Rerun unterbricht nur die Anzeige)
+for job in chat_ui.show_jobs(conversation, jobs_area):
+    # Live-Data Status aktualisieren
+    if job.result and job.result["status"] == "completed" and should_use_live_data(job.question):
+        st.session_state.live_data_fetched = True
+        logging.info("Live-Datenabruf Status aktualisiert.")
@@ -8,26 +8,21 @@ Starten mit: streamlit run app2.0.py
 """
 
 import streamlit as st
-import time
 import logging
-from openai import OpenAI
-from dotenv import load_dotenv
 import os
 import json
 from typing import Optional
 
-# Lade Umgebungsvariablen aus .env-Datei
-load_dotenv()
-
-# Schlüsselwörter für Live-Datenabruf
-LIVE_DATA_KEYWORDS = ["KDO", "KGO", "Besoldung", "Entgelt", "Amtsblätter"]
+import chat_ui
+from faq_warmup import SIDEBAR_EXAMPLES, load_faq
+from qa_service import FALLBACK_ASSISTANTS
+from resources import ensure_env
 
-def should_use_live_data(query):
-    """Forciert die Nutzung von Live-Daten."""
-    return True
+# Lade Umgebungsvariablen aus .env-Datei
+ensure_env()
 
-# Initialisiere den OpenAI-Client
-client = OpenAI()
+# Die Verarbeitung einer Frage liegt in qa_service.py (wie in app.py und der HTTP-API);
+# diese Oberfläche rendert nur deren Ereignisse (chat_ui.py)
 
 # Konfiguriere das Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -42,14 +37,8 @@ def load_assistant_config():
     config_file = "assistant_config.json"
     
     # Fallback-Konfiguration, falls keine JSON-Datei existiert
-    fallback_config = {
-        "GPT-4o (Standard - Beste Qualität)": {
-            "id": "asst_er72T8D7D8xth2HaM0mjxi5m",
-            "description": "Höchste Qualität, aber längere Antwortzeiten (10-30 Sekunden)",
-            "model": "gpt-4o"
-        }
-    }
-    
+    fallback_config = FALLBACK_ASSISTANTS
+
     try:
         if os.path.exists(config_file):
             with open(config_file, "r", encoding="utf-8") as f:
@@ -117,15 +106,14 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Session State initialisieren
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "conversation" not in st.session_state:
+    st.session_state.conversation = chat_ui.open_conversation()
+conversation = st.session_state.conversation
 if "selected_assistant" not in st.session_state:
     st.session_state.selected_assistant = DEFAULT_ASSISTANT
 
-# Chat-Historie anzeigen
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Chat-Historie anzeigen (ältere Nachrichten seitenweise)
+chat_ui.show_history(conversation)
 
 # Modellauswahl
 if len(ASSISTANTS) > 1:
@@ -164,152 +152,17 @@ with st.form(key="question_form", clear_on_submit=True):
             help="Klicken Sie hier oder drücken Sie Ctrl+Enter zum Senden"
         )
 
-# Verarbeitung der Frage
+# Verarbeitung der Frage als Job im Hintergrund (Thread, Streaming und Fehlerbehandlung im Frage-Antwort-Dienst)
 if submit_button and question:
-    # Füge die Benutzerfrage zur Historie hinzu
-    st.session_state.messages.append({"role": "user", "content": question})
-    with st.chat_message("user"):
-        st.markdown(question)
-
-    # Zeige den Assistant-Response Container
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        status_container = st.container()
-
-        try:
-            # Hole die Assistant-Konfiguration
-            assistant_config = ASSISTANTS[st.session_state.selected_assistant]
-            assistant_id = assistant_config["id"]
-
-            # Erstelle die vollständige Chat-Historie für den Assistant
-            full_history = [
-                {"role": message["role"], "content": message["content"]}
-                for message in st.session_state.messages
-            ]
-
-            # Phase 1: Thread erstellen
-            logging.info("Starte neue Konversation...")
-            with st.spinner("🚀 Neue Konversation wird gestartet..."):
-                thread = client.beta.threads.create()
-                logging.info(f"✅ Konversation erfolgreich gestartet: Thread ID {thread.id}")
-
-            # Phase 2: Nachricht senden
-            logging.info("Übermittle Frage an Assistenten...")
-            with st.spinner("📝 Ihre Frage wird an den Assistenten übermittelt..."):
-                client.beta.threads.messages.create(
-                    thread_id=thread.id,
-                    role="user",
-                    content=json.dumps(full_history)  # Sende die gesamte Historie als JSON
-                )
-                logging.info("✅ Frage erfolgreich übermittelt.")
-
-            # Phase 3: Assistant-Verarbeitung starten
-            logging.info(f"Aktiviere {st.session_state.selected_assistant} Assistenten...")
-            with st.spinner(f"🤖 {st.session_state.selected_assistant} wird aktiviert..."):
-                run = client.beta.threads.runs.create(
-                    thread_id=thread.id,
-                    assistant_id=assistant_id
-                )
-                logging.info(f"✅ Assistent wurde aktiviert: Run ID {run.id}")
+    chat_ui.submit(conversation, question, st.session_state.selected_assistant)
 
-            # Phase 4: Antwort-Generierung
-            status_placeholder = st.empty()
-            elapsed_time = 0
+# Beispielfrage aus der Sidebar: sofort aus dem vorab befüllten Cache, auch mitten in einer Unterhaltung
+example_question = chat_ui.pop_example()
+if example_question:
+    chat_ui.submit(conversation, example_question, st.session_state.selected_assistant, standalone=True)
 
-            while run.status not in ["completed", "failed", "cancelled", "expired"]:
-                elapsed_time += 0.5
-
-                # Dynamische Status-Updates basierend auf der verstrichenen Zeit
-                if should_use_live_data(question):
-                    if elapsed_time < 3:
-                        status_text = "🔍 Durchsuche kirchenrecht-ekhn.de..."
-                    elif elapsed_time < 8:
-                        status_text = "📚 Analysiere Live-Daten..."
-                    else:
-                        status_text = f"⏳ Live-Datenabruf läuft... ({int(elapsed_time)}s)"
-                else:
-                    if elapsed_time < 3:
-                        status_text = "🔍 Assistent analysiert Ihre Frage..."
-                    elif elapsed_time < 8:
-                        status_text = "📚 Relevante Kirchenrechts-Dokumente werden durchsucht..."
-                    elif elapsed_time < 15:
-                        status_text = "✍️ Assistent formuliert eine präzise Antwort..."
-                    else:
-                        status_text = f"⏳ Verarbeitung läuft... ({int(elapsed_time)}s) - Komplexe Anfragen können bis zu 30s dauern"
-
-                status_placeholder.info(status_text)
-                logging.debug(f"Run-Status-Update: {status_text} | Current Run ID: {run.id}, Status: {run.status}")
-                time.sleep(0.5)
-                run = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-            
-            logging.info(f"Run beendet mit Status: {run.status}")
-
-            # Status-Container leeren
-            status_placeholder.empty()
-
-            # Prüfe ob der Run erfolgreich war
-            if run.status == "completed":
-                # Phase 5: Antwort abrufen
-                with st.spinner("💬 Antwort wird abgerufen..."):
-                    messages = client.beta.threads.messages.list(thread_id=thread.id)
-                    assistant_message = messages.data[0].content[0].text.value
-                    logging.info("Antwort erfolgreich abgerufen.")
-
-                # Antwort anzeigen
-                message_placeholder.markdown(assistant_message)
-                logging.debug(f"Angezeigte Assistenten-Nachricht: {assistant_message[:50]}...")
-
-                # Füge die Antwort zur Historie hinzu, falls nicht bereits vorhanden
-                if not any(msg['content'] == assistant_message for msg in st.session_state.messages):
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": assistant_message
-                    })
-                    logging.info("Assistenten-Nachricht zur Session State Historie hinzugefügt.")
-                else:
-                    logging.info("Assistenten-Nachricht ist bereits in der Historie, füge sie nicht erneut hinzu.")
-
-                # Quellen anzeigen
-                if "sources" in messages.data[0].content[0]:
-                    sources = messages.data[0].content[0].sources
-                    st.markdown("### Quellen")
-                    for source in sources:
-                        st.markdown(f"- [{source['title']}]({source['url']})")
-                    logging.info("Quellen angezeigt.")
-
-                # Live-Data Status aktualisieren
-                if should_use_live_data(question):
-                    st.session_state.live_data_fetched = True
-                    logging.info("Live-Datenabruf Status aktualisiert.")
-            else:
-                # Fehlerbehandlung für fehlgeschlagene Runs
-                logging.error(f"Assistent konnte Anfrage nicht verarbeiten. Status: {run.status}")
-                status_container.empty()
-                error_msg = f"❌ Der Assistent konnte die Anfrage nicht verarbeiten. Status: {run.status}"
-                message_placeholder.error(error_msg)
-
-                if run.status == "failed" and run.last_error:
-                    logging.error(f"Fehlerdetails des Runs: {run.last_error.message}")
-                    st.error(f"Fehlerdetails: {run.last_error.message}")
-
-        except Exception as e:
-            # Allgemeine Fehlerbehandlung
-            logging.critical(f"Kritischer Fehler aufgetreten: {str(e)}", exc_info=True)
-            error_message = f"❌ Ein Fehler ist aufgetreten: {str(e)}"
-            message_placeholder.error(error_message)
-
-            # Detaillierte Fehlerhinweise
-            with st.expander("🔧 Fehlerdiagnose"):
-                st.write("**Mögliche Ursachen:**")
-                st.write("1. **API-Key fehlt oder ist ungültig**: Überprüfen Sie die `.env`-Datei")
-                st.write("2. **Assistant ID ist falsch**: Vergewissern Sie sich, dass die Assistant ID korrekt ist")
-                st.write("3. **Keine Internetverbindung**: Prüfen Sie Ihre Netzwerkverbindung")
-                st.write("4. **API-Limits erreicht**: Überprüfen Sie Ihr OpenAI-Dashboard")
-                st.write("\n**Fehlermeldung:**")
-                st.code(str(e))
+# Platz für laufende Fragen; gefüllt wird er erst am Ende des Skripts
+jobs_area = st.container()
 
 # Sidebar mit zusätzlichen Informationen
 with st.sidebar:
@@ -317,18 +170,11 @@ with st.sidebar:
     
     # Beispielfragen
     st.subheader("📝 Beispielfragen")
-    example_questions = [
-        "Darf eine Pfarrerin das Abendmahl ohne Ordination spenden?",
-        "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?",
-        "Wie ist das Verfahren bei Amtspflichtverletzungen geregelt?",
-        "Was sind die Aufgaben des Presbyteriums?",
-        "Welche Rechte hat die Gemeindeversammlung?"
-    ]
+    # Die ersten Einträge der FAQ-Liste; ihre Antworten liegen vorab im Cache (faq_warmup.py)
+    example_questions = load_faq()[:SIDEBAR_EXAMPLES]
     
     for eq in example_questions:
-        if st.button(eq, key=eq):
-            st.session_state.messages.append({"role": "user", "content": eq})
-            st.rerun()
+        st.button(eq, key=eq, on_click=chat_ui.choose_example, args=(eq,))
     
     # Hinweise
     st.subheader("💡 Hinweise")
@@ -353,11 +199,11 @@ with st.sidebar:
     
     # Kosten-Tracker (optional)
     st.subheader("💰 Nutzung")
-    st.write(f"Anzahl Fragen in dieser Sitzung: {len([m for m in st.session_state.messages if m['role'] == 'user'])}")
+    st.write(f"Anzahl Fragen in dieser Sitzung: {conversation.question_count()}")
     
     # Reset-Button
     if st.button("🔄 Neue Unterhaltung"):
-        st.session_state.messages = []
+        st.session_state.conversation = chat_ui.open_conversation(resume=False)
         st.rerun()
 
 # Footer
@@ -374,3 +220,6 @@ st.markdown(
     """, 
     unsafe_allow_html=True
 )
+
+# Laufende Fragen anzeigen, bis sie beantwortet sind (ein Rerun unterbricht nur die Anzeige)
+chat_ui.show_jobs(conversation, jobs_area)
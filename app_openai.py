@@ -1,13 +1,16 @@
 # kirchenrecht_debug.py
 import os, openai
 from dotenv import load_dotenv
+from run_waiter import RunWaiter
+from vector_store_sync import load_manifest
 load_dotenv()
 
 client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 ASSISTANT_ID = "asst_er72T8D7D8xth2HaM0mjxi5m"
 THREAD_ID    = "thread_..."         # einmalig anlegen & wiederverwenden
-VECTOR_ID    = "vs_..."             # dein bestehender Vector Store
+# Vector Store aus dem Manifest von vector_store_sync.py (oder per Umgebungsvariable)
+VECTOR_ID    = os.getenv("KIRCHENRECHT_VECTOR_STORE_ID") or load_manifest().get("vector_store_id") or "vs_..."
 
 # --- einmalig sicherstellen, dass File Search aktiv ist
 client.beta.assistants.update(
@@ -34,9 +37,12 @@ run = client.beta.threads.runs.create(
     file_search={"max_num_results": 8},  # mehr Kontext zulassen
 )
 
-# --- Poll bis fertig
-while run.status not in {"completed", "failed"}:
-    run = client.beta.threads.runs.retrieve(run_id=run.id, thread_id=THREAD_ID)
+# --- Warten bis fertig (Backoff statt Dauerschleife, Abbruch nach Deadline)
+waiter = RunWaiter(client)
+run = waiter.wait(THREAD_ID, run)
+print(f"Run-Status: {run.status} ({waiter.overhead_report()})")
+if run.status != "completed":
+    raise SystemExit(1)
 
 msgs = client.beta.threads.messages.list(thread_id=THREAD_ID)
 print(msgs.data[0].content[0].text.value)
@@ -31,24 +31,27 @@ try:
         model="gpt-4o",
         instructions="Du bist ein spezialisierter, präziser und neutraler KI-Assistent für das Kirchenrecht der Evangelischen Kirche in Hessen und Nassau (EKHN). Deine Aufgabe ist es, Anfragen ausschließlich auf Basis der dir zur Verfügung gestellten Wissensdatenbank zu beantworten.\n\n**Deine Kernanweisungen:**\n\n1.  **Strikte Wissensbasis:** Nutze **ausschließlich** die Informationen aus den hochgeladenen Dokumenten in deinem Wissensspeicher (Vector Store). Beginne deine Recherche für jede Anfrage, indem du dieses Wissen durchsuchst.\n2.  **Kein externes Wissen:** Antworte unter keinen Umständen mit Allgemeinwissen oder Informationen, die nicht aus den bereitgestellten Dokumenten stammen. Wenn die Antwort nicht in den Dokumenten enthalten ist, gib klar an: \"Die Antwort auf diese Frage konnte in der hinterlegten Wissensdatenbank nicht gefunden werden.\"\n3.  **Präzise Zitate:** Zitiere bei jeder Antwort die genauen Paragraphen, Artikel und Absätze aus den Dokumenten, auf die sich deine Antwort stützt. Formatiere Zitate klar und korrekt.\n4.  **Neutrale und formelle Sprache:** Behalte einen formalen, juristischen und neutralen Ton bei. Vermeide persönliche Meinungen, Interpretationen oder pastorale Ratschläge.\n5.  **Fokus auf EKHN-Recht:** Beziehe dich ausschließlich auf das Kirchenrecht der EKHN, wie es in der Wissensdatenbank dokumentiert ist. Vergleiche nicht mit anderen Landeskirchen oder dem staatlichen Recht, es sei denn, die Dokumente geben dies explizit vor.\n6.  **Strukturierte Antworten:** Gliedere deine Antworten klar und logisch. Beginne mit der direkten Beantwortung der Frage und untermauere sie dann mit den entsprechenden Zitaten und Erläuterungen aus der Wissensdatenbank.",
         tools=[
-            {"type": "retrieval"},
+            {"type": "file_search"},
             {
-                "name": "get_kirchenrecht_info",
-                "description": "Fetches and summarizes info from kirchenrecht-ekhn.de for the given query.",
-                "strict": True,
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "Search term or topic to look up on kirchenrecht-ekhn.de"
-                        }
-                    },
-                    "required": ["query"],
-                    "additionalProperties": False
+                # Wird von tool_executor.py ausgeführt (Status requires_action)
+                "type": "function",
+                "function": {
+                    "name": "get_kirchenrecht_info",
+                    "description": "Fetches and summarizes info from kirchenrecht-ekhn.de for the given query.",
+                    "strict": True,
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "Search term or topic to look up on kirchenrecht-ekhn.de"
+                            }
+                        },
+                        "required": ["query"],
+                        "additionalProperties": False
+                    }
                 }
-            },
-            {"type": "web_search_preview"}
+            }
         ]
     )
     
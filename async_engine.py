@@ -0,0 +1,577 @@
+"""
+async_engine.py - Asynchrone Request-Engine für die Thread/Message/Run-Pipeline
+
+Bisher blockierte jede Frage den Streamlit-Skript-Thread für die gesamte
+Laufzeit des Runs (10-30 Sekunden). Diese Engine führt die Pipeline auf einer
+gemeinsamen asyncio-Event-Loop in einem Hintergrund-Thread aus und nutzt
+AsyncOpenAI mit einem geteilten Connection-Pool. Dadurch kann ein Prozess
+viele gleichzeitige Fragen bedienen, ohne pro Frage einen Thread zu binden.
+
+Die Streamlit-Seite übergibt Fragen mit submit() und liest die gestreamten
+Ereignisse über den zurückgegebenen RunHandle.
+
+Ruft ein Assistant ein Function-Tool auf (requires_action), führt die Engine
+die Tool-Aufrufe über den ToolExecutor aus und setzt den Run per
+submit_tool_outputs_stream fort.
+
+Optional sichert die Engine langsame Runs ab (Hedging, siehe ask_hedged):
+Kommt vom primären Assistant innerhalb eines Zeitbudgets kein erstes Token,
+wird die Frage zusätzlich einem zweiten Assistant gestellt und der langsamere
+Run abgebrochen.
+
+Gleichzeitige identische Fragen ohne Vorgeschichte werden zusammengelegt
+(coalesce=True, siehe coalescing.py): Nur die erste startet einen Run, weitere
+Sitzungen erhalten dessen gestreamte Ereignisse und Ergebnis.
+
+Vor jedem Run reiht sich die Frage in die Warteschlange ihres Modells ein
+(rate_limiter.py), damit die RPM/TPM-Limits eingehalten werden; die Position
+wird als Ereignis gemeldet.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+import httpx
+from openai import NOT_GIVEN, AsyncOpenAI, DefaultAsyncHttpxClient, NotFoundError, RateLimitError
+from openai.types.beta.threads import Message, Run
+
+from answer_cache import cache_key
+from coalescing import COALESCE_DIR, FOLLOW_INTERVAL, FlightFiles, FlightRegistry, FlightWriter, follower_result
+from conversation import estimate_tokens, thread_seed_messages, truncation_strategy
+from rate_limiter import estimate_request_tokens
+from resources import ensure_env, get_admission_queue, get_tool_executor
+from run_waiter import server_requested_delay
+
+# Größe des geteilten HTTP-Connection-Pools
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+
+# Markiert das Ende des Ereignis-Streams eines RunHandle
+_DONE = object()
+
+
+class RunHandle:
+    """
+    Verbindet einen in der Engine laufenden Run mit dem aufrufenden Thread.
+
+    Ereignisse sind Tupel (art, wert):
+        ("queued", None), ("in_progress", None), ("tool", tool_typ),
+        ("message_created", None), ("delta", text), ("hedge", assistant_id),
+        ("admission", (position, wartezeit_oder_None))
+    """
+
+    def __init__(self):
+        self._events = queue.Queue()
+        self.future = None
+
+    def emit(self, kind, value=None):
+        self._events.put((kind, value))
+
+    def close(self):
+        self._events.put(_DONE)
+
+    def events(self):
+        """Liefert die Ereignisse des Runs, bis dieser beendet ist."""
+        while True:
+            item = self._events.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def result(self, timeout=None):
+        """
+        Wartet auf das Ergebnis des Runs.
+
+        Returns:
+            Dict mit "thread_id", "rebuilt", "run", "answer", "message" und
+            "timings" (Sekunden je Phase, siehe telemetry.PHASES); bei
+            zusammengelegten Fragen zusätzlich "coalesced" (thread_id ist dann None)
+        """
+        return self.future.result(timeout)
+
+
+class _Contender:
+    """Ein Run innerhalb eines abgesicherten Aufrufs (primärer oder zweiter Assistant)."""
+
+    def __init__(self, assistant_id):
+        self.assistant_id = assistant_id
+        self.thread_id = None
+        self.run_id = None
+        self.task = None
+
+    def succeeded(self):
+        if not self.task.done() or self.task.cancelled() or self.task.exception() is not None:
+            return False
+        return self.task.result()["run"].status == "completed"
+
+
+class AsyncRequestEngine:
+    """Führt Assistants-Pipelines nebenläufig auf einer gemeinsamen Event-Loop aus."""
+
+    def __init__(self, client_kwargs=None, max_connections=MAX_CONNECTIONS, tool_executor=None,
+                 flight_files=None, admission=None):
+        """
+        Args:
+            client_kwargs: Zusätzliche Parameter für AsyncOpenAI (z.B. base_url)
+            max_connections: Größe des Connection-Pools
+            tool_executor: ToolExecutor für Runs im Status requires_action (None = nicht behandeln)
+            flight_files: FlightFiles für prozessübergreifendes Zusammenlegen (None = nur im Prozess)
+            admission: AdmissionQueue mit RPM/TPM-Begrenzung (None = unbegrenzt)
+        """
+        self.tool_executor = tool_executor
+        self.admission = admission
+        self.flights = FlightRegistry()
+        self.flight_files = flight_files
+        self._client_kwargs = dict(client_kwargs or {})
+        self._max_connections = max_connections
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="async-request-engine", daemon=True
+        )
+        self._thread.start()
+        self.client = asyncio.run_coroutine_threadsafe(self._create_client(), self._loop).result()
+
+    async def _create_client(self):
+        # Der Client muss innerhalb der Loop erzeugt werden, an die sein Pool gebunden ist
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self._max_connections,
+                max_keepalive_connections=min(MAX_KEEPALIVE_CONNECTIONS, self._max_connections)
+            )
+        )
+        return AsyncOpenAI(http_client=http_client, **self._client_kwargs)
+
+    def stats(self):
+        """Zusammenlegen: laufende Runs und bisher angehängte Follower."""
+        return {"in_flight": self.flights.in_flight(), "coalesced": self.flights.joined}
+
+    def submit(self, assistant_id, question, history, thread_id=None,
+               hedge_assistant_id=None, hedge_after=None, coalesce=False, instructions=None):
+        """
+        Übergibt eine Frage an die Engine (nicht blockierend).
+
+        Args:
+            assistant_id: ID des zu verwendenden Assistants
+            question: Die neue Frage
+            history: Wörtlich zu berücksichtigende Historie inkl. der neuen Frage als letztem Eintrag
+                (conversation.context_window; ältere Nachrichten blendet truncation_strategy aus)
+            thread_id: Wiederzuverwendender Thread oder None für Neuaufbau
+            hedge_assistant_id: Zweiter Assistant für Hedging (None = kein Hedging)
+            hedge_after: Sekunden ohne erstes Token, nach denen er gestartet wird
+            coalesce: Identische laufende Frage mitnutzen (nur ohne Thread und Vorgeschichte)
+            instructions: Zusätzliche Anweisungen für den Run (Zusammenfassung älterer Runden)
+
+        Returns:
+            RunHandle für Ereignisse und Ergebnis
+        """
+        handle = RunHandle()
+
+        def start(emit):
+            if hedge_assistant_id and hedge_after is not None:
+                return self.ask_hedged(
+                    assistant_id, hedge_assistant_id, question, history, thread_id,
+                    emit=emit, hedge_after=hedge_after, instructions=instructions
+                )
+            return self.ask(assistant_id, question, history, thread_id, emit=emit, instructions=instructions)
+
+        if not coalesce or thread_id or len(history) > 1 or instructions:
+            handle.future = asyncio.run_coroutine_threadsafe(
+                self._run_with_handle(handle, start(handle.emit)), self._loop
+            )
+            return handle
+
+        flight, leader = self.flights.join_or_lead(cache_key(assistant_id, question), handle)
+        if not leader:
+            logging.info("Identische Frage läuft bereits - hänge mich an den laufenden Run an.")
+            handle.future = concurrent.futures.Future()
+            flight.outcome.add_done_callback(lambda outcome: _resolve_follower(handle.future, outcome))
+            return handle
+
+        claim = None
+        if self.flight_files is not None:
+            try:
+                claim = self.flight_files.claim(flight.key)
+            except (OSError, RuntimeError) as e:
+                logging.warning(f"Prozessübergreifendes Zusammenlegen nicht möglich: {e}")
+        if isinstance(claim, FlightWriter):
+            flight.sinks.append(claim.event)
+            coroutine = start(flight.publish)
+        elif claim is not None:
+            logging.info("Identische Frage läuft in einem anderen Prozess - lese deren Ereignisse mit.")
+            coroutine = self._follow_file(claim, flight.publish, lambda: start(flight.publish))
+            claim = None
+        else:
+            coroutine = start(flight.publish)
+        handle.future = asyncio.run_coroutine_threadsafe(
+            self._run_with_handle(handle, self._lead(flight, coroutine, claim)), self._loop
+        )
+        return handle
+
+    async def _lead(self, flight, coroutine, writer=None):
+        """Führt den Run des Leaders aus und gibt das Ergebnis an alle Follower weiter."""
+        try:
+            result = await coroutine
+        except BaseException as e:
+            followers = self.flights.land(flight)
+            if writer is not None:
+                writer.finish(error=e)
+            flight.outcome.set_exception(e)
+            for follower in followers:
+                follower.close()
+            raise
+        followers = self.flights.land(flight)
+        if writer is not None:
+            writer.finish(result)
+        flight.outcome.set_result(result)
+        for follower in followers:
+            follower.close()
+        return result
+
+    async def _follow_file(self, reader, emit, fallback):
+        """
+        Liest den Run eines Leaders in einem anderen Prozess mit.
+
+        Endet der Leader ohne Ergebnis (Absturz, Zeitüberschreitung), wird die
+        Frage selbst gestellt (fallback).
+        """
+        deadline = time.monotonic() + self.flight_files.timeout
+        while time.monotonic() < deadline:
+            alive = reader.leader_alive()
+            for entry in reader.read():
+                if not entry.get("done"):
+                    emit(entry["event"], entry["value"])
+                    continue
+                if "error" in entry:
+                    raise RuntimeError(f"Die zusammengelegte Anfrage ist fehlgeschlagen: {entry['error']}")
+                return {
+                    "thread_id": None,
+                    "rebuilt": False,
+                    "run": Run.model_validate(entry["run"]),
+                    "answer": entry["answer"],
+                    "message": Message.model_validate(entry["message"]) if entry["message"] else None,
+                    "timings": {},
+                    "coalesced": True,
+                }
+            if not alive:
+                break
+            await asyncio.sleep(FOLLOW_INTERVAL)
+        logging.warning("Der Leader im anderen Prozess lieferte kein Ergebnis - stelle die Frage selbst.")
+        return await fallback()
+
+    async def _run_with_handle(self, handle, coroutine):
+        try:
+            return await coroutine
+        finally:
+            handle.close()
+
+    async def ask(self, assistant_id, question, history, thread_id=None, emit=None, instructions=None):
+        """Komplette Pipeline als Coroutine: Thread vorbereiten, Run streamen."""
+        emit = emit or (lambda kind, value=None: None)
+        timings = {}
+        ticket = await self._admit(assistant_id, history, emit, timings)
+        run = None
+        try:
+            thread_id, rebuilt = await self._prepare_thread(question, history, thread_id, timings)
+            run, answer, message = await self._stream_run(
+                thread_id, assistant_id, emit, timings, instructions, truncation_strategy(history)
+            )
+        except RateLimitError as e:
+            # 429 trotz Begrenzung (z.B. andere Verbraucher desselben API-Keys): Kontingent sperren
+            if ticket is not None:
+                await asyncio.to_thread(
+                    self.admission.backoff, ticket.model, server_requested_delay(e.response.headers) or 10.0
+                )
+            raise
+        finally:
+            # Auch bei Fehlern und Abbruch (Verlierer beim Hedging): ohne run.usage wird die Schätzung erstattet.
+            # Im Worker-Thread, da SqliteBucketStore die Event-Loop sonst blockieren könnte
+            if ticket is not None:
+                await asyncio.to_thread(self.admission.settle, ticket, getattr(run, "usage", None))
+        return {
+            "thread_id": thread_id,
+            "rebuilt": rebuilt,
+            "run": run,
+            "answer": answer,
+            "message": message,
+            "timings": timings,
+        }
+
+    async def _admit(self, assistant_id, history, emit, timings):
+        """Wartet in der Warteschlange des Modells auf RPM/TPM-Kontingent (ohne Begrenzung: None)."""
+        if self.admission is None:
+            return None
+        ticket = await self.admission.admit_async(
+            self.admission.model_for(assistant_id),
+            estimate_request_tokens(history),
+            on_wait=lambda position, wait: emit("admission", (position, wait))
+        )
+        timings["admission"] = ticket.waited
+        return ticket
+
+    async def _prepare_thread(self, question, history, thread_id, timings):
+        if thread_id:
+            start = time.perf_counter()
+            try:
+                await self.client.beta.threads.messages.create(
+                    thread_id=thread_id, role="user", content=question
+                )
+                timings["message_create"] = time.perf_counter() - start
+                return thread_id, False
+            except NotFoundError:
+                logging.warning(f"Thread {thread_id} ist abgelaufen - baue ihn aus der Historie neu auf.")
+
+        seed, remaining = thread_seed_messages(history)
+        start = time.perf_counter()
+        thread = await self.client.beta.threads.create(messages=seed)
+        timings["thread_create"] = time.perf_counter() - start
+        start = time.perf_counter()
+        for message in remaining:
+            await self.client.beta.threads.messages.create(thread_id=thread.id, **message)
+        if remaining:
+            timings["message_create"] = time.perf_counter() - start
+        return thread.id, True
+
+    async def _stream_run(self, thread_id, assistant_id, emit, timings, instructions=None, truncation=None):
+        answer = ""
+        announced_tools = set()
+        tool_seconds = 0.0
+        # Zeitpunkte der Statuswechsel für die Phasen run_create, queue_wait und in_progress
+        started = created = in_progress = time.perf_counter()
+
+        stream_manager = self.client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            additional_instructions=instructions or NOT_GIVEN,
+            truncation_strategy=truncation or NOT_GIVEN
+        )
+        while True:
+            async with stream_manager as stream:
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        created = in_progress = time.perf_counter()
+                        timings["run_create"] = created - started
+                        emit("run_created", (thread_id, event.data.id))
+                    elif event.event == "thread.run.queued":
+                        emit("queued")
+                    elif event.event == "thread.run.in_progress":
+                        if "queue_wait" not in timings:
+                            in_progress = time.perf_counter()
+                            timings["queue_wait"] = in_progress - created
+                        emit("in_progress")
+                    elif event.event in ("thread.run.step.created", "thread.run.step.delta"):
+                        details = (
+                            event.data.step_details if event.event == "thread.run.step.created"
+                            else event.data.delta.step_details
+                        )
+                        for tool_call in getattr(details, "tool_calls", None) or []:
+                            if tool_call.type not in announced_tools:
+                                announced_tools.add(tool_call.type)
+                                emit("tool", tool_call.type)
+                    elif event.event == "thread.message.created":
+                        emit("message_created")
+                    elif event.event == "thread.message.delta":
+                        for part in event.data.delta.content or []:
+                            if part.type == "text" and part.text and part.text.value:
+                                answer += part.text.value
+                                emit("delta", part.text.value)
+
+                run = await stream.get_final_run()
+                message = stream.current_message_snapshot
+
+            if run.status != "requires_action" or self.tool_executor is None:
+                break
+            # Function-Tools parallel im Thread-Pool ausführen und den Run mit den Ausgaben fortsetzen
+            if "function" not in announced_tools:
+                announced_tools.add("function")
+                emit("tool", "function")
+            tool_start = time.perf_counter()
+            outputs = await asyncio.gather(
+                *(asyncio.wrap_future(future) for future in self.tool_executor.submit(run))
+            )
+            tool_seconds += time.perf_counter() - tool_start
+            stream_manager = self.client.beta.threads.runs.submit_tool_outputs_stream(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=list(outputs)
+            )
+
+        if tool_seconds:
+            timings["tool_execution"] = tool_seconds
+        timings["in_progress"] = time.perf_counter() - in_progress - tool_seconds
+
+        if message is not None and message.content:
+            answer = message.content[0].text.value
+        return run, answer, message
+
+    async def ask_hedged(self, assistant_id, hedge_assistant_id, question, history,
+                         thread_id=None, emit=None, hedge_after=5.0, instructions=None):
+        """
+        Pipeline mit Absicherung gegen lange Warteschlangen (Hedging).
+
+        Liefert der primäre Assistant nach hedge_after Sekunden weder ein erstes
+        Token noch ein Ergebnis, wird dieselbe Frage zusätzlich hedge_assistant_id
+        gestellt - in einem eigenen, aus der Historie aufgebauten Thread, da ein
+        Thread nur einen aktiven Run haben kann. Wer zuerst ein Token liefert oder
+        erfolgreich endet, gewinnt; der andere Run wird serverseitig abgebrochen.
+
+        Returns:
+            Ergebnis wie ask() plus "hedge" mit Ablauf und Token-Verbrauch des Verlierers
+        """
+        emit = emit or (lambda kind, value=None: None)
+        state = {"winner": None, "hedging": False}
+        decided = asyncio.Event()
+        contenders = []
+
+        def claim(contender):
+            if state["winner"] is None:
+                state["winner"] = contender
+                decided.set()
+
+        def forward_for(contender):
+            def forward(kind, value=None):
+                if kind == "run_created":
+                    contender.thread_id, contender.run_id = value
+                    emit(kind, value)
+                elif state["winner"] is contender:
+                    emit(kind, value)
+                elif state["winner"] is None:
+                    if kind == "delta":
+                        claim(contender)
+                        emit(kind, value)
+                    elif not state["hedging"]:
+                        # Bis zum Start des zweiten Runs zeigt die UI den Status des primären
+                        emit(kind, value)
+            return forward
+
+        def start(run_assistant_id, run_thread_id):
+            contender = _Contender(run_assistant_id)
+            contender.task = asyncio.create_task(
+                self.ask(run_assistant_id, question, history, run_thread_id, emit=forward_for(contender),
+                         instructions=instructions)
+            )
+            contenders.append(contender)
+            return contender
+
+        primary = start(assistant_id, thread_id)
+        decision = asyncio.create_task(decided.wait())
+        try:
+            await asyncio.wait({primary.task, decision}, timeout=hedge_after,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not decided.is_set() and not primary.task.done():
+                logging.info(f"Kein Token nach {hedge_after:.1f}s - starte zusätzlich {hedge_assistant_id}.")
+                state["hedging"] = True
+                emit("hedge", hedge_assistant_id)
+                start(hedge_assistant_id, None)
+
+            while not decided.is_set():
+                for contender in contenders:
+                    if contender.succeeded():
+                        claim(contender)
+                        break
+                pending = {contender.task for contender in contenders if not contender.task.done()}
+                if decided.is_set() or not pending:
+                    break
+                await asyncio.wait(pending | {decision}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            decision.cancel()
+
+        # Ohne erfolgreichen Run gewinnt der erste, der nicht mit einer Ausnahme endete
+        winner = state["winner"] or next(
+            (c for c in contenders if c.task.done() and not c.task.cancelled() and c.task.exception() is None),
+            primary
+        )
+        loser = next((contender for contender in contenders if contender is not winner), None)
+        loser_report = await self._stop_contender(loser, history) if loser else None
+
+        result = await winner.task
+        result["hedge"] = {
+            "started": state["hedging"],
+            "winner": winner.assistant_id,
+            "hedge_won": winner is not primary,
+            "loser": loser_report,
+        }
+        return result
+
+    async def _stop_contender(self, contender, history):
+        """
+        Bricht den verlorenen Run ab und ermittelt seinen Token-Verbrauch (Zusatzkosten).
+
+        Liefert die API (noch) keine usage, werden die Eingabe-Tokens aus der
+        Historie geschätzt, da sie bei einem gestarteten Run bereits anfallen.
+        """
+        run = None
+        if contender.task.done() and not contender.task.cancelled() and contender.task.exception() is None:
+            run = contender.task.result()["run"]
+        else:
+            contender.task.cancel()
+            try:
+                await contender.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            if contender.run_id:
+                try:
+                    run = await self.client.beta.threads.runs.cancel(
+                        thread_id=contender.thread_id, run_id=contender.run_id
+                    )
+                except Exception as e:
+                    logging.warning(f"Run {contender.run_id} konnte nicht abgebrochen werden: {e}")
+                    try:
+                        run = await self.client.beta.threads.runs.retrieve(
+                            thread_id=contender.thread_id, run_id=contender.run_id
+                        )
+                    except Exception:
+                        run = None
+
+        usage = getattr(run, "usage", None)
+        estimated = usage is None and contender.run_id is not None
+        prompt_tokens = usage.prompt_tokens if usage else (
+            sum(estimate_tokens(message["content"]) for message in history) if estimated else 0
+        )
+        return {
+            "assistant_id": contender.assistant_id,
+            "run_id": contender.run_id,
+            "status": run.status if run is not None else "not_started",
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "estimated": estimated,
+        }
+
+    def run_coroutine(self, coroutine):
+        """Führt eine beliebige Coroutine auf der Engine-Loop aus (concurrent.futures.Future)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def close(self):
+        """Schließt den Client und stoppt die Event-Loop."""
+        asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+def _resolve_follower(future, outcome):
+    """Überträgt das Ergebnis des Leaders auf einen Follower."""
+    if outcome.exception() is not None:
+        future.set_exception(outcome.exception())
+    else:
+        future.set_result(follower_result(outcome.result()))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Liefert die prozessweit geteilte Engine (wird beim ersten Aufruf gestartet)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            ensure_env()
+            _engine = AsyncRequestEngine(
+                tool_executor=get_tool_executor(),
+                admission=get_admission_queue(),
+                flight_files=FlightFiles(COALESCE_DIR) if COALESCE_DIR else None
+            )
+        return _engine
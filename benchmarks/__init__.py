@@ -0,0 +1,6 @@
+"""
+benchmarks - Mock-Server und Lastmessungen für die Kirchenrechts-App
+
+Alle Messungen laufen gegen einen lokalen Stand-in-Server und verursachen
+keine Kosten bei OpenAI.
+"""
@@ -0,0 +1,104 @@
+"""
+bench_async.py - Lastvergleich: synchroner Polling-Pfad vs. asynchrone Engine
+
+Simuliert 10/50/200 gleichzeitige Nutzer gegen den lokalen Mock-Server und
+vergleicht Durchsatz und Latenz des bisherigen synchronen Pfads (ein Thread
+pro Nutzer, Polling alle 0,5 s) mit der asyncio-Engine (async_engine.py).
+
+Ausführen:
+    python -m benchmarks.bench_async --users 10 50 200 --latency 2.0
+"""
+
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from async_engine import AsyncRequestEngine
+from benchmarks.mock_server import start_in_background
+
+QUESTION = "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?"
+ASSISTANT_ID = "asst_mock"
+
+
+def sync_question(client):
+    """Der bisherige Pfad aus app.py: neuer Thread, JSON-Historie, Polling alle 0,5 s."""
+    start = time.perf_counter()
+    thread = client.beta.threads.create()
+    client.beta.threads.messages.create(
+        thread_id=thread.id,
+        role="user",
+        content=json.dumps([{"role": "user", "content": QUESTION}])
+    )
+    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=ASSISTANT_ID)
+    while run.status not in ["completed", "failed", "cancelled", "expired"]:
+        time.sleep(0.5)
+        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+    client.beta.threads.messages.list(thread_id=thread.id)
+    return time.perf_counter() - start
+
+
+def run_sync(base_url, users):
+    client = OpenAI(base_url=base_url, api_key="mock", max_retries=0)
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(lambda _: sync_question(client), range(users)))
+        total = time.perf_counter() - start
+    client.close()
+    # Ein blockierter Thread pro gleichzeitigem Nutzer
+    return latencies, total, users
+
+
+def run_async(engine, users):
+    history = [{"role": "user", "content": QUESTION}]
+    start = time.perf_counter()
+    submitted = []
+    for _ in range(users):
+        submitted.append((time.perf_counter(), engine.submit(ASSISTANT_ID, QUESTION, history)))
+    latencies = []
+    for submitted_at, handle in submitted:
+        handle.result()
+        latencies.append(time.perf_counter() - submitted_at)
+    total = time.perf_counter() - start
+    # Alle Fragen teilen sich den Loop-Thread der Engine
+    return latencies, total, 1
+
+
+def report(label, users, latencies, total, threads, requests):
+    print(
+        f"{label:<6} | {users:>5} | {users / total:>9.1f} | {statistics.mean(latencies):>8.2f} | "
+        f"{max(latencies):>7.2f} | {requests / users:>9.1f} | {threads:>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync- vs. Async-Pfad unter Last")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--latency", type=float, default=2.0, help="Run-Dauer des Mock-Servers (s)")
+    args = parser.parse_args()
+
+    server, state, base_url = start_in_background(latency=args.latency)
+    engine = AsyncRequestEngine(client_kwargs={"base_url": base_url, "api_key": "mock", "max_retries": 0})
+
+    print(f"Mock-Run-Dauer: {args.latency:.1f}s\n")
+    print(f"{'Pfad':<6} | {'Nutzer':>5} | {'Fragen/s':>9} | {'Ø Lat.':>8} | {'Max':>7} | {'Calls/Fr.':>9} | {'Threads':>8}")
+    print("-" * 70)
+    try:
+        for users in args.users:
+            before = state.request_count
+            latencies, total, threads = run_sync(base_url, users)
+            report("sync", users, latencies, total, threads, state.request_count - before)
+
+            before = state.request_count
+            latencies, total, threads = run_async(engine, users)
+            report("async", users, latencies, total, threads, state.request_count - before)
+    finally:
+        engine.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+bench_hedge.py - Tail-Latenz mit und ohne Hedging
+
+Stellt viele Fragen parallel an den Mock-Server, dessen Run-Dauer einer
+log-normalen Verteilung mit langem Ausläufer folgt (einzelne Runs hängen lange
+in der Warteschlange). Verglichen werden:
+
+    ohne    - nur der primäre Assistant
+    hedging - zweiter Assistant, wenn nach --hedge-after Sekunden kein Token kam
+
+Ausgegeben werden p50/p95/p99 der Zeit bis zum ersten Token und bis zur fertigen
+Antwort sowie der Anteil abgesicherter Fragen und die zusätzlich verbrauchten Tokens.
+
+Ausführen:
+    python -m benchmarks.bench_hedge --questions 200 --latency 1.0 --latency-spread 0.8 --hedge-after 1.5
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_engine import AsyncRequestEngine
+from benchmarks.bench_suite import QUESTIONS, percentile
+from benchmarks.mock_server import add_mock_arguments, mock_options_from_args, start_in_background
+
+PRIMARY_ASSISTANT = "asst_mock_quality"
+HEDGE_ASSISTANT = "asst_mock_fast"
+
+
+def ask_once(engine, index, hedge_after):
+    question = QUESTIONS[index % len(QUESTIONS)]
+    history = [{"role": "user", "content": question}]
+    start = time.perf_counter()
+    handle = engine.submit(
+        PRIMARY_ASSISTANT, question, history,
+        hedge_assistant_id=HEDGE_ASSISTANT if hedge_after is not None else None,
+        hedge_after=hedge_after
+    )
+    ttft = None
+    for kind, _ in handle.events():
+        if kind == "delta" and ttft is None:
+            ttft = time.perf_counter() - start
+    result = handle.result()
+    elapsed = time.perf_counter() - start
+    hedge = result.get("hedge") or {}
+    loser = hedge.get("loser") or {}
+    usage = result["run"].usage
+    return {
+        "latency": elapsed,
+        "ttft": ttft or elapsed,
+        "ok": result["run"].status == "completed",
+        "hedged": bool(hedge.get("started")),
+        "hedge_won": bool(hedge.get("hedge_won")),
+        "tokens": (usage.total_tokens if usage else 0),
+        "extra_tokens": loser.get("prompt_tokens", 0) + loser.get("completion_tokens", 0),
+    }
+
+
+def run_scenario(engine, name, questions, concurrency, hedge_after):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda index: ask_once(engine, index, hedge_after), range(questions)))
+    latencies = [sample["latency"] for sample in samples]
+    ttfts = [sample["ttft"] for sample in samples]
+    tokens = sum(sample["tokens"] for sample in samples)
+    extra = sum(sample["extra_tokens"] for sample in samples)
+    return {
+        "name": name,
+        "ttft": [percentile(ttfts, p) for p in (50, 95, 99)],
+        "total": [percentile(latencies, p) for p in (50, 95, 99)],
+        "errors": sum(1 for sample in samples if not sample["ok"]),
+        "hedged": sum(1 for sample in samples if sample["hedged"]) / len(samples),
+        "hedge_won": sum(1 for sample in samples if sample["hedge_won"]),
+        "extra_share": extra / tokens if tokens else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail-Latenz mit und ohne Hedging gegen den Mock-Server")
+    add_mock_arguments(parser)
+    parser.set_defaults(latency_dist="lognormal", latency_spread=0.8)
+    parser.add_argument("--questions", type=int, default=200, help="Anzahl Fragen pro Szenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="Gleichzeitige Fragen")
+    parser.add_argument("--hedge-after", type=float, default=1.5, help="Budget bis zum Zweit-Run in Sekunden")
+    args = parser.parse_args()
+
+    server, state, base_url = start_in_background(**mock_options_from_args(args))
+    engine = AsyncRequestEngine(client_kwargs={"base_url": base_url, "api_key": "mock"})
+    try:
+        results = [
+            run_scenario(engine, "ohne", args.questions, args.concurrency, None),
+            run_scenario(engine, "hedging", args.questions, args.concurrency, args.hedge_after),
+        ]
+    finally:
+        engine.close()
+        server.shutdown()
+
+    print(f"{args.questions} Fragen, {args.concurrency} parallel, Run-Dauer Median {args.latency:.1f}s "
+          f"({args.latency_dist}, Streuung {args.latency_spread}), Hedging nach {args.hedge_after:.1f}s\n")
+    print(f"{'Szenario':<8} | {'TTFT p50':>8} | {'p95':>6} | {'p99':>6} | {'Gesamt p50':>10} | {'p95':>6} | "
+          f"{'p99':>6} | {'abgesichert':>11} | {'Zusatz-Tokens':>13} | {'Fehler':>6}")
+    print("-" * 106)
+    for result in results:
+        ttft, total = result["ttft"], result["total"]
+        print(f"{result['name']:<8} | {ttft[0]:>8.2f} | {ttft[1]:>6.2f} | {ttft[2]:>6.2f} | {total[0]:>10.2f} | "
+              f"{total[1]:>6.2f} | {total[2]:>6.2f} | {result['hedged']:>11.0%} | "
+              f"{result['extra_share']:>13.1%} | {result['errors']:>6}")
+    hedged = results[1]
+    print(f"\nZweiter Assistant war {hedged['hedge_won']}× schneller. "
+          f"p99 bis zur fertigen Antwort: {results[0]['total'][2]:.2f}s -> {hedged['total'][2]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+bench_rerun.py - Kosten der Ressourcen-Initialisierung pro Streamlit-Rerun
+
+Vergleicht, was app.py früher bei jedem Rerun ausgeführt hat (zweimal
+OpenAI(), load_dotenv(), Parsen der assistant_config.json), mit den
+prozessweit gecachten Ressourcen aus resources.py.
+
+Ausführen:
+    python -m benchmarks.bench_rerun --reruns 200
+"""
+
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from resources import CONFIG_FILE, get_client, load_assistants
+
+
+def legacy_rerun():
+    load_dotenv()
+    OpenAI()
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        json.load(f)
+    OpenAI()
+
+
+def cached_rerun():
+    get_client()
+    load_assistants(CONFIG_FILE)
+
+
+def measure(fn, reruns):
+    start = time.perf_counter()
+    for _ in range(reruns):
+        fn()
+    return (time.perf_counter() - start) / reruns * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Initialisierungskosten pro Rerun")
+    parser.add_argument("--reruns", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    legacy_ms = measure(legacy_rerun, args.reruns)
+    cached_ms = measure(cached_rerun, args.reruns)
+    print(f"Bisher (pro Rerun):     {legacy_ms:8.3f} ms")
+    print(f"resources.py (gecacht): {cached_ms:8.3f} ms")
+    print(f"Faktor:                 {legacy_ms / cached_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+bench_suite.py - Latenz- und Durchsatz-Benchmark als Regressions-Gate
+
+Spielt mehrere Unterhaltungen mit mehreren Runden gleichzeitig gegen den
+lokalen Mock-Server (mock_server.py) ab und misst für jeden Pfad:
+
+- End-to-End-Latenz pro Frage (p50/p95/p99) und Zeit bis zum ersten Token
+- API-Aufrufe pro Frage (inkl. Polling und SDK-Retries)
+- Gesendete Tokens pro Gesprächsrunde
+
+Pfade:
+    legacy  - bisheriges Verhalten: neuer Thread, JSON-Historie, Polling alle 0,5 s
+    current - aktueller App-Pfad: Thread-Wiederverwendung + Streaming (async_engine.py)
+
+Ausführen und Baseline speichern:
+    python -m benchmarks.bench_suite --save benchmarks/baseline.json
+
+Gegen Baseline prüfen (Exit-Code 1 bei Regression):
+    python -m benchmarks.bench_suite --compare benchmarks/baseline.json --tolerance 0.15
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from async_engine import AsyncRequestEngine
+from benchmarks.mock_server import add_mock_arguments, mock_options_from_args, start_in_background
+
+ASSISTANT_ID = "asst_mock"
+
+QUESTIONS = [
+    "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?",
+    "Und wie lange dauert die Amtszeit?",
+    "Wer beruft die Gemeindeversammlung ein?",
+    "Welche Rechte hat die Gemeindeversammlung?",
+    "Wie ist das Verfahren bei Amtspflichtverletzungen geregelt?",
+    "Was sind die Aufgaben des Presbyteriums?",
+]
+
+# Kennzahlen, die beim Vergleich mit der Baseline nicht steigen dürfen
+GATED_METRICS = ["p50", "p95", "p99", "calls_per_question", "tokens_per_turn_mean"]
+
+
+def percentile(values, p):
+    """Perzentil mit linearer Interpolation (p zwischen 0 und 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def legacy_conversation(client, turns):
+    """Bisheriger Pfad aus app.py für eine Unterhaltung mit mehreren Runden."""
+    history, samples = [], []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        history.append({"role": "user", "content": question})
+        start = time.perf_counter()
+        thread = client.beta.threads.create()
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content=json.dumps(history))
+        run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=ASSISTANT_ID)
+        while run.status not in ["completed", "failed", "cancelled", "expired"]:
+            time.sleep(0.5)
+            run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        answer = ""
+        if run.status == "completed":
+            messages = client.beta.threads.messages.list(thread_id=thread.id)
+            answer = messages.data[0].content[0].text.value
+        elapsed = time.perf_counter() - start
+        samples.append({"latency": elapsed, "ttft": elapsed, "ok": run.status == "completed"})
+        history.append({"role": "assistant", "content": answer})
+    return samples
+
+
+def current_conversation(engine, turns):
+    """Aktueller App-Pfad: Thread-Wiederverwendung und Streaming über die Engine."""
+    history, samples, thread_id = [], [], None
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        history.append({"role": "user", "content": question})
+        start = time.perf_counter()
+        handle = engine.submit(ASSISTANT_ID, question, history, thread_id=thread_id)
+        ttft = None
+        for kind, _ in handle.events():
+            if kind == "delta" and ttft is None:
+                ttft = time.perf_counter() - start
+        result = handle.result()
+        elapsed = time.perf_counter() - start
+        ok = result["run"].status == "completed"
+        samples.append({"latency": elapsed, "ttft": ttft or elapsed, "ok": ok})
+        history.append({"role": "assistant", "content": result["answer"]})
+        # Wie in app.py: nur bei synchroner Historie wird der Thread weiterverwendet
+        thread_id = result["thread_id"] if ok else None
+    return samples
+
+
+def run_scenario(name, conversation_fn, state, conversations, turns):
+    """Führt einen Pfad mit parallelen Unterhaltungen aus und verdichtet die Messwerte."""
+    state.reset_counters()
+    with ThreadPoolExecutor(max_workers=conversations) as pool:
+        results = list(pool.map(lambda _: conversation_fn(turns), range(conversations)))
+    counters = state.snapshot()
+
+    samples = [sample for conversation in results for sample in conversation]
+    latencies = [sample["latency"] for sample in samples]
+    questions = len(samples)
+    return {
+        "path": name,
+        "questions": questions,
+        "errors": sum(1 for sample in samples if not sample["ok"]),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "ttft_p50": percentile([sample["ttft"] for sample in samples], 50),
+        "calls_per_question": counters["requests"] / questions,
+        "tokens_per_turn_mean": counters["tokens_sent"] / questions,
+        "calls": counters["calls"],
+    }
+
+
+def print_report(results):
+    print(f"{'Pfad':<8} | {'p50':>6} | {'p95':>6} | {'p99':>6} | {'TTFT':>6} | {'Calls/Frage':>11} | "
+          f"{'Tokens/Runde':>12} | {'Fehler':>6}")
+    print("-" * 84)
+    for result in results:
+        print(f"{result['path']:<8} | {result['p50']:>6.2f} | {result['p95']:>6.2f} | {result['p99']:>6.2f} | "
+              f"{result['ttft_p50']:>6.2f} | {result['calls_per_question']:>11.1f} | "
+              f"{result['tokens_per_turn_mean']:>12.0f} | {result['errors']:>6}")
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Vergleicht die Ergebnisse mit einer gespeicherten Baseline.
+
+    Returns:
+        Liste der Regressionen als Text (leer = bestanden)
+    """
+    regressions = []
+    baseline_by_path = {entry["path"]: entry for entry in baseline["results"]}
+    for result in results:
+        reference = baseline_by_path.get(result["path"])
+        if reference is None:
+            continue
+        for metric in GATED_METRICS:
+            allowed = reference[metric] * (1 + tolerance)
+            if result[metric] > allowed and result[metric] - reference[metric] > 1e-9:
+                regressions.append(
+                    f"{result['path']}.{metric}: {result[metric]:.3f} > {allowed:.3f} "
+                    f"(Baseline {reference[metric]:.3f})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenz-/Durchsatz-Benchmark gegen den Mock-Server")
+    add_mock_arguments(parser)
+    parser.add_argument("--conversations", type=int, default=20, help="Gleichzeitige Unterhaltungen")
+    parser.add_argument("--turns", type=int, default=4, help="Runden pro Unterhaltung")
+    parser.add_argument("--paths", nargs="+", default=["legacy", "current"], choices=["legacy", "current"])
+    parser.add_argument("--save", help="Ergebnisse als Baseline (JSON) speichern")
+    parser.add_argument("--compare", help="Gegen diese Baseline (JSON) prüfen")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Erlaubte Verschlechterung (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    server, state, base_url = start_in_background(**mock_options_from_args(args))
+    client_kwargs = {"base_url": base_url, "api_key": "mock"}
+    sync_client = OpenAI(**client_kwargs)
+    engine = AsyncRequestEngine(client_kwargs=client_kwargs)
+
+    scenarios = {
+        "legacy": lambda turns: legacy_conversation(sync_client, turns),
+        "current": lambda turns: current_conversation(engine, turns),
+    }
+    try:
+        results = [
+            run_scenario(path, scenarios[path], state, args.conversations, args.turns)
+            for path in args.paths
+        ]
+    finally:
+        engine.close()
+        sync_client.close()
+        server.shutdown()
+
+    print(f"{args.conversations} Unterhaltungen × {args.turns} Runden, "
+          f"Run-Dauer {args.latency:.1f}s ({args.latency_dist})\n")
+    print_report(results)
+
+    report = {"config": vars(args), "results": results}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Baseline gespeichert in '{args.save}'")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Performance-Regression gegenüber der Baseline:")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print(f"\n✅ Keine Regression gegenüber '{args.compare}' (Toleranz {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
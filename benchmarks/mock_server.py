@@ -0,0 +1,1106 @@
+"""
+mock_server.py - Lokaler Stand-in-Server für die OpenAI Assistants API
+
+Implementiert die von app.py, debug_assistant.py und app_openai.py genutzten
+Endpunkte für Assistants, Threads, Messages, Runs und Run Steps (inkl.
+Streaming per Server-Sent Events) sowie Files und Vector Stores
+(vector_store_sync.py) und Embeddings (semantic_cache.py, als lokales
+Hashing-Embedding), damit Performance-Messungen ohne echte (kostenpflichtige)
+OpenAI-Aufrufe möglich sind.
+
+Konfigurierbar sind die Verteilung der Run-Dauer (fest, gleichverteilt,
+log-normal), Fehlerraten (HTTP 500, 429 mit Retry-After, fehlgeschlagene
+Runs) und ob Runs einen file_search-Schritt enthalten. Mit --tool-call-rate
+ruft ein Anteil der Runs das Function-Tool get_kirchenrecht_info auf
+(Status requires_action, fortgesetzt per submit_tool_outputs). Der Server zählt
+API-Aufrufe pro Endpunkt und die gesendeten Tokens. Für evaluate_assistants.py
+gibt es außerdem die Batch API (/v1/batches, nur /v1/chat/completions), für die
+Zusammenfassung älterer Runden (conversation.py) /v1/chat/completions. Runs
+berücksichtigen truncation_strategy und additional_instructions in usage.
+
+Starten:
+    python -m benchmarks.mock_server --port 8765 --latency 2.0 --latency-dist lognormal
+
+Anschließend die App oder Skripte mit
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+gegen den Mock laufen lassen.
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from conversation import estimate_tokens
+
+# Antwort, die der Mock-Assistant auf jede Frage gibt
+ANSWER_TEMPLATE = (
+    "Nach § 12 Abs. 1 KGO gilt für Ihre Frage „{question}“ Folgendes: "
+    "Die Kirchengemeindeordnung der EKHN regelt die Voraussetzungen abschließend."
+)
+
+# Markierung der file_citation, die Runs mit file_search an die Antwort hängen
+CITATION_MARKER = "【4:0†KGO.txt】"
+
+# Anzahl Textstücke, in denen die Antwort gestreamt wird
+STREAM_CHUNKS = 8
+
+# Anteile der Run-Dauer: Warteschlange, Dokumentensuche, bis zum ersten Token
+QUEUED_SHARE = 0.1
+FILE_SEARCH_SHARE = 0.3
+FIRST_TOKEN_SHARE = 0.6
+
+# Anteil der Run-Dauer, nach dem ein Run mit Tool-Aufruf auf requires_action wechselt
+TOOL_CALL_SHARE = 0.4
+
+# Verarbeitungsdauer eines File-Batches in Sekunden und empfohlenes Polling-Intervall
+FILE_BATCH_SECONDS = 0.2
+POLL_AFTER_MS = 50
+
+# Verarbeitungsdauer eines Batch-API-Auftrags in Sekunden
+BATCH_SECONDS = 0.3
+
+# Function-Tool, das der Mock-Assistant aufruft (wie in assistant_setup.py)
+TOOL_DEFINITION = {
+    "type": "function",
+    "function": {
+        "name": "get_kirchenrecht_info",
+        "description": "Fetches and summarizes info from kirchenrecht-ekhn.de for the given query.",
+        "strict": True,
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+class LatencyModel:
+    """
+    Verteilung der Run-Dauer.
+
+    kind: "fixed" (immer mean), "uniform" (mean ± spread) oder
+    "lognormal" (Median mean, spread = sigma des Logarithmus)
+    """
+
+    def __init__(self, mean=1.0, kind="fixed", spread=0.0, seed=None):
+        self.mean = mean
+        self.kind = kind
+        self.spread = spread
+        self._random = random.Random(seed)
+
+    def sample(self):
+        if self.kind == "uniform":
+            return max(0.0, self._random.uniform(self.mean - self.spread, self.mean + self.spread))
+        if self.kind == "lognormal":
+            return self._random.lognormvariate(math.log(self.mean), self.spread or 0.5)
+        return self.mean
+
+
+class MockState:
+    """Speichert Assistants, Threads, Nachrichten und Runs des Mock-Servers im Speicher."""
+
+    def __init__(self, latency=1.0, latency_model=None, error_rate=0.0, rate_limit_rate=0.0,
+                 run_failure_rate=0.0, file_search=True, tool_call_rate=0.0, seed=None):
+        self.latency_model = latency_model or LatencyModel(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.run_failure_rate = run_failure_rate
+        self.file_search = file_search
+        self.tool_call_rate = tool_call_rate
+        self._random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.assistants = {}
+        self.threads = {}
+        self.runs = {}
+        self.files = {}
+        self.vector_stores = {}
+        self.file_batches = {}
+        self.batches = {}
+        self.file_contents = {}
+        self._ids = itertools.count(1)
+        self.reset_counters()
+
+    @property
+    def latency(self):
+        return self.latency_model.mean
+
+    def new_id(self, prefix):
+        return f"{prefix}_mock{next(self._ids)}"
+
+    def chance(self, probability):
+        with self.lock:
+            return probability > 0 and self._random.random() < probability
+
+    def reset_counters(self):
+        """Setzt die Zähler für API-Aufrufe und gesendete Tokens zurück."""
+        self.request_count = 0
+        self.calls = Counter()
+        self.tokens_sent = 0
+
+    def snapshot(self):
+        """Liefert eine Kopie der aktuellen Zähler."""
+        with self.lock:
+            return {
+                "requests": self.request_count,
+                "calls": dict(self.calls),
+                "tokens_sent": self.tokens_sent,
+            }
+
+
+def _thread_obj(thread_id, created_at):
+    return {"id": thread_id, "object": "thread", "created_at": created_at,
+            "metadata": {}, "tool_resources": {}}
+
+
+def _message_obj(message_id, thread_id, role, text, created_at, run_id=None, assistant_id=None, annotations=None):
+    return {
+        "id": message_id,
+        "object": "thread.message",
+        "created_at": created_at,
+        "thread_id": thread_id,
+        "role": role,
+        "status": "completed",
+        "content": [{"type": "text", "text": {"value": text, "annotations": annotations or []}}],
+        "assistant_id": assistant_id,
+        "run_id": run_id,
+        "attachments": [],
+        "metadata": {},
+    }
+
+
+def _assistant_obj(assistant_id, body, created_at):
+    return {
+        "id": assistant_id,
+        "object": "assistant",
+        "created_at": created_at,
+        "name": body.get("name"),
+        "description": body.get("description"),
+        "model": body.get("model", "gpt-4o"),
+        "instructions": body.get("instructions"),
+        "tools": body.get("tools", [{"type": "file_search"}]),
+        "tool_resources": body.get("tool_resources") or {"file_search": {"vector_store_ids": ["vs_mock"]}},
+        "metadata": body.get("metadata") or {},
+    }
+
+
+def _content_text(content):
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def _endpoint_name(method, pattern):
+    """Kurzname eines Endpunkts für die Aufrufzähler, z.B. "POST /threads/{}/runs"."""
+    return method + " " + re.sub(r"\(\?P<[^>]+>[^)]+\)", "{}", pattern).replace("/v1", "", 1)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """HTTP-Handler mit den Assistants-Endpunkten unter /v1."""
+
+    protocol_version = "HTTP/1.1"
+    state = None  # wird von create_server gesetzt
+
+    ROUTES = [
+        ("POST", r"/v1/assistants", "_create_assistant"),
+        ("GET", r"/v1/assistants", "_list_assistants"),
+        ("GET", r"/v1/assistants/(?P<assistant_id>[^/]+)", "_get_assistant"),
+        ("POST", r"/v1/assistants/(?P<assistant_id>[^/]+)", "_update_assistant"),
+        ("POST", r"/v1/threads", "_create_thread"),
+        ("GET", r"/v1/threads/(?P<thread_id>[^/]+)", "_get_thread"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/messages", "_create_message"),
+        ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/messages", "_list_messages"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs", "_create_run"),
+        ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)", "_get_run"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/cancel", "_cancel_run"),
+        ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/submit_tool_outputs",
+         "_submit_tool_outputs"),
+        ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/steps", "_list_steps"),
+        ("POST", r"/v1/files", "_create_file"),
+        ("GET", r"/v1/files/(?P<file_id>[^/]+)", "_get_file"),
+        ("GET", r"/v1/files/(?P<file_id>[^/]+)/content", "_get_file_content"),
+        ("DELETE", r"/v1/files/(?P<file_id>[^/]+)", "_delete_file"),
+        ("POST", r"/v1/vector_stores", "_create_vector_store"),
+        ("GET", r"/v1/vector_stores/(?P<store_id>[^/]+)", "_get_vector_store"),
+        ("POST", r"/v1/vector_stores/(?P<store_id>[^/]+)/files", "_create_vector_store_file"),
+        ("GET", r"/v1/vector_stores/(?P<store_id>[^/]+)/files", "_list_vector_store_files"),
+        ("DELETE", r"/v1/vector_stores/(?P<store_id>[^/]+)/files/(?P<file_id>[^/]+)", "_delete_vector_store_file"),
+        ("POST", r"/v1/vector_stores/(?P<store_id>[^/]+)/file_batches", "_create_file_batch"),
+        ("GET", r"/v1/vector_stores/(?P<store_id>[^/]+)/file_batches/(?P<batch_id>[^/]+)", "_get_file_batch"),
+        ("GET", r"/v1/vector_stores/(?P<store_id>[^/]+)/file_batches/(?P<batch_id>[^/]+)/files",
+         "_list_file_batch_files"),
+        ("POST", r"/v1/chat/completions", "_chat_completion"),
+        ("POST", r"/v1/embeddings", "_create_embeddings"),
+        ("POST", r"/v1/batches", "_create_batch"),
+        ("GET", r"/v1/batches/(?P<batch_id>[^/]+)", "_get_batch"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- Hilfsfunktionen ---
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self):
+        body = self._read_body()
+        return json.loads(body) if body else {}
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, error_type, headers=None):
+        self._send_json({"error": {"message": message, "type": error_type, "code": None}}, status, headers)
+
+    def _not_found(self, what="Ressource"):
+        self._send_error(404, f"{what} nicht gefunden", "invalid_request_error")
+
+    def _send_event(self, event, data):
+        payload = json.dumps(data) if not isinstance(data, str) else data
+        chunk = f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def _count_tokens(self, text):
+        with self.state.lock:
+            self.state.tokens_sent += estimate_tokens(text) if text else 0
+
+    # --- Routing ---
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        path = self.path.split("?")[0].rstrip("/")
+        for route_method, pattern, handler_name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.state.lock:
+                    self.state.request_count += 1
+                    self.state.calls[_endpoint_name(method, pattern)] += 1
+                if self._inject_failure():
+                    return
+                return getattr(self, handler_name)(**match.groupdict())
+        self._not_found("Endpunkt")
+
+    def _inject_failure(self):
+        """Simuliert Rate-Limits (429) und Serverfehler (500) mit den konfigurierten Raten."""
+        if self.state.chance(self.state.rate_limit_rate):
+            self._read_body()
+            self._send_error(429, "Rate limit reached (mock)", "rate_limit_exceeded", {
+                "Retry-After": "1",
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "1s",
+            })
+            return True
+        if self.state.chance(self.state.error_rate):
+            self._read_body()
+            self._send_error(500, "Internal server error (mock)", "server_error")
+            return True
+        return False
+
+    # --- Assistants ---
+
+    def _create_assistant(self):
+        body = self._read_json()
+        with self.state.lock:
+            assistant = _assistant_obj(self.state.new_id("asst"), body, int(time.time()))
+            self.state.assistants[assistant["id"]] = assistant
+        self._send_json(assistant)
+
+    def _list_assistants(self):
+        self._send_list(list(reversed(list(self.state.assistants.values()))))
+
+    def _get_assistant(self, assistant_id):
+        assistant = self.state.assistants.get(assistant_id)
+        if assistant is None:
+            # Unbekannte IDs (z.B. aus assistant_config.json) werden bei Bedarf angelegt
+            assistant = _assistant_obj(assistant_id, {"name": "EKHN Kirchenrecht Assistant (Mock)"},
+                                       int(time.time()))
+            self.state.assistants[assistant_id] = assistant
+        self._send_json(assistant)
+
+    def _update_assistant(self, assistant_id):
+        body = self._read_json()
+        with self.state.lock:
+            assistant = self.state.assistants.get(assistant_id) or _assistant_obj(assistant_id, {}, int(time.time()))
+            for key in ("name", "description", "model", "instructions", "tools", "tool_resources", "metadata"):
+                if key in body:
+                    assistant[key] = body[key]
+            self.state.assistants[assistant_id] = assistant
+        self._send_json(assistant)
+
+    # --- Threads & Messages ---
+
+    def _create_thread(self):
+        body = self._read_json()
+        now = int(time.time())
+        for m in body.get("messages", []):
+            self._count_tokens(_content_text(m["content"]))
+        with self.state.lock:
+            thread_id = self.state.new_id("thread")
+            messages = [
+                _message_obj(self.state.new_id("msg"), thread_id, m["role"], _content_text(m["content"]), now)
+                for m in body.get("messages", [])
+            ]
+            self.state.threads[thread_id] = {"created_at": now, "messages": messages}
+        self._send_json(_thread_obj(thread_id, now))
+
+    def _get_thread(self, thread_id):
+        thread = self.state.threads.get(thread_id)
+        if thread is None:
+            return self._not_found("Thread")
+        self._send_json(_thread_obj(thread_id, thread["created_at"]))
+
+    def _create_message(self, thread_id):
+        body = self._read_json()
+        thread = self.state.threads.get(thread_id)
+        if thread is None:
+            return self._not_found("Thread")
+        text = _content_text(body.get("content", ""))
+        self._count_tokens(text)
+        now = int(time.time())
+        with self.state.lock:
+            message = _message_obj(self.state.new_id("msg"), thread_id, body.get("role", "user"), text, now)
+            thread["messages"].append(message)
+        self._send_json(message)
+
+    def _list_messages(self, thread_id):
+        thread = self.state.threads.get(thread_id)
+        if thread is None:
+            return self._not_found("Thread")
+        data = list(reversed(thread["messages"]))
+        self._send_json({
+            "object": "list",
+            "data": data,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+            "has_more": False,
+        })
+
+    # --- Runs ---
+
+    def _run_obj(self, run):
+        """Berechnet den Run-Status aus der seit dem Start vergangenen Zeit."""
+        if run["status"] in ("queued", "in_progress"):
+            elapsed = time.time() - run["started"]
+            if run["tool_calls"] and run["tool_outputs"] is None and elapsed >= run["latency"] * TOOL_CALL_SHARE:
+                self._require_action(run)
+            elif elapsed >= run["latency"]:
+                self._complete_run(run)
+            elif elapsed >= run["latency"] * QUEUED_SHARE:
+                run["status"] = "in_progress"
+        tools = [{"type": "file_search"}]
+        if run["tool_calls"]:
+            tools.append(TOOL_DEFINITION)
+        return {
+            "id": run["id"],
+            "object": "thread.run",
+            "created_at": int(run["started"]),
+            "thread_id": run["thread_id"],
+            "assistant_id": run["assistant_id"],
+            "status": run["status"],
+            "model": self.state.assistants.get(run["assistant_id"], {}).get("model") or "mock",
+            "instructions": "",
+            "tools": tools,
+            "required_action": (
+                {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": run["tool_calls"]}}
+                if run["status"] == "requires_action" else None
+            ),
+            "last_error": run.get("last_error"),
+            "usage": run.get("usage"),
+            "truncation_strategy": run["truncation"],
+            "metadata": {},
+            "parallel_tool_calls": True,
+        }
+
+    def _complete_run(self, run):
+        with self.state.lock:
+            if run["status"] not in ("queued", "in_progress"):
+                return
+            if run["fails"]:
+                run["status"] = "failed"
+                run["last_error"] = {"code": "server_error", "message": "Simulierter Fehler (Mock)"}
+                return
+            thread = self.state.threads[run["thread_id"]]
+            question = next(
+                (m["content"][0]["text"]["value"] for m in reversed(thread["messages"]) if m["role"] == "user"),
+                ""
+            )
+            answer = ANSWER_TEMPLATE.format(question=question[:200])
+            annotations = []
+            if self.state.file_search:
+                # Quellenangabe wie bei file_search: Markierung im Text und file_citation-Annotation
+                file_id = next((f["id"] for f in self.state.files.values() if f["purpose"] == "assistants"),
+                               "file-mock-kgo")
+                annotations.append({"type": "file_citation", "text": CITATION_MARKER, "start_index": len(answer),
+                                    "end_index": len(answer) + len(CITATION_MARKER),
+                                    "file_citation": {"file_id": file_id}})
+                answer += CITATION_MARKER
+            if run["tool_outputs"]:
+                answer += "\n\nLive-Daten: " + run["tool_outputs"][0]["output"][:300]
+            message = _message_obj(self.state.new_id("msg"), run["thread_id"], "assistant", answer,
+                                   int(time.time()), run["id"], run["assistant_id"], annotations)
+            # Das Modell liest nur die per truncation_strategy zugelassenen Nachrichten
+            visible = thread["messages"]
+            if run["truncation"].get("type") == "last_messages":
+                visible = visible[-run["truncation"]["last_messages"]:]
+            prompt_tokens = sum(estimate_tokens(m["content"][0]["text"]["value"]) + 4 for m in visible)
+            prompt_tokens += estimate_tokens(run["instructions"]) if run["instructions"] else 0
+            thread["messages"].append(message)
+            prompt_tokens += sum(estimate_tokens(output["output"]) for output in run["tool_outputs"] or [])
+            completion_tokens = estimate_tokens(answer)
+            run["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens}
+            run["status"] = "completed"
+            run["message"] = message
+
+    def _tool_calls(self, thread_id):
+        """Ein get_kirchenrecht_info-Aufruf je Teilfrage der letzten Nutzerfrage."""
+        question = next(
+            (m["content"][0]["text"]["value"] for m in reversed(self.state.threads[thread_id]["messages"])
+             if m["role"] == "user"),
+            ""
+        )
+        parts = [part.strip(" ?.") for part in re.split(r"\?|\bund\b", question) if part.strip(" ?.")]
+        return [
+            {"id": self.state.new_id("call"), "type": "function",
+             "function": {"name": TOOL_DEFINITION["function"]["name"],
+                          "arguments": json.dumps({"query": part}, ensure_ascii=False)}}
+            for part in parts[:4] or [question]
+        ]
+
+    def _require_action(self, run):
+        """Hält den Run an, bis die Tool-Ausgaben eingereicht werden."""
+        with self.state.lock:
+            if run["status"] in ("queued", "in_progress"):
+                run["paused_at"] = time.time() - run["started"]
+                run["status"] = "requires_action"
+
+    def _create_run(self, thread_id):
+        body = self._read_json()
+        if thread_id not in self.state.threads:
+            return self._not_found("Thread")
+        fails = self.state.chance(self.state.run_failure_rate)
+        calls_tool = self.state.chance(self.state.tool_call_rate)
+        with self.state.lock:
+            run = {
+                "id": self.state.new_id("run"),
+                "thread_id": thread_id,
+                "assistant_id": body.get("assistant_id"),
+                "status": "queued",
+                "started": time.time(),
+                "latency": self.state.latency_model.sample(),
+                "fails": fails,
+                "tool_calls": self._tool_calls(thread_id) if calls_tool else [],
+                "tool_outputs": None,
+                "instructions": body.get("additional_instructions") or "",
+                "truncation": body.get("truncation_strategy") or {"type": "auto"},
+            }
+            self.state.runs[run["id"]] = run
+        if body.get("stream"):
+            return self._stream_run(run)
+        self._send_json(self._run_obj(run))
+
+    def _step_objs(self, run):
+        """Run Steps: optional ein file_search-Schritt, danach die Nachrichtenerstellung."""
+        steps = []
+        base = {"object": "thread.run.step", "run_id": run["id"], "thread_id": run["thread_id"],
+                "assistant_id": run["assistant_id"], "created_at": int(run["started"]),
+                "status": "completed", "last_error": None, "usage": None}
+        if self.state.file_search:
+            steps.append(dict(base, id=f"step_{run['id']}_fs", type="tool_calls", step_details={
+                "type": "tool_calls",
+                "tool_calls": [{"id": f"call_{run['id']}", "type": "file_search",
+                                "file_search": {"ranking_options": {"ranker": "default_2024_08_21",
+                                                                    "score_threshold": 0.0},
+                                                "results": []}}],
+            }))
+        if run["tool_calls"]:
+            outputs = {output["tool_call_id"]: output["output"] for output in run["tool_outputs"] or []}
+            steps.append(dict(
+                base, id=f"step_{run['id']}_fn", type="tool_calls",
+                status="completed" if run["tool_outputs"] is not None else "in_progress",
+                step_details={"type": "tool_calls", "tool_calls": [
+                    {"id": call["id"], "type": "function",
+                     "function": dict(call["function"], output=outputs.get(call["id"]))}
+                    for call in run["tool_calls"]
+                ]},
+            ))
+        if run.get("message"):
+            steps.append(dict(base, id=f"step_{run['id']}_msg", type="message_creation", step_details={
+                "type": "message_creation",
+                "message_creation": {"message_id": run["message"]["id"]},
+            }))
+        return steps
+
+    def _sleep_unless_cancelled(self, run, seconds):
+        """Wartet in kleinen Schritten; liefert False, sobald der Run abgebrochen wurde."""
+        deadline = time.time() + seconds
+        while run["status"] != "cancelled":
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, 0.05))
+        return False
+
+    def _stream_run(self, run):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._stream_run_events(run)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client hat den Stream geschlossen (z.B. verlorener Run beim Hedging)
+            self.close_connection = True
+
+    def _stream_run_events(self, run):
+        latency = run["latency"]
+        self._send_event("thread.run.created", self._run_obj(run))
+        self._send_event("thread.run.queued", self._run_obj(run))
+        if not self._sleep_unless_cancelled(run, latency * QUEUED_SHARE):
+            return self._finish_cancelled_stream(run)
+        with self.state.lock:
+            if run["status"] == "queued":
+                run["status"] = "in_progress"
+        self._send_event("thread.run.in_progress", self._run_obj(run))
+
+        if self.state.file_search:
+            step = dict(self._step_objs(run)[0], status="in_progress")
+            self._send_event("thread.run.step.created", step)
+            if not self._sleep_unless_cancelled(run, latency * FILE_SEARCH_SHARE):
+                return self._finish_cancelled_stream(run)
+            self._send_event("thread.run.step.completed", dict(step, status="completed"))
+
+        elapsed_share = QUEUED_SHARE + (FILE_SEARCH_SHARE if self.state.file_search else 0)
+        if run["tool_calls"]:
+            # Function-Tool aufrufen: Stream endet mit requires_action, weiter per submit_tool_outputs
+            if not self._sleep_unless_cancelled(run, latency * max(0.0, TOOL_CALL_SHARE - elapsed_share)):
+                return self._finish_cancelled_stream(run)
+            self._send_event("thread.run.step.created", self._step_objs(run)[-1])
+            self._require_action(run)
+            self._send_event("thread.run.requires_action", self._run_obj(run))
+            return self._end_stream()
+        self._stream_answer(run, latency * (FIRST_TOKEN_SHARE - elapsed_share))
+
+    def _stream_answer(self, run, first_token_wait):
+        """Wartet bis zum ersten Token und sendet danach die Antwort stückweise."""
+        latency = run["latency"]
+        if not self._sleep_unless_cancelled(run, first_token_wait):
+            return self._finish_cancelled_stream(run)
+        chunk_delay = latency * (1 - FIRST_TOKEN_SHARE) / STREAM_CHUNKS
+        run["latency"] = 0
+        self._complete_run(run)
+
+        if run["status"] == "cancelled":
+            return self._finish_cancelled_stream(run)
+        if run["status"] == "failed":
+            self._send_event("thread.run.failed", self._run_obj(run))
+        else:
+            message = run["message"]
+            text = message["content"][0]["text"]["value"]
+            self._send_event("thread.message.created", dict(message, status="in_progress", content=[]))
+            step = max(1, len(text) // STREAM_CHUNKS)
+            for start in range(0, len(text), step):
+                if start:
+                    time.sleep(chunk_delay)
+                self._send_event("thread.message.delta", {
+                    "id": message["id"],
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text",
+                                           "text": {"value": text[start:start + step], "annotations": []}}]},
+                })
+            annotations = message["content"][0]["text"]["annotations"]
+            if annotations:
+                # Wie die echte API: die Annotationen kommen als eigener Delta mit Index
+                self._send_event("thread.message.delta", {
+                    "id": message["id"],
+                    "object": "thread.message.delta",
+                    "delta": {"content": [{"index": 0, "type": "text", "text": {
+                        "annotations": [dict(annotation, index=i) for i, annotation in enumerate(annotations)]
+                    }}]},
+                })
+            self._send_event("thread.message.completed", message)
+            self._send_event("thread.run.completed", self._run_obj(run))
+        self._end_stream()
+
+    def _finish_cancelled_stream(self, run):
+        self._send_event("thread.run.cancelled", self._run_obj(run))
+        self._end_stream()
+
+    def _end_stream(self):
+        self._send_event("done", "[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _get_run(self, thread_id, run_id):
+        run = self.state.runs.get(run_id)
+        if run is None or run["thread_id"] != thread_id:
+            return self._not_found("Run")
+        self._send_json(self._run_obj(run))
+
+    def _cancel_run(self, thread_id, run_id):
+        self._read_json()
+        run = self.state.runs.get(run_id)
+        if run is None or run["thread_id"] != thread_id:
+            return self._not_found("Run")
+        with self.state.lock:
+            if run["status"] in ("queued", "in_progress", "requires_action"):
+                # Bereits verarbeitete Eingabe-Tokens werden wie bei OpenAI berechnet
+                if run["status"] == "in_progress":
+                    thread = self.state.threads[run["thread_id"]]
+                    prompt_tokens = sum(
+                        estimate_tokens(m["content"][0]["text"]["value"]) + 4 for m in thread["messages"]
+                    )
+                    run["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": 0,
+                                    "total_tokens": prompt_tokens}
+                run["status"] = "cancelled"
+        self._send_json(self._run_obj(run))
+
+    def _submit_tool_outputs(self, thread_id, run_id):
+        body = self._read_json()
+        run = self.state.runs.get(run_id)
+        if run is None or run["thread_id"] != thread_id:
+            return self._not_found("Run")
+        if run["status"] != "requires_action":
+            return self._send_error(400, f"Run {run_id} erwartet keine Tool-Ausgaben (Status {run['status']})",
+                                    "invalid_request_error")
+        outputs = body.get("tool_outputs") or []
+        expected = {call["id"] for call in run["tool_calls"]}
+        if {output.get("tool_call_id") for output in outputs} != expected:
+            return self._send_error(400, "Tool-Ausgaben passen nicht zu den Tool-Aufrufen", "invalid_request_error")
+        for output in outputs:
+            self._count_tokens(output.get("output", ""))
+        with self.state.lock:
+            run["tool_outputs"] = outputs
+            # Die Uhr des Runs läuft ab dem Zeitpunkt des Tool-Aufrufs weiter
+            run["started"] = time.time() - run["paused_at"]
+            run["status"] = "in_progress"
+        if not body.get("stream"):
+            return self._send_json(self._run_obj(run))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._send_event("thread.run.in_progress", self._run_obj(run))
+            self._send_event("thread.run.step.completed", self._step_objs(run)[-1])
+            self._stream_answer(run, run["latency"] * (FIRST_TOKEN_SHARE - TOOL_CALL_SHARE))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _list_steps(self, thread_id, run_id):
+        run = self.state.runs.get(run_id)
+        if run is None or run["thread_id"] != thread_id:
+            return self._not_found("Run")
+        data = list(reversed(self._step_objs(run)))
+        self._send_json({"object": "list", "data": data, "has_more": False,
+                         "first_id": data[0]["id"] if data else None,
+                         "last_id": data[-1]["id"] if data else None})
+
+    # --- Files & Vector Stores ---
+
+    def _send_list(self, data):
+        """Liste mit Cursor-Paginierung wie die API (after, limit)."""
+        query = parse_qs(urlsplit(self.path).query)
+        after = query.get("after", [None])[0]
+        if after:
+            ids = [entry["id"] for entry in data]
+            data = data[ids.index(after) + 1:] if after in ids else []
+        limit = int(query.get("limit", ["20"])[0])
+        page = data[:limit]
+        self._send_json({"object": "list", "data": page, "has_more": len(data) > limit,
+                         "first_id": page[0]["id"] if page else None,
+                         "last_id": page[-1]["id"] if page else None})
+
+    def _create_file(self):
+        body = self._read_body()
+        # Multipart nur so weit auswerten, wie der Mock es braucht: Dateiname, Zweck und Inhalt
+        match = re.search(rb'filename="([^"]*)"', body)
+        filename = match.group(1).decode("utf-8", "replace") if match else "upload"
+        purpose = re.search(rb'name="purpose"\r\n\r\n([^\r]*)', body)
+        content = re.search(rb'filename="[^"]*"\r\n(?:[^\r]+\r\n)*\r\n(.*?)\r\n--', body, re.DOTALL)
+        with self.state.lock:
+            file = {"id": self.state.new_id("file"), "object": "file", "bytes": len(body),
+                    "created_at": int(time.time()), "filename": filename,
+                    "purpose": purpose.group(1).decode("ascii") if purpose else "assistants",
+                    "status": "processed"}
+            self.state.files[file["id"]] = file
+            self.state.file_contents[file["id"]] = content.group(1) if content else b""
+        self._send_json(file)
+
+    def _get_file_content(self, file_id):
+        content = self.state.file_contents.get(file_id)
+        if content is None:
+            return self._not_found("Datei")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _get_file(self, file_id):
+        file = self.state.files.get(file_id)
+        if file is None:
+            return self._not_found("Datei")
+        self._send_json(file)
+
+    def _delete_file(self, file_id):
+        with self.state.lock:
+            file = self.state.files.pop(file_id, None)
+        if file is None:
+            return self._not_found("Datei")
+        self._send_json({"id": file_id, "object": "file", "deleted": True})
+
+    def _vector_store_obj(self, store):
+        files = store["files"].values()
+        return {
+            "id": store["id"], "object": "vector_store", "created_at": store["created_at"],
+            "name": store["name"], "usage_bytes": sum(self.state.files.get(f["id"], {}).get("bytes", 0) for f in files),
+            "file_counts": {"in_progress": 0, "completed": len(files), "failed": 0, "cancelled": 0,
+                            "total": len(files)},
+            "status": "completed", "expires_after": None, "expires_at": None, "last_active_at": None,
+            "metadata": {},
+        }
+
+    def _vector_store_file_obj(self, store_id, entry):
+        return {"id": entry["id"], "object": "vector_store.file", "created_at": entry["created_at"],
+                "vector_store_id": store_id, "status": "completed", "last_error": None, "usage_bytes": 0,
+                "chunking_strategy": entry["chunking_strategy"]}
+
+    def _create_vector_store(self):
+        body = self._read_json()
+        with self.state.lock:
+            store = {"id": self.state.new_id("vs"), "name": body.get("name"), "created_at": int(time.time()),
+                     "files": {}}
+            self.state.vector_stores[store["id"]] = store
+        self._send_json(self._vector_store_obj(store))
+
+    def _get_vector_store(self, store_id):
+        store = self.state.vector_stores.get(store_id)
+        if store is None:
+            return self._not_found("Vector Store")
+        self._send_json(self._vector_store_obj(store))
+
+    def _attach_file(self, store, file_id, strategy):
+        """Hängt eine Datei an (unbekannte Datei-IDs schlagen fehl). Erwartet gehaltenen Lock."""
+        if file_id not in self.state.files:
+            return False
+        store["files"][file_id] = {
+            "id": file_id, "created_at": int(time.time()),
+            "chunking_strategy": strategy or {"type": "static", "static": {
+                "max_chunk_size_tokens": 800, "chunk_overlap_tokens": 400}},
+        }
+        return True
+
+    def _create_vector_store_file(self, store_id):
+        body = self._read_json()
+        store = self.state.vector_stores.get(store_id)
+        if store is None:
+            return self._not_found("Vector Store")
+        with self.state.lock:
+            attached = self._attach_file(store, body.get("file_id"), body.get("chunking_strategy"))
+        if not attached:
+            return self._not_found("Datei")
+        self._send_json(self._vector_store_file_obj(store_id, store["files"][body["file_id"]]))
+
+    def _list_vector_store_files(self, store_id):
+        store = self.state.vector_stores.get(store_id)
+        if store is None:
+            return self._not_found("Vector Store")
+        self._send_list([self._vector_store_file_obj(store_id, entry) for entry in store["files"].values()])
+
+    def _delete_vector_store_file(self, store_id, file_id):
+        store = self.state.vector_stores.get(store_id)
+        with self.state.lock:
+            entry = store["files"].pop(file_id, None) if store else None
+        if entry is None:
+            return self._not_found("Datei im Vector Store")
+        self._send_json({"id": file_id, "object": "vector_store.file.deleted", "deleted": True})
+
+    def _file_batch_obj(self, batch):
+        done = time.time() - batch["started"] >= FILE_BATCH_SECONDS
+        if done and batch["status"] == "in_progress":
+            store = self.state.vector_stores[batch["store_id"]]
+            with self.state.lock:
+                batch["failed"] = [
+                    file_id for file_id in batch["file_ids"]
+                    if not self._attach_file(store, file_id, batch["chunking_strategy"])
+                ]
+                batch["status"] = "completed"
+        failed = len(batch["failed"])
+        completed = batch["status"] == "completed"
+        return {
+            "id": batch["id"], "object": "vector_store.files_batch", "created_at": int(batch["started"]),
+            "vector_store_id": batch["store_id"], "status": batch["status"],
+            "file_counts": {"in_progress": 0 if completed else len(batch["file_ids"]),
+                            "completed": len(batch["file_ids"]) - failed if completed else 0,
+                            "failed": failed, "cancelled": 0, "total": len(batch["file_ids"])},
+        }
+
+    def _create_file_batch(self, store_id):
+        body = self._read_json()
+        if store_id not in self.state.vector_stores:
+            return self._not_found("Vector Store")
+        with self.state.lock:
+            batch = {"id": self.state.new_id("vsfb"), "store_id": store_id, "file_ids": body.get("file_ids", []),
+                     "chunking_strategy": body.get("chunking_strategy"), "started": time.time(),
+                     "status": "in_progress", "failed": []}
+            self.state.file_batches[batch["id"]] = batch
+        self._send_json(self._file_batch_obj(batch), headers={"openai-poll-after-ms": str(POLL_AFTER_MS)})
+
+    def _get_file_batch(self, store_id, batch_id):
+        batch = self.state.file_batches.get(batch_id)
+        if batch is None or batch["store_id"] != store_id:
+            return self._not_found("File-Batch")
+        self._send_json(self._file_batch_obj(batch), headers={"openai-poll-after-ms": str(POLL_AFTER_MS)})
+
+    def _list_file_batch_files(self, store_id, batch_id):
+        batch = self.state.file_batches.get(batch_id)
+        if batch is None or batch["store_id"] != store_id:
+            return self._not_found("File-Batch")
+        status = re.search(r"filter=(\w+)", self.path)
+        failed = set(batch["failed"])
+        entries = [
+            {"id": file_id, "object": "vector_store.file", "created_at": int(batch["started"]),
+             "vector_store_id": store_id, "status": "failed" if file_id in failed else "completed",
+             "last_error": None, "usage_bytes": 0}
+            for file_id in batch["file_ids"]
+        ]
+        if status:
+            entries = [entry for entry in entries if entry["status"] == status.group(1)]
+        self._send_list(entries)
+
+    # --- Batch API ---
+
+    def _create_batch(self):
+        body = self._read_json()
+        if body.get("endpoint") != "/v1/chat/completions" or body.get("input_file_id") not in self.state.file_contents:
+            return self._send_error(400, "Nur /v1/chat/completions mit hochgeladener Eingabedatei (Mock)",
+                                    "invalid_request_error")
+        with self.state.lock:
+            batch = {"id": self.state.new_id("batch"), "started": time.time(), "status": "in_progress",
+                     "input_file_id": body["input_file_id"], "endpoint": body["endpoint"],
+                     "completion_window": body.get("completion_window", "24h"),
+                     "metadata": body.get("metadata"), "output_file_id": None, "total": 0}
+            self.state.batches[batch["id"]] = batch
+        self._send_json(self._batch_obj(batch))
+
+    def _get_batch(self, batch_id):
+        batch = self.state.batches.get(batch_id)
+        if batch is None:
+            return self._not_found("Batch")
+        self._send_json(self._batch_obj(batch))
+
+    def _batch_obj(self, batch):
+        if batch["status"] == "in_progress" and time.time() - batch["started"] >= BATCH_SECONDS:
+            self._complete_batch(batch)
+        return {
+            "id": batch["id"], "object": "batch", "endpoint": batch["endpoint"], "errors": None,
+            "input_file_id": batch["input_file_id"], "completion_window": batch["completion_window"],
+            "status": batch["status"], "output_file_id": batch["output_file_id"], "error_file_id": None,
+            "created_at": int(batch["started"]), "metadata": batch["metadata"],
+            "request_counts": {"total": batch["total"], "completed": batch["total"], "failed": 0},
+        }
+
+    def _chat_completion(self):
+        """Chat Completion ohne Streaming: fasst die Fragen der letzten Nutzernachricht zusammen."""
+        body = self._read_json()
+        messages = body.get("messages", [])
+        for m in messages:
+            self._count_tokens(m["content"])
+        time.sleep(self.state.latency_model.sample() * 0.5)
+        prompt = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        questions = []
+        for line in prompt.splitlines():
+            if line.startswith("Bisher gefragt: "):
+                questions.extend(line[len("Bisher gefragt: "):].split("; "))
+            elif line.startswith("Frage: "):
+                questions.append(line[len("Frage: "):][:80])
+        answer = "Bisher gefragt: " + "; ".join(questions) if questions else "Keine neuen Beiträge."
+        limit = body.get("max_tokens") or body.get("max_completion_tokens")
+        if limit:
+            answer = answer[:limit * 4]
+        prompt_tokens = sum(estimate_tokens(m["content"]) + 4 for m in messages)
+        completion_tokens = estimate_tokens(answer)
+        with self.state.lock:
+            completion_id = self.state.new_id("chatcmpl")
+        self._send_json({
+            "id": completion_id, "object": "chat.completion", "model": body.get("model"),
+            "created": int(time.time()),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _create_embeddings(self):
+        """Embeddings für den semantischen Cache: lokales Hashing-Embedding statt Modell."""
+        # Import erst hier: answer_cache liest KIRCHENRECHT_CACHE_DB beim Import
+        from semantic_cache import local_embedder
+
+        body = self._read_json()
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        data = []
+        for index, text in enumerate(inputs):
+            self._count_tokens(text)
+            vector = local_embedder(text)
+            norm = float(np.linalg.norm(vector))
+            vector = vector / norm if norm > 0 else vector
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(estimate_tokens(text) for text in inputs)
+        self._send_json({"object": "list", "data": data, "model": body.get("model"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _complete_batch(self, batch):
+        """Beantwortet alle Anfragen der Eingabedatei wie ein Run und legt die Ausgabedatei an."""
+        lines = []
+        for line in self.state.file_contents[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            messages = request["body"].get("messages", [])
+            question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+            answer = ANSWER_TEMPLATE.format(question=question.split("\n")[0][:200])
+            prompt_tokens = sum(estimate_tokens(m["content"]) + 4 for m in messages)
+            completion_tokens = estimate_tokens(answer)
+            lines.append(json.dumps({
+                "id": f"batch_req_{len(lines)}", "custom_id": request["custom_id"], "error": None,
+                "response": {"status_code": 200, "request_id": f"req_{len(lines)}", "body": {
+                    "id": f"chatcmpl-{len(lines)}", "object": "chat.completion", "model": request["body"].get("model"),
+                    "created": int(time.time()),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": answer}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }},
+            }, ensure_ascii=False))
+        with self.state.lock:
+            if batch["status"] != "in_progress":
+                return
+            file_id = self.state.new_id("file")
+            content = ("\n".join(lines) + "\n").encode("utf-8")
+            self.state.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content),
+                                         "created_at": int(time.time()), "filename": "batch_output.jsonl",
+                                         "purpose": "batch_output", "status": "processed"}
+            self.state.file_contents[file_id] = content
+            batch.update(status="completed", output_file_id=file_id, total=len(lines))
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+
+def create_server(port=0, latency=1.0, **options):
+    """
+    Erzeugt einen Mock-Server (noch nicht gestartet).
+
+    Args:
+        port: TCP-Port (0 = frei wählen)
+        latency: Mittlere Run-Dauer in Sekunden
+        **options: Weitere Parameter für MockState (latency_model, error_rate,
+            rate_limit_rate, run_failure_rate, file_search, tool_call_rate, seed)
+
+    Returns:
+        Tuple aus Server und MockState (für Zähler und Inspektion)
+    """
+    state = MockState(latency=latency, **options)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = MockServer(("127.0.0.1", port), handler)
+    return server, state
+
+
+def start_in_background(port=0, latency=1.0, **options):
+    """
+    Startet den Mock-Server in einem Hintergrund-Thread.
+
+    Returns:
+        Tuple aus Server, MockState und Basis-URL für den OpenAI-Client
+    """
+    server, state = create_server(port, latency, **options)
+    threading.Thread(target=server.serve_forever, name="mock-assistants-api", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    return server, state, base_url
+
+
+def add_mock_arguments(parser):
+    """Fügt die Mock-Parameter zu einem argparse-Parser hinzu (auch für Benchmarks)."""
+    parser.add_argument("--latency", type=float, default=1.0, help="Mittlere Run-Dauer in Sekunden")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="fixed",
+                        help="Verteilung der Run-Dauer")
+    parser.add_argument("--latency-spread", type=float, default=0.0,
+                        help="Streuung: ± Sekunden (uniform) bzw. Sigma (lognormal)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Anteil HTTP-500-Antworten")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Anteil HTTP-429-Antworten")
+    parser.add_argument("--run-failure-rate", type=float, default=0.0, help="Anteil fehlschlagender Runs")
+    parser.add_argument("--no-file-search", action="store_true", help="Runs ohne file_search-Schritt")
+    parser.add_argument("--tool-call-rate", type=float, default=0.0,
+                        help="Anteil der Runs, die get_kirchenrecht_info aufrufen (requires_action)")
+    parser.add_argument("--seed", type=int, default=None, help="Zufallsstartwert für reproduzierbare Läufe")
+
+
+def mock_options_from_args(args):
+    """Übersetzt die Argumente aus add_mock_arguments in Parameter für create_server."""
+    return {
+        "latency": args.latency,
+        "latency_model": LatencyModel(args.latency, args.latency_dist, args.latency_spread, args.seed),
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "run_failure_rate": args.run_failure_rate,
+        "file_search": not args.no_file_search,
+        "tool_call_rate": args.tool_call_rate,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokaler Mock der OpenAI Assistants API")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server, _ = create_server(args.port, **mock_options_from_args(args))
+    print(f"🧪 Mock-Assistants-API läuft auf http://127.0.0.1:{args.port}/v1")
+    print(f"   OPENAI_BASE_URL=http://127.0.0.1:{args.port}/v1 OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Mock-Server beendet.")
+
+
+if __name__ == "__main__":
+    main()
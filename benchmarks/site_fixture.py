@@ -0,0 +1,190 @@
+"""
+site_fixture.py - Lokaler Stand-in-Server für kirchenrecht-ekhn.de
+
+Liefert die HTML-Seiten aus benchmarks/fixtures/kirchenrecht-ekhn/ mit der
+URL-Struktur des Fachinformationssystems aus:
+
+    /                     Übersicht mit Links auf die Dokumente
+    /document/<id>        Rechtsdokument (document/<id>.html)
+    /search?query=...     Trefferliste für die Suchbegriffe
+
+Damit lassen sich das Function-Tool get_kirchenrecht_info
+(kirchenrecht_site.py) und der Crawler (site_mirror.py) ohne Internetzugriff
+prüfen. Seiten tragen ETag und Last-Modified und werden bei passenden
+If-None-Match/If-Modified-Since-Headern mit 304 beantwortet. Der Server
+zählt die Anfragen pro Pfad und die 304-Antworten.
+
+Starten:
+    python -m benchmarks.site_fixture --port 8766
+
+Anschließend die App oder den Mock-Server mit
+    KIRCHENRECHT_SITE_URL=http://127.0.0.1:8766
+laufen lassen.
+"""
+
+import argparse
+import hashlib
+import html
+import os
+import threading
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from legal_index import analyze, html_to_text
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "kirchenrecht-ekhn")
+
+
+class SiteState:
+    """Verzeichnis der Fixture-Seiten und Zähler der Anfragen."""
+
+    def __init__(self, root=FIXTURE_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.not_modified = 0
+
+    def page_path(self, path):
+        """Datei zu einem URL-Pfad oder None, wenn es keine Seite gibt."""
+        if path in ("", "/"):
+            relative = "index.html"
+        else:
+            relative = path.strip("/") + ".html"
+        full = os.path.normpath(os.path.join(self.root, relative))
+        if not full.startswith(os.path.normpath(self.root) + os.sep) or not os.path.isfile(full):
+            return None
+        return full
+
+    def documents(self):
+        """Liefert (Pfad, Titel, Text) aller Dokumentseiten."""
+        directory = os.path.join(self.root, "document")
+        result = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".html"):
+                continue
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                text = html_to_text(f.read())
+            title = text.splitlines()[0] if text else name
+            result.append((f"/document/{name[:-5]}", title, text))
+        return result
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # wird von create_server gesetzt
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_html(self, body, status=200, headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_modified(self, etag, mtime):
+        """Prüft If-None-Match bzw. If-Modified-Since gegen den aktuellen Stand der Datei."""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        with self.state.lock:
+            self.state.requests[url.path] += 1
+        if url.path.rstrip("/") == "/search":
+            return self._search(parse_qs(url.query).get("query", [""])[0])
+        path = self.state.page_path(url.path)
+        if path is None:
+            return self._send_html("<html><body><h1>Seite nicht gefunden</h1></body></html>", 404)
+        with open(path, "rb") as f:
+            content = f.read()
+        mtime = os.path.getmtime(path)
+        validators = {
+            "ETag": '"' + hashlib.sha1(content).hexdigest() + '"',
+            "Last-Modified": formatdate(mtime, usegmt=True),
+        }
+        if self._not_modified(validators["ETag"], mtime):
+            with self.state.lock:
+                self.state.not_modified += 1
+            self.send_response(304)
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        self._send_html(content.decode("utf-8"), headers=validators)
+
+    def _search(self, query):
+        """Trefferliste: Dokumente sortiert nach der Anzahl passender Suchbegriffe."""
+        terms = set(analyze(query))
+        hits = []
+        for path, title, text in self.state.documents():
+            matched = len(terms & set(analyze(text)))
+            if matched:
+                hits.append((matched, path, title))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        items = "\n".join(
+            f'<li><a href="{path}">{html.escape(title)}</a></li>' for _, path, title in hits
+        )
+        self._send_html(
+            f"<html><body><h1>Suche: {html.escape(query)}</h1>"
+            f"<p>{len(hits)} Treffer</p><ol>{items}</ol></body></html>"
+        )
+
+
+def create_server(port=0, root=FIXTURE_DIR):
+    """
+    Erzeugt den Fixture-Server (noch nicht gestartet).
+
+    Returns:
+        Tuple aus Server und SiteState
+    """
+    state = SiteState(root)
+    handler = type("BoundSiteHandler", (SiteHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server, state
+
+
+def start_in_background(port=0, root=FIXTURE_DIR):
+    """
+    Startet den Fixture-Server in einem Hintergrund-Thread.
+
+    Returns:
+        Tuple aus Server, SiteState und Basis-URL
+    """
+    server, state = create_server(port, root)
+    threading.Thread(target=server.serve_forever, name="site-fixture", daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokaler Stand-in-Server für kirchenrecht-ekhn.de")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--root", default=FIXTURE_DIR, help="Verzeichnis mit den HTML-Seiten")
+    args = parser.parse_args()
+
+    server, _ = create_server(args.port, args.root)
+    print(f"🧪 kirchenrecht-ekhn.de-Fixture läuft auf http://127.0.0.1:{args.port}")
+    print(f"   KIRCHENRECHT_SITE_URL=http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Fixture-Server beendet.")
+
+
+if __name__ == "__main__":
+    main()
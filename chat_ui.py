@@ -0,0 +1,343 @@
+"""
+chat_ui.py - Darstellung einer Frage und ihrer Antwort in Streamlit
+
+Gemeinsamer dünner Client für app.py und app2.0.py: Die Verarbeitung selbst
+übernimmt der Frage-Antwort-Dienst (qa_service.py) im selben Prozess oder,
+wenn KIRCHENRECHT_API_URL gesetzt ist, die HTTP-API (api_client.py). Hier
+werden nur dessen Ereignisse als Statusmeldungen und gestreamte Tokens
+angezeigt und das Ergebnis gerendert.
+
+Fragen laufen als Job in der Hintergrund-Warteschlange (job_queue.py): submit()
+stellt sie ein, show_jobs() zeigt Fortschritt und Ergebnis an - auch nach einem
+Rerun, etwa weil der Nutzer währenddessen die Sidebar bedient hat.
+"""
+
+import logging
+import os
+import time
+
+import streamlit as st
+
+from citations import link_citations
+from qa_service import should_use_live_data
+from resources import get_job_queue as get_shared_job_queue, get_question_service
+
+# Adresse der HTTP-API (api_server.py); nicht gesetzt = Dienst im Streamlit-Prozess
+API_URL = os.getenv("KIRCHENRECHT_API_URL")
+
+# Anzahl der Nachrichten, die sofort angezeigt werden; ältere seitenweise auf Anforderung
+HISTORY_PAGE_SIZE = int(os.getenv("KIRCHENRECHT_HISTORY_PAGE_SIZE", "20"))
+
+# Sekunden zwischen zwei Aktualisierungen beim Anzeigen eines laufenden Jobs
+JOB_REFRESH_INTERVAL = 0.25
+
+# Statusmeldungen für echte Run-Step-Ereignisse (Tool-Typ -> Anzeige)
+TOOL_STATUS_TEXTS = {
+    "file_search": "📚 Durchsuche die Kirchenrechts-Dokumente...",
+    "function": "🔍 Rufe Live-Daten von kirchenrecht-ekhn.de ab...",
+    "code_interpreter": "🧮 Assistent wertet Daten aus...",
+}
+
+
+def get_service():
+    """Frage-Antwort-Dienst: HTTP-API, falls KIRCHENRECHT_API_URL gesetzt ist, sonst im Prozess."""
+    if API_URL:
+        from api_client import get_api_client
+
+        return get_api_client(API_URL)
+    return get_question_service()
+
+
+def get_job_queue():
+    """Hintergrund-Warteschlange des Prozesses (job_queue.py) für den Dienst aus get_service()."""
+    return get_shared_job_queue(get_service())
+
+
+def open_conversation(resume=True):
+    """
+    Setzt die Unterhaltung aus der URL (?conversation=...) fort oder beginnt eine neue.
+
+    Die ID steht danach in der URL, so dass die Unterhaltung ein Neuladen der Seite übersteht.
+    """
+    conversation_id = st.query_params.get("conversation") if resume else None
+    conversation = get_service().open_conversation(conversation_id)
+    st.query_params["conversation"] = conversation.id
+    st.session_state.history_shown = HISTORY_PAGE_SIZE
+    return conversation
+
+
+def show_history(conversation):
+    """
+    Zeigt die letzten Nachrichten der Unterhaltung; ältere erst auf Anforderung seitenweise.
+
+    Die Fragen laufender Jobs fehlen hier, sie zeigt show_jobs mit ihrem Fortschritt an.
+    """
+    shown = st.session_state.get("history_shown", HISTORY_PAGE_SIZE)
+    end = conversation.message_count()
+    queue = get_job_queue()
+    for job_id in st.session_state.get("jobs", []):
+        job = queue.get(job_id)
+        if job is None or job.conversation.id != conversation.id or job.finished or job.message_seq is None:
+            continue
+        end = min(end, job.message_seq)
+    st.session_state.history_end = end
+    hidden = end - shown
+    if hidden > 0 and st.button(f"⬆️ Ältere Nachrichten anzeigen ({hidden})", key="older_messages"):
+        st.session_state.history_shown = shown + HISTORY_PAGE_SIZE
+        st.rerun()
+    for message in conversation.page(before=end, limit=shown):
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+
+def choose_example(question):
+    """on_click der Beispielfragen: Frage vormerken, beantwortet wird sie im nächsten Durchlauf."""
+    st.session_state.example_question = question
+
+
+def pop_example():
+    """Die vorgemerkte Beispielfrage (oder None)."""
+    return st.session_state.pop("example_question", None)
+
+
+def show_sources(sources):
+    """Zeigt die aufgelösten Quellenangaben einer Antwort mit Link und Auszug."""
+    if not sources:
+        return
+    with st.expander(f"📚 Quellen ({len(sources)})"):
+        for number, source in enumerate(sources, 1):
+            label = f"[{source['label']}]({source['url']})" if source["url"] else source["label"]
+            heading = f" – {source['heading']}" if source["heading"] else ""
+            st.markdown(f"{number}. **{label}**{heading}")
+            if source["excerpt"]:
+                st.caption(source["excerpt"])
+
+
+def show_queue_position(status_placeholder, position, wait):
+    """Zeigt die Position in der Warteschlange der Ratenbegrenzung an."""
+    if position == 1:
+        text = "⏳ Hohe Auslastung - Ihre Frage ist als Nächste an der Reihe"
+        if wait:
+            text += f" (ca. {wait:.0f} s)"
+    else:
+        text = f"⏳ Hohe Auslastung - Ihre Frage ist an Position {position} der Warteschlange"
+    status_placeholder.info(text + "...")
+
+
+def poll_status_text(question, elapsed_time):
+    """Statusmeldung im Polling-Modus anhand der verstrichenen Zeit."""
+    if should_use_live_data(question):
+        if elapsed_time < 3:
+            return "🔍 Durchsuche kirchenrecht-ekhn.de..."
+        if elapsed_time < 8:
+            return "📚 Analysiere Live-Daten..."
+        return f"⏳ Live-Datenabruf läuft... ({int(elapsed_time)}s)"
+    if elapsed_time < 3:
+        return "🔍 Assistent analysiert Ihre Frage..."
+    if elapsed_time < 8:
+        return "📚 Relevante Kirchenrechts-Dokumente werden durchsucht..."
+    if elapsed_time < 15:
+        return "✍️ Assistent formuliert eine präzise Antwort..."
+    return f"⏳ Verarbeitung läuft... ({int(elapsed_time)}s) - Komplexe Anfragen können bis zu 30s dauern"
+
+
+def event_renderer(question, message_placeholder, status_placeholder):
+    """
+    Liefert den emit-Callback für den Dienst, der Ereignisse tokenweise rendert.
+
+    Statt fester Wartezeiten werden die Statusmeldungen aus den tatsächlichen
+    Run-Step-Ereignissen (z.B. gestartete file_search) abgeleitet.
+    """
+    state = {"answer": ""}
+
+    def emit(kind, value=None):
+        if kind == "assistant":
+            status_placeholder.info(f"🤖 {value} wird aktiviert...")
+        elif kind == "admission":
+            show_queue_position(status_placeholder, *value)
+        elif kind == "queued":
+            status_placeholder.info("⏳ Anfrage wartet auf freie Kapazität...")
+        elif kind == "in_progress":
+            status_placeholder.info("🔍 Assistent analysiert Ihre Frage...")
+        elif kind == "poll":
+            status_placeholder.info(poll_status_text(question, value))
+        elif kind == "tool":
+            status_placeholder.info(TOOL_STATUS_TEXTS.get(value, "🔧 Werkzeug wird ausgeführt..."))
+            logging.info(f"Run-Step gestartet: {value}")
+        elif kind == "message_created":
+            status_placeholder.info("✍️ Assistent formuliert eine präzise Antwort...")
+        elif kind == "hedge":
+            status_placeholder.info("⏱️ Hohe Auslastung - ein zweiter Assistent bearbeitet die Frage parallel...")
+        elif kind == "delta":
+            if not state["answer"]:
+                status_placeholder.empty()
+                logging.info("Erstes Token empfangen.")
+            state["answer"] += value
+            message_placeholder.markdown(state["answer"] + "▌")
+
+    return emit
+
+
+def show_error_diagnosis(error):
+    """Detaillierte Fehlerhinweise für unerwartete Fehler."""
+    with st.expander("🔧 Fehlerdiagnose"):
+        st.write("**Mögliche Ursachen:**")
+        st.write("1. **API-Key fehlt oder ist ungültig**: Überprüfen Sie die `.env`-Datei")
+        st.write("2. **Assistant ID ist falsch**: Vergewissern Sie sich, dass die Assistant ID korrekt ist")
+        st.write("3. **Keine Internetverbindung**: Prüfen Sie Ihre Netzwerkverbindung")
+        st.write("4. **API-Limits erreicht**: Überprüfen Sie Ihr OpenAI-Dashboard")
+        st.write("\n**Fehlermeldung:**")
+        st.code(error)
+
+
+def render_result(result, message_placeholder):
+    """Zeigt Antwort, Herkunft oder Fehler eines Ergebnisses des Dienstes an."""
+    status = result["status"]
+    origin = result["origin"]
+    if status == "completed":
+        message_placeholder.markdown(link_citations(result["answer"], result["sources"]))
+        if origin == "legal_index":
+            st.caption(f"📖 Wortlaut aus dem lokalen Rechtsindex ({result['lookup_ms']:.0f} ms, ohne KI-Aufruf)")
+        elif origin == "semantic_cache":
+            st.caption(
+                f"⚡ Aus dem Cache - ähnliche Frage: „{result['similar_question']}“ "
+                f"(Ähnlichkeit {result['similarity']:.0%})"
+            )
+        elif origin == "cache":
+            st.caption("⚡ Aus dem Cache - sofort beantwortet")
+        elif origin == "coalesced":
+            st.caption("🤝 Dieselbe Frage wurde gerade schon gestellt - Antwort mitgenutzt")
+        show_sources(result["sources"])
+    elif status == "rejected":
+        message_placeholder.warning(
+            "⏳ Die App ist gerade stark ausgelastet. Bitte stellen Sie Ihre Frage in einigen Minuten erneut."
+        )
+    elif status == "error":
+        message_placeholder.error(f"❌ Ein Fehler ist aufgetreten: {result['error']}")
+        show_error_diagnosis(result["error"])
+    else:
+        message_placeholder.error(f"❌ Der Assistent konnte die Anfrage nicht verarbeiten. Status: {status}")
+        if status == "failed" and result.get("error"):
+            st.error(f"Fehlerdetails: {result['error']}")
+        elif status in ("cancelling", "cancelled", "expired"):
+            st.warning("⏱️ Die Anfrage hat das Zeitlimit überschritten und wurde abgebrochen. Bitte versuchen Sie es erneut.")
+    if result["auto_routed"] and origin in ("assistant", "coalesced") and status not in ("rejected", "error"):
+        st.caption(f"🔀 Automatisch gewählt: {result['assistant']}")
+
+
+def merge_deltas(events):
+    """Fasst aufeinanderfolgende Tokens zusammen (ein Rendering statt eines je Token)."""
+    merged = []
+    for kind, value in events:
+        if kind == "delta" and merged and merged[-1][0] == "delta":
+            merged[-1] = ("delta", merged[-1][1] + value)
+        else:
+            merged.append((kind, value))
+    return merged
+
+
+def submit(conversation, question, assistant_name, standalone=False):
+    """
+    Stellt eine Frage in die Hintergrund-Warteschlange; angezeigt wird sie von show_jobs.
+
+    Mit standalone=True (Beispielfragen) gilt der Antwort-Cache auch in einer laufenden Unterhaltung.
+    """
+    job_id = get_job_queue().submit(conversation, question, assistant_name, standalone=standalone)
+    st.session_state.setdefault("jobs", []).append(job_id)
+
+
+def show_queued(status_placeholder, position):
+    """Zeigt die Position in der Warteschlange der Unterhaltung an."""
+    if position == 1:
+        status_placeholder.info("📥 Ihre Frage wird beantwortet, sobald die vorherige fertig ist...")
+    else:
+        status_placeholder.info(f"📥 Ihre Frage ist an Position {position} der Warteschlange dieser Unterhaltung...")
+
+
+def follow_job(queue, job, message_placeholder, status_placeholder, queued=()):
+    """
+    Rendert die bisherigen und neuen Ereignisse eines Jobs, bis er beendet ist.
+
+    Die Zeitanzeige wird laufend aktualisiert: Nur bei einem Streamlit-Aufruf kann ein
+    Rerun (Klick in der Sidebar) das Skript unterbrechen - der Job läuft dann weiter.
+
+    queued enthält die danach angezeigten Jobs als (Job, Status-Platzhalter); ihre
+    Position wird mit aktualisiert, damit sie nicht als verwaist abgebrochen werden.
+    """
+    render = event_renderer(job.question, message_placeholder, status_placeholder)
+    elapsed_placeholder = st.empty()
+    positions = {}
+    seen = 0
+    while True:
+        for other, placeholder in [(job, status_placeholder), *queued]:
+            position = queue.position(other)
+            if position and position != positions.get(other.id):
+                show_queued(placeholder, position)
+            positions[other.id] = position
+        events, finished = job.wait(seen, JOB_REFRESH_INTERVAL)
+        seen += len(events)
+        for kind, value in merge_deltas(events):
+            render(kind, value)
+        if finished:
+            break
+        elapsed_placeholder.caption(f"⏱️ {time.time() - job.created_at:.0f} s")
+    elapsed_placeholder.empty()
+    status_placeholder.empty()
+    if job.status == "busy":
+        message_placeholder.warning("⏳ Ihre vorherige Frage wird noch beantwortet. Bitte einen Moment Geduld.")
+    elif job.status == "error":
+        # Dienst nicht erreichbar (HTTP-API) oder Konfigurationsfehler
+        message_placeholder.error(f"❌ Ein Fehler ist aufgetreten: {job.error}")
+        show_error_diagnosis(job.error)
+    elif job.status == "cancelled":
+        message_placeholder.warning("⏹️ Die Frage wurde abgebrochen. Bitte stellen Sie sie erneut.")
+    else:
+        render_result(job.result, message_placeholder)
+
+
+def show_jobs(conversation, container):
+    """
+    Zeigt die Jobs dieser Sitzung mit Fortschritt an und wartet, bis sie beendet sind.
+
+    Am Ende des Skripts aufrufen (die Sidebar ist dann schon bedienbar); angezeigt
+    wird in container, z.B. direkt unter dem Eingabefeld.
+
+    Returns:
+        Liste der in diesem Durchlauf beendeten Jobs
+    """
+    queue = get_job_queue()
+    history_end = st.session_state.get("history_end", 0)
+    job_ids = st.session_state.get("jobs", [])
+    pending = []
+    with container:
+        for job_id in list(job_ids):
+            job = queue.get(job_id)
+            if job is None or job.conversation.id != conversation.id:
+                # Nach einem Neustart des Prozesses oder in einer anderen Unterhaltung gestellt
+                job_ids.remove(job_id)
+                continue
+            in_history = job.message_seq is not None and job.message_seq < history_end
+            if in_history and job.finished and job.status == "done" and job.result["status"] == "completed":
+                # Frage und Antwort stehen bereits im Verlauf
+                job_ids.remove(job_id)
+                continue
+            if not in_history:
+                with st.chat_message("user"):
+                    st.markdown(job.question)
+            assistant_message = st.chat_message("assistant")
+            with assistant_message:
+                message_placeholder = st.empty()
+                status_placeholder = st.empty()
+            position = queue.position(job)
+            if position:
+                show_queued(status_placeholder, position)
+            pending.append((job, assistant_message, message_placeholder, status_placeholder))
+
+    finished = []
+    for i, (job, assistant_message, message_placeholder, status_placeholder) in enumerate(pending):
+        queued = [(later[0], later[3]) for later in pending[i + 1:]]
+        with assistant_message:
+            follow_job(queue, job, message_placeholder, status_placeholder, queued)
+        job_ids.remove(job.id)
+        finished.append(job)
+    return finished
@@ -0,0 +1,308 @@
+"""
+citations.py - Quellenangaben einer Antwort auflösen
+
+Antworten des Assistants enthalten zwei Arten von Quellenangaben:
+
+- file_citation-Annotationen von file_search: Markierungen wie „【4:0†KGO.pdf】“
+  im Text, die auf eine Datei im Vector Store (file_id) verweisen
+- Paragraphen-Zitate im Text: "§ 13 Abs. 2 KGO", "KGO § 13", "Art. 5 KO"
+
+Bisher gingen beide verloren (app.py suchte ein "sources"-Feld, das es im
+SDK-Objekt nicht gibt). Dieses Modul löst sie gegen einen vorab berechneten
+Zitatindex auf (citation_index.json):
+
+- file_id -> Gesetz (aus dem Manifest von vector_store_sync.py und dem
+  Rechtsindex, legal_index.py)
+- Gesetz -> Titel, Link und Paragraphen mit Überschrift und Auszug je Absatz
+
+Die Auflösung besteht nur aus Dictionary-Zugriffen - ohne API-Aufruf und
+ohne Datenbankabfrage, auch bei Antworten mit Dutzenden Zitaten. Zitate ohne
+Gesetzesangabe ("nach § 13 Abs. 2") erhalten das Gesetz der file_citation
+in derselben Zeile.
+
+Der Index wird bei Bedarf automatisch neu berechnet (resources.get_citation_index),
+lässt sich aber auch von Hand aufbauen:
+    python citations.py build
+    python citations.py resolve "Nach § 13 Abs. 2 KGO beträgt die Amtszeit sechs Jahre."
+"""
+
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from urllib.parse import quote
+
+from legal_index import DEFAULT_INDEX_PATH, LegalIndex, normalize, parse_citations
+
+# Pfad des Zitatindex (über Umgebungsvariable anpassbar)
+DEFAULT_CITATION_INDEX = os.getenv("KIRCHENRECHT_CITATION_INDEX", "citation_index.json")
+
+# Basis-URL, unter der die Dateien des lokalen Korpus erreichbar sind (z.B. interner Dateiserver).
+# Ohne Angabe werden nur gespiegelte Seiten von kirchenrecht-ekhn.de verlinkt.
+CORPUS_URL = os.getenv("KIRCHENRECHT_CORPUS_URL")
+
+# Länge des Auszugs je Absatz im Index
+EXCERPT_CHARS = 300
+
+# Markierung einer file_citation im Antworttext, z.B. „【4:0†KGO.pdf】“
+MARKER_RE = re.compile(r"[ \t]?【[^】]*】")
+
+
+def excerpt(text, limit=EXCERPT_CHARS):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def document_url(source, corpus_url=CORPUS_URL):
+    """Link auf ein Dokument: gespiegelte Seiten direkt, Korpusdateien über CORPUS_URL."""
+    if "://" in source:
+        return source
+    if corpus_url:
+        return f"{corpus_url.rstrip('/')}/{quote(source.replace(os.sep, '/'))}"
+    return None
+
+
+def build_index(legal_index, manifest=None, corpus_url=CORPUS_URL):
+    """
+    Berechnet den Zitatindex aus dem Rechtsindex und dem Vector-Store-Manifest.
+
+    Returns:
+        Dict mit "laws" (Gesetz -> "law", "title", "url", "paragraphs") und
+        "files" (file_id -> Gesetz), Schlüssel der Gesetze normalisiert
+    """
+    laws, source_laws = {}, {}
+    for unit in legal_index.units():
+        source = unit["source"].replace(os.sep, "/")
+        source_laws[source] = unit["law_key"]
+        law = laws.get(unit["law_key"])
+        url = document_url(source, corpus_url)
+        if law is None:
+            law = laws[unit["law_key"]] = {
+                "law": unit["law"], "title": unit["law_title"], "url": url, "paragraphs": {}
+            }
+        elif url and not law["url"]:
+            law["url"] = url
+        paragraph = law["paragraphs"].setdefault(
+            unit["paragraph"], {"marker": unit["marker"], "heading": unit["heading"], "absaetze": {}}
+        )
+        paragraph["absaetze"].setdefault(unit["absatz"] or "", excerpt(unit["text"]))
+
+    files = {}
+    for source, entry in (manifest or {}).get("files", {}).items():
+        law_key = source_laws.get(source)
+        if law_key and entry.get("file_id"):
+            files[entry["file_id"]] = law_key
+    return {"built_at": time.time(), "laws": laws, "files": files}
+
+
+def save_index(index, path=DEFAULT_CITATION_INDEX):
+    """Schreibt den Index atomar (temporäre Datei + os.replace)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".citations-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def cited_files(result, citation_index):
+    """
+    Dateien des Vector Stores, auf die sich eine Antwort stützt.
+
+    file_citations der Antwort sowie alle Dateien der zitierten Gesetze.
+
+    Args:
+        result: Ergebnis-Dict mit "annotations" und "sources" (qa_service.QuestionService.answer)
+        citation_index: Zitatindex (build_index) oder None
+
+    Returns:
+        Sortierte Liste von file_ids
+    """
+    file_ids = {annotation["file_id"] for annotation in result.get("annotations", [])}
+    if citation_index:
+        laws = {normalize(source["law"]) for source in result.get("sources", []) if source["law"]}
+        file_ids |= {file_id for file_id, law in citation_index["files"].items() if law in laws}
+    return sorted(file_ids)
+
+
+def strip_markers(text):
+    """Entfernt die file_citation-Markierungen („【4:0†KGO.pdf】“) aus einer Antwort."""
+    return MARKER_RE.sub("", text)
+
+
+def _label(marker, paragraph, absatz, law):
+    absatz_text = f" Abs. {absatz}" if absatz else ""
+    return f"{marker} {paragraph}{absatz_text} {law}".strip()
+
+
+def _written_law(citation, known_laws):
+    """Gesetzesangabe eines Zitats (None, wenn das folgende Wort kein Gesetz ist)."""
+    written_law = citation["law"]
+    if written_law and normalize(written_law) not in known_laws and sum(char.isupper() for char in written_law) < 2:
+        # "§ 12 Die Amtszeit ..." - das folgende Wort ist kein Gesetz
+        return None
+    return written_law
+
+
+def resolve_sources(answer, annotations=(), index=None):
+    """
+    Löst die Quellenangaben einer Antwort auf.
+
+    Args:
+        answer: Antworttext (mit den Markierungen der Annotationen)
+        annotations: file_citation-Annotationen (qa_service.message_sources)
+        index: Zitatindex (build_index) oder None - dann nur die Zitate aus dem Text ohne Links
+
+    Returns:
+        Liste von Dicts mit "label", "law", "title", "paragraph", "absatz", "heading",
+        "excerpt", "url" und "file_ids" in der Reihenfolge der ersten Nennung
+    """
+    laws = index["laws"] if index else {}
+    files = index["files"] if index else {}
+
+    # file_citations: Gesetz je Datei und Zeile des Antworttextes
+    cited = []
+    for annotation in annotations:
+        law_key = files.get(annotation["file_id"])
+        start = annotation.get("start_index")
+        if start is None:
+            start = answer.find(annotation["marker"])
+        cited.append((law_key, annotation["file_id"], start))
+    cited_laws = {law_key for law_key, _, _ in cited if law_key}
+
+    sources = {}
+
+    def add(key, **fields):
+        return sources.setdefault(key, dict(fields, file_ids=[]))
+
+    for citation in parse_citations(answer):
+        written_law = _written_law(citation, laws)
+        law_key = normalize(written_law) if written_law else None
+        if law_key not in laws:
+            # Ohne (bekannte) Gesetzesangabe: Gesetz der file_citation in derselben Zeile
+            start, end = citation["span"]
+            line_end = answer.find("\n", end)
+            line_end = len(answer) if line_end == -1 else line_end
+            nearby = [key for key, _, position in cited if key and start <= position <= line_end]
+            if not written_law and nearby:
+                law_key = nearby[0]
+            elif not written_law and len(cited_laws) == 1:
+                law_key = next(iter(cited_laws))
+            elif not written_law:
+                continue
+        law = laws.get(law_key)
+        paragraph = law["paragraphs"].get(citation["paragraph"]) if law else None
+        absatz = citation["absatz"]
+        absaetze = paragraph["absaetze"] if paragraph else {}
+        marker = paragraph["marker"] if paragraph else "§"
+        law_name = law["law"] if law else written_law
+        url = None
+        if law and law["url"]:
+            # Textfragment springt im Browser direkt zum Paragraphen
+            fragment = quote(f"{marker} {citation['paragraph']}")
+            url = f"{law['url']}#:~:text={fragment}"
+        add(
+            (law_key or written_law, citation["paragraph"], absatz),
+            label=_label(marker, citation["paragraph"], absatz, law_name),
+            law=law_name,
+            title=law["title"] if law else None,
+            paragraph=citation["paragraph"],
+            absatz=absatz,
+            heading=paragraph["heading"] if paragraph else None,
+            excerpt=absaetze.get(absatz or "") or next(iter(absaetze.values()), None),
+            url=url,
+        )
+
+    # Zitierte Dateien ohne Paragraphen-Zitat als Quelle des ganzen Gesetzes
+    # (Dateien, die der Index nicht kennt, bleiben nur in den Annotationen)
+    for law_key, file_id, _ in cited:
+        if law_key is None:
+            continue
+        matching = [source for key, source in sources.items() if key[0] == law_key]
+        if not matching:
+            law = laws[law_key]
+            matching = [add(
+                (law_key, None, None),
+                label=law["title"],
+                law=law["law"],
+                title=law["title"],
+                paragraph=None,
+                absatz=None,
+                heading=None,
+                excerpt=None,
+                url=law["url"],
+            )]
+        for source in matching:
+            if file_id not in source["file_ids"]:
+                source["file_ids"].append(file_id)
+    return list(sources.values())
+
+
+def link_citations(answer, sources):
+    """
+    Macht die Paragraphen-Zitate einer Antwort zu Markdown-Links auf ihre Quelle.
+
+    Nennt ein Zitat ein Gesetz, wird nur eine Quelle dieses Gesetzes verlinkt
+    (§ 5 KGO und § 5 KDO sind verschiedene Paragraphen); nur Zitate ohne
+    Gesetzesangabe erhalten die erste Quelle mit passendem Paragraphen.
+    """
+    urls = {}
+    for source in sources:
+        if source["url"] and source["paragraph"]:
+            law = normalize(source["law"]) if source["law"] else None
+            for key in [law, None]:
+                urls.setdefault((key, source["paragraph"], source["absatz"]), source["url"])
+                urls.setdefault((key, source["paragraph"], None), source["url"])
+    if not urls:
+        return answer
+    known_laws = {law for law, _, _ in urls if law}
+    parts, position = [], 0
+    for citation in parse_citations(answer):
+        written_law = _written_law(citation, known_laws)
+        law = normalize(written_law) if written_law else None
+        url = urls.get((law, citation["paragraph"], citation["absatz"]))
+        start, end = citation["span"]
+        if url is None or start < position:
+            continue
+        text = answer[start:end]
+        parts.append(answer[position:start])
+        parts.append(f"[{text}]({url})")
+        position = end
+    parts.append(answer[position:])
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zitatindex der Kirchenrechts-App")
+    parser.add_argument("--index", default=DEFAULT_CITATION_INDEX, help="Pfad des Zitatindex")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Index aus Rechtsindex und Vector-Store-Manifest berechnen")
+    build_parser.add_argument("--db", default=DEFAULT_INDEX_PATH, help="Pfad des Rechtsindex")
+    build_parser.add_argument("--manifest", default=None, help="Manifest von vector_store_sync.py")
+    resolve_parser = subparsers.add_parser("resolve", help="Quellenangaben eines Textes auflösen")
+    resolve_parser.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from vector_store_sync import DEFAULT_MANIFEST, load_manifest
+
+        index = build_index(LegalIndex(args.db), load_manifest(args.manifest or DEFAULT_MANIFEST))
+        save_index(index, args.index)
+        paragraphs = sum(len(law["paragraphs"]) for law in index["laws"].values())
+        print(f"✅ {len(index['laws'])} Gesetze, {paragraphs} Paragraphen, {len(index['files'])} Dateien")
+    else:
+        with open(args.index, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        for source in resolve_sources(args.text, index=index):
+            print(f"{source['label']}: {source['heading'] or ''} {source['url'] or ''}".rstrip())
+            if source["excerpt"]:
+                print(f"    {source['excerpt']}")
+
+
+if __name__ == "__main__":
+    main()
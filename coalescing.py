@@ -0,0 +1,268 @@
+"""
+coalescing.py - Zusammenlegen gleichzeitiger identischer Fragen (Single-Flight)
+
+Verweist z.B. ein Gemeindebrief auf die App, stellen Dutzende Nutzer binnen
+Sekunden dieselbe Frage. Bisher startete jede Sitzung einen eigenen Thread und
+Run. Mit Single-Flight übernimmt die erste Anfrage (Leader) den Run; weitere
+identische Anfragen (Follower) hängen sich an und erhalten dieselben
+gestreamten Ereignisse und dasselbe Ergebnis - ohne eigene API-Aufrufe.
+
+Schlüssel ist wie beim Antwort-Cache die Assistant-ID mit der normalisierten
+Frage (answer_cache.cache_key). Zusammengelegt werden nur eigenständige Fragen
+ohne Vorgeschichte, da nur deren Antworten für alle Sitzungen gleich sind.
+
+- Flight: Register laufender Runs innerhalb eines Prozesses (alle
+  Streamlit-Sitzungen teilen sich die Engine aus async_engine.py)
+- FlightFiles: optional über Prozessgrenzen hinweg. Der Leader legt im
+  Verzeichnis KIRCHENRECHT_COALESCE_DIR eine Sperrdatei an und schreibt die
+  Ereignisse zeilenweise (JSON) in eine Ereignisdatei, die Follower anderer
+  Prozesse mitlesen. Die Sperrdatei entsteht atomar per os.link, sodass
+  immer genau ein Prozess Leader wird.
+"""
+
+import concurrent.futures
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+# Verzeichnis für prozessübergreifendes Zusammenlegen (nicht gesetzt = nur innerhalb des Prozesses)
+COALESCE_DIR = os.getenv("KIRCHENRECHT_COALESCE_DIR")
+
+# Nach so vielen Sekunden gilt ein Leader als abgestürzt und seine Sperre als verwaist
+FLIGHT_TIMEOUT = float(os.getenv("KIRCHENRECHT_COALESCE_TIMEOUT", "240"))
+
+# Ereignisdateien beendeter Runs werden nach dieser Zeit entfernt
+FLIGHT_FILE_TTL = 600
+
+# Polling-Intervall der Follower beim Mitlesen der Ereignisdatei
+FOLLOW_INTERVAL = 0.05
+
+# Interne Ereignisse, die nicht an Follower weitergegeben werden
+PRIVATE_EVENTS = {"run_created"}
+
+
+class Flight:
+    """
+    Ein laufender Run mit seinen Abonnenten.
+
+    Alle Ereignisse werden gepuffert, damit spät hinzukommende Follower den
+    bisherigen Verlauf (z.B. bereits gestreamte Tokens) nachgeliefert bekommen.
+    """
+
+    def __init__(self, key, registry):
+        self.key = key
+        self._registry = registry
+        self.events = []
+        self.handles = []
+        self.sinks = []
+        # IDs der Runs dieses Flights (für FlightRegistry.shared)
+        self.run_ids = set()
+        # Ergebnis des Leaders (concurrent.futures.Future), auf das die Follower warten
+        self.outcome = concurrent.futures.Future()
+
+    def publish(self, kind, value=None):
+        """Gibt ein Ereignis des Leaders an alle Abonnenten weiter."""
+        with self._registry.lock:
+            if kind == "run_created":
+                self.run_ids.add(value[1])
+            if kind not in PRIVATE_EVENTS:
+                self.events.append((kind, value))
+            for handle, is_leader in self.handles:
+                if is_leader or kind not in PRIVATE_EVENTS:
+                    handle.emit(kind, value)
+        for sink in self.sinks:
+            sink(kind, value)
+
+
+class FlightRegistry:
+    """Register der laufenden Runs eines Prozesses (thread-sicher)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._flights = {}
+        self.joined = 0
+
+    def join_or_lead(self, key, handle):
+        """
+        Meldet eine Anfrage an.
+
+        Returns:
+            Tuple aus Flight und True, wenn die Anfrage der Leader ist (sonst Follower,
+            dem die bisherigen Ereignisse bereits zugestellt wurden)
+        """
+        with self.lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                for kind, value in flight.events:
+                    handle.emit(kind, value)
+                flight.handles.append((handle, False))
+                self.joined += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key, self)
+            flight.handles.append((handle, True))
+            return flight, True
+
+    def land(self, flight):
+        """
+        Meldet den Run ab; danach hinzukommende Anfragen starten einen neuen Run.
+
+        Returns:
+            Die Handles der Follower
+        """
+        with self.lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            return [handle for handle, is_leader in flight.handles if not is_leader]
+
+    def shared(self, run_id):
+        """Prüft, ob ein laufender Run noch weiteren Anfragen (Followern) die Antwort liefert."""
+        with self.lock:
+            return any(
+                run_id in flight.run_ids and len(flight.handles) > 1 for flight in self._flights.values()
+            )
+
+    def in_flight(self):
+        with self.lock:
+            return len(self._flights)
+
+
+def follower_result(result):
+    """Ergebnis für Follower: ohne den Thread des Leaders, ohne Hedging- und Phasenangaben."""
+    shared = {key: value for key, value in result.items() if key not in ("hedge", "timings")}
+    shared.update(thread_id=None, rebuilt=False, coalesced=True, timings={})
+    return shared
+
+
+class FlightWriter:
+    """Schreibt die Ereignisse eines Leaders für Follower anderer Prozesse mit."""
+
+    def __init__(self, lock_path, events_path):
+        self.lock_path = lock_path
+        self.events_path = events_path
+        self._file = open(events_path, "a", encoding="utf-8")
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def event(self, kind, value=None):
+        if kind not in PRIVATE_EVENTS:
+            self._write({"event": kind, "value": value})
+
+    def finish(self, result=None, error=None):
+        """Schreibt das Ergebnis (oder den Fehler) und gibt die Sperre frei."""
+        try:
+            if error is not None:
+                self._write({"done": True, "error": str(error)})
+            else:
+                message = result.get("message")
+                self._write({"done": True, "answer": result["answer"], "run": result["run"].model_dump(mode="json"),
+                             "message": message.model_dump(mode="json") if message is not None else None})
+        finally:
+            self._file.close()
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+
+
+class FlightReader:
+    """Liest die Ereignisse eines Leaders aus einem anderen Prozess mit."""
+
+    def __init__(self, lock_path, events_path):
+        self.lock_path = lock_path
+        self.events_path = events_path
+        self._offset = 0
+        self._buffer = b""
+
+    def read(self):
+        """
+        Liefert die seit dem letzten Aufruf geschriebenen, vollständigen Einträge.
+
+        Returns:
+            Liste von Dicts (leer, solange nichts Neues vorliegt)
+        """
+        try:
+            with open(self.events_path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return []
+        self._offset += len(chunk)
+        # Nur vollständige Zeilen auswerten; der Rest wird beim nächsten Aufruf ergänzt
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def leader_alive(self):
+        """Prüft, ob die Sperre des Leaders noch besteht."""
+        return os.path.exists(self.lock_path)
+
+
+class FlightFiles:
+    """Sperr- und Ereignisdateien für das prozessübergreifende Zusammenlegen."""
+
+    def __init__(self, directory=COALESCE_DIR, timeout=FLIGHT_TIMEOUT):
+        self.directory = directory
+        self.timeout = timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _lock_path(self, key):
+        return os.path.join(self.directory, f"{key}.lock")
+
+    def _read_lock(self, lock_path):
+        try:
+            with open(lock_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _cleanup(self):
+        """Entfernt Ereignisdateien beendeter Runs."""
+        cutoff = time.time() - FLIGHT_FILE_TTL
+        for path in glob.glob(os.path.join(self.directory, "*.jsonl")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def claim(self, key):
+        """
+        Wird Leader für key oder liest bei einem bestehenden Leader mit.
+
+        Returns:
+            FlightWriter (Leader) oder FlightReader (Follower)
+        """
+        lock_path = self._lock_path(key)
+        for _ in range(3):
+            flight_id = uuid.uuid4().hex
+            lock = {"flight": flight_id, "pid": os.getpid(), "started": time.time()}
+            fd, temp_path = tempfile.mkstemp(prefix=".flight-", dir=self.directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(lock, f)
+            try:
+                # Atomar: scheitert, wenn bereits ein Leader die Sperre hält
+                os.link(temp_path, lock_path)
+            except FileExistsError:
+                existing = self._read_lock(lock_path)
+                if existing is None:
+                    # Gerade freigegeben: erneut versuchen
+                    continue
+                if time.time() - existing["started"] <= self.timeout:
+                    return FlightReader(lock_path, os.path.join(self.directory, f"{key}-{existing['flight']}.jsonl"))
+                logging.warning(f"Verwaiste Sperre für {key[:12]} wird entfernt.")
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            finally:
+                os.remove(temp_path)
+            self._cleanup()
+            return FlightWriter(lock_path, os.path.join(self.directory, f"{key}-{flight_id}.jsonl"))
+        raise RuntimeError(f"Sperre für {key[:12]} konnte nicht erlangt werden")
@@ -0,0 +1,287 @@
+"""
+conversation.py - Hilfsfunktionen für persistente Konversations-Threads
+
+Früher wurde bei jeder Frage ein neuer Thread erstellt und die gesamte
+Chat-Historie als JSON-Text mitgeschickt. Dadurch wuchsen Prompt-Tokens,
+Kosten und Latenz quadratisch mit der Länge der Unterhaltung.
+
+Dieses Modul enthält die (Streamlit-unabhängigen) Bausteine für den
+Konversationsmodus mit Thread-Wiederverwendung sowie einen Token-Vergleich
+zwischen altem und neuem Verhalten.
+
+Begrenztes Gedächtnis: Auch im Thread liest das Modell bei jeder Frage die
+gesamte bisherige Unterhaltung. Deshalb gehen nur die letzten RECENT_TURNS
+Runden wörtlich in den Kontext (truncation_strategy "last_messages"); ältere
+Runden werden nach jeder Antwort im Hintergrund zu einer fortlaufenden
+Zusammenfassung verdichtet, die per additional_instructions mitgeht. Das
+Token-Budget je Modell steht als "context_budget" in assistant_config.json.
+
+Token-Vergleich anzeigen:
+    python conversation.py
+"""
+
+import json
+import os
+
+# Geschätzter Overhead pro Thread-Nachricht (Rolle, Trennzeichen)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Maximale Anzahl Nachrichten, die beim Anlegen eines Threads mitgegeben werden
+# können (Limit der Assistants API für threads.create)
+THREAD_SEED_LIMIT = 32
+
+# Anzahl der letzten Runden (Frage + Antwort), die wörtlich im Kontext bleiben
+RECENT_TURNS = int(os.getenv("KIRCHENRECHT_RECENT_TURNS", "4"))
+
+# Token-Budget für Zusammenfassung und Verlauf je Anfrage, falls der Assistant keines festlegt
+DEFAULT_CONTEXT_BUDGET = 6_000
+
+# Modell und Länge der fortlaufenden Zusammenfassung
+SUMMARY_MODEL = os.getenv("KIRCHENRECHT_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 400
+
+SUMMARY_PROMPT = (
+    "Du fasst eine Unterhaltung über evangelisches Kirchenrecht (EKHN) für den weiteren "
+    "Gesprächsverlauf zusammen. Aktualisiere die bisherige Zusammenfassung um die neuen Beiträge. "
+    "Behalte die Fragen der Nutzerin bzw. des Nutzers, die Kernaussagen der Antworten und alle "
+    "genannten Fundstellen (z.B. § 12 Abs. 1 KGO) bei. Höchstens 200 Wörter, ohne Einleitung."
+)
+
+
+def estimate_tokens(text):
+    """
+    Schätzt die Anzahl Tokens eines Textes.
+
+    Nutzt tiktoken, falls installiert, sonst die Faustregel ~4 Zeichen pro Token.
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return len(encoding.encode(text))
+    except Exception:
+        return max(1, (len(text) + 3) // 4)
+
+
+def message_tokens(message):
+    """
+    Tokens einer Nachricht inkl. Overhead.
+
+    Das Ergebnis wird in der Nachricht unter "tokens" zwischengespeichert, damit
+    lange Unterhaltungen nicht bei jeder Frage erneut gezählt werden.
+    """
+    if "tokens" not in message:
+        message["tokens"] = estimate_tokens(message["content"] or "") + MESSAGE_OVERHEAD_TOKENS
+    return message["tokens"]
+
+
+def context_budget(assistant_config):
+    """Token-Budget für Zusammenfassung und Verlauf aus der Assistant-Konfiguration."""
+    return int((assistant_config or {}).get("context_budget") or DEFAULT_CONTEXT_BUDGET)
+
+
+def summary_instructions(summary):
+    """Zusätzliche Anweisungen für den Run mit der Zusammenfassung älterer Runden (oder None)."""
+    if not summary:
+        return None
+    return "Zusammenfassung des früheren Gesprächsverlaufs (nicht mehr wörtlich enthalten):\n" + summary
+
+
+def context_window(history, summarized_count=0, summary=None, budget=DEFAULT_CONTEXT_BUDGET):
+    """
+    Wählt die Nachrichten, die wörtlich in den Kontext eines Runs gehen.
+
+    Alles ab summarized_count (noch nicht zusammengefasst) bleibt erhalten, solange
+    es mit der Zusammenfassung ins Budget passt; sonst fallen die ältesten
+    Nachrichten weg. Die neue Frage (letzter Eintrag) bleibt immer enthalten.
+
+    Args:
+        history: Session-Historie inkl. der neuen Frage als letztem Eintrag
+        summarized_count: Anzahl der Nachrichten, die die Zusammenfassung abdeckt
+        summary: Fortlaufende Zusammenfassung oder None
+        budget: Token-Budget (context_budget)
+
+    Returns:
+        Index der ersten wörtlich übernommenen Nachricht in history
+    """
+    used = estimate_tokens(summary) if summary else 0
+    start = len(history)
+    while start > 0:
+        candidate = start - 1
+        if candidate < summarized_count:
+            break
+        tokens = message_tokens(history[candidate])
+        if start < len(history) and used + tokens > budget:
+            break
+        used += tokens
+        start = candidate
+    # Nicht mit einer Antwort ohne die zugehörige Frage beginnen
+    while start < len(history) - 1 and history[start]["role"] != "user":
+        start += 1
+    return start
+
+
+def truncation_strategy(window):
+    """
+    truncation_strategy für einen Run, der nur die Nachrichten aus window liest.
+
+    Args:
+        window: Wörtlich zu berücksichtigende Nachrichten inkl. der neuen Frage
+    """
+    count = sum(1 for message in window if message["role"] in ("user", "assistant") and message["content"])
+    return {"type": "last_messages", "last_messages": max(1, count)}
+
+
+def summary_due(history, summarized_count, recent_turns=RECENT_TURNS):
+    """
+    Prüft nach einer Antwort, ob ältere Runden zusammengefasst werden sollten.
+
+    Returns:
+        Index, bis zu dem die Zusammenfassung reichen soll, oder None
+    """
+    questions = [index for index, message in enumerate(history) if message["role"] == "user"]
+    if len(questions) <= recent_turns:
+        return None
+    end = questions[-recent_turns]
+    return end if end > summarized_count else None
+
+
+def summarize(client, summary, messages, model=SUMMARY_MODEL):
+    """
+    Verdichtet die bisherige Zusammenfassung und neue Nachrichten zu einer neuen Zusammenfassung.
+
+    Args:
+        client: OpenAI-Client (synchron)
+        summary: Bisherige Zusammenfassung oder None
+        messages: Neu zusammenzufassende Nachrichten ({"role", "content"})
+
+    Returns:
+        Die neue Zusammenfassung
+    """
+    labels = {"user": "Frage", "assistant": "Antwort"}
+    transcript = "\n\n".join(
+        f"{labels.get(message['role'], message['role'])}: {message['content']}"
+        for message in messages if message["content"]
+    )
+    response = client.chat.completions.create(
+        model=model,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        temperature=0,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Bisherige Zusammenfassung:\n{summary or '(keine)'}\n\n"
+                                        f"Neue Beiträge:\n{transcript}"},
+        ]
+    )
+    return response.choices[0].message.content.strip()
+
+
+def legacy_payload(history):
+    """Nutzlast des alten Verhaltens: die gesamte Historie als JSON-Text."""
+    return json.dumps(history)
+
+
+def thread_seed_messages(history):
+    """
+    Wandelt die Session-Historie in Thread-Nachrichten für threads.create um.
+
+    Returns:
+        Tuple aus den Nachrichten für threads.create (höchstens THREAD_SEED_LIMIT)
+        und den übrigen Nachrichten, die einzeln nachgereicht werden müssen
+    """
+    messages = [
+        {"role": message["role"], "content": message["content"]}
+        for message in history
+        if message["role"] in ("user", "assistant") and message["content"]
+    ]
+    return messages[:THREAD_SEED_LIMIT], messages[THREAD_SEED_LIMIT:]
+
+
+def needs_rebuild(thread_id, thread_assistant_id, synced_count, assistant_id, history_length):
+    """
+    Entscheidet, ob der Thread der Sitzung aus der Historie neu aufgebaut werden muss.
+
+    Ein Neuaufbau ist nötig, wenn noch kein Thread existiert, der Assistant
+    gewechselt wurde oder Thread und Session-Historie auseinanderlaufen
+    (z.B. nach einem fehlgeschlagenen Run oder einer Beispielfrage).
+    """
+    if not thread_id:
+        return True
+    if thread_assistant_id != assistant_id:
+        return True
+    return synced_count != history_length
+
+
+def compare_token_usage(history):
+    """
+    Vergleicht die Tokens pro Runde: alt (JSON-Historie) vs. neu (Thread).
+
+    "legacy" ist die alte Nutzlast, die zugleich gesendet und vom Modell gelesen
+    wurde. "incremental" ist, was im Thread-Modus gesendet wird (nur die neue
+    Frage), "thread_context" der Kontext, den das Modell serverseitig liest.
+    "bounded" ist dieser Kontext mit begrenztem Gedächtnis (letzte RECENT_TURNS
+    Runden plus Zusammenfassung, deren Länge mit SUMMARY_MAX_TOKENS angesetzt wird).
+
+    Args:
+        history: Liste von {"role", "content"}-Dicts einer Unterhaltung
+
+    Returns:
+        Liste von Dicts mit "turn", "legacy", "incremental", "thread_context" und "bounded"
+    """
+    rows = []
+    turn = 0
+    for index, message in enumerate(history):
+        if message["role"] != "user":
+            continue
+        turn += 1
+        current = history[:index + 1]
+        summarized_count = summary_due(history[:index], 0) or 0
+        summary_tokens = SUMMARY_MAX_TOKENS if summarized_count else 0
+        start = context_window(current, summarized_count, budget=DEFAULT_CONTEXT_BUDGET - summary_tokens)
+        rows.append({
+            "turn": turn,
+            "legacy": estimate_tokens(legacy_payload(history[:index + 1])),
+            "incremental": estimate_tokens(message["content"]),
+            "thread_context": sum(
+                estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS
+                for m in history[:index + 1]
+            ),
+            "bounded": summary_tokens + sum(message_tokens(m) for m in current[start:]),
+        })
+    return rows
+
+
+def _demo_history(turns=10):
+    """Erzeugt eine typische Beispiel-Unterhaltung für den Token-Vergleich."""
+    history = []
+    for turn in range(1, turns + 1):
+        history.append({
+            "role": "user",
+            "content": f"Frage {turn}: Welche Voraussetzungen gelten nach der KGO für die Wahl zum Kirchenvorstand?"
+        })
+        history.append({
+            "role": "assistant",
+            "content": "Nach § 12 Abs. 1 KGO sind wählbar alle Gemeindemitglieder, die ... " * 20
+        })
+    return history
+
+
+def main():
+    rows = compare_token_usage(_demo_history(20))
+    print(f"{'Runde':>5} | {'Alt (JSON)':>10} | {'Neu gesendet':>12} | {'Neu Kontext':>11} | {'Begrenzt':>8}")
+    print("-" * 59)
+    for row in rows:
+        print(f"{row['turn']:>5} | {row['legacy']:>10} | {row['incremental']:>12} | {row['thread_context']:>11} | "
+              f"{row['bounded']:>8}")
+    totals = {key: sum(row[key] for row in rows) for key in ("legacy", "incremental", "thread_context", "bounded")}
+    print("-" * 59)
+    print(f"{'Summe':>5} | {totals['legacy']:>10} | {totals['incremental']:>12} | {totals['thread_context']:>11} | "
+          f"{totals['bounded']:>8}")
+    print(f"\n📤 Ersparnis gesendeter Tokens: {100 * (1 - totals['incremental'] / totals['legacy']):.1f}%")
+    print(f"🧠 Ersparnis Prompt-Tokens (Modellkontext): {100 * (1 - totals['thread_context'] / totals['legacy']):.1f}%")
+    print(f"📏 Ersparnis mit begrenztem Gedächtnis: {100 * (1 - totals['bounded'] / totals['legacy']):.1f}%")
+    print("   Ohne Begrenzung wächst der Thread-Kontext mit der Unterhaltung; begrenzt bleibt er nach")
+    print(f"   den ersten Runden konstant (letzte {RECENT_TURNS} Runden plus Zusammenfassung).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+conversation_store.py - Persistente Unterhaltungen (SQLite im WAL-Modus)
+
+Bisher lag der Verlauf jeder Sitzung als Liste in st.session_state: Er ging
+beim Neuladen der Seite verloren, wuchs mit jeder Frage im Speicher, und bei
+jedem Rerun wurden alle Nachrichten gerendert und für die Duplikatprüfung und
+die Fragezählung komplett durchlaufen.
+
+Dieser Speicher hält Unterhaltungen in einer SQLite-Datenbank:
+
+- Nachrichten mit fortlaufender Nummer je Unterhaltung (Primärschlüssel), so
+  dass eine Seite älterer Nachrichten ein Index-Bereichszugriff ist
+- Inhalts-Hash je Nachricht mit Index für die Duplikatprüfung
+- Zähler für Nachrichten und Fragen in der Unterhaltungszeile
+- Thread und Zusammenfassung der Unterhaltung, damit sie nach einem Neuladen
+  oder auf einem anderen Worker der HTTP-API fortgesetzt werden kann
+- Ergebnisse beantworteter Fragen für GET /v1/questions/{id}
+
+Im Speicher hält qa_service.Conversation nur die noch nicht zusammengefasste
+Nachrichten; ältere werden seitenweise von hier gelesen. Der WAL-Modus erlaubt
+gleichzeitiges Lesen mehrerer Prozesse während eines Schreibvorgangs.
+
+Alte Unterhaltungen entfernen:
+    python conversation_store.py --purge [--days 30]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Datenbank der Unterhaltungen (über Umgebungsvariable anpassbar)
+DEFAULT_CONVERSATION_PATH = os.getenv("KIRCHENRECHT_CONVERSATION_DB", "conversations.sqlite3")
+
+# Unterhaltungen ohne Aktivität werden nach so vielen Tagen entfernt
+RETENTION_DAYS = float(os.getenv("KIRCHENRECHT_CONVERSATION_RETENTION_DAYS", "30"))
+
+# Felder des Unterhaltungszustands, die mit gespeichert werden
+STATE_FIELDS = ("thread_id", "thread_assistant_id", "synced_count", "summary", "summarized_count")
+
+
+def content_hash(content):
+    """Hash eines Nachrichtentextes für die Duplikatprüfung."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ConversationStore:
+    """Unterhaltungen, Nachrichten und Ergebnisse in SQLite (thread- und prozesssicher)."""
+
+    def __init__(self, path=DEFAULT_CONVERSATION_PATH, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    question_count INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    conversation_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (conversation_id, seq)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_messages_hash ON messages(conversation_id, content_hash);
+                CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at);
+                CREATE TABLE IF NOT EXISTS results (
+                    question_id TEXT PRIMARY KEY,
+                    conversation_id TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_results_conversation ON results(conversation_id);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, conversation_id):
+        """
+        Zähler und Zustand einer Unterhaltung.
+
+        Returns:
+            Dict mit "message_count", "question_count", "updated_at" und den STATE_FIELDS oder None
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT message_count, question_count, updated_at, state FROM conversations WHERE id = ?",
+                (conversation_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row["state"]), message_count=row["message_count"],
+                    question_count=row["question_count"], updated_at=row["updated_at"])
+
+    def message_count(self, conversation_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row["message_count"] if row else 0
+
+    def append(self, conversation_id, seq, message):
+        """Speichert eine Nachricht ({"role", "content", "hash"}) an Position seq."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO conversations (id, created_at, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO NOTHING",
+                (conversation_id, now, now)
+            )
+            # OR REPLACE: schreiben zwei Worker gleichzeitig in dieselbe Unterhaltung, gewinnt der letzte
+            conn.execute(
+                "INSERT OR REPLACE INTO messages (conversation_id, seq, role, content, content_hash, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation_id, seq, message["role"], message["content"], message["hash"], now)
+            )
+            conn.execute(
+                "UPDATE conversations SET updated_at = ?, message_count = MAX(message_count, ?), "
+                "question_count = question_count + ? WHERE id = ?",
+                (now, seq + 1, 1 if message["role"] == "user" else 0, conversation_id)
+            )
+
+    def save_state(self, conversation_id, state):
+        """Speichert Thread und Zusammenfassung (Werte zu STATE_FIELDS)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO conversations (id, created_at, updated_at, state) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, state = excluded.state",
+                (conversation_id, now, now, json.dumps(state, ensure_ascii=False))
+            )
+
+    def messages(self, conversation_id, start=0, end=None):
+        """
+        Nachrichten mit start <= Nummer < end (Bereichszugriff über den Primärschlüssel).
+
+        Returns:
+            Liste von Dicts mit "role", "content" und "hash"
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT role, content, content_hash FROM messages "
+                "WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, start, end if end is not None else 2**62)
+            ).fetchall()
+        return [{"role": row["role"], "content": row["content"], "hash": row["content_hash"]} for row in rows]
+
+    def contains(self, conversation_id, digest, role=None):
+        """Prüft über den Hash-Index, ob die Unterhaltung eine Nachricht mit diesem Inhalt enthält."""
+        query = "SELECT 1 FROM messages WHERE conversation_id = ? AND content_hash = ?"
+        params = [conversation_id, digest]
+        if role is not None:
+            query += " AND role = ?"
+            params.append(role)
+        with self._connect() as conn:
+            return conn.execute(query + " LIMIT 1", params).fetchone() is not None
+
+    def save_result(self, result):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (question_id, conversation_id, result, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (result["question_id"], result["conversation_id"], json.dumps(result, ensure_ascii=False),
+                 time.time())
+            )
+
+    def result(self, question_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT result FROM results WHERE question_id = ?", (question_id,)).fetchone()
+        return json.loads(row["result"]) if row else None
+
+    def delete(self, conversation_id):
+        """Entfernt eine Unterhaltung samt Nachrichten und Ergebnissen."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM results WHERE conversation_id = ?", (conversation_id,))
+            return conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0
+
+    def purge(self, days=None):
+        """
+        Entfernt Unterhaltungen, die länger als days (Standard: retention_days) inaktiv sind.
+
+        Returns:
+            Anzahl der entfernten Unterhaltungen
+        """
+        cutoff = time.time() - (days if days is not None else self.retention_days) * 86400
+        with self._connect() as conn:
+            expired = [row["id"] for row in conn.execute(
+                "SELECT id FROM conversations WHERE updated_at < ?", (cutoff,)
+            )]
+            for conversation_id in expired:
+                conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                conn.execute("DELETE FROM results WHERE conversation_id = ?", (conversation_id,))
+                conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        return len(expired)
+
+    def stats(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS conversations, COALESCE(SUM(message_count), 0) AS messages FROM conversations"
+            ).fetchone()
+        return {"conversations": row["conversations"], "messages": row["messages"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unterhaltungsspeicher der Kirchenrechts-App")
+    parser.add_argument("--db", default=DEFAULT_CONVERSATION_PATH, help="Pfad zur Datenbank")
+    parser.add_argument("--purge", action="store_true", help="Inaktive Unterhaltungen entfernen")
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS, help="Aufbewahrungsdauer in Tagen")
+    args = parser.parse_args()
+
+    store = ConversationStore(args.db)
+    if args.purge:
+        print(f"{store.purge(args.days)} Unterhaltungen entfernt.")
+    stats = store.stats()
+    print(f"{stats['conversations']} Unterhaltungen mit {stats['messages']} Nachrichten gespeichert.")
+
+
+if __name__ == "__main__":
+    main()
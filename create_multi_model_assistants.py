@@ -4,14 +4,27 @@ create_multi_model_assistants.py - Erstellt mehrere Assistants mit verschiedenen
 Dieses Script hilft beim Erstellen von OpenAI Assistants mit verschiedenen Modellen,
 um eine Modellauswahl in der App zu ermöglichen.
 
+Im Provisionierungsmodus (--provision) ist ASSISTANT_CONFIGS der Sollzustand:
+Vorhandene Assistants werden über ihre Metadaten (bzw. ID aus der Konfiguration
+oder Namen) zugeordnet, nur abweichende werden parallel aktualisiert, fehlende
+angelegt. Das Ergebnis wird atomar in assistant_config.json eingearbeitet; andere
+Einträge der Datei bleiben erhalten. Der Modus fragt nichts ab und kann beliebig
+oft ausgeführt werden (z.B. beim Deployment).
+
 Verwendung:
-    python create_multi_model_assistants.py
+    python create_multi_model_assistants.py                      # interaktiv, legt immer neu an
+    python create_multi_model_assistants.py --provision --dry-run
+    python create_multi_model_assistants.py --provision --environment produktion
 """
 
 from openai import OpenAI
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
 import os
 import json
+import tempfile
 
 # Lade Umgebungsvariablen
 load_dotenv()
@@ -49,6 +62,17 @@ Beziehe dich auf relevante kirchenrechtliche Dokumente und Bestimmungen.
 Wenn du dir unsicher bist, weise darauf hin und empfehle eine juristische Prüfung.
 """
 
+# Werkzeuge aller Assistants
+TOOLS = [{"type": "file_search"}]  # Aktiviere File Search (früher Retrieval)
+
+# Kennzeichnung der von diesem Script verwalteten Assistants (Metadaten)
+MANAGED_BY = "create_multi_model_assistants"
+DEFAULT_ENVIRONMENT = os.getenv("KIRCHENRECHT_ENVIRONMENT", "default")
+CONFIG_FILE = "assistant_config.json"
+
+# Parallele API-Aufrufe beim Provisionieren
+PROVISION_WORKERS = 8
+
 def create_assistants():
     """Erstellt Assistants für verschiedene Modelle"""
     created_assistants = {}
@@ -64,7 +88,7 @@ def create_assistants():
                 name=config["name"],
                 model=config["model"],
                 instructions=INSTRUCTIONS,
-                tools=[{"type": "file_search"}]  # Aktiviere File Search (früher Retrieval)
+                tools=TOOLS
             )
             
             # Speichere die Assistant-Informationen
@@ -84,14 +108,133 @@ def create_assistants():
     
     return created_assistants
 
+def desired_spec(config, environment):
+    """Sollzustand eines Assistants inkl. Metadaten zur Wiedererkennung"""
+    spec = {
+        "name": config["name"],
+        "model": config["model"],
+        "description": config["description"],
+        "instructions": INSTRUCTIONS,
+        "tools": TOOLS,
+    }
+    spec_hash = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    spec["metadata"] = {
+        "managed_by": MANAGED_BY,
+        "config_key": config["key"][:512],
+        "environment": environment,
+        "spec_hash": spec_hash,
+    }
+    return spec
+
+def find_existing(config, environment, existing, current_config):
+    """Ordnet einen vorhandenen Assistant zu: Metadaten, dann ID aus der Konfiguration, dann Name"""
+    for assistant in existing:
+        metadata = assistant.metadata or {}
+        if (metadata.get("managed_by") == MANAGED_BY and metadata.get("config_key") == config["key"][:512]
+                and metadata.get("environment") == environment):
+            return assistant
+    # Übernahme bisher nicht verwalteter Assistants (z.B. interaktiv angelegt)
+    unmanaged = [assistant for assistant in existing if not (assistant.metadata or {}).get("managed_by")]
+    known_id = (current_config.get(config["key"]) or {}).get("id")
+    for assistant in unmanaged:
+        if assistant.id == known_id:
+            return assistant
+    for assistant in unmanaged:
+        if assistant.name == config["name"]:
+            return assistant
+    return None
+
+def differences(assistant, spec):
+    """Felder, in denen ein vorhandener Assistant vom Sollzustand abweicht"""
+    actual = {
+        "name": assistant.name,
+        "model": assistant.model,
+        "description": assistant.description,
+        "instructions": assistant.instructions,
+        "tools": [{"type": tool.type} for tool in assistant.tools],
+        "metadata": {key: (assistant.metadata or {}).get(key) for key in spec["metadata"]},
+    }
+    return [field for field, value in actual.items() if value != spec[field]]
+
+def provision_assistants(environment=DEFAULT_ENVIRONMENT, config_file=CONFIG_FILE, dry_run=False,
+                         workers=PROVISION_WORKERS):
+    """
+    Gleicht die Assistants mit ASSISTANT_CONFIGS ab (idempotent, parallel).
+
+    Returns:
+        Tuple aus Konfiguration {key: {...}} der provisionierten Assistants und
+        Aktionen {key: "angelegt" | "aktualisiert (...)" | "unverändert" | Fehlertext}
+    """
+    current_config = load_assistant_config(config_file)
+    existing = list(client.beta.assistants.list(limit=100))
+    plan = []
+    for config in ASSISTANT_CONFIGS:
+        spec = desired_spec(config, environment)
+        assistant = find_existing(config, environment, existing, current_config)
+        plan.append((config, spec, assistant, differences(assistant, spec) if assistant else None))
+
+    def apply(item):
+        config, spec, assistant, changed = item
+        if assistant is None:
+            if dry_run:
+                return config, None, "wird angelegt"
+            return config, client.beta.assistants.create(**spec).id, "angelegt"
+        if not changed:
+            return config, assistant.id, "unverändert"
+        action = f"aktualisiert ({', '.join(changed)})"
+        if dry_run:
+            return config, assistant.id, "wird " + action
+        client.beta.assistants.update(assistant.id, **spec)
+        return config, assistant.id, action
+
+    def apply_safely(item):
+        try:
+            return apply(item)
+        except Exception as e:
+            return item[0], None, f"Fehler: {e}"
+
+    provisioned, actions = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for config, assistant_id, action in pool.map(apply_safely, plan):
+            actions[config["key"]] = action
+            if assistant_id:
+                provisioned[config["key"]] = {
+                    "id": assistant_id,
+                    "description": config["description"],
+                    "model": config["model"]
+                }
+    return provisioned, actions
+
+def load_assistant_config(config_file=CONFIG_FILE):
+    """Liest die vorhandene Konfiguration (leer, wenn die Datei fehlt)"""
+    try:
+        with open(config_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def merge_assistant_config(assistants, config_file=CONFIG_FILE):
+    """Arbeitet Assistants in die Konfiguration ein und ersetzt die Datei atomar"""
+    merged = load_assistant_config(config_file)
+    for key, entry in assistants.items():
+        # Von Hand gepflegte Felder (z.B. context_budget) bleiben erhalten
+        merged[key] = {**merged.get(key, {}), **entry}
+    directory = os.path.dirname(os.path.abspath(config_file))
+    fd, temp_path = tempfile.mkstemp(prefix=".assistant_config-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, config_file)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return merged
+
 def save_assistant_config(assistants):
     """Speichert die Assistant-Konfiguration in einer Datei"""
-    config_file = "assistant_config.json"
-    
-    with open(config_file, "w", encoding="utf-8") as f:
-        json.dump(assistants, f, indent=2, ensure_ascii=False)
+    merge_assistant_config(assistants)
     
-    print(f"💾 Konfiguration gespeichert in '{config_file}'")
+    print(f"💾 Konfiguration gespeichert in '{CONFIG_FILE}'")
     
     # Erstelle auch Python-Code zum Kopieren
     print("\n📝 Kopieren Sie folgende Konfiguration in Ihre app.py:\n")
@@ -104,7 +247,35 @@ def save_assistant_config(assistants):
         print("    },")
     print("}")
 
+def provision_main(args):
+    """Nicht-interaktiver Provisionierungsmodus"""
+    print(f"🔧 Provisioniere {len(ASSISTANT_CONFIGS)} Assistants (Umgebung: {args.environment})"
+          + (" - Probelauf" if args.dry_run else "") + "\n")
+    provisioned, actions = provision_assistants(args.environment, args.config, args.dry_run, args.workers)
+    for key, action in actions.items():
+        symbol = "❌" if action.startswith("Fehler") else ("✅" if action == "unverändert" else "🔄")
+        print(f"{symbol} {key}: {action}")
+    if not args.dry_run and provisioned:
+        merge_assistant_config(provisioned, args.config)
+        print(f"\n💾 {len(provisioned)} Einträge in '{args.config}' eingearbeitet")
+    if any(action.startswith("Fehler") for action in actions.values()):
+        raise SystemExit(1)
+
 def main():
+    parser = argparse.ArgumentParser(description="Assistants für verschiedene Modelle erstellen bzw. provisionieren")
+    parser.add_argument("--provision", action="store_true",
+                        help="Sollzustand abgleichen statt neu anlegen (nicht-interaktiv, idempotent)")
+    parser.add_argument("--environment", default=DEFAULT_ENVIRONMENT, help="Umgebung (Metadaten der Assistants)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="Konfigurationsdatei der App")
+    parser.add_argument("--dry-run", action="store_true", help="Nur anzeigen, was geändert würde")
+    parser.add_argument("--workers", type=int, default=PROVISION_WORKERS, help="Parallele API-Aufrufe")
+    parser.add_argument("--yes", action="store_true", help="Sicherheitsabfrage im interaktiven Modus überspringen")
+    args = parser.parse_args()
+
+    if args.provision:
+        provision_main(args)
+        return
+
     print("=" * 60)
     print("MULTI-MODEL ASSISTANT CREATOR")
     print("=" * 60)
@@ -112,8 +283,8 @@ def main():
     print("verschiedenen Modellen für die Kirchenrechts-App.\n")
     
     # Sicherheitsabfrage
-    response = input("⚠️  ACHTUNG: Dies erstellt neue Assistants und kann Kosten verursachen.\n"
-                    "Möchten Sie fortfahren? (ja/nein): ")
+    response = "ja" if args.yes else input("⚠️  ACHTUNG: Dies erstellt neue Assistants und kann Kosten verursachen.\n"
+                                           "Möchten Sie fortfahren? (ja/nein): ")
     
     if response.lower() != "ja":
         print("\n❌ Abgebrochen.")
@@ -1,9 +1,12 @@
 # kirchenrecht_debug.py
 import os
 import openai
-import time
 from dotenv import load_dotenv
 
+from run_waiter import RunWaiter
+from tool_executor import ToolExecutor
+from vector_store_sync import load_manifest
+
 # Lade Umgebungsvariablen (stelle sicher, dass OPENAI_API_KEY in .env oder der Umgebung gesetzt ist)
 load_dotenv()
 
@@ -40,6 +43,9 @@ try:
     if assistant.tool_resources and assistant.tool_resources.file_search and assistant.tool_resources.file_search.vector_store_ids:
         vector_store_id = assistant.tool_resources.file_search.vector_store_ids[0]
         print(f"✅ Angebundener Vector Store: {vector_store_id}")
+        synced_id = load_manifest().get("vector_store_id")
+        if synced_id and synced_id != vector_store_id:
+            print(f"⚠️ WARNUNG: vector_store_sync.py gleicht einen anderen Vector Store ab ({synced_id})!")
     else:
         print("⚠️ WARNUNG: Kein Vector Store an den Assistant angebunden!")
 
@@ -74,12 +80,14 @@ try:
 
     # Warten, bis der Run abgeschlossen ist
     print("⏳ Warte auf Abschluss des Runs...", end="", flush=True)
-    while run.status not in ["completed", "failed", "cancelled"]:
-        time.sleep(1)
-        run = client.beta.threads.runs.retrieve(run_id=run.id, thread_id=thread.id)
-        print(".", end="", flush=True)
-    
+    waiter = RunWaiter(client)
+    run = waiter.wait(thread.id, run, on_poll=lambda *_: print(".", end="", flush=True))
+    if run.status == "requires_action":
+        print("\n🔧 Führe Function-Tools aus...", end="", flush=True)
+        run = ToolExecutor().resolve(client, thread.id, run, waiter, on_poll=lambda *_: print(".", end="", flush=True))
+
     print(f"\n✅ Run abgeschlossen mit Status: {run.status}")
+    print(f"   Polling: {waiter.overhead_report()}")
 
     if run.status == "failed":
         print(f"❌ Run fehlgeschlagen. Grund: {run.last_error.message}")
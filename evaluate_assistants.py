@@ -0,0 +1,464 @@
+"""
+evaluate_assistants.py - Qualität und Antwortzeit aller konfigurierten Assistants vergleichen
+
+Stellt einen Fragenkatalog mit erwarteten Fundstellen (eval_questions.json)
+parallel an alle Assistants aus assistant_config.json und misst je Frage:
+
+- Antwortzeit (Ende-zu-Ende) und Token-Verbrauch aus run.usage
+- Trefferquote der erwarteten Zitate (z.B. "§ 12 Abs. 2 KGO") in der Antwort
+- ob der Run die Dokumentensuche (file_search) tatsächlich genutzt hat (Run Steps)
+
+Die Fragen werden über einen Thread-Pool verteilt; ein Ratenbegrenzer
+beschränkt die gestarteten Runs pro Minute. Das Ergebnis wird als CSV (oder
+Parquet, wenn pandas/pyarrow installiert sind) geschrieben und pro Assistant
+zusammengefasst.
+
+Günstige Läufe:
+- --mock: gegen den lokalen Mock-Server (benchmarks/mock_server.py), ohne Kosten
+- --batch / --collect: über die Batch API (50 % günstiger, Ergebnis innerhalb
+  von 24 h). Die Batch API unterstützt keine Assistants-Runs; ausgewertet
+  werden deshalb die Modelle der Assistants per Chat Completions, mit deren
+  Instruktionen und den passendsten Absätzen aus dem lokalen Rechtsindex
+  (legal_index.py) als Kontext. file_search und Antwortzeiten entfallen.
+
+Verwendung:
+    python evaluate_assistants.py --mock
+    python evaluate_assistants.py --assistants "GPT-4o (Standard - Beste Qualität)" --rpm 30
+    python evaluate_assistants.py --batch
+    python evaluate_assistants.py --collect --wait --output eval_report.parquet
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from legal_index import format_units, normalize, parse_citations
+from resources import CONFIG_FILE, load_assistants
+from run_waiter import RunWaiter
+from telemetry import estimate_cost, percentile
+from tool_executor import ToolExecutor
+
+# Fragenkatalog, Bericht und Auftragsdatei der Batch API
+DEFAULT_QUESTIONS = "eval_questions.json"
+DEFAULT_REPORT = "eval_report.csv"
+DEFAULT_BATCH_JOB = "eval_batch.json"
+
+# Parallele Fragen und gestartete Runs pro Minute (Standardwerte)
+EVAL_CONCURRENCY = int(os.getenv("KIRCHENRECHT_EVAL_CONCURRENCY", "8"))
+EVAL_RUNS_PER_MINUTE = float(os.getenv("KIRCHENRECHT_EVAL_RPM", "60"))
+
+# Batch-API-Aufträge kosten die Hälfte des Listenpreises
+BATCH_DISCOUNT = 0.5
+
+# Absätze aus dem lokalen Rechtsindex als Kontext für Batch-Anfragen
+BATCH_CONTEXT_UNITS = 5
+
+# Spalten des Berichts
+REPORT_FIELDS = [
+    "mode", "assistant", "assistant_id", "model", "question_id", "repetition", "question", "status",
+    "latency_seconds", "prompt_tokens", "completion_tokens", "total_tokens", "cost_usd",
+    "expected_citations", "found_citations", "citation_hits", "citation_hit_rate",
+    "file_search_used", "function_calls", "file_citations", "error", "answer",
+]
+
+
+class RateLimiter:
+    """Verteilt Aufrufe gleichmäßig: höchstens per_minute Aufrufe pro Minute (thread-sicher)."""
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wartet bis zum nächsten freien Zeitfenster."""
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            self._sleep(slot - now)
+
+
+def load_questions(path=DEFAULT_QUESTIONS):
+    """
+    Liest den Fragenkatalog.
+
+    Returns:
+        Liste von Dicts mit "id", "question" und "expected" (Liste erwarteter Zitate)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    questions = data["questions"] if isinstance(data, dict) else data
+    return [
+        {"id": str(entry.get("id", number)), "question": entry["question"], "expected": entry.get("expected", [])}
+        for number, entry in enumerate(questions, 1)
+    ]
+
+
+def select_assistants(names=None, config_file=CONFIG_FILE):
+    """
+    Liefert die zu vergleichenden Assistants aus assistant_config.json.
+
+    Returns:
+        Liste von Dicts mit "name", "id" und "model"
+
+    Raises:
+        KeyError: Wenn ein angegebener Name nicht konfiguriert ist
+    """
+    config = load_assistants(config_file)
+    names = names or list(config)
+    return [{"name": name, "id": config[name]["id"], "model": config[name].get("model")} for name in names]
+
+
+def _citation_key(citation):
+    return citation["paragraph"], citation["absatz"], normalize(citation["law"] or "")
+
+
+def citation_hits(expected, answer):
+    """
+    Prüft, welche erwarteten Zitate in der Antwort vorkommen.
+
+    Ein Zitat gilt als getroffen, wenn Paragraph und Gesetz übereinstimmen; der
+    Absatz muss nur passen, wenn ihn beide Seiten nennen.
+
+    Returns:
+        Tuple aus Anzahl Treffern und den in der Antwort gefundenen Zitaten (Text)
+    """
+    found = parse_citations(answer)
+    found_keys = [_citation_key(citation) for citation in found if citation["law"]]
+    hits = 0
+    for text in expected:
+        wanted = parse_citations(text)
+        if not wanted:
+            continue
+        paragraph, absatz, law = _citation_key(wanted[0])
+        if any(p == paragraph and l == law and (not absatz or not a or a == absatz) for p, a, l in found_keys):
+            hits += 1
+    return hits, [answer[start:end].strip() for start, end in (citation["span"] for citation in found)]
+
+
+def run_tool_types(client, thread_id, run_id):
+    """Zählt die Tool-Aufrufe eines Runs nach Typ (file_search, function, ...) anhand der Run Steps."""
+    steps = client.beta.threads.runs.steps.list(thread_id=thread_id, run_id=run_id)
+    return Counter(
+        tool_call.type
+        for step in steps.data if step.type == "tool_calls"
+        for tool_call in step.step_details.tool_calls
+    )
+
+
+def _report_row(mode, assistant, question, repetition):
+    return {
+        "mode": mode, "assistant": assistant["name"], "assistant_id": assistant["id"], "model": assistant["model"],
+        "question_id": question["id"], "repetition": repetition, "question": question["question"],
+        "expected_citations": "; ".join(question["expected"]), "status": None, "latency_seconds": None,
+        "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_usd": 0.0,
+        "found_citations": "", "citation_hits": 0, "citation_hit_rate": None, "file_search_used": None,
+        "function_calls": 0, "file_citations": 0, "error": "", "answer": "",
+    }
+
+
+def _score_answer(row, question, answer):
+    hits, found = citation_hits(question["expected"], answer)
+    row.update(answer=answer, found_citations="; ".join(dict.fromkeys(found)), citation_hits=hits,
+               citation_hit_rate=hits / len(question["expected"]) if question["expected"] else None)
+
+
+def evaluate_question(client, assistant, question, repetition=1, limiter=None, executor=None):
+    """
+    Stellt eine Frage in einem neuen Thread an einen Assistant und bewertet die Antwort.
+
+    Returns:
+        Zeile für den Bericht (Dict mit den Spalten aus REPORT_FIELDS)
+    """
+    row = _report_row("live", assistant, question, repetition)
+    if limiter is not None:
+        limiter.acquire()
+    start = time.perf_counter()
+    try:
+        thread = client.beta.threads.create(messages=[{"role": "user", "content": question["question"]}])
+        run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant["id"])
+        waiter = RunWaiter(client)
+        run = waiter.wait(thread.id, run)
+        if run.status == "requires_action" and executor is not None:
+            run = executor.resolve(client, thread.id, run, waiter)
+        answer, file_citations = "", 0
+        if run.status == "completed":
+            messages = client.beta.threads.messages.list(thread_id=thread.id, limit=1)
+            content = messages.data[0].content[0].text
+            answer = content.value
+            file_citations = sum(1 for annotation in content.annotations if annotation.type == "file_citation")
+        row["latency_seconds"] = round(time.perf_counter() - start, 3)
+        row.update(status=run.status, model=run.model or assistant["model"], file_citations=file_citations)
+        if run.last_error:
+            row["error"] = run.last_error.message
+        if run.usage:
+            row.update(prompt_tokens=run.usage.prompt_tokens, completion_tokens=run.usage.completion_tokens,
+                       total_tokens=run.usage.total_tokens,
+                       cost_usd=estimate_cost(row["model"], run.usage.prompt_tokens, run.usage.completion_tokens))
+        tools = run_tool_types(client, thread.id, run.id)
+        row.update(file_search_used=tools["file_search"] > 0, function_calls=tools["function"])
+        _score_answer(row, question, answer)
+    except Exception as e:
+        row.update(status="error", error=str(e), latency_seconds=round(time.perf_counter() - start, 3))
+    return row
+
+
+def run_live(client, assistants, questions, concurrency=EVAL_CONCURRENCY, runs_per_minute=EVAL_RUNS_PER_MINUTE,
+             repeat=1, on_result=None):
+    """
+    Stellt alle Fragen an alle Assistants (parallel, ratenbegrenzt).
+
+    Die Aufträge werden nach Assistants verschränkt, damit jedes Modell unter
+    derselben Last gemessen wird.
+
+    Returns:
+        Liste der Berichtszeilen
+    """
+    limiter = RateLimiter(runs_per_minute)
+    executor = ToolExecutor()
+    jobs = [
+        (assistant, question, repetition)
+        for repetition in range(1, repeat + 1)
+        for question in questions
+        for assistant in assistants
+    ]
+
+    def evaluate(job):
+        row = evaluate_question(client, *job[:2], repetition=job[2], limiter=limiter, executor=executor)
+        if on_result:
+            on_result(row)
+        return row
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(evaluate, jobs))
+    finally:
+        executor.close()
+
+
+def build_batch_requests(client, assistants, questions, index=None):
+    """
+    Erzeugt die Chat-Completions-Anfragen für die Batch API.
+
+    Returns:
+        Tuple aus JSONL-Zeilen und Zuordnung custom_id -> (Assistant, Frage)
+    """
+    requests, mapping = [], {}
+    for assistant in assistants:
+        instructions = client.beta.assistants.retrieve(assistant["id"]).instructions or ""
+        for question in questions:
+            content = question["question"]
+            units = index.search(question["question"], limit=BATCH_CONTEXT_UNITS) if index is not None else []
+            if units:
+                content += "\n\nAuszüge aus dem Kirchenrecht der EKHN:\n\n" + format_units(units)
+            custom_id = f"eval-{len(mapping)}"
+            mapping[custom_id] = {"assistant": assistant, "question": question}
+            requests.append(json.dumps({
+                "custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                "body": {"model": assistant["model"], "messages": [
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": content},
+                ]},
+            }, ensure_ascii=False))
+    return requests, mapping
+
+
+def submit_batch(client, assistants, questions, job_file=DEFAULT_BATCH_JOB, index=None):
+    """Lädt die Anfragen hoch, startet den Batch-Auftrag und merkt ihn in job_file vor."""
+    requests, mapping = build_batch_requests(client, assistants, questions, index)
+    upload = client.files.create(file=("eval_batch.jsonl", io.BytesIO("\n".join(requests).encode("utf-8"))),
+                                 purpose="batch")
+    batch = client.batches.create(input_file_id=upload.id, endpoint="/v1/chat/completions",
+                                  completion_window="24h", metadata={"purpose": "kirchenrecht-eval"})
+    with open(job_file, "w", encoding="utf-8") as f:
+        json.dump({"batch_id": batch.id, "submitted_at": time.time(), "requests": mapping}, f,
+                  indent=2, ensure_ascii=False)
+    return batch
+
+
+def collect_batch(client, job_file=DEFAULT_BATCH_JOB, wait=False, poll_interval=30.0):
+    """
+    Holt die Ergebnisse eines Batch-Auftrags ab.
+
+    Returns:
+        Liste der Berichtszeilen oder None, solange der Auftrag nicht fertig ist
+    """
+    with open(job_file, "r", encoding="utf-8") as f:
+        job = json.load(f)
+    batch = client.batches.retrieve(job["batch_id"])
+    while wait and batch.status in ("validating", "in_progress", "finalizing"):
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(job["batch_id"])
+    if batch.status != "completed" or not batch.output_file_id:
+        print(f"⏳ Batch {batch.id}: {batch.status}")
+        return None
+
+    rows = []
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        entry = job["requests"][result["custom_id"]]
+        row = _report_row("batch", entry["assistant"], entry["question"], 1)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            row.update(status="error", error=json.dumps(result.get("error") or response.get("body")))
+            rows.append(row)
+            continue
+        body = response["body"]
+        usage = body.get("usage") or {}
+        row.update(status="completed", model=body.get("model") or row["model"],
+                   prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0),
+                   total_tokens=usage.get("total_tokens", 0))
+        row["cost_usd"] = BATCH_DISCOUNT * estimate_cost(row["model"], row["prompt_tokens"], row["completion_tokens"])
+        _score_answer(row, entry["question"], body["choices"][0]["message"]["content"] or "")
+        rows.append(row)
+    return rows
+
+
+def summarize(rows):
+    """
+    Verdichtet die Berichtszeilen pro Assistant.
+
+    Returns:
+        Liste von Dicts mit Anzahl, Fehlern, Latenz-Perzentilen, Tokens, Kosten,
+        Zitat-Trefferquote und Anteil der Runs mit file_search
+    """
+    summary = []
+    for name in dict.fromkeys(row["assistant"] for row in rows):
+        own = [row for row in rows if row["assistant"] == name]
+        ok = [row for row in own if row["status"] == "completed"]
+        latencies = [row["latency_seconds"] for row in ok if row["latency_seconds"] is not None]
+        expected = sum(len(row["expected_citations"].split("; ")) for row in ok if row["expected_citations"])
+        searched = [row["file_search_used"] for row in ok if row["file_search_used"] is not None]
+        summary.append({
+            "assistant": name,
+            "model": own[0]["model"],
+            "questions": len(own),
+            "errors": len(own) - len(ok),
+            "p50": percentile(latencies, 50) if latencies else None,
+            "p95": percentile(latencies, 95) if latencies else None,
+            "tokens_mean": sum(row["total_tokens"] for row in ok) / len(ok) if ok else 0,
+            "cost_usd": sum(row["cost_usd"] for row in own),
+            "citation_hit_rate": sum(row["citation_hits"] for row in ok) / expected if expected else None,
+            "file_search_rate": sum(searched) / len(searched) if searched else None,
+        })
+    return summary
+
+
+def print_summary(summary):
+    def fmt(value, pattern):
+        return "–" if value is None else format(value, pattern)
+
+    print(f"{'Assistant':<38} | {'Fragen':>6} | {'Fehler':>6} | {'p50':>6} | {'p95':>6} | {'Tokens':>6} | "
+          f"{'Kosten $':>8} | {'Zitate':>6} | {'Suche':>6}")
+    print("-" * 115)
+    for entry in summary:
+        print(f"{entry['assistant'][:38]:<38} | {entry['questions']:>6} | {entry['errors']:>6} | "
+              f"{fmt(entry['p50'], '6.2f'):>6} | {fmt(entry['p95'], '6.2f'):>6} | {entry['tokens_mean']:>6.0f} | "
+              f"{entry['cost_usd']:>8.4f} | {fmt(entry['citation_hit_rate'], '6.0%'):>6} | "
+              f"{fmt(entry['file_search_rate'], '6.0%'):>6}")
+
+
+def write_report(rows, path=DEFAULT_REPORT):
+    """Schreibt die Berichtszeilen als CSV bzw. Parquet (Dateiendung .parquet)."""
+    if path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise RuntimeError("Für Parquet-Berichte werden pandas und pyarrow benötigt") from e
+        pd.DataFrame(rows, columns=REPORT_FIELDS).to_parquet(path, index=False)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assistants mit einem Fragenkatalog vergleichen")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Fragenkatalog (JSON)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="Assistant-Konfiguration")
+    parser.add_argument("--assistants", nargs="+", help="Nur diese Assistants (Namen aus der Konfiguration)")
+    parser.add_argument("--output", default=DEFAULT_REPORT, help="Bericht (.csv oder .parquet)")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="Parallele Fragen")
+    parser.add_argument("--rpm", type=float, default=EVAL_RUNS_PER_MINUTE, help="Gestartete Runs pro Minute")
+    parser.add_argument("--repeat", type=int, default=1, help="Jede Frage so oft stellen (Latenzstreuung)")
+    parser.add_argument("--mock", action="store_true", help="Gegen den lokalen Mock-Server statt die OpenAI API")
+    parser.add_argument("--batch", action="store_true", help="Als Batch-API-Auftrag einreichen")
+    parser.add_argument("--collect", action="store_true", help="Ergebnis des Batch-API-Auftrags abholen")
+    parser.add_argument("--wait", action="store_true", help="Mit --collect: warten, bis der Auftrag fertig ist")
+    parser.add_argument("--batch-job", default=DEFAULT_BATCH_JOB, help="Datei mit dem laufenden Batch-Auftrag")
+    args = parser.parse_args()
+
+    load_dotenv()
+    server = None
+    if args.mock:
+        from benchmarks.mock_server import start_in_background
+
+        server, _, base_url = start_in_background(latency=1.0)
+        client = OpenAI(base_url=base_url, api_key="mock")
+    else:
+        client = OpenAI()
+
+    try:
+        assistants = select_assistants(args.assistants, args.config)
+        if args.mock:
+            # Der Mock kennt die IDs nicht; Modell und Name für den Bericht übernehmen
+            for assistant in assistants:
+                client.beta.assistants.update(assistant["id"], name=assistant["name"], model=assistant["model"])
+
+        if args.collect:
+            rows = collect_batch(client, args.batch_job, wait=args.wait, poll_interval=1.0 if args.mock else 30.0)
+            if rows is None:
+                return
+        else:
+            questions = load_questions(args.questions)
+            if args.batch:
+                from resources import get_legal_index
+
+                batch = submit_batch(client, assistants, questions, args.batch_job, get_legal_index())
+                print(f"📤 Batch {batch.id} eingereicht ({len(assistants) * len(questions)} Anfragen).")
+                print(f"   Ergebnis abholen: python evaluate_assistants.py --collect --batch-job {args.batch_job}")
+                if not args.mock:
+                    return
+                rows = collect_batch(client, args.batch_job, wait=True, poll_interval=0.1)
+            else:
+                total = len(assistants) * len(questions) * args.repeat
+                print(f"🧪 {len(questions)} Fragen × {len(assistants)} Assistants"
+                      + (f" × {args.repeat}" if args.repeat > 1 else "")
+                      + f" (parallel {args.concurrency}, {args.rpm:g} Runs/Minute)\n")
+                done = []
+
+                def progress(row):
+                    done.append(row)
+                    symbol = "✅" if row["status"] == "completed" else "❌"
+                    print(f"{symbol} [{len(done)}/{total}] {row['assistant'][:30]} · {row['question_id']} · "
+                          f"{row['latency_seconds']:.1f}s")
+
+                rows = run_live(client, assistants, questions, args.concurrency, args.rpm, args.repeat, progress)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    write_report(rows, args.output)
+    print()
+    print_summary(summarize(rows))
+    print(f"\n💾 Bericht gespeichert in '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
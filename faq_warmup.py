@@ -0,0 +1,274 @@
+"""
+faq_warmup.py - Vorab beantwortete FAQ- und Beispielfragen
+
+Die Beispielfragen in der Sidebar sind die am häufigsten angeklickten
+Einträge der App - trotzdem kostete jeder Klick einen vollständigen Run.
+Dieser Job beantwortet eine konfigurierbare FAQ-Liste (faq_questions.json,
+die ersten Einträge erscheinen als Beispielfragen) vorab für jeden Assistant
+und legt die Antworten im Antwort-Cache ab. Ein Klick auf eine Beispielfrage
+wird dann sofort aus dem Cache beantwortet.
+
+- Begrenzte Parallelität (KIRCHENRECHT_FAQ_WORKERS), die Runs laufen über
+  dieselbe Ratenbegrenzung wie die Fragen der Nutzer
+- Je Antwort werden die zitierten Dateien des Vector Stores gemerkt
+  (faq_warmup.json); nach einem Abgleich (vector_store_sync.py) werden nur
+  FAQ-Einträge neu beantwortet, deren Quelldokumente ersetzt oder entfernt
+  wurden, außerdem fehlende und bald ablaufende Einträge. Der Abgleich
+  entfernt selbst nur die Cache-Einträge mit diesen Quellen; alle anderen
+  Beispielfragen bleiben sofort beantwortbar
+- Im Dauerbetrieb wird beim Start (Deployment) sofort, danach nur in der
+  verkehrsarmen Zeit aufgefrischt (KIRCHENRECHT_FAQ_OFF_PEAK, z.B. "1-5")
+
+    python faq_warmup.py            # einmalig, z.B. als Schritt des Deployments
+    python faq_warmup.py --watch    # Dauerbetrieb
+    python faq_warmup.py --plan     # nur anzeigen, was beantwortet würde
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from citations import cited_files
+
+# FAQ-Liste (JSON-Liste von Fragen) und Stand der vorab beantworteten Einträge
+FAQ_FILE = os.getenv("KIRCHENRECHT_FAQ_FILE", "faq_questions.json")
+STATE_FILE = os.getenv("KIRCHENRECHT_FAQ_STATE", "faq_warmup.json")
+
+# FAQ-Liste, falls keine faq_questions.json existiert
+DEFAULT_FAQ = [
+    "Darf eine Pfarrerin das Abendmahl ohne Ordination spenden?",
+    "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?",
+    "Wie ist das Verfahren bei Amtspflichtverletzungen geregelt?",
+    "Was sind die Aufgaben des Presbyteriums?",
+    "Welche Rechte hat die Gemeindeversammlung?",
+]
+
+# Anzahl der FAQ-Einträge, die in der Sidebar als Beispielfragen erscheinen
+SIDEBAR_EXAMPLES = 5
+
+# Gleichzeitige Runs beim Vorab-Beantworten
+WARMUP_WORKERS = int(os.getenv("KIRCHENRECHT_FAQ_WORKERS", "2"))
+
+# Assistants, für die vorab beantwortet wird (kommagetrennte Namen; leer = alle)
+WARMUP_ASSISTANTS = os.getenv("KIRCHENRECHT_FAQ_ASSISTANTS", "")
+
+# Verkehrsarme Zeit (Stunden Ortszeit, Ende ausschließlich), in der aufgefrischt wird
+OFF_PEAK_HOURS = os.getenv("KIRCHENRECHT_FAQ_OFF_PEAK", "1-5")
+
+# Prüfintervall im Dauerbetrieb in Sekunden
+CHECK_INTERVAL = float(os.getenv("KIRCHENRECHT_FAQ_CHECK_INTERVAL", "900"))
+
+# Einträge, die älter als dieser Anteil der Cache-TTL sind, werden vorzeitig aufgefrischt
+EXPIRY_SHARE = 0.8
+
+_faq_lock = threading.Lock()
+_faq = {"path": None, "mtime": None, "data": None}
+
+
+def load_faq(path=FAQ_FILE):
+    """
+    Liefert die FAQ-Liste (Neuladen nur bei geänderter mtime, sonst DEFAULT_FAQ).
+
+    Raises:
+        ValueError: Wenn die Datei keine JSON-Liste von Fragen enthält
+    """
+    if not os.path.exists(path):
+        return DEFAULT_FAQ
+    mtime = os.stat(path).st_mtime_ns
+    with _faq_lock:
+        if _faq["path"] != path or _faq["mtime"] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, list) or not all(isinstance(q, str) and q.strip() for q in data):
+                raise ValueError(f"{path} muss eine JSON-Liste von Fragen enthalten")
+            _faq.update(path=path, mtime=mtime, data=[q.strip() for q in data])
+        return _faq["data"]
+
+
+def is_off_peak(hours=OFF_PEAK_HOURS, now=None):
+    """Prüft, ob die aktuelle Stunde (Ortszeit) in der verkehrsarmen Zeit "start-ende" liegt."""
+    start, end = (int(part) for part in hours.split("-"))
+    hour = time.localtime(now).tm_hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def vector_store_files(manifest):
+    """Die file_ids, die laut Manifest aktuell im Vector Store liegen."""
+    return {entry["file_id"] for entry in manifest.get("files", {}).values() if entry.get("file_id")}
+
+
+def fingerprint(file_ids):
+    return hashlib.sha256("\n".join(sorted(file_ids)).encode("utf-8")).hexdigest()[:16]
+
+
+class FaqWarmup:
+    """Beantwortet die FAQ-Liste vorab und hält den Antwort-Cache dafür aktuell."""
+
+    def __init__(self, service, faq_path=FAQ_FILE, state_path=STATE_FILE, manifest_path=None,
+                 workers=WARMUP_WORKERS, assistant_names=None):
+        from vector_store_sync import DEFAULT_MANIFEST
+
+        self.service = service
+        self.faq_path = faq_path
+        self.state_path = state_path
+        self.manifest_path = manifest_path or DEFAULT_MANIFEST
+        self.workers = workers
+        names = assistant_names if assistant_names is not None else WARMUP_ASSISTANTS
+        self.assistant_names = [name.strip() for name in names.split(",") if name.strip()] \
+            if isinstance(names, str) else list(names)
+
+    def load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"entries": {}, "last_run": None}
+
+    def save_state(self, state):
+        """Schreibt den Stand atomar (temporäre Datei + os.replace)."""
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, temp_path = tempfile.mkstemp(prefix=".faq-", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _current_files(self):
+        from vector_store_sync import load_manifest
+
+        return vector_store_files(load_manifest(self.manifest_path))
+
+    def plan(self):
+        """
+        Ermittelt die FAQ-Einträge, die (neu) beantwortet werden müssen.
+
+        Returns:
+            Liste von Dicts mit "assistant", "assistant_id", "question" und "reason"
+        """
+        assistants = self.service.assistants()
+        names = [name for name in self.assistant_names if name in assistants] or list(assistants)
+        state = self.load_state()
+        current_files = self._current_files()
+        cache = self.service.answer_cache
+        pending = []
+        for name in names:
+            assistant_id = assistants[name]["id"]
+            entries = state["entries"].get(assistant_id, {})
+            for question in load_faq(self.faq_path):
+                entry = entries.get(question)
+                if entry is not None and entry.get("origin") == "legal_index":
+                    # Direkt aus dem Rechtsindex beantwortet - braucht keinen Cache-Eintrag
+                    continue
+                age = cache.age(assistant_id, question)
+                if entry is not None and entry["file_ids"] and not set(entry["file_ids"]) <= current_files:
+                    # Vor "fehlt" prüfen: der Abgleich hat den Cache-Eintrag bereits entfernt
+                    reason = "Quelle geändert"
+                elif age is None:
+                    reason = "fehlt"
+                elif age > cache.ttl_seconds * EXPIRY_SHARE:
+                    reason = "läuft ab"
+                elif entry is None:
+                    reason = "Quellen unbekannt"
+                elif not entry["file_ids"] and entry["vector_store"] != fingerprint(current_files):
+                    reason = "Vector Store geändert"
+                else:
+                    continue
+                pending.append({"assistant": name, "assistant_id": assistant_id, "question": question,
+                                "reason": reason})
+        return pending
+
+    def _answer(self, item):
+        from qa_service import Conversation
+        from resources import get_citation_index
+
+        conversation = Conversation()
+        try:
+            result = self.service.answer(conversation, item["question"], item["assistant"], refresh=True)
+        finally:
+            # Nur der Antwort-Cache soll die Vorab-Antwort behalten, nicht der Unterhaltungsspeicher
+            self.service.store.delete(conversation.id)
+        return result, cited_files(result, get_citation_index())
+
+    def run(self, pending=None):
+        """
+        Beantwortet die ausstehenden FAQ-Einträge mit begrenzter Parallelität.
+
+        Returns:
+            Dict mit "answered", "failed" und "seconds"
+        """
+        started = time.perf_counter()
+        pending = self.plan() if pending is None else pending
+        stats = {"answered": 0, "failed": 0}
+        if pending:
+            current_files = self._current_files()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="faq-warmup") as executor:
+                outcomes = list(executor.map(self._answer, pending))
+            state = self.load_state()
+            for item, (result, file_ids) in zip(pending, outcomes):
+                if result["status"] != "completed":
+                    logging.warning(f"FAQ nicht beantwortet ({result['status']}): {item['question']}")
+                    stats["failed"] += 1
+                    continue
+                state["entries"].setdefault(item["assistant_id"], {})[item["question"]] = {
+                    "answered_at": time.time(),
+                    "origin": result["origin"],
+                    "file_ids": file_ids,
+                    "vector_store": fingerprint(current_files),
+                }
+                stats["answered"] += 1
+            state["last_run"] = time.time()
+            self.save_state(state)
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ- und Beispielfragen vorab beantworten")
+    parser.add_argument("--faq", default=FAQ_FILE, help="FAQ-Liste (JSON-Liste von Fragen)")
+    parser.add_argument("--state", default=STATE_FILE, help="Stand der vorab beantworteten Einträge")
+    parser.add_argument("--workers", type=int, default=WARMUP_WORKERS, help="Gleichzeitige Runs")
+    parser.add_argument("--plan", action="store_true", help="Nur anzeigen, was beantwortet würde")
+    parser.add_argument("--watch", action="store_true",
+                        help="Dauerbetrieb: sofort, danach nur in der verkehrsarmen Zeit auffrischen")
+    parser.add_argument("--off-peak", default=OFF_PEAK_HOURS, help="Verkehrsarme Zeit, z.B. 1-5 (Uhr)")
+    parser.add_argument("--interval", type=float, default=CHECK_INTERVAL, help="Prüfintervall in Sekunden")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    from resources import get_question_service
+
+    warmup = FaqWarmup(get_question_service(), args.faq, args.state, workers=args.workers)
+    if args.plan:
+        for item in warmup.plan():
+            print(f"{item['assistant']}: {item['question']} ({item['reason']})")
+        return
+
+    first = True
+    while True:
+        if first or is_off_peak(args.off_peak):
+            pending = warmup.plan()
+            if pending:
+                stats = warmup.run(pending)
+                print(f"✅ {stats['answered']} FAQ-Antworten vorab berechnet, {stats['failed']} fehlgeschlagen "
+                      f"({stats['seconds']:.1f}s)")
+                if stats["failed"] and not args.watch:
+                    raise SystemExit(1)
+            elif not args.watch:
+                print("✅ Alle FAQ-Antworten sind aktuell.")
+        if not args.watch:
+            break
+        first = False
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
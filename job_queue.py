@@ -0,0 +1,245 @@
+"""
+job_queue.py - Hintergrund-Warteschlange für die Fragen der Streamlit-Oberfläche
+
+Bisher lief eine Frage im Skript-Thread von Streamlit. Klickte der Nutzer
+währenddessen irgendetwas an, führte Streamlit das Skript neu aus: Die
+Warteschleife wurde verlassen, der Run bei OpenAI lief aber weiter (und wurde
+bezahlt), ohne dass die Antwort je angezeigt wurde.
+
+Jetzt übergibt die Oberfläche jede Frage als Job an diese Warteschlange:
+
+- Ein Thread-Pool unabhängig vom Skriptlauf beantwortet die Jobs; die Job-IDs
+  stehen in st.session_state, der nächste Durchlauf zeigt Fortschritt und
+  Ergebnis weiter an (chat_ui.show_jobs)
+- Mehrere Fragen derselben Unterhaltung werden nacheinander beantwortet
+  (FIFO je Unterhaltung), verschiedene Unterhaltungen parallel
+- Jeder Durchlauf, der einen Job anzeigt, meldet sich bei ihm; meldet sich
+  länger als KIRCHENRECHT_JOB_ORPHAN_TIMEOUT niemand mehr (Tab geschlossen),
+  wird der Job verworfen und sein Run abgebrochen
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from qa_service import ConversationBusy
+
+# Gleichzeitig beantwortete Jobs (Unterhaltungen) pro Prozess
+JOB_WORKERS = int(os.getenv("KIRCHENRECHT_JOB_WORKERS", "8"))
+
+# Sekunden ohne Abfrage, nach denen ein Job als verwaist gilt und abgebrochen wird
+ORPHAN_TIMEOUT = float(os.getenv("KIRCHENRECHT_JOB_ORPHAN_TIMEOUT", "120"))
+
+# Prüfintervall für verwaiste Jobs und Aufbewahrung abgeschlossener Jobs in Sekunden
+REAP_INTERVAL = 5.0
+FINISHED_TTL = 600.0
+
+
+class Job:
+    """Eine Frage in der Warteschlange mit gepufferten Ereignissen und Ergebnis."""
+
+    def __init__(self, conversation, question, assistant_name=None, standalone=False):
+        self.id = uuid.uuid4().hex
+        self.conversation = conversation
+        self.question = question
+        self.assistant_name = assistant_name
+        self.standalone = standalone
+        self.status = "queued"
+        self.events = []
+        self.runs = []
+        self.cancelled_runs = set()
+        self.result = None
+        self.error = None
+        # Position der Frage im Verlauf, sobald der Job läuft (für chat_ui.show_history)
+        self.message_seq = None
+        self.cancel_requested = False
+        self.created_at = self.last_seen = time.time()
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def emit(self, kind, value=None):
+        with self._condition:
+            self.events.append((kind, value))
+            if kind == "run_created":
+                self.runs.append(value)
+            self._condition.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self._condition:
+            self.status, self.result, self.error = status, result, error
+            self.finished_at = time.time()
+            self._condition.notify_all()
+
+    def wait(self, seen, timeout):
+        """
+        Wartet auf neue Ereignisse oder das Ende des Jobs (und gilt damit als abgefragt).
+
+        Returns:
+            Tuple aus den Ereignissen ab Index seen und dem Flag, ob der Job beendet ist
+        """
+        with self._condition:
+            self.last_seen = time.time()
+            self._condition.wait_for(lambda: len(self.events) > seen or self.finished, timeout)
+            return self.events[seen:], self.finished
+
+
+class JobQueue:
+    """Beantwortet Fragen im Hintergrund (thread-sicher, ein Objekt pro Prozess)."""
+
+    def __init__(self, service, workers=JOB_WORKERS, orphan_timeout=ORPHAN_TIMEOUT):
+        """
+        Args:
+            service: qa_service.QuestionService oder api_client.ApiClient
+            workers: Gleichzeitig beantwortete Jobs
+            orphan_timeout: Sekunden ohne Abfrage, nach denen ein Job abgebrochen wird
+        """
+        self.service = service
+        self.orphan_timeout = orphan_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kirchenrecht-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        # Unterhaltung -> laufender Job bzw. wartende Jobs
+        self._active = {}
+        self._waiting = {}
+        self._stats = {"submitted": 0, "completed": 0, "orphaned": 0}
+        threading.Thread(target=self._reap_forever, name="kirchenrecht-job-reaper", daemon=True).start()
+
+    def submit(self, conversation, question, assistant_name=None, standalone=False):
+        """
+        Stellt eine Frage in die Warteschlange (nicht blockierend).
+
+        Returns:
+            Job-ID
+        """
+        job = Job(conversation, question, assistant_name, standalone)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+            if conversation.id in self._active:
+                self._waiting.setdefault(conversation.id, deque()).append(job)
+            else:
+                self._start(job)
+        return job.id
+
+    def get(self, job_id):
+        """Der Job zur ID (oder None, z.B. nach einem Neustart des Prozesses)."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """
+        Anzahl der Fragen derselben Unterhaltung vor diesem Job (0 = läuft bzw. als Nächstes).
+
+        Der Job gilt damit als abgefragt: Wartende Jobs zeigt die Oberfläche nur
+        über ihre Position an, solange sie einem früheren Job folgt.
+        """
+        with self._lock:
+            job.last_seen = time.time()
+            waiting = self._waiting.get(job.conversation.id, ())
+            return list(waiting).index(job) + 1 if job in waiting else 0
+
+    def _start(self, job):
+        # Aufruf nur unter self._lock
+        self._active[job.conversation.id] = job
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        status, result, error = "cancelled", None, None
+        try:
+            if not job.cancel_requested:
+                job.status = "running"
+                job.message_seq = job.conversation.message_count()
+                result = self.service.answer(
+                    job.conversation, job.question, job.assistant_name, emit=job.emit, standalone=job.standalone
+                )
+                status = "done"
+        except ConversationBusy as e:
+            # Dieselbe Unterhaltung wird gerade anderweitig beantwortet (z.B. zweiter Tab)
+            status, error = "busy", str(e)
+        except Exception as e:
+            logging.critical(f"Job {job.id} fehlgeschlagen: {e}", exc_info=True)
+            status, error = "error", str(e)
+        finally:
+            job.finish(status, result, error)
+            with self._lock:
+                if status == "done" and result["status"] == "completed":
+                    self._stats["completed"] += 1
+                self._active.pop(job.conversation.id, None)
+                waiting = self._waiting.get(job.conversation.id)
+                if waiting:
+                    self._start(waiting.popleft())
+                    if not waiting:
+                        del self._waiting[job.conversation.id]
+
+    def cancel(self, job_id):
+        """
+        Bricht einen Job ab: wartende werden verworfen, bei laufenden wird der Run abgebrochen.
+
+        Returns:
+            True, wenn der Job noch nicht beendet war
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancel_requested = True
+            waiting = self._waiting.get(job.conversation.id)
+            if waiting and job in waiting:
+                waiting.remove(job)
+                job.finish("cancelled")
+                return True
+        self._cancel_runs(job)
+        return True
+
+    def _cancel_runs(self, job):
+        cancel_run = getattr(self.service, "cancel_run", None)
+        if cancel_run is None:
+            # HTTP-API: die Frage läuft dort zu Ende und landet im Verlauf
+            return
+        for thread_id, run_id in job.runs:
+            if run_id in job.cancelled_runs:
+                continue
+            job.cancelled_runs.add(run_id)
+            if cancel_run(thread_id, run_id):
+                logging.info(f"Run {run_id} des Jobs {job.id} abgebrochen.")
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(REAP_INTERVAL)
+            self.reap()
+
+    def reap(self, now=None):
+        """Bricht verwaiste Jobs ab und entfernt lange abgeschlossene."""
+        now = now or time.time()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.finished:
+                if now - job.finished_at > FINISHED_TTL:
+                    with self._lock:
+                        self._jobs.pop(job.id, None)
+            elif now - job.last_seen > self.orphan_timeout and not job.cancel_requested:
+                logging.warning(f"Job {job.id} wird seit {now - job.last_seen:.0f}s nicht mehr abgefragt - breche ab.")
+                with self._lock:
+                    self._stats["orphaned"] += 1
+                self.cancel(job.id)
+            elif job.cancel_requested and job.status == "running":
+                # Run erst nach dem Abbruchwunsch gestartet (z.B. nach Wartezeit in der Ratenbegrenzung)
+                self._cancel_runs(job)
+
+    def stats(self):
+        """Anzahl wartender, laufender und insgesamt gestellter, beantworteter und verwaister Jobs."""
+        with self._lock:
+            return dict(
+                self._stats,
+                waiting=sum(len(waiting) for waiting in self._waiting.values()),
+                running=len(self._active),
+            )
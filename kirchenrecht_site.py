@@ -0,0 +1,148 @@
+"""
+kirchenrecht_site.py - Abruf von Live-Daten aus kirchenrecht-ekhn.de
+
+Liefert die Daten für das Function-Tool get_kirchenrecht_info, wenn der lokale
+Rechtsindex (legal_index.py) keine Fundstelle kennt: Die Suchseite des
+Fachinformationssystems wird abgefragt, die ersten Trefferdokumente werden
+geladen, in Paragraphen und Absätze zerlegt und per BM25 nach der Anfrage
+sortiert.
+
+Die Basis-URL ist konfigurierbar, sodass sich der Abruf gegen die lokale
+HTML-Fixture (benchmarks/site_fixture.py) testen lässt:
+    KIRCHENRECHT_SITE_URL=http://127.0.0.1:8766
+"""
+
+import logging
+import math
+import os
+import re
+from collections import Counter
+from html.parser import HTMLParser
+from urllib.parse import quote_plus, urljoin
+
+import httpx
+
+from legal_index import BM25_B, BM25_K1, analyze, detect_law, format_tool_output, html_to_text, split_units
+
+# Basis-URL des Fachinformationssystems und Pfad der Suchseite
+SITE_URL = os.getenv("KIRCHENRECHT_SITE_URL", "https://www.kirchenrecht-ekhn.de")
+SEARCH_PATH = os.getenv("KIRCHENRECHT_SITE_SEARCH", "/search?query={query}")
+
+# Links auf Rechtsdokumente in der Trefferliste
+DOCUMENT_LINK_RE = re.compile(r"/document/\d+")
+
+# Anzahl der Trefferdokumente, die pro Anfrage geladen werden
+MAX_DOCUMENTS = 3
+
+# Zeitlimit pro HTTP-Anfrage in Sekunden
+FETCH_TIMEOUT = float(os.getenv("KIRCHENRECHT_SITE_TIMEOUT", "10"))
+
+USER_AGENT = "Kirchenrechts-APP (EKHN)"
+
+
+class _LinkCollector(HTMLParser):
+    """Sammelt die href-Ziele aller Links einer Seite in Dokumentreihenfolge."""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+
+def page_links(html, base_url):
+    """Liefert alle Links einer Seite als absolute URLs (ohne Fragment)."""
+    parser = _LinkCollector()
+    parser.feed(html)
+    return [urljoin(base_url, href).split("#")[0] for href in parser.links]
+
+
+def document_links(html, base_url):
+    """Liefert die Links auf Rechtsdokumente einer Seite ohne Duplikate."""
+    links = [link for link in page_links(html, base_url) if DOCUMENT_LINK_RE.search(link)]
+    return list(dict.fromkeys(links))
+
+
+def page_units(html, url):
+    """
+    Zerlegt eine Dokumentseite in Fundstellen.
+
+    Returns:
+        Liste von Fundstellen wie LegalIndex.search (mit "law" und "source" = URL)
+    """
+    text = html_to_text(html)
+    law, law_title = detect_law(text, url)
+    return [dict(unit, law=law, law_title=law_title, source=url) for unit in split_units(text)]
+
+
+def rank_units(query, units, limit=3):
+    """
+    Sortiert Fundstellen nach BM25 bezüglich der Anfrage (ohne Index, für wenige Dokumente).
+
+    Returns:
+        Die besten Fundstellen mit Feld "score", absteigend sortiert
+    """
+    terms = set(analyze(query))
+    if not terms or not units:
+        return []
+    counted = [Counter(analyze(f"{unit['heading']} {unit['text']}")) for unit in units]
+    avg_length = sum(sum(counts.values()) for counts in counted) / len(counted) or 1
+    document_frequency = Counter(term for counts in counted for term in terms if term in counts)
+
+    scored = []
+    for unit, counts in zip(units, counted):
+        length = sum(counts.values())
+        score = 0.0
+        for term in terms & counts.keys():
+            df = document_frequency[term]
+            idf = math.log(1 + (len(units) - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            score += idf * counts[term] * (BM25_K1 + 1) / (counts[term] + norm)
+        if score > 0:
+            scored.append(dict(unit, score=round(score, 3)))
+    scored.sort(key=lambda unit: unit["score"], reverse=True)
+    return scored[:limit]
+
+
+def fetch_live_info(query, base_url=None, limit=3, http_client=None):
+    """
+    Sucht auf kirchenrecht-ekhn.de und liefert die passendsten Absätze mit Quellen.
+
+    Args:
+        query: Suchbegriff bzw. Frage
+        base_url: Basis-URL der Website (Standard: SITE_URL)
+        limit: Anzahl der zurückgegebenen Fundstellen
+        http_client: Optionaler httpx.Client (sonst wird ein eigener erzeugt)
+
+    Returns:
+        Text für die Tool-Ausgabe
+
+    Raises:
+        httpx.HTTPError: Wenn die Website nicht erreichbar ist
+    """
+    base_url = (base_url or SITE_URL).rstrip("/")
+    client = http_client or httpx.Client(timeout=FETCH_TIMEOUT, follow_redirects=True,
+                                         headers={"User-Agent": USER_AGENT})
+    try:
+        response = client.get(base_url + SEARCH_PATH.format(query=quote_plus(query)))
+        response.raise_for_status()
+        links = document_links(response.text, str(response.url))[:MAX_DOCUMENTS]
+        units = []
+        for link in links:
+            page = client.get(link)
+            if page.status_code != 200:
+                logging.warning(f"Dokument {link} nicht abrufbar: HTTP {page.status_code}")
+                continue
+            units.extend(page_units(page.text, link))
+    finally:
+        if http_client is None:
+            client.close()
+
+    best = rank_units(query, units, limit)
+    if not best:
+        return f"Keine Treffer auf kirchenrecht-ekhn.de für „{query}“."
+    return format_tool_output(best)
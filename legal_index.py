@@ -0,0 +1,579 @@
+"""
+legal_index.py - Lokaler Volltextindex des EKHN-Kirchenrechts
+
+Bisher ging jede Frage über file_search an den Vector Store von OpenAI, auch
+reine Nachschlage-Anfragen wie "§ 12 KGO". Dieses Modul baut aus den
+Rechtstexten (PDF, HTML oder Text) einen Index auf der Festplatte:
+
+- Zerlegung in Gesetz / Paragraph (bzw. Artikel) / Absatz
+- Invertierter Index in SQLite mit BM25-Ranking
+- Normalisierung mit Umlaut-Faltung und einem leichten deutschen Stemmer
+- Direkte Zitat-Suche ("§ 12 Abs. 2 KGO", "KGO § 12", "Art. 5 KO") ohne API-Aufruf
+
+Der Index beantwortet reine Zitat-Anfragen in der App sofort und liefert die
+Fundstellen für das Function-Tool get_kirchenrecht_info (tool_executor.py).
+
+PDF-Dateien werden nur gelesen, wenn pypdf installiert ist.
+
+Index aufbauen (nur geänderte Dateien werden neu eingelesen):
+    python legal_index.py build corpus/
+
+Suchen und nachschlagen:
+    python legal_index.py search "Wahl zum Kirchenvorstand"
+    python legal_index.py lookup "§ 12 Abs. 1 KGO"
+"""
+
+import argparse
+import hashlib
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from html.parser import HTMLParser
+
+from answer_cache import UMLAUT_MAP
+
+# Standardpfade (über Umgebungsvariablen anpassbar)
+DEFAULT_INDEX_PATH = os.getenv("KIRCHENRECHT_INDEX_DB", "legal_index.sqlite3")
+DEFAULT_CORPUS_DIR = os.getenv("KIRCHENRECHT_CORPUS_DIR", "corpus")
+
+# Unterstützte Dateitypen des Korpus
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".html", ".htm", ".pdf"}
+
+# BM25-Parameter
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reine Zitat-Anfragen dürfen neben dem Zitat höchstens so viele Inhaltswörter enthalten
+MAX_LOOKUP_EXTRA_WORDS = 2
+
+# Häufige Wörter ohne Aussagekraft für die Suche (bereits umlaut-gefaltet)
+STOPWORDS = {
+    "aber", "als", "am", "an", "auch", "auf", "aus", "bei", "bis", "da", "dann", "das", "dass",
+    "dem", "den", "der", "des", "die", "dies", "diese", "dieser", "durch", "ein", "eine", "einem",
+    "einen", "einer", "eines", "es", "fuer", "gegen", "hat", "haben", "im", "in", "ist", "kann",
+    "mit", "muss", "nach", "nicht", "noch", "nur", "oder", "ob", "sich", "sind", "so", "soll",
+    "steht", "ueber", "um", "und", "unter", "vom", "von", "vor", "was", "welche", "welcher",
+    "welches", "wenn", "wer", "werden", "wie", "wird", "wo", "zu", "zum", "zur", "gilt", "gelten",
+    "regelt", "geregelt", "sagt", "lautet", "abs", "absatz", "satz", "art", "artikel", "paragraph",
+    "paragraf", "zeige", "zeig", "bitte", "mir", "wortlaut", "text",
+}
+
+# Gesetzesabkürzung, z.B. "KGO", "PfDG.EKHN"
+LAW_PATTERN = r"[A-ZÄÖÜ][A-Za-zÄÖÜäöü\-]{1,24}(?:\.[A-ZÄÖÜ][A-Za-zÄÖÜäöü\-]+)?"
+
+# Überschrift eines Paragraphen oder Artikels am Zeilenanfang, z.B. "§ 12 Wahlberechtigung"
+HEADING_RE = re.compile(r"^[ \t]*(§|Art\.|Artikel)[ \t]*(\d+[a-z]?)\b\.?[ \t]*(.{0,120})$", re.MULTILINE)
+
+# Beginn eines Absatzes, z.B. "(2) Wählbar ist ..."
+ABSATZ_RE = re.compile(r"^[ \t]*\((\d+[a-z]?)\)[ \t]+", re.MULTILINE)
+
+# Zitat mit nachgestellter Gesetzesabkürzung: "§ 12 Abs. 2 KGO", "§ 12 (2) KGO", "Art. 5 KO"
+CITATION_RE = re.compile(
+    r"(?:§|Art\.|Artikel)\s*(?P<paragraph>\d+[a-z]?)\b"
+    r"(?:\s*(?:Abs\.|Absatz)\s*(?P<absatz>\d+[a-z]?)|\s*\((?P<absatz_klammer>\d+[a-z]?)\))?"
+    r"(?:\s*(?:S\.|Satz)\s*\d+)?"
+    rf"(?:\s+(?:der|des)?\s*(?P<law>{LAW_PATTERN}))?"
+)
+
+# Zitat mit vorangestellter Abkürzung: "KGO § 12 Abs. 2"
+LAW_FIRST_RE = re.compile(
+    rf"(?P<law>{LAW_PATTERN})\s+(?:§|Art\.|Artikel)\s*(?P<paragraph>\d+[a-z]?)\b"
+    r"(?:\s*(?:Abs\.|Absatz)\s*(?P<absatz>\d+[a-z]?)|\s*\((?P<absatz_klammer>\d+[a-z]?)\))?"
+)
+
+
+def normalize(text):
+    return text.casefold().translate(UMLAUT_MAP)
+
+
+def stem(word):
+    """
+    Leichter deutscher Stemmer nach dem Vorbild von CISTEM.
+
+    Entfernt wiederholt die Endungen -em, -er, -nd (bei längeren Wörtern) sowie
+    -e, -s, -n, sodass z.B. "Kirchenvorstandes" und "Kirchenvorstand" denselben
+    Stamm erhalten.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    while len(word) > 3:
+        if len(word) > 5 and word[-2:] in ("em", "er", "nd"):
+            word = word[:-2]
+        elif word[-1] in "esn":
+            word = word[:-1]
+        else:
+            break
+    return word
+
+
+def analyze(text):
+    """Zerlegt einen Text in normalisierte, gestemmte Suchbegriffe."""
+    words = re.findall(r"[a-z0-9]+", normalize(text))
+    return [stem(word) for word in words if word not in STOPWORDS and len(word) > 1]
+
+
+class _HTMLText(HTMLParser):
+    """Extrahiert den sichtbaren Text einer HTML-Seite mit Zeilenumbrüchen an Blockelementen."""
+
+    BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article"}
+    SKIP_TAGS = {"script", "style", "nav", "header", "footer", "noscript"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def text(self):
+        text = "".join(self.parts).replace("\xa0", " ")
+        lines = (re.sub(r"[ \t]+", " ", line).strip() for line in text.splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def html_to_text(html):
+    parser = _HTMLText()
+    parser.feed(html)
+    return parser.text()
+
+
+def read_document(path):
+    """
+    Liest ein Dokument des Korpus als Text.
+
+    Returns:
+        Text oder None, wenn der Dateityp nicht gelesen werden kann
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            logging.warning(f"pypdf ist nicht installiert - überspringe {path}")
+            return None
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read()
+    if extension in (".html", ".htm"):
+        return html_to_text(content)
+    return content
+
+
+def detect_law(text, source):
+    """
+    Ermittelt Abkürzung und Titel des Gesetzes eines Dokuments.
+
+    Die Abkürzung wird aus einer Klammer im Kopf des Dokuments gelesen, z.B.
+    "Kirchengemeindeordnung (KGO)", sonst aus dem Dateinamen.
+
+    Returns:
+        Tuple aus Abkürzung und Titel
+    """
+    head = text[:2000]
+    lines = [line.strip() for line in head.splitlines() if line.strip()]
+    title = lines[0][:200] if lines else os.path.basename(source)
+    match = re.search(rf"\(({LAW_PATTERN})\)", head)
+    if match:
+        return match.group(1), title
+    return os.path.splitext(os.path.basename(source))[0], title
+
+
+def split_units(text):
+    """
+    Zerlegt einen Gesetzestext in Paragraphen bzw. Artikel und deren Absätze.
+
+    Returns:
+        Liste von Dicts mit "marker" ("§" oder "Art."), "paragraph", "absatz" (oder None),
+        "heading" und "text"
+    """
+    headings = list(HEADING_RE.finditer(text))
+    units = []
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(text)
+        body = text[heading.end():end].strip()
+        marker = "§" if heading.group(1) == "§" else "Art."
+        title = heading.group(3).strip()
+        # Verweise wie "§ 5 Abs. 2 gilt entsprechend" am Zeilenanfang sind keine Überschriften
+        if re.match(r"(?:Abs\.|Absatz|Satz)\b", title):
+            if units:
+                units[-1]["text"] += "\n" + text[heading.start():end].strip()
+            continue
+        if not title and body:
+            first_line, _, rest = body.partition("\n")
+            if not ABSATZ_RE.match(first_line):
+                title, body = first_line.strip(), rest.strip()
+
+        absaetze = list(ABSATZ_RE.finditer(body))
+        if not absaetze:
+            units.append({"marker": marker, "paragraph": heading.group(2), "absatz": None,
+                          "heading": title, "text": body})
+            continue
+        for position, absatz in enumerate(absaetze):
+            absatz_end = absaetze[position + 1].start() if position + 1 < len(absaetze) else len(body)
+            units.append({
+                "marker": marker,
+                "paragraph": heading.group(2),
+                "absatz": absatz.group(1),
+                "heading": title,
+                "text": body[absatz.start():absatz_end].strip(),
+            })
+    return units
+
+
+def parse_citations(text):
+    """
+    Findet Paragraphen-Zitate in einem Text.
+
+    Returns:
+        Liste von Dicts mit "paragraph", "absatz" (oder None), "law" (oder None) und "span"
+    """
+    citations = []
+    for pattern in (LAW_FIRST_RE, CITATION_RE):
+        for match in pattern.finditer(text):
+            if any(start <= match.start() < end for start, end in (c["span"] for c in citations)):
+                continue
+            # Vorangestellt zählen nur echte Abkürzungen ("KGO"), nicht "Nach § 12 ..."
+            if pattern is LAW_FIRST_RE and sum(char.isupper() for char in match.group("law")) < 2:
+                continue
+            citations.append({
+                "paragraph": match.group("paragraph"),
+                "absatz": match.group("absatz") or match.group("absatz_klammer"),
+                "law": match.group("law"),
+                "span": match.span(),
+            })
+    return sorted(citations, key=lambda citation: citation["span"])
+
+
+def format_citation(unit):
+    absatz = f" Abs. {unit['absatz']}" if unit["absatz"] else ""
+    return f"{unit['marker']} {unit['paragraph']}{absatz} {unit['law']}"
+
+
+def format_units(units):
+    """Formatiert Fundstellen als Markdown, gruppiert nach Paragraph."""
+    blocks, current = [], None
+    for unit in units:
+        key = (unit["law"], unit["paragraph"])
+        if key != current:
+            current = key
+            heading = f" – {unit['heading']}" if unit["heading"] else ""
+            prefix = format_citation(dict(unit, absatz=None))
+            blocks.append(f"**{prefix}{heading}**")
+        blocks.append(unit["text"])
+    return "\n\n".join(blocks)
+
+
+def format_tool_output(units):
+    """Formatiert Fundstellen als Tool-Ausgabe: Wortlaut und eine Zeile mit den Quellen."""
+    return format_units(units) + "\n\nQuellen: " + "; ".join(
+        dict.fromkeys(f"{format_citation(unit)} ({unit['source']})" for unit in units)
+    )
+
+
+class LegalIndex:
+    """Invertierter Index über die Paragraphen und Absätze des Kirchenrechts (SQLite)."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    source TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    law TEXT NOT NULL,
+                    law_title TEXT NOT NULL,
+                    indexed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS units (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    law TEXT NOT NULL,
+                    law_key TEXT NOT NULL,
+                    law_title TEXT NOT NULL,
+                    marker TEXT NOT NULL,
+                    paragraph TEXT NOT NULL,
+                    absatz TEXT,
+                    heading TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_units_citation ON units (law_key, paragraph, absatz);
+                CREATE INDEX IF NOT EXISTS idx_units_source ON units (source);
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    unit_id INTEGER NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, unit_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_postings_unit ON postings (unit_id);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Aufbau ---
+
+    def index_document(self, source, text):
+        """
+        Nimmt ein Dokument in den Index auf (ersetzt eine frühere Fassung).
+
+        Returns:
+            Anzahl der indexierten Einheiten (Paragraphen bzw. Absätze)
+        """
+        law, law_title = detect_law(text, source)
+        units = split_units(text)
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock, self._connect() as conn:
+            self._delete_source(conn, source)
+            for unit in units:
+                terms = Counter(analyze(f"{unit['heading']} {unit['text']}"))
+                cursor = conn.execute(
+                    "INSERT INTO units (source, law, law_key, law_title, marker, paragraph, absatz, heading, text, "
+                    "length) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (source, law, normalize(law), law_title, unit["marker"], unit["paragraph"], unit["absatz"],
+                     unit["heading"], unit["text"], sum(terms.values()))
+                )
+                conn.executemany(
+                    "INSERT INTO postings (term, unit_id, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()]
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (source, content_hash, law, law_title, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source, content_hash, law, law_title, time.time())
+            )
+        return len(units)
+
+    def _delete_source(self, conn, source):
+        conn.execute(
+            "DELETE FROM postings WHERE unit_id IN (SELECT id FROM units WHERE source = ?)", (source,)
+        )
+        conn.execute("DELETE FROM units WHERE source = ?", (source,))
+        conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+
+    def remove_document(self, source):
+        with self._lock, self._connect() as conn:
+            self._delete_source(conn, source)
+
+    def document_hashes(self):
+        """Liefert {source: content_hash} aller indexierten Dokumente."""
+        with self._connect() as conn:
+            return {row["source"]: row["content_hash"] for row in conn.execute("SELECT source, content_hash FROM documents")}
+
+    def build(self, corpus_dir=DEFAULT_CORPUS_DIR):
+        """
+        Indexiert alle Dokumente eines Verzeichnisses; unveränderte werden übersprungen.
+
+        Returns:
+            Dict mit Anzahl neu indexierter, unveränderter und entfernter Dokumente sowie Einheiten
+        """
+        known = self.document_hashes()
+        seen = set()
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0, "units": 0}
+        for root, _, files in os.walk(corpus_dir):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                source = os.path.relpath(path, corpus_dir)
+                text = read_document(path)
+                if text is None:
+                    continue
+                seen.add(source)
+                if known.get(source) == hashlib.sha256(text.encode("utf-8")).hexdigest():
+                    stats["unchanged"] += 1
+                    continue
+                stats["units"] += self.index_document(source, text)
+                stats["indexed"] += 1
+        for source in set(known) - seen:
+            if "://" in source:
+                # Gespiegelte Seiten (site_mirror.py) verwaltet der Crawler selbst
+                continue
+            self.remove_document(source)
+            stats["removed"] += 1
+        return stats
+
+    # --- Abfragen ---
+
+    def stats(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT COUNT(*) AS units, COUNT(DISTINCT law) AS laws FROM units").fetchone()
+            documents = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"documents": documents, "laws": row["laws"], "units": row["units"]}
+
+    def laws(self):
+        """Liefert die normalisierten Abkürzungen aller indexierten Gesetze."""
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT DISTINCT law_key FROM units")}
+
+    def units(self):
+        """Alle Einheiten in Dokumentreihenfolge (z.B. für den Zitatindex, citations.py)."""
+        with self._connect() as conn:
+            for row in conn.execute(
+                "SELECT source, law, law_key, law_title, marker, paragraph, absatz, heading, text FROM units ORDER BY id"
+            ):
+                yield dict(row)
+
+    def lookup(self, paragraph, absatz=None, law=None, limit=50):
+        """Schlägt einen Paragraphen (optional Absatz und Gesetz) direkt nach."""
+        query = "SELECT * FROM units WHERE paragraph = ?"
+        params = [paragraph]
+        if absatz:
+            query += " AND absatz = ?"
+            params.append(absatz)
+        if law:
+            query += " AND law_key = ?"
+            params.append(normalize(law))
+        query += " ORDER BY law, id LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def lookup_citation(self, text):
+        """
+        Löst alle Zitate eines Textes mit bekanntem Gesetz auf.
+
+        Returns:
+            Liste der Fundstellen (Dicts) in der Reihenfolge der Zitate
+        """
+        laws = self.laws()
+        units = []
+        for citation in parse_citations(text):
+            if citation["law"] and normalize(citation["law"]) in laws:
+                units.extend(self.lookup(citation["paragraph"], citation["absatz"], citation["law"]))
+        return units
+
+    def search(self, query, limit=5):
+        """
+        BM25-Suche über alle Absätze.
+
+        Nennt die Anfrage ein indexiertes Gesetz (z.B. "KGO"), werden dessen
+        Fundstellen bevorzugt.
+
+        Returns:
+            Liste von Fundstellen (Dicts) mit zusätzlichem Feld "score", absteigend sortiert
+        """
+        terms = sorted(set(analyze(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._connect() as conn:
+            total, avg_length = conn.execute("SELECT COUNT(*), AVG(length) FROM units").fetchone()
+            if not total:
+                return []
+            document_frequency = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            rows = conn.execute(
+                f"SELECT p.term, p.unit_id, p.tf, u.length, u.law_key FROM postings p "
+                f"JOIN units u ON u.id = p.unit_id WHERE p.term IN ({placeholders})", terms
+            ).fetchall()
+
+            mentioned_laws = {normalize(word) for word in re.findall(r"[A-Za-zÄÖÜäöü\-]+", query)}
+            scores = Counter()
+            for row in rows:
+                df = document_frequency[row["term"]]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * row["length"] / (avg_length or 1))
+                score = idf * row["tf"] * (BM25_K1 + 1) / (row["tf"] + norm)
+                scores[row["unit_id"]] += score * (1.5 if row["law_key"] in mentioned_laws else 1.0)
+
+            top = scores.most_common(limit)
+            if not top:
+                return []
+            ids = [unit_id for unit_id, _ in top]
+            units = {
+                row["id"]: dict(row)
+                for row in conn.execute(f"SELECT * FROM units WHERE id IN ({','.join('?' * len(ids))})", ids)
+            }
+        return [dict(units[unit_id], score=round(score, 3)) for unit_id, score in top]
+
+    def direct_answer(self, question):
+        """
+        Beantwortet reine Zitat-Anfragen wie "§ 12 KGO" oder "Was steht in § 12 Abs. 2 KGO?".
+
+        Returns:
+            Markdown mit dem Wortlaut oder None, wenn die Frage mehr als ein Nachschlagen ist
+        """
+        citations = parse_citations(question)
+        if not citations:
+            return None
+        remainder = question
+        for citation in reversed(citations):
+            start, end = citation["span"]
+            remainder = remainder[:start] + " " + remainder[end:]
+        if len(analyze(remainder)) > MAX_LOOKUP_EXTRA_WORDS:
+            return None
+        units = self.lookup_citation(question)
+        return format_units(units) if units else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokaler Volltextindex des EKHN-Kirchenrechts")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH, help="Pfad der Index-Datenbank")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Korpus indexieren")
+    build_parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS_DIR)
+    search_parser = subparsers.add_parser("search", help="BM25-Suche")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=5)
+    lookup_parser = subparsers.add_parser("lookup", help="Zitat nachschlagen")
+    lookup_parser.add_argument("citation")
+    args = parser.parse_args()
+
+    index = LegalIndex(args.db)
+    if args.command == "build":
+        start = time.perf_counter()
+        stats = index.build(args.corpus)
+        print(f"✅ {stats['indexed']} Dokumente indexiert ({stats['units']} Einheiten), "
+              f"{stats['unchanged']} unverändert, {stats['removed']} entfernt "
+              f"in {time.perf_counter() - start:.1f}s")
+        totals = index.stats()
+        print(f"📚 Index: {totals['documents']} Dokumente, {totals['laws']} Gesetze, {totals['units']} Einheiten")
+    elif args.command == "search":
+        start = time.perf_counter()
+        results = index.search(args.query, limit=args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for unit in results:
+            print(f"{unit['score']:>6.2f}  {format_citation(unit)}  {unit['heading']}")
+            print(f"        {unit['text'][:120]}")
+        print(f"\n{len(results)} Treffer in {elapsed:.1f} ms")
+    else:
+        start = time.perf_counter()
+        units = index.lookup_citation(args.citation)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(format_units(units) if units else "❌ Zitat nicht im Index gefunden.")
+        print(f"\n({elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
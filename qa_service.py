@@ -0,0 +1,748 @@
+"""
+qa_service.py - Frage-Antwort-Pipeline als wiederverwendbarer Dienst
+
+Früher stand die gesamte Verarbeitung einer Frage direkt im Streamlit-Skript
+(app.py, nahezu wortgleich in app2.0.py). Andere Clients konnten sie nicht
+nutzen, und sie ließ sich nicht unabhängig von der Oberfläche skalieren.
+
+Dieses Modul enthält die Pipeline ohne Streamlit-Abhängigkeit:
+
+1. Modellwahl (fest oder automatisch, routing.py)
+2. Reine Zitat-Anfragen aus dem lokalen Rechtsindex
+3. Antwort-Cache (exakt und semantisch) für eigenständige Fragen
+4. Run über die asynchrone Engine (Streaming, Hedging, Zusammenlegen) oder
+   klassisch per Polling (KIRCHENRECHT_STREAMING=0)
+5. Historie, Thread und begrenztes Gedächtnis der Unterhaltung fortschreiben
+   (persistent im Unterhaltungsspeicher, conversation_store.py)
+
+Nutzer sind die Streamlit-Oberflächen (chat_ui.py) und die HTTP-API
+(api_server.py). Fortschritt wird über einen Callback emit(art, wert)
+gemeldet (Ereignisse wie bei async_engine.RunHandle, zusätzlich
+("assistant", name) und im Polling-Modus ("poll", sekunden)).
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from openai import NOT_GIVEN, NotFoundError, RateLimitError
+
+from citations import cited_files, resolve_sources, strip_markers
+from conversation import (
+    context_budget, context_window, needs_rebuild, summarize, summary_due, summary_instructions,
+    thread_seed_messages, truncation_strategy
+)
+from conversation_store import STATE_FIELDS, content_hash
+from rate_limiter import AdmissionError, estimate_request_tokens
+from resources import (
+    CONFIG_FILE, ensure_env, get_admission_queue, get_background_executor, get_caches, get_citation_index,
+    get_client, get_conversation_store, get_legal_index, get_tool_executor, load_assistants
+)
+from routing import AUTO_ROUTING, Router
+from run_waiter import RunWaiter, server_requested_delay
+from telemetry import get_registry
+
+# Schlüsselwörter für Live-Datenabruf (machen Fragen für das Routing komplexer)
+LIVE_DATA_KEYWORDS = ["KDO", "KGO", "Besoldung", "Entgelt", "Amtsblätter"]
+
+# Streaming-Modus: Die Pipeline läuft in der asynchronen Engine (async_engine.py),
+# Antworten werden tokenweise über den Run-Event-Stream gemeldet.
+# Mit KIRCHENRECHT_STREAMING=0 wird auf das klassische synchrone Polling zurückgeschaltet.
+USE_STREAMING = os.getenv("KIRCHENRECHT_STREAMING", "1") != "0"
+
+# Hedging (nur im Streaming-Modus): Liefert der gewählte Assistant nach so vielen Sekunden
+# kein erstes Token, wird die Frage zusätzlich dem schnellsten anderen Assistant gestellt
+# (oder KIRCHENRECHT_HEDGE_ASSISTANT). 0 = aus.
+HEDGE_AFTER = float(os.getenv("KIRCHENRECHT_HEDGE_AFTER", "0"))
+HEDGE_ASSISTANT = os.getenv("KIRCHENRECHT_HEDGE_ASSISTANT")
+
+# Gleichzeitige identische Fragen teilen sich einen Run (nur im Streaming-Modus, siehe coalescing.py).
+# Mit KIRCHENRECHT_COALESCE=0 stellt jede Sitzung ihre Frage selbst.
+COALESCE = os.getenv("KIRCHENRECHT_COALESCE", "1") != "0"
+
+# Fallback-Konfiguration, falls keine assistant_config.json existiert
+FALLBACK_ASSISTANTS = {
+    "GPT-4o (Standard - Beste Qualität)": {
+        "id": "asst_er72T8D7D8xth2HaM0mjxi5m",
+        "description": "Höchste Qualität, aber längere Antwortzeiten (10-30 Sekunden)",
+        "model": "gpt-4o"
+    }
+}
+
+# Unterhaltungen im Speicher: Lebensdauer ohne Aktivität und maximale Anzahl
+# (danach werden sie bei Bedarf aus dem Unterhaltungsspeicher geladen)
+CONVERSATION_TTL = float(os.getenv("KIRCHENRECHT_CONVERSATION_TTL", "3600"))
+MAX_CONVERSATIONS = 10_000
+
+# Anzahl der zuletzt beantworteten Fragen, deren Ergebnis im Speicher bleibt
+MAX_RESULTS = 1_000
+
+
+def should_use_live_data(query):
+    """Prüft, ob die Anfrage Live-Daten erfordert."""
+    return any(keyword.lower() in query.lower() for keyword in LIVE_DATA_KEYWORDS)
+
+
+def message_sources(message):
+    """
+    Liest die file_citation-Annotationen einer Assistant-Nachricht.
+
+    Returns:
+        Liste von Dicts mit "marker" (Text im Antworttext), "start_index", "end_index",
+        "file_id" und "quote" (ggf. None)
+    """
+    sources = []
+    for part in getattr(message, "content", None) or []:
+        text = getattr(part, "text", None)
+        for annotation in getattr(text, "annotations", None) or []:
+            citation = getattr(annotation, "file_citation", None)
+            if annotation.type == "file_citation" and citation is not None:
+                sources.append({
+                    "marker": annotation.text,
+                    "start_index": getattr(annotation, "start_index", None),
+                    "end_index": getattr(annotation, "end_index", None),
+                    "file_id": citation.file_id,
+                    "quote": getattr(citation, "quote", None),
+                })
+    return sources
+
+
+class ConversationBusy(RuntimeError):
+    """In der Unterhaltung wird gerade schon eine Frage beantwortet."""
+
+
+class Conversation:
+    """
+    Zustand einer Unterhaltung: Historie, Thread und fortlaufende Zusammenfassung.
+
+    In Streamlit liegt ein Objekt je Sitzung in st.session_state, in der
+    HTTP-API im ConversationRegistry. Mit einem ConversationStore wird jede
+    Nachricht gespeichert, und im Speicher bleiben nur die Nachrichten ab der
+    Zusammenfassung: messages beginnt dann bei Nachricht Nummer offset.
+    """
+
+    def __init__(self, conversation_id=None, messages=None, store=None):
+        self.id = conversation_id or uuid.uuid4().hex
+        self.store = store
+        self.messages = []
+        self.offset = 0
+        self.questions = 0
+        self.thread_id = None
+        self.thread_assistant_id = None
+        self.synced_count = 0
+        self.summary = None
+        self.summarized_count = 0
+        self.summary_future = None
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+        for message in messages or []:
+            self.append(message["role"], message["content"])
+
+    @classmethod
+    def load(cls, store, conversation_id):
+        """Lädt eine gespeicherte Unterhaltung (Nachrichten ab der Zusammenfassung) oder None."""
+        saved = store.load(conversation_id)
+        if saved is None:
+            return None
+        conversation = cls(conversation_id, store=store)
+        for field in STATE_FIELDS:
+            if field in saved:
+                setattr(conversation, field, saved[field])
+        conversation.offset = conversation.summarized_count
+        conversation.messages = store.messages(conversation_id, conversation.offset)
+        conversation.questions = saved["question_count"]
+        conversation.updated_at = saved["updated_at"]
+        return conversation
+
+    def message_count(self):
+        return self.offset + len(self.messages)
+
+    def question_count(self):
+        return self.questions
+
+    def append(self, role, content):
+        """Hängt eine Nachricht an die Historie an (und speichert sie)."""
+        message = {"role": role, "content": content, "hash": content_hash(content)}
+        if self.store is not None:
+            self.store.append(self.id, self.message_count(), message)
+        self.messages.append(message)
+        if role == "user":
+            self.questions += 1
+        self.updated_at = time.time()
+        return message
+
+    def contains(self, content, role="assistant"):
+        """Prüft über den Inhalts-Hash, ob die Historie diese Nachricht bereits enthält."""
+        digest = content_hash(content)
+        if any(message["hash"] == digest and message["role"] == role for message in self.messages):
+            return True
+        return self.offset > 0 and self.store.contains(self.id, digest, role)
+
+    def page_bounds(self, before=None, limit=None):
+        """Nummern [start, end) der Seite mit höchstens limit Nachrichten vor Nummer before."""
+        end = self.message_count() if before is None else max(0, min(before, self.message_count()))
+        return (0 if limit is None else max(0, end - limit)), end
+
+    def page(self, before=None, limit=None):
+        """
+        Eine Seite der Historie: die letzten limit Nachrichten vor Nummer before.
+
+        Ältere Nachrichten, die nicht mehr im Speicher liegen, kommen aus dem Store.
+        """
+        start, end = self.page_bounds(before, limit)
+        if start >= self.offset:
+            return self.messages[start - self.offset:end - self.offset]
+        older = self.store.messages(self.id, start, min(end, self.offset))
+        return older + self.messages[:max(0, end - self.offset)]
+
+    def is_standalone(self):
+        """Eigenständige Frage ohne Vorgeschichte (nur dann gilt der Antwort-Cache)."""
+        return self.offset == 0 and not any(message["role"] == "assistant" for message in self.messages[:-1])
+
+    def reusable_thread_id(self, assistant_id):
+        """
+        Liefert den Thread, falls er für die neue Frage (letzter Eintrag) wiederverwendbar ist.
+
+        Returns:
+            Thread-ID oder None, wenn der Thread neu aufgebaut werden muss
+        """
+        rebuild = needs_rebuild(
+            self.thread_id, self.thread_assistant_id, self.synced_count, assistant_id, self.message_count() - 1
+        )
+        return None if rebuild else self.thread_id
+
+    def remember_thread(self, thread_id, assistant_id):
+        """Speichert den Thread und den mit ihm synchronisierten Stand."""
+        self.thread_id = thread_id
+        self.thread_assistant_id = assistant_id
+        self.mark_synced()
+
+    def mark_synced(self):
+        """Die Historie liegt vollständig im Thread."""
+        self.synced_count = self.message_count()
+        self.save_state()
+
+    def save_state(self):
+        """Speichert Thread und Zusammenfassung, damit die Unterhaltung anderswo fortgesetzt werden kann."""
+        if self.store is not None:
+            self.store.save_state(self.id, {field: getattr(self, field) for field in STATE_FIELDS})
+
+    def context(self, assistant_config):
+        """
+        Begrenztes Gedächtnis: wählt die wörtlich zu sendenden Nachrichten und die Zusammenfassung.
+
+        Returns:
+            Tuple aus den Nachrichten im Kontextfenster und den zusätzlichen Anweisungen (oder None)
+        """
+        self.collect_summary()
+        start = context_window(
+            self.messages, self.summarized_count - self.offset, self.summary, context_budget(assistant_config)
+        )
+        return self.messages[start:], summary_instructions(self.summary)
+
+    def collect_summary(self):
+        """Übernimmt eine im Hintergrund fertiggestellte Zusammenfassung (wartet nicht)."""
+        future = self.summary_future
+        if future is None or not future.done():
+            return
+        self.summary_future = None
+        try:
+            summary, summarized_count = future.result()
+        except Exception as e:
+            logging.warning(f"Zusammenfassung älterer Runden fehlgeschlagen: {e}")
+            return
+        self.summary, self.summarized_count = summary, summarized_count
+        self.save_state()
+        logging.info(f"Zusammenfassung aktualisiert: {summarized_count} Nachrichten verdichtet.")
+        if self.store is not None:
+            # Zusammengefasste Nachrichten liegen im Store und werden nur noch seitenweise gelesen
+            drop = self.summarized_count - self.offset
+            del self.messages[:drop]
+            self.offset += drop
+
+    def schedule_summary(self, client):
+        """Verdichtet nach einer Antwort ältere Runden im Hintergrund zur fortlaufenden Zusammenfassung."""
+        self.collect_summary()
+        if self.summary_future is not None:
+            return
+        start = self.summarized_count - self.offset
+        end = summary_due(self.messages, start)
+        if end is None:
+            return
+        summary, messages, summarized_count = self.summary, self.messages[start:end], self.offset + end
+        self.summary_future = get_background_executor().submit(
+            lambda: (summarize(client, summary, messages), summarized_count)
+        )
+
+    def to_dict(self, before=None, limit=None):
+        """Darstellung für die HTTP-API (optional nur eine Seite der Historie)."""
+        start, _ = self.page_bounds(before, limit)
+        return {
+            "conversation_id": self.id,
+            "message_count": self.message_count(),
+            "question_count": self.question_count(),
+            "start": start,
+            "messages": [{"role": message["role"], "content": message["content"]}
+                         for message in self.page(before, limit)],
+            "summary": self.summary,
+        }
+
+
+class ConversationRegistry:
+    """
+    Unterhaltungen im Speicher (thread-sicher, mit Ablaufzeit).
+
+    Unbekannte oder von einem anderen Prozess fortgeschriebene Unterhaltungen
+    werden aus dem Unterhaltungsspeicher geladen.
+    """
+
+    def __init__(self, store=None, ttl=CONVERSATION_TTL, max_entries=MAX_CONVERSATIONS):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._conversations:
+            oldest = next(iter(self._conversations.values()))
+            if oldest.updated_at >= cutoff and len(self._conversations) <= self.max_entries:
+                break
+            self._conversations.popitem(last=False)
+
+    def get(self, conversation_id):
+        with self._lock:
+            self._expire()
+            conversation = self._conversations.get(conversation_id)
+            if conversation is not None:
+                self._conversations.move_to_end(conversation_id)
+        if self.store is None:
+            return conversation
+        if conversation is not None and (
+            conversation.lock.locked()
+            or self.store.message_count(conversation_id) <= conversation.message_count()
+        ):
+            return conversation
+        loaded = Conversation.load(self.store, conversation_id)
+        if loaded is None:
+            return conversation
+        with self._lock:
+            self._conversations[conversation_id] = loaded
+            self._conversations.move_to_end(conversation_id)
+        return loaded
+
+    def create(self, conversation_id=None, messages=None):
+        """Legt eine Unterhaltung an (optional mit mitgeschickter Historie)."""
+        conversation = Conversation(conversation_id, messages, store=self.store)
+        with self._lock:
+            self._conversations[conversation.id] = conversation
+            self._expire()
+        return conversation
+
+    def drop(self, conversation_id):
+        with self._lock:
+            dropped = self._conversations.pop(conversation_id, None) is not None
+        if self.store is not None:
+            dropped = self.store.delete(conversation_id) or dropped
+        return dropped
+
+
+class QuestionService:
+    """Beantwortet Fragen über die vollständige Pipeline (thread-sicher, ein Objekt pro Prozess)."""
+
+    def __init__(self, client=None, config_file=CONFIG_FILE, streaming=USE_STREAMING, hedge_after=HEDGE_AFTER,
+                 hedge_assistant=HEDGE_ASSISTANT, coalesce=COALESCE, store=None):
+        ensure_env()
+        self.client = client or get_client()
+        self.config_file = config_file
+        self.streaming = streaming
+        self.hedge_after = hedge_after
+        self.hedge_assistant = hedge_assistant
+        self.coalesce = coalesce
+        self.telemetry = get_registry()
+        self.answer_cache, self.semantic_cache = get_caches()
+        self.store = store or get_conversation_store()
+        self.conversations = ConversationRegistry(self.store)
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+
+    def assistants(self):
+        """Assistant-Registry aus assistant_config.json (Fallback, falls die Datei fehlt)."""
+        try:
+            return load_assistants(self.config_file)
+        except FileNotFoundError:
+            logging.warning(f"Keine {self.config_file} gefunden. Verwende Standard-Konfiguration.")
+            return FALLBACK_ASSISTANTS
+
+    def router(self, assistants=None):
+        return Router(assistants or self.assistants(), self.telemetry, keywords=LIVE_DATA_KEYWORDS)
+
+    def open_conversation(self, conversation_id=None):
+        """Setzt eine gespeicherte Unterhaltung fort oder beginnt eine neue."""
+        conversation = self.conversations.get(conversation_id) if conversation_id else None
+        return conversation or self.conversations.create()
+
+    def result(self, question_id):
+        """Ergebnis einer beantworteten Frage (oder None)."""
+        with self._results_lock:
+            result = self._results.get(question_id)
+        return result if result is not None else self.store.result(question_id)
+
+    def cancel_run(self, thread_id, run_id):
+        """
+        Bricht einen Run ab, dessen Antwort niemand mehr abholt (job_queue.py).
+
+        Runs, an die sich identische Fragen anderer Sitzungen angehängt haben, laufen weiter.
+
+        Returns:
+            True, wenn der Abbruch angefordert wurde
+        """
+        if self.streaming:
+            from async_engine import get_engine
+
+            if get_engine().flights.shared(run_id):
+                logging.info(f"Run {run_id} wird noch von anderen Anfragen genutzt - kein Abbruch.")
+                return False
+        return RunWaiter(self.client).cancel(thread_id, run_id) is not None
+
+    def _store_result(self, result):
+        with self._results_lock:
+            self._results[result["question_id"]] = result
+            while len(self._results) > MAX_RESULTS:
+                self._results.popitem(last=False)
+        self.store.save_result(result)
+
+    def answer(self, conversation, question, assistant_name=None, emit=None, standalone=False, refresh=False):
+        """
+        Beantwortet eine Frage im Kontext der Unterhaltung (blockierend).
+
+        Die Frage und ggf. die Antwort werden an die Historie der Unterhaltung angehängt.
+
+        Args:
+            conversation: Conversation
+            question: Die neue Frage
+            assistant_name: Name aus assistant_config.json, AUTO_ROUTING oder None (erster Assistant)
+            emit: Callback (art, wert) für Fortschritt und gestreamte Tokens
+            standalone: Frage hängt nicht vom Verlauf ab (z.B. Beispielfragen) - Antwort-Cache
+                auch in einer laufenden Unterhaltung nutzen
+            refresh: Antwort-Cache nicht lesen, sondern neu befüllen (faq_warmup.py)
+
+        Returns:
+            Ergebnis-Dict mit "question_id", "conversation_id", "status" ("completed", "failed",
+            "cancelled", "expired", "rejected" oder "error"), "answer", "origin" ("legal_index",
+            "cache", "semantic_cache", "coalesced" oder "assistant"), "assistant", "model",
+            "auto_routed", "sources" (citations.resolve_sources), "annotations" und je nach Herkunft "similar_question", "similarity",
+            "lookup_ms", "error"
+
+        Raises:
+            ConversationBusy: Wenn in der Unterhaltung bereits eine Frage läuft
+            KeyError: Unbekannter Assistant
+        """
+        if not conversation.lock.acquire(blocking=False):
+            raise ConversationBusy(f"In der Unterhaltung {conversation.id} läuft bereits eine Frage")
+        try:
+            result = self._answer(conversation, question, assistant_name, emit or (lambda kind, value=None: None),
+                                  standalone, refresh)
+        finally:
+            conversation.updated_at = time.time()
+            conversation.lock.release()
+        self._store_result(result)
+        return result
+
+    def _answer(self, conversation, question, assistant_name, emit, standalone, refresh):
+        assistants = self.assistants()
+        assistant_name = assistant_name or next(iter(assistants))
+        if assistant_name != AUTO_ROUTING and assistant_name not in assistants:
+            raise KeyError(f"Unbekannter Assistant: {assistant_name}")
+
+        conversation.append("user", question)
+        result = {
+            "question_id": uuid.uuid4().hex,
+            "conversation_id": conversation.id,
+            "question": question,
+            "status": "error",
+            "answer": None,
+            "origin": "assistant",
+            "auto_routed": assistant_name == AUTO_ROUTING,
+            "sources": [],
+            "annotations": [],
+        }
+        timer = None
+        routing_decision = None
+        router = self.router(assistants)
+
+        try:
+            # Hole die Assistant-Konfiguration (im Automatik-Modus pro Frage gewählt)
+            if assistant_name == AUTO_ROUTING:
+                assistant_name, routing_decision = router.choose(question)
+            assistant_config = assistants[assistant_name]
+            assistant_id = assistant_config["id"]
+            result.update(assistant=assistant_name, model=assistant_config.get("model"))
+            emit("assistant", assistant_name)
+
+            # Phase 0a: Reine Zitat-Anfragen ("§ 12 KGO") direkt aus dem lokalen Rechtsindex
+            legal_index = get_legal_index()
+            lookup_started = time.perf_counter()
+            direct_answer = legal_index.direct_answer(question) if legal_index is not None else None
+
+            # Phase 0b: Antwort-Cache prüfen (nur für eigenständige Fragen ohne Vorgeschichte)
+            is_standalone = conversation.is_standalone()
+            cached = None
+            if direct_answer is None and (is_standalone or standalone) and not refresh:
+                cached = (self.answer_cache.get(assistant_id, question)
+                          or self.semantic_cache.lookup(assistant_id, question))
+
+            if direct_answer is not None:
+                result["lookup_ms"] = (time.perf_counter() - lookup_started) * 1000
+                logging.info(f"✅ Zitat aus dem lokalen Rechtsindex beantwortet ({result['lookup_ms']:.1f} ms).")
+                self.telemetry.record_cache_hit("legal_index")
+                if routing_decision is not None:
+                    router.record_outcome(routing_decision, "legal_index", 0.0)
+                conversation.append("assistant", direct_answer)
+                result.update(status="completed", answer=direct_answer, origin="legal_index",
+                              sources=resolve_sources(direct_answer, index=get_citation_index()))
+                return result
+
+            if cached is not None:
+                logging.info("✅ Antwort aus dem Cache geliefert.")
+                semantic = "similarity" in cached
+                self.telemetry.record_cache_hit("semantic" if semantic else "exact")
+                if routing_decision is not None:
+                    router.record_outcome(routing_decision, "cache", 0.0)
+                conversation.append("assistant", cached["answer"])
+                result.update(status="completed", answer=cached["answer"],
+                              origin="semantic_cache" if semantic else "cache",
+                              sources=resolve_sources(cached["answer"], index=get_citation_index()))
+                if semantic:
+                    result.update(similar_question=cached["question"], similarity=cached["similarity"])
+                return result
+
+            timer = self.telemetry.start_question(assistant_name, assistant_config.get("model", "unbekannt"))
+            # Begrenztes Gedächtnis: nur die letzten Runden wörtlich, ältere als Zusammenfassung
+            window, instructions = conversation.context(assistant_config)
+
+            if self.streaming:
+                # Gewinnt beim Hedging der zweite Assistant, gehören Thread und Cache-Eintrag zu ihm
+                run, answer, message, coalesced, assistant_name, assistant_id = self._ask_streaming(
+                    conversation, assistants, router, assistant_name, assistant_id, question, window,
+                    instructions, is_standalone, timer, emit
+                )
+            else:
+                run, answer, message = self._ask_polling(
+                    conversation, assistant_config, assistant_id, window, instructions, timer, emit
+                )
+                coalesced = False
+            result.update(status=run.status, assistant=assistant_name,
+                          model=assistants[assistant_name].get("model"),
+                          origin="coalesced" if coalesced else "assistant")
+
+            if run.status == "completed":
+                # Phase 5: Antwort abrufen (im Streaming-Modus bereits vorhanden)
+                if message is None:
+                    with timer.phase("message_retrieval"):
+                        message = self.client.beta.threads.messages.list(thread_id=conversation.thread_id).data[0]
+                        answer = message.content[0].text.value
+                        logging.info("Antwort erfolgreich abgerufen.")
+                # Quellenangaben auflösen, danach die Markierungen („【4:0†KGO.pdf】“) entfernen
+                annotations = message_sources(message)
+                sources = resolve_sources(answer, annotations, get_citation_index())
+                answer = strip_markers(answer)
+                result.update(answer=answer, sources=sources, annotations=annotations)
+
+                # Füge die Antwort zur Historie hinzu, falls nicht bereits vorhanden
+                if not conversation.contains(answer):
+                    conversation.append("assistant", answer)
+                    # Die Antwort liegt bereits im Thread der Unterhaltung
+                    conversation.mark_synced()
+                    logging.info("Assistenten-Nachricht zur Historie hinzugefügt.")
+                    conversation.schedule_summary(self.client)
+                    if is_standalone:
+                        # Zitierte Dateien merken: ein Abgleich des Vector Stores entfernt nur betroffene Antworten
+                        file_ids = cited_files(result, get_citation_index())
+                        self.answer_cache.put(assistant_id, question, answer, file_ids=file_ids)
+                        # Neu berechnet (refresh): ältere Antworten auf ähnliche Fragen sind veraltet
+                        self.semantic_cache.add(assistant_id, question, answer, replace_similar=refresh,
+                                                file_ids=file_ids)
+                else:
+                    logging.info("Assistenten-Nachricht ist bereits in der Historie, füge sie nicht erneut hinzu.")
+            else:
+                # Fehlerbehandlung für fehlgeschlagene Runs
+                logging.error(f"Assistent konnte Anfrage nicht verarbeiten. Status: {run.status}")
+                if run.status == "failed" and run.last_error:
+                    logging.error(f"Fehlerdetails des Runs: {run.last_error.message}")
+                    result["error"] = run.last_error.message
+
+            if coalesced:
+                timer.finish(status=run.status)
+            else:
+                timer.finish(run)
+            if routing_decision is not None:
+                router.record_outcome(routing_decision, run.status, timer.total_seconds)
+            return result
+
+        except AdmissionError as e:
+            # Ratenbegrenzung: Warteschlange voll oder Wartezeit überschritten - kein API-Fehler
+            logging.warning(f"Frage nicht zugelassen: {e}")
+            if timer is not None:
+                timer.finish(status="rejected")
+                if routing_decision is not None:
+                    router.record_outcome(routing_decision, "rejected", timer.total_seconds)
+            result.update(status="rejected", error=str(e))
+            return result
+
+        except Exception as e:
+            # Allgemeine Fehlerbehandlung
+            logging.critical(f"Kritischer Fehler aufgetreten: {str(e)}", exc_info=True)
+            admission = get_admission_queue()
+            if isinstance(e, RateLimitError) and admission is not None and result.get("model"):
+                # 429 trotz Begrenzung (synchroner Pfad): Kontingent des Modells sperren
+                admission.backoff(result["model"], server_requested_delay(e.response.headers) or 10.0)
+            if timer is not None:
+                timer.finish(status="error")
+                if routing_decision is not None:
+                    router.record_outcome(routing_decision, "error", timer.total_seconds)
+            result.update(status="error", error=str(e))
+            return result
+
+    def _ask_streaming(self, conversation, assistants, router, assistant_name, assistant_id, question, window,
+                       instructions, is_standalone, timer, emit):
+        """Phase 1-4 in der asynchronen Engine: Thread vorbereiten und Run streamen."""
+        # Import erst hier: die Engine startet eine eigene Event-Loop
+        from async_engine import get_engine
+
+        logging.info(f"Übergebe Frage an {assistant_name} (Streaming)...")
+        hedge_name = None
+        if self.hedge_after > 0:
+            hedge_name = (self.hedge_assistant if self.hedge_assistant in assistants
+                          else router.hedge_partner(assistant_name))
+        handle = get_engine().submit(
+            assistant_id,
+            question,
+            window,
+            thread_id=conversation.reusable_thread_id(assistant_id),
+            hedge_assistant_id=assistants[hedge_name]["id"] if hedge_name else None,
+            hedge_after=self.hedge_after if hedge_name else None,
+            coalesce=self.coalesce and is_standalone,
+            instructions=instructions
+        )
+        for kind, value in handle.events():
+            emit(kind, value)
+        result = handle.result()
+        thread_id, run = result["thread_id"], result["run"]
+        timer.record_all(result["timings"])
+        coalesced = result.get("coalesced", False)
+        if coalesced:
+            # Antwort eines laufenden identischen Runs mitgenutzt: keine eigenen Kosten
+            self.telemetry.record_cache_hit("coalesced")
+
+        hedge = result.get("hedge")
+        if hedge and hedge["started"]:
+            # Gewinner und Zusatzkosten des abgebrochenen Runs erfassen
+            winner_name, loser_name = (
+                (hedge_name, assistant_name) if hedge["hedge_won"] else (assistant_name, hedge_name)
+            )
+            timer.assistant, timer.model = winner_name, assistants[winner_name].get("model", "unbekannt")
+            loser = hedge["loser"]
+            self.telemetry.record_hedge(
+                "hedge_won" if hedge["hedge_won"] else "primary_won",
+                loser_name,
+                assistants[loser_name].get("model", "unbekannt"),
+                loser["prompt_tokens"],
+                loser["completion_tokens"]
+            )
+            if hedge["hedge_won"]:
+                assistant_name, assistant_id = winner_name, hedge["winner"]
+        conversation.remember_thread(thread_id, assistant_id)
+        logging.info(f"Run beendet mit Status: {run.status} (Thread ID {thread_id})")
+        return run, result["answer"], result["message"], coalesced, assistant_name, assistant_id
+
+    def _prepare_thread(self, conversation, assistant_id, window):
+        """
+        Liefert den Thread der Unterhaltung und hängt nur die neue Frage an (Polling-Modus).
+
+        Nur wenn nötig (erster Aufruf, Assistant-Wechsel, abgelaufener Thread oder
+        abweichende Historie) wird er aus dem Kontextfenster neu aufgebaut.
+
+        Returns:
+            Tuple aus Thread-ID und Flag, ob der Thread neu aufgebaut wurde
+        """
+        thread_id = conversation.reusable_thread_id(assistant_id)
+
+        if thread_id:
+            try:
+                self.client.beta.threads.messages.create(
+                    thread_id=thread_id,
+                    role="user",
+                    content=conversation.messages[-1]["content"]
+                )
+                conversation.mark_synced()
+                return thread_id, False
+            except NotFoundError:
+                logging.warning(f"Thread {thread_id} ist abgelaufen - baue ihn aus der Historie neu auf.")
+
+        seed, remaining = thread_seed_messages(window)
+        thread = self.client.beta.threads.create(messages=seed)
+        for message in remaining:
+            self.client.beta.threads.messages.create(thread_id=thread.id, **message)
+
+        conversation.remember_thread(thread.id, assistant_id)
+        return thread.id, True
+
+    def _ask_polling(self, conversation, assistant_config, assistant_id, window, instructions, timer, emit):
+        """Phase 1-4 synchron: Thread vorbereiten, Run starten und adaptiv pollen."""
+        # Phase 1 + 2: Thread der Unterhaltung wiederverwenden und nur die neue Frage senden
+        logging.info("Übermittle Frage an Assistenten...")
+        prepare_started = time.perf_counter()
+        thread_id, rebuilt = self._prepare_thread(conversation, assistant_id, window)
+        timer.record("thread_create" if rebuilt else "message_create", time.perf_counter() - prepare_started)
+        if rebuilt:
+            logging.info(f"✅ Konversation aus der Historie aufgebaut: Thread ID {thread_id}")
+        else:
+            logging.info(f"✅ Frage an bestehende Konversation angehängt: Thread ID {thread_id}")
+
+        # Phase 3: Assistant-Verarbeitung starten (nach Zulassung durch die Ratenbegrenzung)
+        admission = get_admission_queue()
+        ticket = None
+        if admission is not None:
+            ticket = admission.admit(
+                assistant_config.get("model"),
+                estimate_request_tokens(window),
+                on_wait=lambda position, wait: emit("admission", (position, wait))
+            )
+            timer.record("admission", ticket.waited)
+        run = None
+        try:
+            with timer.phase("run_create"):
+                run = self.client.beta.threads.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=assistant_id,
+                    additional_instructions=instructions or NOT_GIVEN,
+                    truncation_strategy=truncation_strategy(window)
+                )
+                logging.info(f"✅ Assistent wurde aktiviert: Run ID {run.id}")
+            emit("run_created", (thread_id, run.id))
+
+            # Phase 4: Antwort-Generierung (adaptives Polling mit Deadline)
+            def on_poll(current_run, elapsed_time):
+                emit("poll", elapsed_time)
+
+            on_poll(run, 0)
+            waiter = RunWaiter(self.client)
+            run = waiter.wait(thread_id, run, on_poll=on_poll)
+            run_timings = waiter.phase_timings()
+            # Function-Tools (requires_action) ausführen, bis der Run abgeschlossen ist
+            run = get_tool_executor().resolve(
+                self.client, thread_id, run, waiter, on_poll=on_poll, timings=run_timings
+            )
+            logging.info(f"Polling: {waiter.overhead_report()}")
+            timer.record_all(run_timings)
+        finally:
+            # Auch bei Fehlern und Abbruch: ohne run.usage wird die Schätzung erstattet
+            if ticket is not None:
+                admission.settle(ticket, getattr(run, "usage", None))
+        logging.info(f"Run beendet mit Status: {run.status}")
+        return run, None, None
@@ -0,0 +1,397 @@
+"""
+rate_limiter.py - Ratenbegrenzung und Warteschlange für Runs (RPM/TPM je Modell)
+
+Unter Last feuerte die App Anfragen, bis OpenAI mit 429 antwortete; die
+Nutzer sahen dann die allgemeine Diagnose "API-Limits erreicht", und die
+Retries verschärften den Stau. Jetzt muss jeder Run vor dem Start zugelassen
+werden:
+
+- Zwei Token-Buckets je Modell: Anfragen pro Minute (RPM) und Tokens pro
+  Minute (TPM). Der Token-Bedarf wird vor dem Run geschätzt und danach mit
+  run.usage verrechnet (ohne run.usage, etwa nach einem Fehler, erstattet).
+- Eine faire FIFO-Warteschlange je Modell: Nur die vorderste Anfrage darf
+  Kontingent entnehmen; alle anderen sehen ihre Position.
+- Die Buckets liegen im Speicher (prozessweit für alle Sitzungen) oder, mit
+  KIRCHENRECHT_RATE_LIMIT_DB, in einer SQLite-Datei, die sich mehrere
+  Prozesse teilen.
+
+Limits je Modell lassen sich per JSON überschreiben (RPM, TPM):
+    KIRCHENRECHT_RATE_LIMITS='{"gpt-4o": [5000, 800000]}'
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from conversation import message_tokens
+
+# Limits je Modell als (Anfragen pro Minute, Tokens pro Minute); Standard: Usage Tier 1
+MODEL_LIMITS = {
+    "gpt-4o": (500, 30_000),
+    "gpt-4-turbo": (500, 30_000),
+    "gpt-3.5-turbo": (3_500, 200_000),
+    "o3-mini": (1_000, 100_000),
+    "gpt-o3-mini": (1_000, 100_000),  # Schreibweise aus assistant_config.json
+}
+DEFAULT_LIMITS = (500, 30_000)
+MODEL_LIMITS.update({
+    model: tuple(limits) for model, limits in json.loads(os.getenv("KIRCHENRECHT_RATE_LIMITS", "{}")).items()
+})
+
+# Anteil der Limits, der ausgeschöpft wird (Reserve für Polling, Dateien usw.)
+LIMIT_HEADROOM = 0.9
+
+# Pauschalen für die Schätzung eines Runs: von file_search eingefügte Auszüge und die Antwort
+FILE_SEARCH_TOKENS = 2_000
+COMPLETION_TOKENS = 800
+
+# Warteschlange: maximale Länge je Modell und maximale Wartezeit in Sekunden
+MAX_QUEUE = int(os.getenv("KIRCHENRECHT_MAX_QUEUE", "200"))
+ADMISSION_TIMEOUT = float(os.getenv("KIRCHENRECHT_ADMISSION_TIMEOUT", "120"))
+
+# Prüfintervall der Wartenden in Sekunden
+POLL_INTERVAL = 0.1
+
+# SQLite-Datei für prozessübergreifende Buckets (nicht gesetzt = nur im Prozess)
+RATE_LIMIT_DB = os.getenv("KIRCHENRECHT_RATE_LIMIT_DB")
+
+
+class AdmissionError(Exception):
+    """Die Anfrage wurde nicht zugelassen (Warteschlange voll oder Wartezeit überschritten)."""
+
+
+def limits_for(model):
+    """Limits (RPM, TPM) eines Modells; längster passender Präfix wie bei telemetry.estimate_cost."""
+    matches = [name for name in MODEL_LIMITS if (model or "").startswith(name)]
+    return MODEL_LIMITS[max(matches, key=len)] if matches else DEFAULT_LIMITS
+
+
+def estimate_request_tokens(history):
+    """Schätzt die Tokens eines Runs aus der Historie plus Pauschalen für Suche und Antwort."""
+    prompt = sum(message_tokens(message) for message in history)
+    return prompt + FILE_SEARCH_TOKENS + COMPLETION_TOKENS
+
+
+def _refill(level, updated_at, now, capacity, rate):
+    return min(capacity, level + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBucketStore:
+    """Token-Buckets im Speicher (thread-sicher, für alle Sitzungen eines Prozesses)."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, demands):
+        """
+        Entnimmt alle Mengen auf einmal oder keine.
+
+        Args:
+            demands: Liste von (Bucket-Name, Menge, Kapazität, Nachfüllrate pro Sekunde)
+
+        Returns:
+            0.0, wenn entnommen wurde, sonst die Sekunden bis genug nachgefüllt ist
+        """
+        with self._lock:
+            now = self._clock()
+            levels = {
+                name: _refill(*self._buckets.get(name, (capacity, now)), now, capacity, rate)
+                for name, _, capacity, rate in demands
+            }
+            wait = max((amount - levels[name]) / rate for name, amount, _, rate in demands)
+            if wait > 0:
+                return wait
+            for name, amount, _, _ in demands:
+                self._buckets[name] = (levels[name] - amount, now)
+            return 0.0
+
+    def adjust(self, name, delta, capacity, rate):
+        """Bucht nachträglich Menge zu (delta > 0) oder ab (delta < 0, auch unter null)."""
+        with self._lock:
+            now = self._clock()
+            level = _refill(*self._buckets.get(name, (capacity, now)), now, capacity, rate)
+            self._buckets[name] = (min(capacity, level + delta), now)
+
+    def cap(self, name, maximum, capacity, rate):
+        """Senkt den Füllstand auf höchstens maximum (auch unter null)."""
+        with self._lock:
+            now = self._clock()
+            level = _refill(*self._buckets.get(name, (capacity, now)), now, capacity, rate)
+            self._buckets[name] = (min(level, maximum), now)
+
+
+class SqliteBucketStore:
+    """Token-Buckets in einer SQLite-Datei, die sich mehrere Prozesse teilen."""
+
+    def __init__(self, path=RATE_LIMIT_DB, clock=time.time):
+        self.path = path
+        self._clock = clock
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    name TEXT PRIMARY KEY,
+                    level REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit-Modus; Transaktionen werden mit BEGIN IMMEDIATE explizit gesperrt
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _level(self, conn, name, now, capacity, rate):
+        row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+        return _refill(*(row or (capacity, now)), now, capacity, rate)
+
+    def acquire(self, demands):
+        """Wie MemoryBucketStore.acquire, atomar über Prozessgrenzen hinweg."""
+        with self._transaction() as conn:
+            now = self._clock()
+            levels = {name: self._level(conn, name, now, capacity, rate) for name, _, capacity, rate in demands}
+            wait = max((amount - levels[name]) / rate for name, amount, _, rate in demands)
+            if wait > 0:
+                return wait
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                [(name, levels[name] - amount, now) for name, amount, _, _ in demands]
+            )
+            return 0.0
+
+    def adjust(self, name, delta, capacity, rate):
+        with self._transaction() as conn:
+            now = self._clock()
+            level = self._level(conn, name, now, capacity, rate)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                (name, min(capacity, level + delta), now)
+            )
+
+    def cap(self, name, maximum, capacity, rate):
+        with self._transaction() as conn:
+            now = self._clock()
+            level = self._level(conn, name, now, capacity, rate)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                (name, min(level, maximum), now)
+            )
+
+
+class Ticket:
+    """Eine Anfrage in der Warteschlange eines Modells."""
+
+    def __init__(self, model, tokens):
+        self.model = model
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.waited = 0.0
+
+
+class AdmissionQueue:
+    """Faire FIFO-Warteschlange je Modell vor den RPM/TPM-Buckets."""
+
+    def __init__(self, store=None, resolve_model=None, max_queue=MAX_QUEUE, timeout=ADMISSION_TIMEOUT,
+                 headroom=LIMIT_HEADROOM):
+        """
+        Args:
+            store: MemoryBucketStore oder SqliteBucketStore (Standard: im Speicher)
+            resolve_model: Funktion Assistant-ID -> Modell (für model_for)
+            max_queue: Maximale Anzahl Wartender je Modell
+            timeout: Maximale Wartezeit in Sekunden
+            headroom: Anteil der Limits, der ausgeschöpft wird
+        """
+        self.store = store or MemoryBucketStore()
+        self.resolve_model = resolve_model
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.headroom = headroom
+        self._queues = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"admitted": 0, "rejected": 0, "wait_seconds": 0.0, "max_wait": 0.0})
+
+    def model_for(self, assistant_id):
+        """Modell eines Assistants (None, wenn unbekannt - dann gelten DEFAULT_LIMITS)."""
+        try:
+            return self.resolve_model(assistant_id) if self.resolve_model else None
+        except Exception:
+            return None
+
+    def _buckets(self, model):
+        rpm, tpm = limits_for(model)
+        rpm, tpm = rpm * self.headroom, tpm * self.headroom
+        return (f"{model}:requests", rpm, rpm / 60), (f"{model}:tokens", tpm, tpm / 60)
+
+    def _demands(self, ticket):
+        (requests, rpm, rpm_rate), (tokens, tpm, tpm_rate) = self._buckets(ticket.model)
+        # Größere Anfragen als ein volles Minutenkontingent würden sonst nie zugelassen
+        return [(requests, min(1, rpm), rpm, rpm_rate), (tokens, min(ticket.tokens, tpm), tpm, tpm_rate)]
+
+    def _enqueue(self, model, tokens):
+        ticket = Ticket(model, tokens)
+        with self._lock:
+            queue = self._queues[model]
+            if len(queue) >= self.max_queue:
+                self._stats[model]["rejected"] += 1
+                raise AdmissionError(f"Warteschlange für {model} ist voll ({len(queue)} Anfragen)")
+            queue.append(ticket)
+        return ticket
+
+    def _poll(self, ticket):
+        """
+        Versucht, die Anfrage zuzulassen.
+
+        Returns:
+            Tuple aus Position (1 = vorn, 0 = zugelassen) und geschätzter Wartezeit bis
+            zum nächsten Versuch in Sekunden (None für Wartende hinter der Spitze)
+        """
+        with self._lock:
+            queue = self._queues[ticket.model]
+            position = queue.index(ticket) + 1
+            if position > 1:
+                return position, None
+            wait = self.store.acquire(self._demands(ticket))
+            if wait > 0:
+                return 1, wait
+            queue.popleft()
+            ticket.waited = time.monotonic() - ticket.enqueued_at
+            stats = self._stats[ticket.model]
+            stats["admitted"] += 1
+            stats["wait_seconds"] += ticket.waited
+            stats["max_wait"] = max(stats["max_wait"], ticket.waited)
+            return 0, 0.0
+
+    def _leave(self, ticket, timed_out=False):
+        with self._lock:
+            try:
+                self._queues[ticket.model].remove(ticket)
+            except ValueError:
+                pass
+            if timed_out:
+                self._stats[ticket.model]["rejected"] += 1
+
+    def _step(self, ticket, on_wait, last):
+        """Ein Versuch inkl. Meldung an on_wait; liefert (zugelassen, Pause, Meldung)."""
+        position, wait = self._poll(ticket)
+        if position == 0:
+            return True, 0.0, last
+        if time.monotonic() - ticket.enqueued_at > self.timeout:
+            self._leave(ticket, timed_out=True)
+            raise AdmissionError(f"Zeitlimit von {self.timeout:g} s in der Warteschlange überschritten")
+        report = (position, round(wait) if wait is not None else None)
+        if on_wait is not None and report != last:
+            on_wait(position, wait)
+        return False, min(wait or POLL_INTERVAL, POLL_INTERVAL), report
+
+    def admit(self, model, tokens, on_wait=None):
+        """
+        Wartet (blockierend), bis die Anfrage zugelassen ist.
+
+        Args:
+            model: Modell, dessen Limits gelten
+            tokens: Geschätzte Tokens des Runs (estimate_request_tokens)
+            on_wait: Callback (Position, Wartezeit oder None), wenn sich die Position ändert
+
+        Returns:
+            Ticket (für settle)
+
+        Raises:
+            AdmissionError: Warteschlange voll oder Zeitlimit überschritten
+        """
+        ticket = self._enqueue(model, tokens)
+        admitted, last = False, None
+        try:
+            while True:
+                admitted, pause, last = self._step(ticket, on_wait, last)
+                if admitted:
+                    return ticket
+                time.sleep(pause)
+        finally:
+            if not admitted:
+                self._leave(ticket)
+
+    async def admit_async(self, model, tokens, on_wait=None):
+        """
+        Wie admit, wartet aber ohne den Thread zu blockieren (für async_engine.py).
+
+        Die Versuche laufen in einem Worker-Thread: SqliteBucketStore sperrt die Datenbank
+        bis zu 5 s und darf die Event-Loop (alle laufenden Streams) nicht anhalten.
+        on_wait wird deshalb aus diesem Thread aufgerufen.
+        """
+        ticket = self._enqueue(model, tokens)
+        admitted, last = False, None
+        try:
+            while True:
+                step = asyncio.ensure_future(asyncio.to_thread(self._step, ticket, on_wait, last))
+                try:
+                    admitted, pause, last = await asyncio.shield(step)
+                except asyncio.CancelledError:
+                    # Der Versuch läuft im Thread zu Ende; lässt er die Anfrage noch zu, Kontingent erstatten
+                    step.add_done_callback(lambda done: self._release_if_admitted(ticket, done))
+                    raise
+                if admitted:
+                    return ticket
+                await asyncio.sleep(pause)
+        finally:
+            if not admitted:
+                self._leave(ticket)
+
+    def _release_if_admitted(self, ticket, step):
+        """Gibt das Kontingent eines erst nach dem Abbruch zugelassenen Tickets zurück (im Worker-Thread)."""
+        if step.cancelled() or step.exception() is not None or not step.result()[0]:
+            return
+
+        def release():
+            for name, amount, capacity, rate in self._demands(ticket):
+                self.store.adjust(name, amount, capacity, rate)
+
+        asyncio.get_running_loop().run_in_executor(None, release)
+
+    def settle(self, ticket, usage):
+        """
+        Verrechnet die geschätzten mit den tatsächlich verbrauchten Tokens (run.usage).
+
+        Ohne usage (API-Fehler, Abbruch, Run ohne Verbrauchsangabe) wird die
+        Schätzung vollständig zurückgebucht.
+        """
+        if ticket is None:
+            return
+        _, (tokens, tpm, tpm_rate) = self._buckets(ticket.model)
+        used = usage.total_tokens if usage is not None else 0
+        self.store.adjust(tokens, min(ticket.tokens, tpm) - used, tpm, tpm_rate)
+
+    def backoff(self, model, seconds):
+        """Nach einem 429 trotz Begrenzung: das Anfragekontingent für seconds Sekunden sperren."""
+        (requests, rpm, rpm_rate), _ = self._buckets(model)
+        self.store.cap(requests, -seconds * rpm_rate, rpm, rpm_rate)
+
+    def stats(self):
+        """Warteschlangen und Wartezeiten je Modell."""
+        with self._lock:
+            return {
+                model: dict(stats, waiting=len(self._queues[model]),
+                            mean_wait=stats["wait_seconds"] / stats["admitted"] if stats["admitted"] else 0.0)
+                for model, stats in self._stats.items()
+            }
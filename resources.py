@@ -0,0 +1,275 @@
+"""
+resources.py - Prozessweite Ressourcen für die Kirchenrechts-App
+
+Streamlit führt app.py bei jeder Interaktion komplett neu aus. Früher wurden
+dabei jedes Mal der OpenAI-Client (zweimal), load_dotenv() und das Parsen der
+assistant_config.json wiederholt.
+
+Dieses Modul baut teure Objekte genau einmal pro Prozess auf, da importierte
+Module über Reruns hinweg erhalten bleiben:
+
+- OpenAI-Client mit geteiltem HTTP-Connection-Pool (Keep-Alive über alle Nutzer)
+- Assistant-Registry aus assistant_config.json mit Neuladen bei geänderter mtime
+- Antwort-Caches (exakt und semantisch)
+- Lokaler Volltextindex des Kirchenrechts (sobald er gebaut wurde)
+- Spiegel von kirchenrecht-ekhn.de (sobald der Crawler gelaufen ist)
+- Ausführung von Function-Tools mit Thread-Pool und Ergebnis-Cache
+- Warteschlange mit RPM/TPM-Begrenzung je Modell für alle Sitzungen
+- Thread-Pool für Hintergrundarbeiten (z.B. Zusammenfassung älterer Runden)
+- Frage-Antwort-Dienst (qa_service.py) für Streamlit und HTTP-API
+- Persistente Unterhaltungen (conversation_store.py)
+- Zitatindex für Quellenangaben (citations.py) mit Neuaufbau bei geändertem Rechtsindex
+- Hintergrund-Warteschlange für die Fragen der Streamlit-Oberfläche (job_queue.py)
+"""
+
+import concurrent.futures
+import json
+import os
+import threading
+
+import httpx
+from dotenv import load_dotenv
+from openai import DefaultHttpxClient, OpenAI
+
+# Standardpfad der Assistant-Konfiguration
+CONFIG_FILE = "assistant_config.json"
+
+# Größe des geteilten HTTP-Connection-Pools des synchronen Clients
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Threads für Hintergrundarbeiten nach einer Antwort
+BACKGROUND_WORKERS = 4
+
+_lock = threading.RLock()
+_client = None
+_caches = None
+_legal_index = None
+_tool_executor = None
+_site_mirror = None
+_admission_queue = None
+_background_executor = None
+_question_service = None
+_conversation_store = None
+_job_queue = None
+_env_loaded = False
+_registry = {"path": None, "mtime": None, "data": None}
+_citation_index = {"path": None, "mtime": None, "data": None}
+
+
+def ensure_env():
+    """Lädt die .env-Datei einmal pro Prozess."""
+    global _env_loaded
+    with _lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
+
+def get_client():
+    """
+    Liefert den prozessweit geteilten OpenAI-Client.
+
+    Der API-Key wird automatisch aus der Umgebungsvariable OPENAI_API_KEY geladen.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            ensure_env()
+            _client = OpenAI(
+                http_client=DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+                    )
+                )
+            )
+        return _client
+
+
+def load_assistants(path=CONFIG_FILE):
+    """
+    Liefert die geparste Assistant-Registry aus assistant_config.json.
+
+    Die Datei wird nur neu eingelesen, wenn sich ihre Änderungszeit geändert hat.
+
+    Raises:
+        FileNotFoundError: Wenn die Datei nicht existiert
+        ValueError: Wenn die Datei kein gültiges JSON enthält
+    """
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        if _registry["path"] == path and _registry["mtime"] == mtime:
+            return _registry["data"]
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _registry.update(path=path, mtime=mtime, data=data)
+        return data
+
+
+def get_caches():
+    """
+    Liefert den exakten und den semantischen Antwort-Cache (einmal pro Prozess).
+
+    Returns:
+        Tuple aus AnswerCache und SemanticCache
+    """
+    global _caches
+    with _lock:
+        if _caches is None:
+            from answer_cache import AnswerCache
+            from semantic_cache import SemanticCache, default_embedder
+
+            answer_cache = AnswerCache()
+            semantic_cache = SemanticCache(default_embedder(get_client()))
+            _caches = (answer_cache, semantic_cache)
+        return _caches
+
+
+def get_legal_index():
+    """
+    Liefert den lokalen Volltextindex (legal_index.py) oder None, solange keiner gebaut wurde.
+    """
+    global _legal_index
+    with _lock:
+        if _legal_index is None:
+            from legal_index import DEFAULT_INDEX_PATH, LegalIndex
+
+            if not os.path.exists(DEFAULT_INDEX_PATH):
+                return None
+            _legal_index = LegalIndex(DEFAULT_INDEX_PATH)
+        return _legal_index
+
+
+def get_site_mirror():
+    """
+    Liefert den Spiegel von kirchenrecht-ekhn.de (site_mirror.py) oder None, solange keiner existiert.
+    """
+    global _site_mirror
+    with _lock:
+        if _site_mirror is None:
+            from site_mirror import DEFAULT_MIRROR_PATH, SiteMirror
+
+            if not os.path.exists(DEFAULT_MIRROR_PATH):
+                return None
+            _site_mirror = SiteMirror(DEFAULT_MIRROR_PATH)
+        return _site_mirror
+
+
+def get_tool_executor():
+    """Liefert den prozessweit geteilten ToolExecutor (tool_executor.py)."""
+    global _tool_executor
+    with _lock:
+        if _tool_executor is None:
+            from tool_executor import ToolExecutor
+
+            _tool_executor = ToolExecutor()
+        return _tool_executor
+
+
+def get_admission_queue():
+    """
+    Liefert die prozessweit geteilte Warteschlange (rate_limiter.py) oder None,
+    wenn die Begrenzung mit KIRCHENRECHT_RATE_LIMIT=0 abgeschaltet ist.
+    """
+    global _admission_queue
+    if os.getenv("KIRCHENRECHT_RATE_LIMIT", "1") == "0":
+        return None
+    with _lock:
+        if _admission_queue is None:
+            from rate_limiter import RATE_LIMIT_DB, AdmissionQueue, MemoryBucketStore, SqliteBucketStore
+
+            def resolve_model(assistant_id):
+                for config in load_assistants().values():
+                    if config.get("id") == assistant_id:
+                        return config.get("model")
+                return None
+
+            store = SqliteBucketStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryBucketStore()
+            _admission_queue = AdmissionQueue(store, resolve_model=resolve_model)
+        return _admission_queue
+
+
+def get_background_executor():
+    """
+    Liefert den prozessweit geteilten Thread-Pool für Hintergrundarbeiten,
+    die die Antwortzeit nicht verlängern sollen.
+    """
+    global _background_executor
+    with _lock:
+        if _background_executor is None:
+            _background_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=BACKGROUND_WORKERS, thread_name_prefix="kirchenrecht-background"
+            )
+        return _background_executor
+
+
+def get_question_service():
+    """Liefert den prozessweit geteilten Frage-Antwort-Dienst (qa_service.QuestionService)."""
+    global _question_service
+    with _lock:
+        if _question_service is None:
+            from qa_service import QuestionService
+
+            _question_service = QuestionService()
+        return _question_service
+
+
+def get_conversation_store():
+    """
+    Liefert den prozessweit geteilten Unterhaltungsspeicher (conversation_store.py).
+
+    Beim ersten Aufruf werden lange inaktive Unterhaltungen entfernt.
+    """
+    global _conversation_store
+    with _lock:
+        if _conversation_store is None:
+            from conversation_store import ConversationStore
+
+            _conversation_store = ConversationStore()
+            _conversation_store.purge()
+        return _conversation_store
+
+
+def get_job_queue(service):
+    """
+    Liefert die prozessweit geteilte Job-Warteschlange (job_queue.py).
+
+    Args:
+        service: Dienst, der die Fragen beantwortet (beim ersten Aufruf festgelegt)
+    """
+    global _job_queue
+    with _lock:
+        if _job_queue is None:
+            from job_queue import JobQueue
+
+            _job_queue = JobQueue(service)
+        return _job_queue
+
+
+def get_citation_index():
+    """
+    Liefert den Zitatindex (citations.py) oder None, solange kein Rechtsindex gebaut wurde.
+
+    Ist der Index älter als der Rechtsindex oder das Vector-Store-Manifest, wird er
+    neu berechnet; sonst wird die Datei nur bei geänderter mtime neu eingelesen.
+    """
+    from citations import DEFAULT_CITATION_INDEX, build_index, save_index
+    from legal_index import DEFAULT_INDEX_PATH
+    from vector_store_sync import DEFAULT_MANIFEST, load_manifest
+
+    def mtime(path):
+        return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    with _lock:
+        index_mtime = mtime(DEFAULT_CITATION_INDEX)
+        inputs = [m for m in (mtime(DEFAULT_INDEX_PATH), mtime(DEFAULT_MANIFEST)) if m is not None]
+        if inputs and (index_mtime is None or index_mtime < max(inputs)) and get_legal_index() is not None:
+            save_index(build_index(get_legal_index(), load_manifest(DEFAULT_MANIFEST)), DEFAULT_CITATION_INDEX)
+            index_mtime = mtime(DEFAULT_CITATION_INDEX)
+        if index_mtime is None:
+            return None
+        if _citation_index["path"] != DEFAULT_CITATION_INDEX or _citation_index["mtime"] != index_mtime:
+            with open(DEFAULT_CITATION_INDEX, "r", encoding="utf-8") as f:
+                _citation_index.update(path=DEFAULT_CITATION_INDEX, mtime=index_mtime, data=json.load(f))
+        return _citation_index["data"]
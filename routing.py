@@ -0,0 +1,228 @@
+"""
+routing.py - Automatische Auswahl des Assistants pro Frage
+
+Im Modus "Automatisch" wählt die App für jede Frage einen Assistant aus
+assistant_config.json anhand von:
+
+- einer Komplexitätsheuristik der Frage (Länge, Absätze, Teilfragen,
+  Paragraphenangaben, Schlüsselwörter wie LIVE_DATA_KEYWORDS)
+- der gemessenen Latenz (rollierender Median aus telemetry.py)
+- der Fehlerquote der letzten Fragen je Assistant
+
+Einfache Fragen gehen an das schnellste gesunde Modell, komplexe an ein Modell
+der höchsten Qualitätsstufe (gpt-4o). Jede Entscheidung und ihr Ergebnis werden
+als JSON-Zeile protokolliert, damit die Schwellwerte nachjustiert werden können.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from telemetry import percentile
+
+# Bezeichnung des Routing-Modus in der Modellauswahl
+AUTO_ROUTING = "🔀 Automatisch"
+
+# Protokoll der Routing-Entscheidungen (JSON Lines)
+ROUTING_LOG = os.getenv("KIRCHENRECHT_ROUTING_LOG", "routing_log.jsonl")
+
+# Qualitätsstufe je Modell (längster passender Präfix gilt)
+MODEL_QUALITY = {
+    "gpt-4o": 3,
+    "gpt-4-turbo": 3,
+    "gpt-o3-mini": 2,
+    "o3-mini": 2,
+    "gpt-3.5-turbo": 1,
+}
+
+# Angenommene Antwortzeit in Sekunden, solange keine Messwerte vorliegen
+PRIOR_LATENCY = {
+    "gpt-4o": 15.0,
+    "gpt-4-turbo": 18.0,
+    "gpt-o3-mini": 12.0,
+    "o3-mini": 12.0,
+    "gpt-3.5-turbo": 6.0,
+}
+
+# Komplexitätsschwellen: darunter "einfach", ab COMPLEX_THRESHOLD "komplex"
+SIMPLE_THRESHOLD = 2.0
+COMPLEX_THRESHOLD = 4.0
+
+# Mindestqualität je Komplexitätsstufe
+REQUIRED_QUALITY = {"einfach": 1, "mittel": 2, "komplex": 3}
+
+# Assistants mit höherer Fehlerquote werden gemieden (ab MIN_SAMPLES Messwerten)
+MAX_ERROR_RATE = 0.3
+MIN_SAMPLES = 5
+
+# Anzahl der letzten Fragen, aus denen Latenz und Fehlerquote berechnet werden
+ROLLING_WINDOW = 50
+
+# Begriffe, die auf eine Abwägung oder ein mehrstufiges Verfahren hindeuten
+COMPLEX_TERMS = [
+    "verfahren", "voraussetzung", "abwägung", "unterschied", "verhältnis",
+    "ausnahme", "widerspruch", "rechtsfolge", "zuständig", "frist", "begründ",
+]
+
+
+def _lookup(table, model, default):
+    matches = [name for name in table if (model or "").startswith(name)]
+    return table[max(matches, key=len)] if matches else default
+
+
+def complexity_features(question, keywords=()):
+    """
+    Zerlegt eine Frage in die Merkmale der Komplexitätsheuristik.
+
+    Returns:
+        Dict mit den einzelnen Merkmalen und dem Gesamtwert "score"
+    """
+    text = question.strip()
+    lowered = text.lower()
+    words = len(text.split())
+    features = {
+        "words": words,
+        "paragraphs": len([block for block in re.split(r"\n\s*\n", text) if block.strip()]),
+        "questions": max(1, text.count("?")),
+        "citations": len(re.findall(r"§|\bart(?:ikel|\.)\s*\d", lowered)),
+        "keywords": sum(1 for keyword in keywords if keyword.lower() in lowered),
+        "complex_terms": sum(1 for term in COMPLEX_TERMS if term in lowered),
+    }
+    features["score"] = round(
+        words / 15
+        + (features["paragraphs"] - 1) * 1.5
+        + (features["questions"] - 1)
+        + features["citations"] * 0.5
+        + features["keywords"]
+        + features["complex_terms"] * 0.75,
+        2
+    )
+    return features
+
+
+def complexity_tier(score):
+    if score < SIMPLE_THRESHOLD:
+        return "einfach"
+    if score < COMPLEX_THRESHOLD:
+        return "mittel"
+    return "komplex"
+
+
+class Router:
+    """Wählt pro Frage einen Assistant und protokolliert Entscheidung und Ergebnis."""
+
+    def __init__(self, assistants, registry, keywords=(), log_path=ROUTING_LOG):
+        """
+        Args:
+            assistants: Dict Name -> Konfiguration aus assistant_config.json
+            registry: MetricsRegistry mit den gemessenen Ergebnissen je Assistant
+            keywords: Zusätzliche Schlüsselwörter, die eine Frage komplexer machen
+            log_path: JSON-Lines-Datei für Entscheidungen (None = nur logging)
+        """
+        self.assistants = assistants
+        self.registry = registry
+        self.keywords = list(keywords)
+        self.log_path = log_path
+        self._lock = threading.Lock()
+
+    def assistant_stats(self, name):
+        """Rollierende Latenz und Fehlerquote eines Assistants."""
+        outcomes = self.registry.recent_outcomes(name)[-ROLLING_WINDOW:]
+        durations = [seconds for ok, seconds in outcomes if ok]
+        model = self.assistants[name].get("model")
+        return {
+            "samples": len(outcomes),
+            "error_rate": 1 - len(durations) / len(outcomes) if outcomes else 0.0,
+            "latency": percentile(durations, 50) if durations else _lookup(PRIOR_LATENCY, model, 15.0),
+            "measured": bool(durations),
+            "quality": _lookup(MODEL_QUALITY, model, 2),
+        }
+
+    def choose(self, question):
+        """
+        Wählt den Assistant für eine Frage.
+
+        Returns:
+            Tuple aus Assistant-Name und Entscheidungs-Dict (für record_outcome)
+        """
+        features = complexity_features(question, self.keywords)
+        tier = complexity_tier(features["score"])
+        stats = {name: self.assistant_stats(name) for name in self.assistants}
+
+        healthy = [
+            name for name, values in stats.items()
+            if values["samples"] < MIN_SAMPLES or values["error_rate"] <= MAX_ERROR_RATE
+        ] or list(stats)
+        required = REQUIRED_QUALITY[tier]
+        candidates = [name for name in healthy if stats[name]["quality"] >= required]
+        if not candidates:
+            # Kein Modell der geforderten Stufe verfügbar: bestes gesundes Modell nehmen
+            best = max(stats[name]["quality"] for name in healthy)
+            candidates = [name for name in healthy if stats[name]["quality"] == best]
+
+        chosen = min(candidates, key=lambda name: stats[name]["latency"])
+        decision = {
+            "decision_id": uuid.uuid4().hex[:12],
+            "timestamp": time.time(),
+            "question_hash": hashlib.sha256(question.encode("utf-8")).hexdigest()[:16],
+            "features": features,
+            "tier": tier,
+            "chosen": chosen,
+            "model": self.assistants[chosen].get("model"),
+            "candidates": {
+                name: {
+                    "latency": round(values["latency"], 2),
+                    "error_rate": round(values["error_rate"], 2),
+                    "measured": values["measured"],
+                }
+                for name, values in stats.items()
+            },
+        }
+        logging.info(
+            f"Routing: Komplexität {features['score']} ({tier}) -> {chosen} "
+            f"(erwartete Latenz {stats[chosen]['latency']:.1f}s)"
+        )
+        self._write({"type": "decision", **decision})
+        return chosen, decision
+
+    def hedge_partner(self, name):
+        """
+        Liefert den Assistant, der einen langsamen Run von name absichert.
+
+        Gewählt wird der schnellste gesunde andere Assistant (None, wenn es keinen gibt).
+        """
+        others = {other: self.assistant_stats(other) for other in self.assistants if other != name}
+        healthy = [
+            other for other, values in others.items()
+            if values["samples"] < MIN_SAMPLES or values["error_rate"] <= MAX_ERROR_RATE
+        ]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda other: others[other]["latency"])
+
+    def record_outcome(self, decision, status, seconds):
+        """Protokolliert das Ergebnis einer Routing-Entscheidung."""
+        logging.info(f"Routing-Ergebnis {decision['decision_id']}: {decision['chosen']} {status} in {seconds:.2f}s")
+        self._write({
+            "type": "outcome",
+            "decision_id": decision["decision_id"],
+            "timestamp": time.time(),
+            "chosen": decision["chosen"],
+            "tier": decision["tier"],
+            "status": status,
+            "seconds": round(seconds, 3),
+        })
+
+    def _write(self, entry):
+        if not self.log_path:
+            return
+        try:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.warning(f"Routing-Protokoll konnte nicht geschrieben werden: {e}")
@@ -0,0 +1,218 @@
+"""
+run_waiter.py - Wiederverwendbares Warten auf Assistants-Runs mit adaptivem Polling
+
+Wo (noch) gepollt werden muss, ersetzt dieser Baustein die bisherigen
+Schleifen mit festen Intervallen (0,5 s in app.py, 1 s in debug_assistant.py)
+bzw. ohne Pause (app_openai.py):
+
+- Exponentielles Backoff mit Jitter zwischen den Abfragen
+- Beachtung von Retry-After und x-ratelimit-*-Headern
+- Harte Deadline, nach der der Run serverseitig abgebrochen wird
+- Statistik über Anzahl Abfragen und Polling-Overhead
+
+Verwendung:
+    waiter = RunWaiter(client, deadline=120)
+    run = waiter.wait(thread_id, run)
+    print(waiter.stats)
+"""
+
+import logging
+import os
+import random
+import re
+import time
+
+from openai import APIStatusError, RateLimitError
+
+# Status, bei denen das Warten endet. requires_action muss vom Aufrufer
+# behandelt werden (Tool-Ausgaben einreichen), sonst läuft der Run ab.
+STOP_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+# Standardwerte für das Backoff
+INITIAL_DELAY = 0.25
+MAX_DELAY = 4.0
+MULTIPLIER = 1.6
+JITTER = 0.25
+DEFAULT_DEADLINE = float(os.getenv("KIRCHENRECHT_RUN_DEADLINE", "180"))
+
+
+def parse_duration(value):
+    """
+    Wandelt Dauerangaben aus Rate-Limit-Headern in Sekunden um.
+
+    Unterstützt Sekunden als Zahl ("2", "0.5") und das Format der OpenAI-Header
+    ("1s", "6m0s", "20ms").
+
+    Returns:
+        Sekunden als float oder None, wenn die Angabe nicht lesbar ist
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    factors = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * factors[unit] for number, unit in parts)
+
+
+def server_requested_delay(headers):
+    """
+    Ermittelt aus Antwort-Headern, wie lange der Server eine Pause wünscht.
+
+    Returns:
+        Sekunden oder None, wenn keine Vorgabe vorliegt
+    """
+    if not headers:
+        return None
+    retry_after = parse_duration(headers.get("retry-after-ms"))
+    if retry_after is not None:
+        return retry_after / 1000
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    if headers.get("x-ratelimit-remaining-requests") == "0":
+        return parse_duration(headers.get("x-ratelimit-reset-requests"))
+    return None
+
+
+class RunWaiter:
+    """Wartet mit exponentiellem Backoff auf einen Run und bricht ihn nach der Deadline ab."""
+
+    def __init__(self, client, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY,
+                 multiplier=MULTIPLIER, jitter=JITTER, deadline=DEFAULT_DEADLINE,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.client = client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self._sleep = sleep
+        self._clock = clock
+        self.stats = {}
+
+    def _next_delay(self, delay):
+        """Nächstes Intervall: exponentiell wachsend, gedeckelt, mit ±Jitter."""
+        delay = min(self.max_delay, delay * self.multiplier)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _retrieve(self, thread_id, run_id):
+        """
+        Ruft den Run ab und liefert zusätzlich eine vom Server gewünschte Pause.
+
+        Returns:
+            Tuple aus Run (oder None bei Rate-Limit) und Pause in Sekunden (oder None)
+        """
+        try:
+            # Ohne SDK-Retries, damit Rate-Limits hier sichtbar werden und das Tempo bestimmen
+            raw = self.client.with_options(max_retries=0).beta.threads.runs.with_raw_response.retrieve(
+                thread_id=thread_id,
+                run_id=run_id
+            )
+        except RateLimitError as e:
+            self.stats["rate_limited"] += 1
+            return None, server_requested_delay(e.response.headers) or self.max_delay
+        except APIStatusError as e:
+            if e.status_code >= 500:
+                logging.warning(f"Serverfehler beim Abrufen des Runs {run_id}: {e.status_code}")
+                return None, server_requested_delay(e.response.headers)
+            raise
+        return raw.parse(), server_requested_delay(raw.headers)
+
+    def cancel(self, thread_id, run_id):
+        """Bricht einen Run serverseitig ab (Fehler werden protokolliert, nicht geworfen)."""
+        try:
+            return self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            logging.warning(f"Run {run_id} konnte nicht abgebrochen werden: {e}")
+            return None
+
+    def wait(self, thread_id, run, on_poll=None):
+        """
+        Wartet, bis der Run einen Endstatus (oder requires_action) erreicht.
+
+        Args:
+            thread_id: ID des Threads
+            run: Der gestartete Run (Rückgabe von runs.create)
+            on_poll: Optionaler Callback on_poll(run, elapsed_seconds) nach jeder Abfrage
+
+        Returns:
+            Den letzten abgerufenen Run. Nach Ablauf der Deadline wird der Run
+            serverseitig abgebrochen und im Status "cancelling"/"cancelled" geliefert.
+        """
+        start = self._clock()
+        delay = self.initial_delay
+        self.stats = {
+            "polls": 0,
+            "sleep_seconds": 0.0,
+            "rate_limited": 0,
+            "server_delays": 0,
+            "timed_out": False,
+            "last_delay": 0.0,
+            # Erster Zeitpunkt (Sekunden seit Start), zu dem ein Status beobachtet wurde
+            "status_seen": {run.status: 0.0},
+        }
+
+        while run.status not in STOP_STATUSES:
+            elapsed = self._clock() - start
+            if elapsed >= self.deadline:
+                logging.error(f"Run {run.id} überschreitet die Deadline von {self.deadline:.0f}s - breche ab.")
+                self.stats["timed_out"] = True
+                run = self.cancel(thread_id, run.id) or run
+                break
+
+            pause = min(delay, max(0.0, self.deadline - elapsed))
+            self._sleep(pause)
+            self.stats["sleep_seconds"] += pause
+            self.stats["last_delay"] = pause
+
+            latest, requested = self._retrieve(thread_id, run.id)
+            self.stats["polls"] += 1
+            if latest is not None:
+                run = latest
+                self.stats["status_seen"].setdefault(run.status, self._clock() - start)
+            if requested is not None:
+                # Der Server gibt das Tempo vor (Retry-After / Rate-Limit-Reset)
+                self.stats["server_delays"] += 1
+                delay = max(requested, self.initial_delay)
+            else:
+                delay = self._next_delay(delay)
+
+            if on_poll is not None:
+                on_poll(run, self._clock() - start)
+
+        self.stats["elapsed_seconds"] = self._clock() - start
+        return run
+
+    def phase_timings(self):
+        """
+        Teilt die Wartezeit des letzten Runs in Warteschlange und Verarbeitung auf.
+
+        Returns:
+            Dict mit "queue_wait" und "in_progress" in Sekunden (Auflösung = Polling-Intervall)
+        """
+        elapsed = self.stats.get("elapsed_seconds", 0.0)
+        started = self.stats.get("status_seen", {}).get("in_progress", elapsed)
+        return {"queue_wait": started, "in_progress": elapsed - started}
+
+    def overhead_report(self):
+        """
+        Fasst den Polling-Overhead zusammen.
+
+        Die Erkennungsverzögerung (Zeit zwischen Fertigstellung des Runs und
+        deren Bemerken) ist höchstens so lang wie das letzte Warteintervall.
+        """
+        stats = self.stats
+        if not stats:
+            return "Noch kein Run abgewartet."
+        return (
+            f"{stats['polls']} Abfragen in {stats.get('elapsed_seconds', 0):.1f}s, "
+            f"max. Erkennungsverzögerung {stats['last_delay']:.2f}s, "
+            f"{stats['rate_limited']}× Rate-Limit, {stats['server_delays']}× Server-Vorgabe"
+            + (", Deadline überschritten" if stats["timed_out"] else "")
+        )
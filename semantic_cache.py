@@ -0,0 +1,454 @@
+"""
+semantic_cache.py - Semantischer Antwort-Cache mit Embeddings
+
+Der exakte Antwort-Cache (answer_cache.py) erkennt nur identische Fragen.
+Umformulierungen wie "Wahl zum Kirchenvorstand Voraussetzungen" und
+"Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?" verfehlen ihn.
+
+Dieser Cache bettet Fragen als Vektoren ein und sucht per Kosinus-Ähnlichkeit
+(NumPy-Matrix) nach bereits beantworteten, ähnlichen Fragen. Liegt die
+Ähnlichkeit über einem konfigurierbaren Schwellwert, wird die gespeicherte
+Antwort geliefert.
+
+Fragen mit entgegengesetzter Bedeutung liegen als Vektoren oft dicht beieinander
+("Darf ... ohne Ordination ...?" / "Darf ... mit Ordination ...?"). Unterscheiden
+sich zwei Fragen in Verneinungen oder Wörtern wie "ohne"/"mit" (POLARITY_WORDS),
+gelten sie deshalb nie als Treffer.
+
+Die Embedding-Funktion ist austauschbar. Standardmäßig wird das Embedding-Modell
+KIRCHENRECHT_EMBEDDING_MODEL der OpenAI API verwendet (default_embedder); das
+lokale Hashing-Embedding (KIRCHENRECHT_EMBEDDING_MODEL=local) arbeitet offline
+und ist nur für Tests und den Mock-Server gedacht.
+
+Je Assistant und normalisierter Frage gibt es höchstens einen Eintrag (eine
+neue Antwort ersetzt die alte), die Anzahl ist wie beim exakten Cache begrenzt
+(LRU). Invalidiert wird über AnswerCache.invalidate bzw. invalidate_files
+(answer_cache.py) für beide Caches; die Matrizen werden beim nächsten Zugriff
+neu geladen.
+
+Ähnlichkeit zweier Fragen prüfen:
+    python semantic_cache.py "Frage A" "Frage B"
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from answer_cache import (
+    DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, UMLAUT_MAP, add_file_ids_column, cache_generation,
+    init_meta, normalize_question
+)
+
+# Schwellwert für einen Treffer (Kosinus-Ähnlichkeit, 0..1)
+DEFAULT_THRESHOLD = float(os.getenv("KIRCHENRECHT_SEMANTIC_THRESHOLD", "0.9"))
+
+# Embedding-Modell der OpenAI API; "local" = Hashing-Embedding (nur Tests/Offline)
+EMBEDDING_MODEL = os.getenv("KIRCHENRECHT_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Dimension des lokalen Hashing-Embeddings
+LOCAL_EMBEDDING_DIM = 512
+
+# Breite der Histogramm-Klassen für die Ähnlichkeitsverteilung
+SIMILARITY_BIN_WIDTH = 0.05
+
+# Mindestanzahl Zeilen, um die eine Matrix wächst (sonst verdoppelt sie sich)
+GROW_ROWS = 64
+
+# Zuletzt berechnete Embeddings (Nachschlagen und Aufnehmen derselben Frage kosten einen Aufruf)
+EMBEDDING_MEMO_SIZE = 256
+
+# Füllwörter, die für die Bedeutung einer Frage keine Rolle spielen
+STOPWORDS = {
+    "welche", "welcher", "welches", "was", "wie", "wer", "wann", "wo", "warum",
+    "gelten", "gilt", "ist", "sind", "hat", "haben", "darf", "kann", "muss",
+    "der", "die", "das", "den", "dem", "des", "ein", "eine", "einer", "eines",
+    "fuer", "zum", "zur", "im", "in", "bei", "von", "und", "oder",
+    "es", "sich", "auf", "an", "zu", "ueber", "nach", "geregelt",
+}
+
+# Verneinungen und Präpositionen, die die Bedeutung einer Frage umkehren;
+# Fragen, die sich darin unterscheiden, gelten nie als ähnlich
+POLARITY_WORDS = {
+    "nicht", "nichts", "nie", "niemals", "kein", "keine", "keinen", "keinem", "keiner", "keines",
+    "weder", "ohne", "mit", "ausser", "gegen",
+}
+
+
+def _words(text):
+    text = text.casefold().translate(UMLAUT_MAP)
+    return re.findall(r"[a-z0-9§]+", text)
+
+
+def _tokens(text):
+    return [word for word in _words(text) if word not in STOPWORDS]
+
+
+def polarity(text):
+    """Die Verneinungen und Präpositionen aus POLARITY_WORDS, die in einer Frage vorkommen."""
+    return frozenset(word for word in _words(text) if word in POLARITY_WORDS)
+
+
+def _bucket(feature, dim):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % dim
+
+
+def local_embedder(text, dim=LOCAL_EMBEDDING_DIM):
+    """
+    Lokales Hashing-Embedding aus Wörtern und Zeichen-Trigrammen.
+
+    Arbeitet ohne Netzwerk und ohne Modell-Download und ist damit für Tests
+    und den Mock-Server geeignet, erkennt aber nur gemeinsame Wörter statt
+    Bedeutung. Füllwörter werden ignoriert, die Trigramme fangen Flexionen ab
+    ("Kirchenvorstand" / "Kirchenvorstands").
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _tokens(text):
+        vector[_bucket("w:" + word, dim)] += 2.0
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            vector[_bucket("t:" + padded[i:i + 3], dim)] += 1.0
+    return vector
+
+
+def openai_embedder(client, model="text-embedding-3-small"):
+    """Erzeugt eine Embedding-Funktion auf Basis der OpenAI Embeddings API."""
+    def embed(text):
+        response = client.embeddings.create(model=model, input=text)
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+    embed.__name__ = f"openai:{model}"
+    return embed
+
+
+def default_embedder(client, model=EMBEDDING_MODEL):
+    """Embedding-Funktion gemäß KIRCHENRECHT_EMBEDDING_MODEL ("local" = Hashing-Embedding)."""
+    if model == "local":
+        return local_embedder
+    return openai_embedder(client, model)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticCache:
+    """Semantischer Cache: Kosinus-Ähnlichkeit über eine NumPy-Matrix pro Assistant."""
+
+    def __init__(self, embed_fn, threshold=DEFAULT_THRESHOLD, path=DEFAULT_CACHE_PATH,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            embed_fn: Embedding-Funktion text -> Vektor (default_embedder, in Tests local_embedder)
+        """
+        self.embed_fn = embed_fn
+        self.embedder_name = getattr(embed_fn, "__name__", "custom")
+        self.threshold = threshold
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # assistant_id -> {"matrix": np.ndarray (Kapazität x Dimension), "size": belegte Zeilen,
+        #                  "polarity": np.ndarray, "keys": [...], "entries": [(question, answer, created_at)],
+        #                  "rows": {normalisierte Frage: Zeile}}
+        self._index = {}
+        self._polarity_ids = {}
+        self._embeddings = OrderedDict()
+        self._lookups = 0
+        self._hits = 0
+        self._similarity_bins = np.zeros(int(round(1 / SIMILARITY_BIN_WIDTH)) + 1, dtype=np.int64)
+        self._generation = None
+        self._init_db()
+        with self._lock:
+            self._load()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            init_meta(conn)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(semantic_entries)")}
+            if columns and "question_key" not in columns:
+                # Tabelle ohne Schlüssel je Frage (Duplikate möglich): Einträge verwerfen
+                conn.execute("DROP TABLE semantic_entries")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS semantic_entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    assistant_id TEXT NOT NULL,
+                    embedder TEXT NOT NULL,
+                    question_key TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    file_ids TEXT NOT NULL DEFAULT '[]',
+                    UNIQUE (assistant_id, embedder, question_key)
+                )
+            """)
+            add_file_ids_column(conn, "semantic_entries")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_semantic_last_access ON semantic_entries(last_access)")
+
+    def _load(self):
+        """Lädt gespeicherte Einträge des aktuellen Embedders in die Matrizen (Aufruf nur unter self._lock)."""
+        cutoff = time.time() - self.ttl_seconds
+        self._index.clear()
+        with self._connect() as conn:
+            self._generation = cache_generation(conn)
+            conn.execute("DELETE FROM semantic_entries WHERE created_at < ?", (cutoff,))
+            rows = conn.execute(
+                """
+                SELECT assistant_id, question_key, question, answer, embedding, created_at
+                FROM semantic_entries WHERE embedder = ? ORDER BY id
+                """,
+                (self.embedder_name,)
+            ).fetchall()
+        for assistant_id, key, question, answer, blob, created_at in rows:
+            self._store(assistant_id, key, question, answer, np.frombuffer(blob, dtype=np.float32), created_at)
+
+    def _reload_if_invalidated(self):
+        """Lädt die Matrizen neu, wenn ein Prozess die Caches inzwischen invalidiert hat (unter self._lock)."""
+        with self._connect() as conn:
+            generation = cache_generation(conn)
+        if generation != self._generation:
+            logging.info("Antwort-Cache wurde invalidiert - lade den semantischen Cache neu.")
+            self._load()
+
+    def _embed(self, question):
+        """Normalisiertes Embedding einer Frage (die letzten werden zwischengespeichert)."""
+        with self._lock:
+            vector = self._embeddings.get(question)
+            if vector is not None:
+                self._embeddings.move_to_end(question)
+                return vector
+        vector = _normalize(self.embed_fn(question))
+        with self._lock:
+            self._embeddings[question] = vector
+            while len(self._embeddings) > EMBEDDING_MEMO_SIZE:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _polarity_id(self, question):
+        return self._polarity_ids.setdefault(polarity(question), len(self._polarity_ids))
+
+    def _store(self, assistant_id, key, question, answer, vector, created_at):
+        """Setzt die Zeile einer Frage in der Matrix (ersetzt einen vorhandenen Eintrag)."""
+        bucket = self._index.get(assistant_id)
+        if bucket is None:
+            bucket = self._index[assistant_id] = {
+                "matrix": np.empty((GROW_ROWS, vector.shape[0]), dtype=np.float32),
+                "polarity": np.empty(GROW_ROWS, dtype=np.int32),
+                "size": 0, "keys": [], "entries": [], "rows": {},
+            }
+        row = bucket["rows"].get(key)
+        if row is None:
+            row = bucket["size"]
+            if row == len(bucket["matrix"]):
+                # Kapazität verdoppeln statt bei jedem Eintrag die ganze Matrix zu kopieren
+                grow = max(GROW_ROWS, row)
+                bucket["matrix"] = np.concatenate(
+                    [bucket["matrix"], np.empty((grow, bucket["matrix"].shape[1]), dtype=np.float32)]
+                )
+                bucket["polarity"] = np.concatenate([bucket["polarity"], np.empty(grow, dtype=np.int32)])
+            bucket["size"] += 1
+            bucket["keys"].append(key)
+            bucket["entries"].append(None)
+            bucket["rows"][key] = row
+        bucket["matrix"][row] = vector
+        bucket["polarity"][row] = self._polarity_id(question)
+        bucket["entries"][row] = (question, answer, created_at)
+
+    def _remove(self, assistant_id, key):
+        """Entfernt einen Eintrag; die letzte Zeile rückt an seine Stelle."""
+        bucket = self._index.get(assistant_id)
+        row = bucket["rows"].pop(key, None) if bucket else None
+        if row is None:
+            return
+        last = bucket["size"] - 1
+        if row != last:
+            bucket["matrix"][row] = bucket["matrix"][last]
+            bucket["polarity"][row] = bucket["polarity"][last]
+            bucket["entries"][row] = bucket["entries"][last]
+            bucket["keys"][row] = bucket["keys"][last]
+            bucket["rows"][bucket["keys"][row]] = row
+        bucket["entries"].pop()
+        bucket["keys"].pop()
+        bucket["size"] = last
+
+    def lookup(self, assistant_id, question):
+        """
+        Sucht die ähnlichste bereits beantwortete Frage mit gleichen Verneinungen.
+
+        Returns:
+            Dict mit "question", "answer" und "similarity" oder None
+        """
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            # Ohne Embedding kein semantischer Treffer - die Frage geht an den Assistant
+            logging.warning(f"Embedding für den semantischen Cache fehlgeschlagen: {e}")
+            return None
+        with self._lock:
+            self._reload_if_invalidated()
+            self._lookups += 1
+            bucket = self._index.get(assistant_id)
+            if not bucket or not bucket["size"]:
+                return None
+            size = bucket["size"]
+            similarities = bucket["matrix"][:size] @ vector
+            similarities[bucket["polarity"][:size] != self._polarity_id(question)] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < 0:
+                return None
+            self._similarity_bins[int(min(similarity, 1.0) / SIMILARITY_BIN_WIDTH)] += 1
+            cached_question, answer, created_at = bucket["entries"][best]
+            if similarity < self.threshold or time.time() - created_at > self.ttl_seconds:
+                return None
+            self._hits += 1
+            key = bucket["keys"][best]
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    UPDATE semantic_entries SET last_access = ?
+                    WHERE assistant_id = ? AND embedder = ? AND question_key = ?
+                    """,
+                    (time.time(), assistant_id, self.embedder_name, key)
+                )
+        return {"question": cached_question, "answer": answer, "similarity": similarity}
+
+    def add(self, assistant_id, question, answer, replace_similar=False, file_ids=()):
+        """
+        Nimmt eine beantwortete Frage auf (ersetzt den Eintrag derselben Frage).
+
+        Args:
+            replace_similar: Auch Einträge ähnlicher Fragen über dem Schwellwert entfernen,
+                z.B. wenn die Antwort nach geänderten Quellen neu berechnet wurde (faq_warmup.py)
+            file_ids: Dateien des Vector Stores, auf die sich die Antwort stützt
+        """
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            logging.warning(f"Embedding für den semantischen Cache fehlgeschlagen: {e}")
+            return
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._reload_if_invalidated()
+            stale = self._similar_keys(assistant_id, question, vector) if replace_similar else []
+            self._store(assistant_id, key, question, answer, vector, now)
+            with self._connect() as conn:
+                for stale_key in stale:
+                    if stale_key != key:
+                        conn.execute(
+                            """
+                            DELETE FROM semantic_entries
+                            WHERE assistant_id = ? AND embedder = ? AND question_key = ?
+                            """,
+                            (assistant_id, self.embedder_name, stale_key)
+                        )
+                        self._remove(assistant_id, stale_key)
+                conn.execute(
+                    """
+                    INSERT INTO semantic_entries
+                        (assistant_id, embedder, question_key, question, answer, embedding, created_at, last_access,
+                         file_ids)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (assistant_id, embedder, question_key) DO UPDATE SET
+                        question = excluded.question, answer = excluded.answer, embedding = excluded.embedding,
+                        created_at = excluded.created_at, last_access = excluded.last_access,
+                        file_ids = excluded.file_ids
+                    """,
+                    (assistant_id, self.embedder_name, key, question, answer, vector.tobytes(), now, now,
+                     json.dumps(sorted(set(file_ids))))
+                )
+                self._evict(conn, now)
+
+    def _similar_keys(self, assistant_id, question, vector):
+        """Schlüssel aller Einträge, die für question als Treffer gelten würden (Aufruf nur unter self._lock)."""
+        bucket = self._index.get(assistant_id)
+        if not bucket or not bucket["size"]:
+            return []
+        size = bucket["size"]
+        similarities = bucket["matrix"][:size] @ vector
+        matches = (similarities >= self.threshold) & (bucket["polarity"][:size] == self._polarity_id(question))
+        return [bucket["keys"][row] for row in np.flatnonzero(matches)]
+
+    def _evict(self, conn, now):
+        """Entfernt abgelaufene und die am längsten nicht genutzten Einträge (Aufruf nur unter self._lock)."""
+        evicted = conn.execute(
+            """
+            SELECT assistant_id, question_key FROM semantic_entries
+            WHERE embedder = ? AND (created_at < ? OR id IN (
+                SELECT id FROM semantic_entries WHERE embedder = ?
+                ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            ))
+            """,
+            (self.embedder_name, now - self.ttl_seconds, self.embedder_name, self.max_entries)
+        ).fetchall()
+        for assistant_id, key in evicted:
+            conn.execute(
+                "DELETE FROM semantic_entries WHERE assistant_id = ? AND embedder = ? AND question_key = ?",
+                (assistant_id, self.embedder_name, key)
+            )
+            self._remove(assistant_id, key)
+
+    def metrics(self):
+        """
+        Liefert Kennzahlen für Trefferquote und Ähnlichkeitsverteilung.
+
+        Returns:
+            Dict mit "lookups", "hits", "hit_rate", "entries", "threshold" und
+            "similarity_histogram" ({Klassen-Untergrenze: Anzahl})
+        """
+        with self._lock:
+            histogram = {
+                round(i * SIMILARITY_BIN_WIDTH, 2): int(count)
+                for i, count in enumerate(self._similarity_bins) if count
+            }
+            return {
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "entries": sum(bucket["size"] for bucket in self._index.values()),
+                "threshold": self.threshold,
+                "similarity_histogram": histogram,
+            }
+
+
+def main():
+    if len(sys.argv) != 3:
+        print('Verwendung: python semantic_cache.py "Frage A" "Frage B"')
+        return
+    from resources import get_client
+
+    embed = local_embedder if EMBEDDING_MODEL == "local" else default_embedder(get_client())
+    a, b = (_normalize(embed(text)) for text in sys.argv[1:])
+    similarity = float(a @ b)
+    if polarity(sys.argv[1]) != polarity(sys.argv[2]):
+        verdict = "❌ Kein Treffer (Verneinung/Präposition unterschiedlich)"
+    else:
+        verdict = "✅ Treffer" if similarity >= DEFAULT_THRESHOLD else "❌ Kein Treffer"
+    print(f"Ähnlichkeit: {similarity:.3f} (Schwellwert {DEFAULT_THRESHOLD}) -> {verdict}")
+
+
+if __name__ == "__main__":
+    main()
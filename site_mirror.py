@@ -0,0 +1,368 @@
+"""
+site_mirror.py - Inkrementeller Spiegel von kirchenrecht-ekhn.de
+
+Bisher hing jede Live-Daten-Frage von einem Abruf der Website zur Fragezeit
+ab. Dieser Crawler hält stattdessen einen lokalen Spiegel aktuell:
+
+- Bedingte Abrufe (If-None-Match / If-Modified-Since): unveränderte Seiten
+  kosten nur eine 304-Antwort ohne Inhalt
+- Begrenzte Parallelität über einen Thread-Pool
+- Inhalts-Hash des extrahierten Textes: Seiten ohne inhaltliche Änderung
+  werden nicht neu indexiert
+- Änderungs-Feed (hinzugefügt / geändert / entfernt) für nachgelagerte Caches
+
+Die Rechtsdokumente (/document/<id>) landen im lokalen Rechtsindex
+(legal_index.py), aus dem das Tool get_kirchenrecht_info antwortet. Ein
+erneuter Lauf ist billig genug, um stündlich per cron zu laufen:
+
+    python site_mirror.py crawl
+    python site_mirror.py crawl --interval 3600    # Dauerbetrieb
+    python site_mirror.py feed --since 0
+
+Gegen die lokale Fixture (benchmarks/site_fixture.py) testen:
+    python site_mirror.py crawl --site http://127.0.0.1:8766
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from kirchenrecht_site import DOCUMENT_LINK_RE, FETCH_TIMEOUT, SITE_URL, USER_AGENT, page_links
+from legal_index import DEFAULT_INDEX_PATH, LegalIndex, html_to_text
+
+# Datenbank des Spiegels (Seiten, Validatoren, Änderungs-Feed)
+DEFAULT_MIRROR_PATH = os.getenv("KIRCHENRECHT_MIRROR_DB", "site_mirror.sqlite3")
+
+# Gleichzeitige HTTP-Abrufe und Obergrenze der Seiten pro Lauf
+CRAWL_WORKERS = int(os.getenv("KIRCHENRECHT_CRAWL_WORKERS", "4"))
+MAX_PAGES = int(os.getenv("KIRCHENRECHT_CRAWL_MAX_PAGES", "5000"))
+
+# Dateiendungen, denen der Crawler nicht folgt
+SKIPPED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".css", ".js", ".zip", ".doc", ".docx"}
+
+
+def in_scope(url, base_url):
+    """Nur Seiten derselben Website ohne Query-String (keine Suchergebnisse, keine Dateien)."""
+    parts, base = urlsplit(url), urlsplit(base_url)
+    if parts.scheme not in ("http", "https") or parts.netloc != base.netloc or parts.query:
+        return False
+    return os.path.splitext(parts.path)[1].lower() not in SKIPPED_EXTENSIONS
+
+
+def is_document(url):
+    return bool(DOCUMENT_LINK_RE.search(urlsplit(url).path))
+
+
+class SiteMirror:
+    """Gespiegelte Seiten mit HTTP-Validatoren, Inhalts-Hash und Änderungs-Feed (SQLite)."""
+
+    def __init__(self, path=DEFAULT_MIRROR_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT NOT NULL,
+                    title TEXT,
+                    body BLOB NOT NULL,
+                    links TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    changed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    content_hash TEXT,
+                    detected_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS crawls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at REAL NOT NULL,
+                    finished_at REAL NOT NULL,
+                    stats TEXT NOT NULL
+                );
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def page(self, url):
+        """Gespeicherter Stand einer Seite (ohne Inhalt) oder None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT url, etag, last_modified, content_hash, title, links, fetched_at, changed_at "
+                "FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return dict(row, links=json.loads(row["links"])) if row else None
+
+    def html(self, url):
+        with self._connect() as conn:
+            row = conn.execute("SELECT body FROM pages WHERE url = ?", (url,)).fetchone()
+        return zlib.decompress(row["body"]).decode("utf-8") if row else None
+
+    def urls(self):
+        with self._connect() as conn:
+            return [row["url"] for row in conn.execute("SELECT url FROM pages ORDER BY url")]
+
+    def store(self, url, html, content_hash, title, links, etag, last_modified):
+        """
+        Speichert eine neue oder geänderte Seite und trägt sie in den Änderungs-Feed ein.
+
+        Returns:
+            "added" oder "changed"
+        """
+        now = time.time()
+        with self._connect() as conn:
+            exists = conn.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, title, body, links, "
+                "fetched_at, changed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, title, zlib.compress(html.encode("utf-8")),
+                 json.dumps(links), now, now)
+            )
+            kind = "changed" if exists else "added"
+            conn.execute(
+                "INSERT INTO changes (url, kind, content_hash, detected_at) VALUES (?, ?, ?, ?)",
+                (url, kind, content_hash, now)
+            )
+        return kind
+
+    def touch(self, url, etag=None, last_modified=None):
+        """Vermerkt einen Abruf ohne inhaltliche Änderung (neue Validatoren werden übernommen)."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE pages SET fetched_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url)
+            )
+
+    def remove(self, url):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            conn.execute(
+                "INSERT INTO changes (url, kind, content_hash, detected_at) VALUES (?, 'removed', NULL, ?)",
+                (url, time.time())
+            )
+
+    def changes(self, since_id=0, limit=100):
+        """
+        Änderungs-Feed: Einträge mit einer ID größer als since_id in Reihenfolge ihres Auftretens.
+
+        Returns:
+            Liste von Dicts mit "id", "url", "kind", "content_hash" und "detected_at"
+        """
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM changes WHERE id > ? ORDER BY id LIMIT ?", (since_id, limit)
+            )]
+
+    def record_crawl(self, started_at, stats):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO crawls (started_at, finished_at, stats) VALUES (?, ?, ?)",
+                (started_at, time.time(), json.dumps(stats))
+            )
+
+    def last_crawl(self):
+        """Letzter Crawl-Lauf als Dict ("started_at", "finished_at", "stats") oder None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM crawls ORDER BY id DESC LIMIT 1").fetchone()
+        return dict(row, stats=json.loads(row["stats"])) if row else None
+
+    def stats(self):
+        with self._connect() as conn:
+            pages = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            changes = conn.execute("SELECT COUNT(*), MAX(id) FROM changes").fetchone()
+        return {"pages": pages, "changes": changes[0], "last_change_id": changes[1] or 0}
+
+
+class SiteCrawler:
+    """Aktualisiert einen SiteMirror und den Rechtsindex mit bedingten, parallelen Abrufen."""
+
+    def __init__(self, mirror, index, base_url=SITE_URL, max_workers=CRAWL_WORKERS,
+                 max_pages=MAX_PAGES, http_client=None):
+        """
+        Args:
+            mirror: SiteMirror
+            index: LegalIndex für die Rechtsdokumente (None = nicht indexieren)
+            base_url: Startseite der Website
+            max_workers: Gleichzeitige HTTP-Abrufe
+            max_pages: Obergrenze der abgerufenen Seiten pro Lauf
+            http_client: Optionaler httpx.Client (sonst wird ein eigener erzeugt)
+        """
+        self.mirror = mirror
+        self.index = index
+        self.base_url = base_url.rstrip("/") + "/"
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self._http = http_client
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fetch(self, url):
+        """
+        Ruft eine Seite bedingt ab und aktualisiert Spiegel, Index und Feed.
+
+        Returns:
+            Links der Seite (bei 304 aus dem Spiegel)
+        """
+        known = self.mirror.page(url)
+        headers = {}
+        if known and known["etag"]:
+            headers["If-None-Match"] = known["etag"]
+        if known and known["last_modified"]:
+            headers["If-Modified-Since"] = known["last_modified"]
+        try:
+            response = self._http.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            logging.warning(f"Abruf von {url} fehlgeschlagen: {e}")
+            self._count("errors")
+            return known["links"] if known else []
+
+        if response.status_code == 304 and known:
+            self._count("not_modified")
+            self.mirror.touch(url)
+            return known["links"]
+        if response.status_code in (404, 410):
+            if known:
+                self.mirror.remove(url)
+                if self.index is not None and is_document(url):
+                    self.index.remove_document(url)
+                self._count("removed")
+            return []
+        if response.status_code != 200 or "html" not in response.headers.get("content-type", "html"):
+            logging.warning(f"Abruf von {url}: HTTP {response.status_code}")
+            self._count("errors")
+            return known["links"] if known else []
+
+        self._count("fetched")
+        html = response.text
+        links = [link for link in page_links(html, url) if in_scope(link, self.base_url)]
+        text = html_to_text(html)
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        etag, last_modified = response.headers.get("etag"), response.headers.get("last-modified")
+        if known and known["content_hash"] == content_hash:
+            # Nur Markup oder Validatoren haben sich geändert
+            self._count("unchanged")
+            self.mirror.touch(url, etag, last_modified)
+            return links
+
+        title = text.splitlines()[0][:200] if text else url
+        kind = self.mirror.store(url, html, content_hash, title, links, etag, last_modified)
+        self._count(kind)
+        if self.index is not None and is_document(url):
+            self.index.index_document(url, text)
+            self._count("indexed")
+        return links
+
+    def run(self):
+        """
+        Führt einen Crawl-Lauf aus: Startseite und alle bekannten Seiten, dann neu entdeckte Links.
+
+        Returns:
+            Dict mit Zählern (fetched, not_modified, unchanged, added, changed, removed,
+            indexed, errors) und "seconds"
+        """
+        started_at, start = time.time(), time.perf_counter()
+        self.stats = Counter()
+        # Bekannte Seiten werden immer geprüft, damit auch nicht mehr verlinkte Löschungen auffallen
+        frontier = deque(dict.fromkeys([self.base_url] + self.mirror.urls()))
+        seen = set(frontier)
+        http = self._http or httpx.Client(timeout=FETCH_TIMEOUT, follow_redirects=True,
+                                          headers={"User-Agent": USER_AGENT})
+        self._http, owns_client = http, self._http is None
+        submitted = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="crawl") as pool:
+                pending = {}
+                while frontier or pending:
+                    while frontier and len(pending) < self.max_workers and submitted < self.max_pages:
+                        url = frontier.popleft()
+                        pending[pool.submit(self._fetch, url)] = url
+                        submitted += 1
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del pending[future]
+                        for link in future.result():
+                            if link not in seen:
+                                seen.add(link)
+                                frontier.append(link)
+        finally:
+            if owns_client:
+                http.close()
+                self._http = None
+
+        stats = dict(self.stats, requests=submitted, seconds=round(time.perf_counter() - start, 3))
+        if frontier:
+            logging.warning(f"Crawl nach {self.max_pages} Seiten beendet, {len(frontier)} Links offen.")
+        self.mirror.record_crawl(started_at, stats)
+        logging.info(f"Crawl von {self.base_url}: {stats}")
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inkrementeller Spiegel von kirchenrecht-ekhn.de")
+    parser.add_argument("--db", default=DEFAULT_MIRROR_PATH, help="Datenbank des Spiegels")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Rechtsindex für die Dokumente")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    crawl_parser = subparsers.add_parser("crawl", help="Spiegel aktualisieren")
+    crawl_parser.add_argument("--site", default=SITE_URL, help="Basis-URL der Website")
+    crawl_parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    crawl_parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    crawl_parser.add_argument("--interval", type=float, default=0,
+                              help="Sekunden zwischen Läufen (0 = einmalig)")
+    feed_parser = subparsers.add_parser("feed", help="Änderungs-Feed ausgeben (JSON Lines)")
+    feed_parser.add_argument("--since", type=int, default=0, help="Nur Einträge nach dieser ID")
+    feed_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    mirror = SiteMirror(args.db)
+    if args.command == "feed":
+        for change in mirror.changes(args.since, args.limit):
+            print(json.dumps(change, ensure_ascii=False))
+        return
+
+    crawler = SiteCrawler(mirror, LegalIndex(args.index), args.site, args.workers, args.max_pages)
+    while True:
+        stats = crawler.run()
+        print(f"✅ {stats.get('requests', 0)} Abrufe in {stats['seconds']:.1f}s: "
+              f"{stats.get('not_modified', 0)} unverändert (304), {stats.get('unchanged', 0)} gleicher Inhalt, "
+              f"{stats.get('added', 0)} neu, {stats.get('changed', 0)} geändert, "
+              f"{stats.get('removed', 0)} entfernt, {stats.get('errors', 0)} Fehler")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+telemetry.py - Antwortzeiten und Token-Verbrauch der Kirchenrechts-App
+
+Bisher gab es nur logging.info-Zeilen um die einzelnen Phasen. Dieses Modul
+sammelt strukturierte Messwerte in einer prozessweiten Registry:
+
+- Dauer je Phase: admission (Warteschlange der Ratenbegrenzung), thread_create,
+  message_create, run_create, queue_wait, in_progress, tool_execution,
+  message_retrieval sowie die Gesamtdauer (total)
+- Token-Verbrauch aus run.usage und geschätzte Kosten je Assistant
+- Anzahl Fragen je Assistant und Ergebnis (completed, failed, ...) sowie Cache-Treffer
+- Hedging: gestartete Zweit-Runs, Gewinner und Zusatzkosten der abgebrochenen Runs
+
+Die Werte stehen als Prometheus-Textformat (start_metrics_server, Pfad /metrics)
+und als Zusammenfassung für das Admin-Panel der App (summary) zur Verfügung.
+Der Endpunkt wird von app.py gestartet, wenn KIRCHENRECHT_METRICS_PORT gesetzt ist:
+    KIRCHENRECHT_METRICS_PORT=9464 streamlit run app.py
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Phasen einer Frage in der Reihenfolge ihres Auftretens
+PHASES = [
+    "admission", "thread_create", "message_create", "run_create", "queue_wait", "in_progress", "tool_execution",
+    "message_retrieval",
+]
+
+# Histogramm-Grenzen in Sekunden (Prometheus "le"-Buckets)
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60]
+
+# Anzahl der letzten Messwerte je Assistant und Phase für Perzentile im Admin-Panel
+WINDOW_SIZE = 500
+
+# Listenpreise in USD pro 1 Mio. Tokens (Eingabe, Ausgabe) für die Kostenschätzung
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o3-mini": (1.10, 4.40),
+    "gpt-o3-mini": (1.10, 4.40),  # Schreibweise aus assistant_config.json
+}
+
+# Port des Prometheus-Endpunkts (0 = deaktiviert)
+METRICS_PORT = int(os.getenv("KIRCHENRECHT_METRICS_PORT", "0"))
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Schätzt die Kosten eines Runs in USD (0.0 bei unbekanntem Modell)."""
+    # Längster passender Präfix, damit z.B. "gpt-4-turbo-preview" den Preis von "gpt-4-turbo" erhält
+    matches = [name for name in MODEL_PRICES if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    prices = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def percentile(values, p):
+    """Perzentil mit linearer Interpolation (p zwischen 0 und 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class QuestionTimer:
+    """
+    Misst die Phasen einer einzelnen Frage und meldet sie an die Registry.
+
+    Verwendung:
+        timer = registry.start_question("GPT-4o", "gpt-4o")
+        with timer.phase("run_create"):
+            ...
+        timer.finish(run)
+    """
+
+    def __init__(self, registry, assistant, model):
+        self.registry = registry
+        self.assistant = assistant
+        self.model = model
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.finished = False
+        self.total_seconds = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Addiert eine extern gemessene Phasendauer."""
+        self.phases[name] = self.phases.get(name, 0.0) + max(0.0, seconds)
+
+    def record_all(self, timings):
+        for name, seconds in (timings or {}).items():
+            self.record(name, seconds)
+
+    def finish(self, run=None, status=None):
+        """
+        Schließt die Messung ab.
+
+        Args:
+            run: Der beendete Run (liefert Status und run.usage), optional
+            status: Ergebnis, falls kein Run vorliegt (z.B. "error")
+        """
+        if self.finished:
+            return
+        self.finished = True
+        status = status or (run.status if run is not None else "error")
+        usage = getattr(run, "usage", None) if run is not None else None
+        self.total_seconds = time.perf_counter() - self.started
+        self.registry.record_question(
+            self.assistant,
+            self.model,
+            status,
+            self.total_seconds,
+            self.phases,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+
+
+class MetricsRegistry:
+    """Thread-sichere Sammlung aller Messwerte eines Prozesses."""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._window_size = window_size
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (assistant, model, phase) -> [Bucket-Zähler..., Summe, Anzahl]
+            self._histograms = {}
+            self._recent = defaultdict(lambda: deque(maxlen=self._window_size))
+            self._outcomes = defaultdict(lambda: deque(maxlen=self._window_size))
+            self._questions = defaultdict(int)
+            self._tokens = defaultdict(int)
+            self._cost = defaultdict(float)
+            self._cache_hits = defaultdict(int)
+            self._hedges = defaultdict(int)
+            self._hedge_cost = defaultdict(float)
+            self._models = {}
+
+    def start_question(self, assistant, model):
+        return QuestionTimer(self, assistant, model)
+
+    def _observe(self, key, seconds):
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+        self._recent[key].append(seconds)
+
+    def record_question(self, assistant, model, status, total_seconds, phases,
+                        prompt_tokens=0, completion_tokens=0):
+        """Nimmt die Messwerte einer beendeten Frage auf."""
+        with self._lock:
+            self._models[assistant] = model
+            self._questions[(assistant, model, status)] += 1
+            self._outcomes[assistant].append((status == "completed", total_seconds))
+            self._observe((assistant, model, "total"), total_seconds)
+            for phase, seconds in phases.items():
+                self._observe((assistant, model, phase), seconds)
+            self._tokens[(assistant, model, "prompt")] += prompt_tokens
+            self._tokens[(assistant, model, "completion")] += completion_tokens
+            self._cost[(assistant, model)] += estimate_cost(model, prompt_tokens, completion_tokens)
+
+        logging.info(
+            f"Telemetrie: {assistant} ({model}) {status} in {total_seconds:.2f}s | "
+            + ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in phases.items())
+            + f" | Tokens {prompt_tokens}/{completion_tokens}"
+        )
+
+    def record_cache_hit(self, kind):
+        """Zählt einen Cache-Treffer ("exact", "semantic", "legal_index" oder "coalesced")."""
+        with self._lock:
+            self._cache_hits[kind] += 1
+
+    def record_hedge(self, outcome, loser_assistant=None, loser_model=None,
+                     prompt_tokens=0, completion_tokens=0):
+        """
+        Nimmt das Ergebnis eines abgesicherten Aufrufs auf.
+
+        Args:
+            outcome: "primary_won" oder "hedge_won"
+            loser_assistant/loser_model: Assistant des abgebrochenen Runs
+            prompt_tokens/completion_tokens: Dessen Verbrauch (= Zusatzkosten)
+        """
+        cost = estimate_cost(loser_model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self._hedges[outcome] += 1
+            if loser_assistant is not None:
+                self._tokens[(loser_assistant, loser_model, "prompt")] += prompt_tokens
+                self._tokens[(loser_assistant, loser_model, "completion")] += completion_tokens
+                self._cost[(loser_assistant, loser_model)] += cost
+                self._hedge_cost[(loser_assistant, loser_model)] += cost
+        logging.info(f"Hedging: {outcome}, Zusatzkosten {cost:.5f} USD ({prompt_tokens}/{completion_tokens} Tokens)")
+
+    def hedge_stats(self):
+        with self._lock:
+            return {
+                "outcomes": dict(self._hedges),
+                "extra_cost": sum(self._hedge_cost.values()),
+            }
+
+    def recent_outcomes(self, assistant):
+        """Letzte Ergebnisse eines Assistants als Liste von (erfolgreich, Dauer)."""
+        with self._lock:
+            return list(self._outcomes.get(assistant, ()))
+
+    def summary(self):
+        """
+        Verdichtet die Messwerte je Assistant für das Admin-Panel.
+
+        Returns:
+            Liste von Dicts, eine Zeile pro Assistant
+        """
+        with self._lock:
+            rows = []
+            for assistant, model in sorted(self._models.items()):
+                answered = sum(
+                    count for (name, _, status), count in self._questions.items()
+                    if name == assistant
+                )
+                completed = self._questions.get((assistant, model, "completed"), 0)
+                total = list(self._recent.get((assistant, model, "total"), ()))
+                prompt = self._tokens[(assistant, model, "prompt")]
+                completion = self._tokens[(assistant, model, "completion")]
+                cost = self._cost[(assistant, model)]
+                row = {
+                    "Assistant": assistant,
+                    "Modell": model,
+                    "Fragen": answered,
+                    "Fehlerquote": 1 - completed / answered if answered else 0.0,
+                    "p50 (s)": round(percentile(total, 50), 2),
+                    "p95 (s)": round(percentile(total, 95), 2),
+                    "Tokens/Antwort": round((prompt + completion) / completed) if completed else 0,
+                    "USD/gute Antwort": round(cost / completed, 5) if completed else None,
+                }
+                for phase in PHASES:
+                    samples = self._recent.get((assistant, model, phase))
+                    row[f"{phase} (s)"] = round(sum(samples) / len(samples), 2) if samples else None
+                rows.append(row)
+            return rows
+
+    def cache_hits(self):
+        with self._lock:
+            return dict(self._cache_hits)
+
+    def render_prometheus(self):
+        """Liefert alle Messwerte im Prometheus-Textformat."""
+        lines = []
+        with self._lock:
+            lines.append("# HELP kirchenrecht_phase_seconds Dauer der Verarbeitungsphasen einer Frage")
+            lines.append("# TYPE kirchenrecht_phase_seconds histogram")
+            for (assistant, model, phase), histogram in sorted(self._histograms.items()):
+                labels = [("assistant", assistant), ("model", model), ("phase", phase)]
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append(
+                        f"kirchenrecht_phase_seconds_bucket{_format_labels(labels + [('le', bound)])} {count}"
+                    )
+                lines.append(
+                    f"kirchenrecht_phase_seconds_bucket{_format_labels(labels + [('le', '+Inf')])} {histogram[-1]}"
+                )
+                lines.append(f"kirchenrecht_phase_seconds_sum{_format_labels(labels)} {histogram[-2]:.6f}")
+                lines.append(f"kirchenrecht_phase_seconds_count{_format_labels(labels)} {histogram[-1]}")
+
+            lines.append("# HELP kirchenrecht_questions_total Beantwortete Fragen nach Ergebnis")
+            lines.append("# TYPE kirchenrecht_questions_total counter")
+            for (assistant, model, status), count in sorted(self._questions.items()):
+                labels = [("assistant", assistant), ("model", model), ("status", status)]
+                lines.append(f"kirchenrecht_questions_total{_format_labels(labels)} {count}")
+
+            lines.append("# HELP kirchenrecht_tokens_total Verbrauchte Tokens laut run.usage")
+            lines.append("# TYPE kirchenrecht_tokens_total counter")
+            for (assistant, model, kind), count in sorted(self._tokens.items()):
+                labels = [("assistant", assistant), ("model", model), ("kind", kind)]
+                lines.append(f"kirchenrecht_tokens_total{_format_labels(labels)} {count}")
+
+            lines.append("# HELP kirchenrecht_cost_usd_total Geschätzte Kosten in USD")
+            lines.append("# TYPE kirchenrecht_cost_usd_total counter")
+            for (assistant, model), cost in sorted(self._cost.items()):
+                labels = [("assistant", assistant), ("model", model)]
+                lines.append(f"kirchenrecht_cost_usd_total{_format_labels(labels)} {cost:.6f}")
+
+            lines.append("# HELP kirchenrecht_hedges_total Abgesicherte Aufrufe mit zweitem Run nach Gewinner")
+            lines.append("# TYPE kirchenrecht_hedges_total counter")
+            for outcome, count in sorted(self._hedges.items()):
+                lines.append(f"kirchenrecht_hedges_total{_format_labels([('outcome', outcome)])} {count}")
+
+            lines.append("# HELP kirchenrecht_hedge_extra_cost_usd_total Kosten abgebrochener Hedging-Runs in USD")
+            lines.append("# TYPE kirchenrecht_hedge_extra_cost_usd_total counter")
+            for (assistant, model), cost in sorted(self._hedge_cost.items()):
+                labels = [("assistant", assistant), ("model", model)]
+                lines.append(f"kirchenrecht_hedge_extra_cost_usd_total{_format_labels(labels)} {cost:.6f}")
+
+            lines.append("# HELP kirchenrecht_cache_hits_total Aus dem Antwort-Cache beantwortete Fragen")
+            lines.append("# TYPE kirchenrecht_cache_hits_total counter")
+            for kind, count in sorted(self._cache_hits.items()):
+                lines.append(f"kirchenrecht_cache_hits_total{_format_labels([('kind', kind)])} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Liefert die Registry unter /metrics im Prometheus-Textformat aus."""
+
+    registry = None
+
+    def log_message(self, format, *args):
+        logging.debug("Metrics-Endpunkt: " + format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_registry = MetricsRegistry()
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_registry():
+    """Liefert die prozessweit geteilte Registry."""
+    return _registry
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """
+    Startet den Prometheus-Endpunkt einmal pro Prozess in einem Hintergrund-Thread.
+
+    Returns:
+        Den laufenden Server oder None, wenn port 0 ist oder der Port belegt ist
+    """
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        handler = type("RegistryMetricsHandler", (MetricsHandler,), {"registry": _registry})
+        try:
+            _server = ThreadingHTTPServer((host, port), handler)
+        except OSError as e:
+            logging.warning(f"Prometheus-Endpunkt auf Port {port} konnte nicht gestartet werden: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logging.info(f"Prometheus-Endpunkt läuft auf http://{host}:{port}/metrics")
+        return _server
+
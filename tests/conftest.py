@@ -0,0 +1,73 @@
+"""
+conftest.py - Gemeinsame Fixtures der Tests
+
+Die Tests laufen ohne Internet und ohne OpenAI-Konto gegen die lokalen
+Stand-in-Server aus benchmarks/ (site_fixture.py für kirchenrecht-ekhn.de,
+mock_server.py für die Assistants-API). Alle Datenbanken liegen in einem
+temporären Verzeichnis; die Pfade werden gesetzt, bevor ein Modul der App
+sie beim Import liest.
+
+Ausführen im Projektverzeichnis:
+    python -m pytest -q
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_data_dir = tempfile.mkdtemp(prefix="kirchenrecht-tests-")
+for name, file_name in [
+    ("KIRCHENRECHT_CACHE_DB", "answer_cache.sqlite3"),
+    ("KIRCHENRECHT_CONVERSATION_DB", "conversations.sqlite3"),
+    ("KIRCHENRECHT_INDEX_DB", "legal_index.sqlite3"),
+    ("KIRCHENRECHT_MIRROR_DB", "site_mirror.sqlite3"),
+    ("KIRCHENRECHT_VECTOR_MANIFEST", "vector_store_manifest.json"),
+    ("KIRCHENRECHT_CITATION_INDEX", "citation_index.json"),
+    ("KIRCHENRECHT_FAQ_STATE", "faq_warmup.json"),
+]:
+    os.environ[name] = os.path.join(_data_dir, file_name)
+# Ratenbegrenzung im Speicher des Testprozesses
+os.environ.pop("KIRCHENRECHT_RATE_LIMIT_DB", None)
+# Prozessweiter Client (resources.get_client): nie die echte API erreichen
+os.environ["OPENAI_API_KEY"] = "mock"
+os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+# Semantischer Cache mit dem lokalen Hashing-Embedding (ohne API)
+os.environ["KIRCHENRECHT_EMBEDDING_MODEL"] = "local"
+
+from benchmarks import mock_server, site_fixture  # noqa: E402
+
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    Fixture-Server für kirchenrecht-ekhn.de auf einer Kopie der Fixture-Seiten.
+
+    Returns:
+        Tuple aus SiteState, Basis-URL und Verzeichnis der (änderbaren) Seiten
+    """
+    root = tmp_path / "site"
+    shutil.copytree(site_fixture.FIXTURE_DIR, root)
+    server, state, url = site_fixture.start_in_background(root=str(root))
+    yield state, url, root
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mock_api():
+    """
+    Mock der Assistants-API mit kurzen Runs.
+
+    Returns:
+        Tuple aus MockState und Basis-URL für den OpenAI-Client
+    """
+    server, state, base_url = mock_server.start_in_background(latency=0.05, seed=1)
+    yield state, base_url
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,119 @@
+"""Tests für die Auflösung von file_search- und Paragraphen-Zitaten (user-023)."""
+
+import pytest
+from openai import OpenAI
+
+from citations import build_index, link_citations, resolve_sources, strip_markers
+from legal_index import LegalIndex
+from qa_service import message_sources
+from run_waiter import RunWaiter
+from vector_store_sync import VectorStoreSync
+
+KGO = """Kirchengemeindeordnung (KGO)
+
+§ 12 Wahlberechtigung
+(1) Wahlberechtigt sind alle Gemeindemitglieder, die am Wahltag das 14. Lebensjahr vollendet haben.
+(2) Das Wahlrecht ruht bei Kirchenaustritt.
+
+§ 13 Amtszeit
+(1) Die Amtszeit des Kirchenvorstandes beträgt sechs Jahre.
+(2) Sie beginnt mit der Einführung.
+"""
+
+CORPUS_URL = "https://intranet.example/korpus"
+
+
+@pytest.fixture
+def synced(mock_api, tmp_path):
+    """Korpus mit der KGO, hochgeladen in den Vector Store des Mocks, und der Zitatindex dazu."""
+    state, base_url = mock_api
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "KGO.txt").write_text(KGO, encoding="utf-8")
+    legal_index = LegalIndex(str(tmp_path / "index.sqlite3"))
+    legal_index.build(str(corpus))
+    client = OpenAI(base_url=base_url, api_key="mock")
+    sync = VectorStoreSync(client, str(corpus), str(tmp_path / "manifest.json"), cache_path=None)
+    sync.sync()
+    index = build_index(legal_index, sync.manifest, corpus_url=CORPUS_URL)
+    return client, index, sync.manifest["files"]["KGO.txt"]["file_id"]
+
+
+def ask(client, question):
+    """Beantwortet eine Frage über den Mock und liefert die Assistant-Nachricht."""
+    thread = client.beta.threads.create(messages=[{"role": "user", "content": question}])
+    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_mock")
+    assert RunWaiter(client).wait(thread.id, run).status == "completed"
+    return client.beta.threads.messages.list(thread_id=thread.id, order="desc", limit=1).data[0]
+
+
+def test_build_index_maps_files_to_laws(synced):
+    _, index, file_id = synced
+    assert index["files"] == {file_id: "kgo"}
+    law = index["laws"]["kgo"]
+    assert (law["law"], law["url"]) == ("KGO", f"{CORPUS_URL}/KGO.txt")
+    assert law["paragraphs"]["13"]["heading"] == "Amtszeit"
+    assert law["paragraphs"]["13"]["absaetze"]["2"] == "(2) Sie beginnt mit der Einführung."
+
+
+def test_file_search_answer_resolves_against_index(synced):
+    client, index, file_id = synced
+    message = ask(client, "Wer darf den Kirchenvorstand wählen?")
+    answer = message.content[0].text.value
+    annotations = message_sources(message)
+    assert [(a["marker"], a["file_id"]) for a in annotations] == [("【4:0†KGO.txt】", file_id)]
+
+    sources = resolve_sources(answer, annotations, index)
+    assert len(sources) == 1
+    source = sources[0]
+    assert (source["label"], source["heading"]) == ("§ 12 Abs. 1 KGO", "Wahlberechtigung")
+    assert source["file_ids"] == [file_id]
+    assert source["excerpt"].startswith("(1) Wahlberechtigt sind alle Gemeindemitglieder")
+    assert source["url"] == f"{CORPUS_URL}/KGO.txt#:~:text=%C2%A7%2012"
+
+    text = strip_markers(answer)
+    assert "【" not in text
+    assert link_citations(text, sources).startswith(f"Nach [§ 12 Abs. 1 KGO]({source['url']}) gilt")
+
+
+def test_citation_without_law_uses_file_citation_in_same_line(synced):
+    _, index, file_id = synced
+    answer = "Die Amtszeit beginnt nach § 13 Abs. 2 mit der Einführung.【4:0†KGO.txt】"
+    annotations = [{"marker": "【4:0†KGO.txt】", "start_index": answer.index("【"), "file_id": file_id}]
+    sources = resolve_sources(answer, annotations, index)
+    assert [(source["label"], source["file_ids"]) for source in sources] == [("§ 13 Abs. 2 KGO", [file_id])]
+    assert sources[0]["excerpt"] == "(2) Sie beginnt mit der Einführung."
+
+
+def test_cited_file_without_paragraph_becomes_law_source(synced):
+    _, index, file_id = synced
+    answer = "Das regelt die Kirchengemeindeordnung.【4:0†KGO.txt】"
+    annotations = [{"marker": "【4:0†KGO.txt】", "start_index": None, "file_id": file_id}]
+    sources = resolve_sources(answer, annotations, index)
+    assert [(source["label"], source["paragraph"], source["url"]) for source in sources] == [
+        ("Kirchengemeindeordnung (KGO)", None, f"{CORPUS_URL}/KGO.txt")]
+
+
+def test_unknown_files_and_index_missing():
+    answer = "Nach § 5 KO gilt das.【4:0†fremd.pdf】"
+    annotations = [{"marker": "【4:0†fremd.pdf】", "start_index": None, "file_id": "file-unbekannt"}]
+    sources = resolve_sources(answer, annotations)
+    assert [(source["label"], source["url"], source["file_ids"]) for source in sources] == [("§ 5 KO", None, [])]
+    assert link_citations(answer, sources) == answer
+
+
+def test_link_citations_keeps_laws_with_same_paragraph_apart():
+    def source(law, absatz):
+        return {"label": f"§ 5 {law}", "law": law, "paragraph": "5", "absatz": absatz,
+                "url": f"{CORPUS_URL}/{law}.txt#:~:text=%C2%A7%205"}
+
+    # Die KDO-Quelle steht zuerst, das erste Zitat nennt aber die KGO
+    sources = [source("KDO", "2"), source("KGO", None)]
+    answer = "Nach § 5 KGO entscheidet der Kirchenvorstand, nach § 5 Abs. 2 KDO die Dekanatssynode; § 5 gilt."
+    assert link_citations(answer, sources) == (
+        f"Nach [§ 5 KGO]({CORPUS_URL}/KGO.txt#:~:text=%C2%A7%205) entscheidet der Kirchenvorstand, "
+        f"nach [§ 5 Abs. 2 KDO]({CORPUS_URL}/KDO.txt#:~:text=%C2%A7%205) die Dekanatssynode; "
+        f"[§ 5]({CORPUS_URL}/KDO.txt#:~:text=%C2%A7%205) gilt."
+    )
+    # Ein Gesetz ohne Quelle wird nicht mit dem gleichnamigen Paragraphen eines anderen verlinkt
+    assert link_citations("Siehe § 5 ZKO.", sources) == "Siehe § 5 ZKO."
@@ -0,0 +1,137 @@
+"""Tests für das Zusammenlegen gleichzeitiger identischer Fragen (user-018)."""
+
+import json
+import os
+import time
+
+import openai
+import pytest
+
+from answer_cache import cache_key
+from async_engine import AsyncRequestEngine, RunHandle
+from benchmarks.mock_server import LatencyModel
+from coalescing import FlightFiles, FlightReader, FlightRegistry, FlightWriter
+
+QUESTION = "Wer darf den Kirchenvorstand wählen?"
+HISTORY = [{"role": "user", "content": QUESTION}]
+
+
+def drain(handle):
+    """Ereignisse eines beendeten Handles (ohne Status-Ereignisse des Mocks)."""
+    return [event for event in handle.events() if event[0] == "delta"]
+
+
+def runs_created(state):
+    return state.snapshot()["calls"].get("POST /threads/{}/runs", 0)
+
+
+@pytest.fixture
+def engines(mock_api, tmp_path):
+    """Erzeugt Engines wie in getrennten Prozessen, die sich ein Verzeichnis für Sperrdateien teilen."""
+    state, base_url = mock_api
+    state.latency_model = LatencyModel(0.3)
+    created = []
+
+    def engine(timeout=60, **client_kwargs):
+        created.append(AsyncRequestEngine(
+            client_kwargs=dict({"base_url": base_url, "api_key": "mock"}, **client_kwargs),
+            flight_files=FlightFiles(str(tmp_path / "flights"), timeout=timeout)
+        ))
+        return created[-1]
+
+    yield state, engine
+    for item in created:
+        item.close()
+
+
+def test_registry_replays_events_to_late_follower_and_lands():
+    registry = FlightRegistry()
+    leader = RunHandle()
+    flight, is_leader = registry.join_or_lead("schluessel", leader)
+    assert is_leader
+    flight.publish("run_created", ("thread_1", "run_1"))
+    flight.publish("delta", "Nach")
+
+    follower = RunHandle()
+    assert registry.join_or_lead("schluessel", follower) == (flight, False)
+    flight.publish("delta", " § 12")
+    assert registry.shared("run_1")
+
+    assert registry.land(flight) == [follower]
+    follower.close()
+    leader.close()
+    # Der Follower erhält den bisherigen Verlauf, aber keine internen Ereignisse des Leaders
+    assert list(follower.events()) == [("delta", "Nach"), ("delta", " § 12")]
+    assert list(leader.events())[0] == ("run_created", ("thread_1", "run_1"))
+    assert (registry.joined, registry.in_flight(), registry.shared("run_1")) == (1, 0, False)
+    # Nach der Landung startet dieselbe Frage einen neuen Run
+    assert registry.join_or_lead("schluessel", RunHandle())[1]
+
+
+def test_identical_questions_share_one_run(engines):
+    state, engine = engines
+    first = engine()
+    leader = first.submit("asst_mock", QUESTION, HISTORY, coalesce=True)
+    follower = first.submit("asst_mock", QUESTION, HISTORY, coalesce=True)
+    leader_result, follower_result = leader.result(timeout=10), follower.result(timeout=10)
+    assert runs_created(state) == 1
+    assert follower_result["answer"] == leader_result["answer"]
+    assert (follower_result["coalesced"], follower_result["thread_id"]) == (True, None)
+    assert drain(follower) == drain(leader)
+    assert first.stats() == {"in_flight": 0, "coalesced": 1}
+
+
+def test_leader_error_reaches_joined_followers(engines):
+    state, engine = engines
+    state.error_rate = 1.0
+    # Mit den Wiederholungen des SDK bleibt der Leader lange genug in der Luft
+    first = engine(max_retries=2)
+    leader = first.submit("asst_mock", QUESTION, HISTORY, coalesce=True)
+    follower = first.submit("asst_mock", QUESTION, HISTORY, coalesce=True)
+    with pytest.raises(openai.InternalServerError):
+        leader.result(timeout=10)
+    with pytest.raises(openai.InternalServerError):
+        follower.result(timeout=10)
+    assert first.stats() == {"in_flight": 0, "coalesced": 1}
+
+
+def test_follower_in_other_process_reads_event_file(engines):
+    state, engine = engines
+    first, second = engine(), engine()
+    leader = first.submit("asst_mock", QUESTION, HISTORY, coalesce=True)
+    follower = second.submit("asst_mock", QUESTION, HISTORY, coalesce=True)
+    assert follower.result(timeout=10)["answer"] == leader.result(timeout=10)["answer"]
+    assert follower.result()["coalesced"]
+    assert runs_created(state) == 1
+    assert not os.path.exists(os.path.join(first.flight_files.directory, f"{cache_key('asst_mock', QUESTION)}.lock"))
+
+
+def write_lock(files, key, started):
+    """Sperre eines abgestürzten Leaders (der Prozess existiert nicht mehr)."""
+    with open(os.path.join(files.directory, f"{key}.lock"), "w", encoding="utf-8") as f:
+        json.dump({"flight": "abgestuerzt", "pid": 999999, "started": started}, f)
+
+
+def test_expired_lock_of_crashed_process_is_taken_over(tmp_path):
+    files = FlightFiles(str(tmp_path / "flights"), timeout=60)
+    write_lock(files, "schluessel", time.time() - 120)
+    writer = files.claim("schluessel")
+    assert isinstance(writer, FlightWriter)
+    with open(writer.lock_path, encoding="utf-8") as f:
+        assert json.load(f)["pid"] == os.getpid()
+    # Solange der neue Leader läuft, lesen weitere Anfragen mit
+    assert isinstance(files.claim("schluessel"), FlightReader)
+    writer.finish(error=RuntimeError("abgebrochen"))
+    assert not os.path.exists(writer.lock_path)
+
+
+def test_fresh_lock_of_crashed_process_falls_back_after_timeout(engines):
+    state, engine = engines
+    first = engine(timeout=0.5)
+    write_lock(first.flight_files, cache_key("asst_mock", QUESTION), time.time())
+    started = time.monotonic()
+    result = first.submit("asst_mock", QUESTION, HISTORY, coalesce=True).result(timeout=10)
+    # Der Follower wartet bis zum Zeitlimit auf den Leader und stellt die Frage dann selbst
+    assert time.monotonic() - started >= 0.5
+    assert result["answer"].startswith("Nach § 12 Abs. 1 KGO")
+    assert runs_created(state) == 1
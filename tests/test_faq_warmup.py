@@ -0,0 +1,82 @@
+"""Tests für das Vorab-Beantworten der FAQ nach einem Abgleich des Vector Stores (user-024)."""
+
+import json
+
+import pytest
+from openai import OpenAI
+
+from answer_cache import AnswerCache
+from faq_warmup import FaqWarmup
+from qa_service import QuestionService
+from semantic_cache import SemanticCache, local_embedder
+from vector_store_sync import VectorStoreSync
+
+FAQ = ["Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?", "Was sind die Aufgaben des Presbyteriums?"]
+
+
+@pytest.fixture
+def warmup(mock_api, tmp_path):
+    """
+    FAQ-Job mit zwei Fragen für einen Assistant; der Korpus ist bereits abgeglichen.
+
+    Returns:
+        Tuple aus FaqWarmup, Funktion für einen weiteren Abgleich und Korpus-Verzeichnis
+    """
+    state, base_url = mock_api
+    client = OpenAI(base_url=base_url, api_key="mock")
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    # Der Mock zitiert in jeder Antwort die zuerst hochgeladene Datei (KGO.txt)
+    (corpus / "KGO.txt").write_text("Kirchengemeindeordnung (KGO)\n\n§ 12 Wahl\n(1) Text.\n", encoding="utf-8")
+    (corpus / "ZKO.txt").write_text("Zweite Kirchenordnung (ZKO)\n\n§ 3 Versammlung\n(1) Text.\n", encoding="utf-8")
+    cache_path = str(tmp_path / "cache.sqlite3")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def sync():
+        return VectorStoreSync(client, str(corpus), manifest_path, workers=1, cache_path=cache_path).sync()
+
+    sync()
+    service = QuestionService(client=client, streaming=False)
+    service.answer_cache = AnswerCache(cache_path)
+    service.semantic_cache = SemanticCache(local_embedder, path=cache_path)
+    faq_path = tmp_path / "faq.json"
+    faq_path.write_text(json.dumps(FAQ), encoding="utf-8")
+    assistant = next(iter(service.assistants()))
+    job = FaqWarmup(service, str(faq_path), str(tmp_path / "faq_warmup.json"), manifest_path,
+                    workers=2, assistant_names=[assistant])
+    assert [item["reason"] for item in job.plan()] == ["fehlt", "fehlt"]
+    stats = job.run()
+    assert (stats["answered"], stats["failed"]) == (2, 0)
+    assert job.plan() == []
+    return job, sync, corpus
+
+
+def test_unrelated_file_keeps_faq_cached(warmup):
+    job, sync, corpus = warmup
+    (corpus / "Amtsblatt.txt").write_text("Amtsblatt 2026\n", encoding="utf-8")
+    result = sync()
+    assert (result["add"], result["invalidated"]) == (1, 0)
+    assert job.plan() == []
+
+
+def test_replaced_source_plans_only_affected_entries(warmup):
+    job, sync, corpus = warmup
+    # Eine weitere FAQ-Antwort, die sich nur auf das andere Gesetz stützt
+    with open(job.manifest_path, encoding="utf-8") as f:
+        zko_file = json.load(f)["files"]["ZKO.txt"]["file_id"]
+    state = job.load_state()
+    assistant_id, entries = next(iter(state["entries"].items()))
+    other = "Wer beruft die Gemeindeversammlung ein?"
+    entries[other] = dict(entries[FAQ[0]], file_ids=[zko_file])
+    job.save_state(state)
+    job.service.answer_cache.put(assistant_id, other, "Der Kirchenvorstand.", file_ids=[zko_file])
+    with open(job.faq_path, "w", encoding="utf-8") as f:
+        json.dump(FAQ + [other], f)
+
+    with open(corpus / "KGO.txt", "a", encoding="utf-8") as f:
+        f.write("(2) Geändert.\n")
+    result = sync()
+    assert (result["replace"], result["invalidated"]) == (1, 2 * 2)  # exakt und semantisch je FAQ
+    plan = job.plan()
+    assert [(item["question"], item["reason"]) for item in plan] == [(question, "Quelle geändert") for question in FAQ]
+    assert job.service.answer_cache.get(assistant_id, other) is not None
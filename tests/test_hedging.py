@@ -0,0 +1,59 @@
+"""Tests für das Hedging langsamer Runs mit einem zweiten Assistant (user-011)."""
+
+import json
+
+import pytest
+from openai import OpenAI
+
+import async_engine
+from answer_cache import AnswerCache
+from async_engine import AsyncRequestEngine
+from benchmarks.mock_server import LatencyModel
+from qa_service import QuestionService
+from semantic_cache import SemanticCache, local_embedder
+
+QUESTION = "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?"
+ASSISTANTS = {
+    "Gründlich": {"id": "asst_gruendlich", "model": "gpt-4o"},
+    "Schnell": {"id": "asst_schnell", "model": "gpt-3.5-turbo"},
+}
+
+
+class QueuedLatency(LatencyModel):
+    """Erster Run (der primäre Assistant) hängt in der Warteschlange, alle weiteren sind schnell."""
+
+    def __init__(self):
+        super().__init__(0.1)
+        self.durations = [3.0]
+
+    def sample(self):
+        return self.durations.pop(0) if self.durations else self.mean
+
+
+@pytest.fixture
+def service(mock_api, tmp_path, monkeypatch):
+    """QuestionService im Streaming-Modus, der nach 0,3 s ohne Token „Schnell“ zusätzlich fragt."""
+    state, base_url = mock_api
+    state.latency_model = QueuedLatency()
+    config_file = tmp_path / "assistant_config.json"
+    config_file.write_text(json.dumps(ASSISTANTS), encoding="utf-8")
+    engine = AsyncRequestEngine(client_kwargs={"base_url": base_url, "api_key": "mock"})
+    monkeypatch.setattr(async_engine, "_engine", engine)
+    service = QuestionService(client=OpenAI(base_url=base_url, api_key="mock"), config_file=str(config_file),
+                              streaming=True, hedge_after=0.3, hedge_assistant="Schnell", coalesce=False)
+    service.answer_cache = AnswerCache(str(tmp_path / "cache.sqlite3"))
+    service.semantic_cache = SemanticCache(local_embedder, path=str(tmp_path / "cache.sqlite3"))
+    yield service
+    engine.close()
+
+
+def test_hedge_winner_owns_thread_and_cache_entry(service):
+    conversation = service.open_conversation()
+    result = service.answer(conversation, QUESTION, assistant_name="Gründlich")
+    assert result["status"] == "completed"
+    assert (result["assistant"], result["model"]) == ("Schnell", "gpt-3.5-turbo")
+    # Der Thread gehört dem Gewinner; eine Folgefrage an ihn baut ihn nicht neu auf
+    assert conversation.thread_assistant_id == "asst_schnell"
+    assert service.answer_cache.get("asst_schnell", QUESTION)["answer"] == result["answer"]
+    assert service.answer_cache.get("asst_gruendlich", QUESTION) is None
+    assert service.semantic_cache.lookup("asst_gruendlich", QUESTION) is None
@@ -0,0 +1,90 @@
+"""Tests für die Hintergrund-Warteschlange der Streamlit-Oberfläche (user-025)."""
+
+import time
+
+import pytest
+from openai import OpenAI
+
+from answer_cache import AnswerCache
+from benchmarks.mock_server import LatencyModel
+from job_queue import JobQueue
+from qa_service import QuestionService
+from semantic_cache import SemanticCache, local_embedder
+
+QUESTIONS = ["Wie lange dauert die Amtszeit des Kirchenvorstandes?", "Wer beruft die Gemeindeversammlung ein?",
+             "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?"]
+
+
+@pytest.fixture
+def service(mock_api, tmp_path):
+    """QuestionService gegen den Mock mit Runs von einer Sekunde und leeren Caches."""
+    state, base_url = mock_api
+    state.latency_model = LatencyModel(1.0)
+    service = QuestionService(client=OpenAI(base_url=base_url, api_key="mock"), streaming=False)
+    service.answer_cache = AnswerCache(str(tmp_path / "cache.sqlite3"))
+    service.semantic_cache = SemanticCache(local_embedder, path=str(tmp_path / "cache.sqlite3"))
+    return state, service
+
+
+def follow(job, timeout=10):
+    """Fragt einen Job ab wie die Oberfläche, bis er beendet ist."""
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, "Job wurde nicht rechtzeitig beendet"
+        job.wait(len(job.events), 0.1)
+
+
+def test_position_counts_earlier_jobs_of_same_conversation(service):
+    _, service = service
+    queue = JobQueue(service)
+    first, second = service.open_conversation(), service.open_conversation()
+    a, b, c = (queue.get(queue.submit(first, question)) for question in QUESTIONS)
+    d = queue.get(queue.submit(second, QUESTIONS[0]))
+    assert [queue.position(job) for job in (a, b, c, d)] == [0, 1, 2, 0]
+    assert (queue.stats()["running"], queue.stats()["waiting"]) == (2, 2)
+
+    follow(a)
+    assert [queue.position(job) for job in (b, c)] == [0, 1]
+    assert queue.cancel(c.id)
+    assert c.status == "cancelled"
+    for job in (b, d):
+        follow(job)
+    assert [job.status for job in (a, b, d)] == ["done"] * 3
+    assert [job.result["question"] for job in (a, b)] == QUESTIONS[:2]
+
+
+def test_reap_cancels_abandoned_running_job(service):
+    state, service = service
+    queue = JobQueue(service, orphan_timeout=0.5)
+    job = queue.get(queue.submit(service.open_conversation(), QUESTIONS[0]))
+    while not job.runs:
+        job.wait(len(job.events), 0.1)
+    queue.reap()
+    assert not job.cancel_requested  # eben noch abgefragt
+
+    # Tab geschlossen: niemand fragt den Job mehr ab
+    queue.reap(now=time.time() + 1)
+    assert job.cancel_requested
+    follow(job)
+    assert job.result["status"] == "cancelled"
+    _, run_id = job.runs[0]
+    assert state.runs[run_id]["status"] == "cancelled"
+    assert queue.stats()["orphaned"] == 1
+
+
+def test_waiting_job_survives_while_earlier_job_is_followed(service):
+    _, service = service
+    queue = JobQueue(service, orphan_timeout=0.5)
+    conversation = service.open_conversation()
+    a, b, c = (queue.get(queue.submit(conversation, question)) for question in QUESTIONS)
+    # Die Oberfläche fragt den laufenden Job ab und zeigt für b die Position an; c wird nicht mehr angezeigt
+    while not a.finished:
+        a.wait(len(a.events), 0.2)
+        queue.position(b)
+        queue.reap()
+    assert a.status == "done"
+    assert not b.cancel_requested
+    assert (c.cancel_requested, c.status) == (True, "cancelled")
+    follow(b)
+    assert b.status == "done"
+    assert queue.stats()["orphaned"] == 1
@@ -0,0 +1,163 @@
+"""Tests für die RPM/TPM-Buckets und die Warteschlange vor den Runs (user-019)."""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from async_engine import AsyncRequestEngine
+from benchmarks.mock_server import LatencyModel
+from rate_limiter import DEFAULT_LIMITS, AdmissionQueue, MemoryBucketStore, SqliteBucketStore
+
+RPM, TPM = DEFAULT_LIMITS
+HISTORY = [{"role": "user", "content": "Wer darf den Kirchenvorstand wählen?"}]
+
+
+def levels(store, model=None):
+    """Füllstände (Anfragen, Tokens) der Buckets eines Modells (voll, solange unbenutzt)."""
+    return tuple(store._buckets.get(f"{model}:{kind}", (capacity, 0.0))[0]
+                 for kind, capacity in [("requests", RPM * 0.9), ("tokens", TPM * 0.9)])
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Bedingung nicht rechtzeitig erfüllt"
+        time.sleep(0.01)
+
+
+def test_request_bucket_refills_at_rpm_rate():
+    now = [0.0]
+    store = MemoryBucketStore(clock=lambda: now[0])
+    demands = [("m:requests", 1, 2, 2 / 60)]
+    assert store.acquire(demands) == 0.0
+    assert store.acquire(demands) == 0.0
+    assert store.acquire(demands) == pytest.approx(30.0)  # eine Anfrage je 30 s
+    now[0] = 15.0
+    assert store.acquire(demands) == pytest.approx(15.0)
+    now[0] = 30.0
+    assert store.acquire(demands) == 0.0
+
+
+def test_token_bucket_refills_at_tpm_rate_and_blocks_both_demands():
+    now = [0.0]
+    store = MemoryBucketStore(clock=lambda: now[0])
+    demands = [("m:requests", 1, 100, 100 / 60), ("m:tokens", 400, 600, 600 / 60)]
+    assert store.acquire(demands) == 0.0
+    # 200 Tokens übrig, 200 fehlen: 20 s bei 10 Tokens/s, nichts wird teilweise entnommen
+    assert store.acquire(demands) == pytest.approx(20.0)
+    assert store._buckets["m:requests"][0] == 99
+    now[0] = 20.0
+    assert store.acquire(demands) == 0.0
+    assert store._buckets["m:tokens"][0] == pytest.approx(0.0)
+
+
+def test_sqlite_store_shares_buckets_between_instances(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    first = SqliteBucketStore(path, clock=lambda: 0.0)
+    second = SqliteBucketStore(path, clock=lambda: 0.0)
+    demands = [("m:requests", 1, 1, 1 / 60)]
+    assert first.acquire(demands) == 0.0
+    assert second.acquire(demands) == pytest.approx(60.0)
+
+
+def test_admission_is_fifo():
+    now = [0.0]
+    admission = AdmissionQueue(MemoryBucketStore(clock=lambda: now[0]), headroom=1.0)
+    admission.admit("m", 10)
+    admission.backoff("m", 0)  # Anfragekontingent leeren
+    admitted, reports = [], {"b": [], "c": []}
+
+    def ask(name):
+        admission.admit("m", 10, on_wait=lambda position, wait: reports[name].append(position))
+        admitted.append(name)
+
+    threads = [threading.Thread(target=ask, args=(name,)) for name in ["b", "c"]]
+    for count, thread in enumerate(threads, 1):
+        thread.start()
+        wait_until(lambda: admission.stats()["m"]["waiting"] == count)
+    # Eine Anfrage wird frei (500 RPM = 8,3/s): nur die vordere kommt dran
+    now[0] = 0.15
+    wait_until(lambda: admitted == ["b"])
+    wait_until(lambda: reports["c"][-1:] == [1])
+    now[0] = 0.3
+    for thread in threads:
+        thread.join(timeout=5)
+    assert admitted == ["b", "c"]
+    assert reports == {"b": [1], "c": [2, 1]}
+    assert admission.stats()["m"]["admitted"] == 3
+
+
+def test_settle_books_actual_usage_or_refunds_estimate():
+    store = MemoryBucketStore(clock=lambda: 0.0)
+    admission = AdmissionQueue(store)
+    ticket = admission.admit(None, 1000)
+    assert levels(store) == (RPM * 0.9 - 1, TPM * 0.9 - 1000)
+    admission.settle(ticket, SimpleNamespace(total_tokens=300))
+    assert levels(store)[1] == TPM * 0.9 - 300
+    admission.settle(admission.admit(None, 1000), None)
+    assert levels(store)[1] == TPM * 0.9 - 300
+
+
+def test_engine_refunds_tokens_on_error_and_cancellation(mock_api):
+    state, base_url = mock_api
+    store = MemoryBucketStore(clock=lambda: 0.0)
+    engine = AsyncRequestEngine(client_kwargs={"base_url": base_url, "api_key": "mock", "max_retries": 0},
+                                admission=AdmissionQueue(store))
+    try:
+        run = engine.submit("asst_mock", "Wer darf wählen?", HISTORY).result(timeout=10)["run"]
+        assert levels(store)[1] == TPM * 0.9 - run.usage.total_tokens
+        before = levels(store)
+
+        state.error_rate = 1.0
+        with pytest.raises(Exception):
+            engine.submit("asst_mock", "Wie lange dauert die Amtszeit?", HISTORY).result(timeout=10)
+        assert levels(store) == (before[0] - 1, before[1])
+
+        state.error_rate = 0.0
+        state.latency_model = LatencyModel(0.5)
+
+        async def cancel_mid_run():
+            task = asyncio.ensure_future(engine.ask("asst_mock", "Wer beruft die Versammlung ein?", HISTORY))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        engine.run_coroutine(cancel_mid_run()).result(timeout=10)
+        assert levels(store) == (before[0] - 2, before[1])
+    finally:
+        engine.close()
+
+
+class SlowStore(MemoryBucketStore):
+    """Bucket-Store, der wie SQLite unter BEGIN IMMEDIATE blockiert."""
+
+    def acquire(self, demands):
+        time.sleep(0.3)
+        return super().acquire(demands)
+
+
+def test_admit_async_keeps_event_loop_running_and_releases_after_cancel():
+    store = SlowStore(clock=lambda: 0.0)
+    admission = AdmissionQueue(store)
+
+    async def scenario():
+        task = asyncio.ensure_future(admission.admit_async(None, 1000))
+        started = time.monotonic()
+        await asyncio.sleep(0.05)
+        # Die Event-Loop läuft weiter, während der Store im Worker-Thread blockiert
+        assert time.monotonic() - started < 0.2
+        assert not task.done()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.5)
+
+    asyncio.run(scenario())
+    # Der Versuch im Thread hat die Anfrage noch zugelassen; das Kontingent ist zurückgebucht
+    assert admission.stats()[None]["admitted"] == 1
+    assert levels(store) == (RPM * 0.9, TPM * 0.9)
+    assert admission.stats()[None]["waiting"] == 0
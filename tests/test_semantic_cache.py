@@ -0,0 +1,71 @@
+"""Tests für den semantischen Antwort-Cache mit dem lokalen Hashing-Embedding (user-004)."""
+
+import time
+
+import pytest
+
+from answer_cache import AnswerCache
+from semantic_cache import SemanticCache, local_embedder
+
+QUESTION = "Welche Voraussetzungen gelten für die Wahl zum Kirchenvorstand?"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(local_embedder, path=str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+
+def test_paraphrase_hits(cache):
+    cache.add("asst_a", QUESTION, "Mitglieder ab 14 Jahren.")
+    hit = cache.lookup("asst_a", "Wahl zum Kirchenvorstand Voraussetzungen")
+    assert (hit["question"], hit["answer"]) == (QUESTION, "Mitglieder ab 14 Jahren.")
+    assert hit["similarity"] >= cache.threshold
+    # Einträge gelten nur für den Assistant, der geantwortet hat
+    assert cache.lookup("asst_b", QUESTION) is None
+
+
+@pytest.mark.parametrize("question", [
+    "Welche Voraussetzungen gelten nicht für die Wahl zum Kirchenvorstand?",
+    "Welche Voraussetzungen gelten ohne Wahl zum Kirchenvorstand?",
+])
+def test_negated_question_misses(cache, question):
+    cache.add("asst_a", QUESTION, "Mitglieder ab 14 Jahren.")
+    assert cache.lookup("asst_a", question) is None
+    assert cache.metrics()["hits"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    questions = [QUESTION, "Wie lange dauert die Amtszeit des Kirchenvorstandes?",
+                 "Wer beruft die Gemeindeversammlung ein?"]
+    cache.add("asst_a", questions[0], "1")
+    time.sleep(0.01)
+    cache.add("asst_a", questions[1], "2")
+    time.sleep(0.01)
+    assert cache.lookup("asst_a", questions[0])["answer"] == "1"  # zuletzt benutzt
+    time.sleep(0.01)
+    cache.add("asst_a", questions[2], "3")
+    assert cache.metrics()["entries"] == 2
+    assert cache.lookup("asst_a", questions[1]) is None
+    assert [cache.lookup("asst_a", q)["answer"] for q in [questions[0], questions[2]]] == ["1", "3"]
+    # Auch eine neue Instanz auf derselben Datei sieht nur die verbliebenen Einträge
+    reloaded = SemanticCache(local_embedder, path=cache.path, max_entries=2)
+    assert reloaded.metrics()["entries"] == 2
+
+
+def test_generation_bump_wipes_entries(cache):
+    cache.add("asst_a", QUESTION, "Mitglieder ab 14 Jahren.")
+    other = SemanticCache(local_embedder, path=cache.path)
+    assert other.lookup("asst_a", QUESTION) is not None
+    # Der exakte Cache invalidiert beide Caches derselben Datei (z.B. nach einem Abgleich)
+    AnswerCache(cache.path).invalidate()
+    assert cache.lookup("asst_a", QUESTION) is None
+    assert other.lookup("asst_a", QUESTION) is None
+    assert cache.metrics()["entries"] == 0
+
+
+def test_invalidate_files_keeps_answers_with_other_sources(cache):
+    cache.add("asst_a", QUESTION, "Mitglieder ab 14 Jahren.", file_ids=["file-kgo"])
+    cache.add("asst_a", "Wer beruft die Gemeindeversammlung ein?", "Der Kirchenvorstand.", file_ids=["file-zko"])
+    assert AnswerCache(cache.path).invalidate_files(["file-kgo"]) == 1
+    assert cache.lookup("asst_a", QUESTION) is None
+    assert cache.lookup("asst_a", "Wer beruft die Gemeindeversammlung ein?")["answer"] == "Der Kirchenvorstand."
@@ -0,0 +1,90 @@
+"""Tests für den Crawler und Spiegel von kirchenrecht-ekhn.de (user-014)."""
+
+import os
+import time
+
+import pytest
+
+from legal_index import LegalIndex
+from site_mirror import SiteCrawler, SiteMirror, in_scope, is_document
+
+
+@pytest.fixture
+def crawler(site, tmp_path):
+    _, url, _ = site
+    mirror = SiteMirror(str(tmp_path / "mirror.sqlite3"))
+    index = LegalIndex(str(tmp_path / "index.sqlite3"))
+    return SiteCrawler(mirror, index, url, max_workers=2)
+
+
+def touch_later(path):
+    """Verschiebt die mtime, damit der Fixture-Server ein neues Last-Modified meldet."""
+    later = time.time() + 5
+    os.utime(path, (later, later))
+
+
+def test_scope_and_documents():
+    base = "https://www.kirchenrecht-ekhn.de/"
+    assert in_scope("https://www.kirchenrecht-ekhn.de/document/1001", base)
+    assert not in_scope("https://www.ekhn.de/document/1001", base)
+    assert not in_scope("https://www.kirchenrecht-ekhn.de/files/kgo.pdf", base)
+    assert is_document("https://www.kirchenrecht-ekhn.de/document/1001")
+    assert not is_document("https://www.kirchenrecht-ekhn.de/")
+
+
+def test_first_crawl_mirrors_and_indexes_all_documents(site, crawler):
+    state, url, _ = site
+    stats = crawler.run()
+    assert (stats["fetched"], stats["added"], stats["indexed"], stats.get("errors", 0)) == (4, 4, 3, 0)
+    assert sorted(state.requests) == ["/", "/document/1001", "/document/1002", "/document/1003"]
+    assert crawler.mirror.stats()["pages"] == 4
+    assert [change["kind"] for change in crawler.mirror.changes()] == ["added"] * 4
+    assert crawler.index.stats()["documents"] == 3
+    units = crawler.index.search("Gemeindeversammlung einberufen", limit=1)
+    assert units[0]["source"] == f"{url}/document/1001"
+    assert crawler.mirror.last_crawl()["stats"]["added"] == 4
+
+
+def test_second_crawl_only_revalidates(site, crawler):
+    state, _, _ = site
+    crawler.run()
+    stats = crawler.run()
+    assert stats["not_modified"] == 4
+    assert "fetched" not in stats and "indexed" not in stats
+    assert state.not_modified == 4
+    assert crawler.mirror.stats()["changes"] == 4
+
+
+def test_changes_are_detected_and_fed(site, crawler):
+    _, url, root = site
+    crawler.run()
+    since = crawler.mirror.stats()["last_change_id"]
+
+    changed = root / "document" / "1003.html"
+    changed.write_text(changed.read_text(encoding="utf-8").replace("im November", "im Dezember"), encoding="utf-8")
+    touch_later(changed)
+    # Nur das Markup ändert sich, der extrahierte Text nicht
+    markup_only = root / "document" / "1002.html"
+    with open(markup_only, "a", encoding="utf-8") as f:
+        f.write("<!-- Kommentar -->\n")
+    touch_later(markup_only)
+    os.remove(root / "document" / "1001.html")
+
+    stats = crawler.run()
+    assert (stats["fetched"], stats["changed"], stats["unchanged"], stats["removed"], stats["indexed"]) == \
+        (2, 1, 1, 1, 1)
+    assert [(change["kind"], change["url"]) for change in crawler.mirror.changes(since)] == [
+        ("removed", f"{url}/document/1001"),
+        ("changed", f"{url}/document/1003"),
+    ]
+    assert crawler.index.stats()["documents"] == 2
+    assert crawler.index.search("Gemeindeversammlung einberufen") == []
+    assert "im Dezember" in crawler.index.search("Jahressonderzahlung", limit=1)[0]["text"]
+
+
+def test_corpus_build_keeps_mirrored_documents(crawler, tmp_path):
+    crawler.run()
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    crawler.index.build(str(corpus))
+    assert crawler.index.stats()["documents"] == 3
@@ -0,0 +1,104 @@
+"""Tests für das Function-Tool get_kirchenrecht_info und den ToolExecutor (user-013)."""
+
+from openai import OpenAI
+
+from kirchenrecht_site import fetch_live_info
+from legal_index import format_tool_output
+from run_waiter import RunWaiter
+from tool_executor import ToolExecutor, ToolResultCache, cache_key
+
+QUESTION = "Wer beruft die Gemeindeversammlung ein und wie hoch ist das Entgelt?"
+
+
+def test_fetch_live_info_ranks_paragraphs_with_sources(site):
+    state, url, _ = site
+    output = fetch_live_info("Wer beruft die Gemeindeversammlung ein?", base_url=url)
+    assert output.startswith("**§ 20 KGO – Gemeindeversammlung**")
+    assert "mindestens einmal jährlich einberufen" in output
+    assert output.splitlines()[-1] == (
+        f"Quellen: § 20 Abs. 1 KGO ({url}/document/1001); § 20 Abs. 2 KGO ({url}/document/1001)"
+    )
+    assert state.requests["/search"] == 1
+
+
+def test_fetch_live_info_without_hits(site):
+    _, url, _ = site
+    assert fetch_live_info("xyzzy", base_url=url) == "Keine Treffer auf kirchenrecht-ekhn.de für „xyzzy“."
+
+
+def test_format_tool_output_lists_each_source_once():
+    unit = {"law": "KGO", "marker": "§", "paragraph": "12", "absatz": "1", "heading": "Wahl",
+            "text": "(1) Text.", "source": "kgo.pdf"}
+    output = format_tool_output([unit, dict(unit)])
+    assert output == "**§ 12 KGO – Wahl**\n\n(1) Text.\n\n(1) Text.\n\nQuellen: § 12 Abs. 1 KGO (kgo.pdf)"
+
+
+def test_cache_key_normalizes_query():
+    assert cache_key("get_kirchenrecht_info", {"query": "Wahl  zum Kirchenvorstand"}) == \
+        cache_key("get_kirchenrecht_info", {"query": "wahl zum kirchenvorstand "})
+
+
+def test_tool_result_cache_expires_and_evicts():
+    now = [0.0]
+    cache = ToolResultCache(ttl=10, max_entries=2, clock=lambda: now[0])
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None  # am längsten nicht benutzt
+    now[0] = 11
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_resolve_submits_tool_outputs_and_caches_them(site, mock_api):
+    _, url, _ = site
+    state, base_url = mock_api
+    state.tool_call_rate = 1.0
+    client = OpenAI(base_url=base_url, api_key="mock")
+    calls = []
+
+    def get_kirchenrecht_info(query):
+        calls.append(query)
+        return fetch_live_info(query, base_url=url)
+
+    executor = ToolExecutor({"get_kirchenrecht_info": get_kirchenrecht_info})
+    try:
+        for expected_hits in (0, 2):
+            thread = client.beta.threads.create(messages=[{"role": "user", "content": QUESTION}])
+            run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_mock")
+            waiter = RunWaiter(client)
+            run = waiter.wait(thread.id, run)
+            assert run.status == "requires_action"
+            timings = {}
+            run = executor.resolve(client, thread.id, run, waiter, timings=timings)
+            assert run.status == "completed"
+            assert "tool_execution" in timings
+            assert executor.stats() == {"hits": expected_hits, "misses": 2}
+    finally:
+        executor.close()
+    # Eine Ausführung je Teilfrage; der zweite Run wird aus dem Cache bedient
+    assert len(calls) == 2
+    assert state.snapshot()["calls"]["POST /threads/{}/runs/{}/submit_tool_outputs"] == 2
+
+
+def test_unknown_tool_and_failures_are_reported_to_the_assistant(mock_api):
+    state, base_url = mock_api
+    state.tool_call_rate = 1.0
+    client = OpenAI(base_url=base_url, api_key="mock")
+
+    def failing(query):
+        raise RuntimeError("Website nicht erreichbar")
+
+    for functions, expected in [({}, "Unbekanntes Tool: get_kirchenrecht_info"),
+                                ({"get_kirchenrecht_info": failing},
+                                 "Fehler bei der Ausführung von get_kirchenrecht_info: Website nicht erreichbar")]:
+        thread = client.beta.threads.create(messages=[{"role": "user", "content": "Wahl zum Kirchenvorstand?"}])
+        run = RunWaiter(client).wait(thread.id, client.beta.threads.runs.create(
+            thread_id=thread.id, assistant_id="asst_mock"))
+        executor = ToolExecutor(functions)
+        try:
+            outputs = executor.execute(run)
+        finally:
+            executor.close()
+        assert [output["output"] for output in outputs] == [expected] * len(outputs)
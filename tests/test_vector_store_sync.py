@@ -0,0 +1,147 @@
+"""Tests für den inkrementellen Abgleich des Vector Stores gegen den Mock-Server (user-015)."""
+
+import pytest
+from openai import OpenAI
+
+from answer_cache import AnswerCache
+from semantic_cache import SemanticCache, local_embedder
+from vector_store_sync import VectorStoreSync, chunking_strategy, load_manifest, plan_sync, scan_corpus, with_retries
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / "corpus"
+    (directory / "amtsblatt").mkdir(parents=True)
+    for i in range(5):
+        (directory / "amtsblatt" / f"ab{i:03}.txt").write_text(f"Amtsblatt {i}\n§ 1 Test\n(1) Inhalt {i}.\n",
+                                                                encoding="utf-8")
+    (directory / "notizen.docx").write_bytes(b"nicht unterstuetzt")
+    return directory
+
+
+@pytest.fixture
+def client(mock_api):
+    _, base_url = mock_api
+    return OpenAI(base_url=base_url, api_key="mock")
+
+
+def sync(client, corpus, tmp_path, **options):
+    """Führt einen Abgleich aus und liefert Ergebnis und gespeichertes Manifest."""
+    manifest_path = str(tmp_path / "manifest.json")
+    options.setdefault("cache_path", None)
+    result = VectorStoreSync(client, str(corpus), manifest_path, workers=2, **options).sync()
+    return result, load_manifest(manifest_path)
+
+
+def assert_consistent(state, manifest):
+    """Vector Store, Dateispeicher und Manifest beschreiben dieselben Dateien."""
+    store = state.vector_stores[manifest["vector_store_id"]]
+    file_ids = {entry["file_id"] for entry in manifest["files"].values()}
+    assert set(store["files"]) == file_ids == set(state.files)
+
+
+def test_plan_sync_classifies_documents():
+    strategy = chunking_strategy()
+    manifest = {"chunking_strategy": strategy, "files": {
+        "a.txt": {"sha256": "1"}, "b.txt": {"sha256": "2"}, "c.txt": {"sha256": "3"}}}
+    documents = {"a.txt": {"sha256": "1"}, "b.txt": {"sha256": "neu"}, "d.txt": {"sha256": "4"}}
+    assert plan_sync(documents, manifest, strategy) == {
+        "add": ["d.txt"], "replace": ["b.txt"], "delete": ["c.txt"], "rechunk": [], "unchanged": ["a.txt"]}
+    plan = plan_sync(documents, manifest, chunking_strategy(600, 200))
+    assert (plan["rechunk"], plan["unchanged"]) == (["a.txt"], [])
+
+
+def test_scan_corpus_reuses_known_hashes(corpus):
+    documents = scan_corpus(str(corpus))
+    assert sorted(documents) == [f"amtsblatt/ab{i:03}.txt" for i in range(5)]
+    known = {source: dict(document, sha256="aus dem Manifest") for source, document in documents.items()}
+    assert {document["sha256"] for document in scan_corpus(str(corpus), known).values()} == {"aus dem Manifest"}
+
+
+def test_sync_uploads_only_changes(mock_api, client, corpus, tmp_path):
+    state, _ = mock_api
+    result, manifest = sync(client, corpus, tmp_path)
+    assert (result["add"], result["failed"]) == (5, 0)
+    assert_consistent(state, manifest)
+
+    result, _ = sync(client, corpus, tmp_path)
+    assert (result["add"], result["replace"], result["delete"], result["unchanged"]) == (0, 0, 0, 5)
+    assert state.snapshot()["calls"]["POST /files"] == 5
+
+    first_id = manifest["files"]["amtsblatt/ab000.txt"]["file_id"]
+    with open(corpus / "amtsblatt" / "ab001.txt", "a", encoding="utf-8") as f:
+        f.write("(2) Geändert.\n")
+    (corpus / "amtsblatt" / "ab002.txt").unlink()
+    (corpus / "neu.md").write_text("# Neu\n", encoding="utf-8")
+    result, manifest = sync(client, corpus, tmp_path)
+    assert (result["add"], result["replace"], result["delete"], result["unchanged"]) == (1, 1, 1, 3)
+    assert state.snapshot()["calls"]["POST /files"] == 7
+    assert manifest["files"]["amtsblatt/ab000.txt"]["file_id"] == first_id
+    assert "amtsblatt/ab002.txt" not in manifest["files"]
+    assert_consistent(state, manifest)
+
+
+def test_changed_chunking_reattaches_without_upload(mock_api, client, corpus, tmp_path):
+    state, _ = mock_api
+    sync(client, corpus, tmp_path)
+    result, manifest = sync(client, corpus, tmp_path, chunk_size=600, chunk_overlap=200)
+    assert (result["rechunk"], result["add"]) == (5, 0)
+    assert state.snapshot()["calls"]["POST /files"] == 5
+    assert manifest["chunking_strategy"] == chunking_strategy(600, 200)
+    store = state.vector_stores[manifest["vector_store_id"]]
+    assert {file["chunking_strategy"]["static"]["max_chunk_size_tokens"] for file in store["files"].values()} == {600}
+    assert_consistent(state, manifest)
+
+
+def test_dry_run_changes_nothing(mock_api, client, corpus, tmp_path):
+    state, _ = mock_api
+    result = VectorStoreSync(client, str(corpus), str(tmp_path / "manifest.json"), cache_path=None).sync(dry_run=True)
+    assert result["add"] == 5
+    assert state.files == {} and state.vector_stores == {}
+    assert not (tmp_path / "manifest.json").exists()
+
+
+def test_sync_invalidates_only_answers_citing_changed_files(client, corpus, tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite3")
+    cache = AnswerCache(cache_path)
+    semantic = SemanticCache(local_embedder, path=cache_path)
+    _, manifest = sync(client, corpus, tmp_path, cache_path=cache_path)
+    file_ids = {source: entry["file_id"] for source, entry in manifest["files"].items()}
+    cache.put("asst_mock", "Frage zu Amtsblatt 0", "Antwort 0", file_ids=[file_ids["amtsblatt/ab000.txt"]])
+    cache.put("asst_mock", "Frage zu Amtsblatt 1", "Antwort 1", file_ids=[file_ids["amtsblatt/ab001.txt"]])
+    cache.put("asst_mock", "Frage ohne Quellen", "Antwort ohne Quellen")
+    semantic.add("asst_mock", "Frage zu Amtsblatt 0", "Antwort 0", file_ids=[file_ids["amtsblatt/ab000.txt"]])
+
+    # Neue, nirgends zitierte Datei: alle Antworten bleiben erhalten
+    (corpus / "amtsblatt" / "ab900.txt").write_text("Amtsblatt 900\n", encoding="utf-8")
+    result, _ = sync(client, corpus, tmp_path, cache_path=cache_path)
+    assert (result["add"], result["invalidated"]) == (1, 0)
+    assert cache.stats()["entries"] == 3
+    assert semantic.lookup("asst_mock", "Frage zu Amtsblatt 0") is not None
+
+    # Zitierte Datei ersetzt: nur deren Antworten (exakt und semantisch) werden entfernt
+    with open(corpus / "amtsblatt" / "ab000.txt", "a", encoding="utf-8") as f:
+        f.write("(2) Geändert.\n")
+    result, _ = sync(client, corpus, tmp_path, cache_path=cache_path)
+    assert (result["replace"], result["invalidated"]) == (1, 2)
+    assert cache.get("asst_mock", "Frage zu Amtsblatt 0") is None
+    assert semantic.lookup("asst_mock", "Frage zu Amtsblatt 0") is None
+    assert cache.get("asst_mock", "Frage zu Amtsblatt 1") is not None
+    assert cache.get("asst_mock", "Frage ohne Quellen") is not None
+
+    # Zitierte Datei gelöscht
+    (corpus / "amtsblatt" / "ab001.txt").unlink()
+    result, _ = sync(client, corpus, tmp_path, cache_path=cache_path)
+    assert (result["delete"], result["invalidated"]) == (1, 1)
+    assert cache.get("asst_mock", "Frage zu Amtsblatt 1") is None
+    assert cache.get("asst_mock", "Frage ohne Quellen") is not None
+
+
+def test_with_retries_honors_retry_after(mock_api, client):
+    state, _ = mock_api
+    state.rate_limit_rate = 0.5
+    delays = []
+    store = with_retries(lambda: client.with_options(max_retries=0).beta.vector_stores.create(name="Test"),
+                         "Vector Store anlegen", attempts=20, sleep=delays.append)
+    assert store.id in state.vector_stores
+    assert delays and set(delays) == {1.0}
@@ -0,0 +1,203 @@
+"""
+tool_executor.py - Ausführung von Function-Tools für Assistants-Runs
+
+Ruft ein Assistant ein Function-Tool auf (z.B. get_kirchenrecht_info aus
+assistant_setup.py), wechselt der Run in den Status "requires_action" und
+wartet, bis die Tool-Ausgaben eingereicht werden. Ohne Behandlung lief der
+Run bisher bis zu seinem Ablauf (10 Minuten).
+
+Der ToolExecutor
+- führt alle Tool-Aufrufe eines Runs parallel in einem Thread-Pool aus,
+- speichert Ergebnisse pro Tool und normalisierter Anfrage mit Ablaufzeit (TTL),
+- reicht die Ausgaben per submit_tool_outputs ein und wartet weiter.
+
+get_kirchenrecht_info beantwortet Anfragen aus dem lokalen Rechtsindex, der
+auch den Spiegel von kirchenrecht-ekhn.de enthält (site_mirror.py). Nur ohne
+Spiegel wird die Website zur Fragezeit abgefragt (kirchenrecht_site.py).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from kirchenrecht_site import fetch_live_info
+from legal_index import format_tool_output, normalize
+
+# Anzahl paralleler Tool-Ausführungen (prozessweit)
+TOOL_WORKERS = int(os.getenv("KIRCHENRECHT_TOOL_WORKERS", "8"))
+
+# Gültigkeit eines gecachten Tool-Ergebnisses in Sekunden
+TOOL_CACHE_TTL = float(os.getenv("KIRCHENRECHT_TOOL_CACHE_TTL", "3600"))
+TOOL_CACHE_SIZE = 1000
+
+# Tool-Ausgaben werden gekürzt, damit sie den Kontext nicht sprengen
+MAX_OUTPUT_CHARS = 8000
+
+
+def get_kirchenrecht_info(query):
+    """
+    Implementierung des Function-Tools get_kirchenrecht_info.
+
+    Zitate und Suchbegriffe werden zuerst im lokalen Rechtsindex (inkl. Spiegel)
+    gesucht; kirchenrecht-ekhn.de wird nur live abgefragt, wenn es keinen
+    Spiegel gibt.
+    """
+    from resources import get_legal_index, get_site_mirror
+
+    index = get_legal_index()
+    if index is not None:
+        units = index.lookup_citation(query) or index.search(query, limit=3)
+        if units:
+            return format_tool_output(units)
+    mirror = get_site_mirror()
+    crawl = mirror.last_crawl() if mirror is not None else None
+    if crawl is not None:
+        stand = time.strftime("%d.%m.%Y %H:%M", time.localtime(crawl["finished_at"]))
+        return f"Keine Treffer im Spiegel von kirchenrecht-ekhn.de (Stand {stand}) für „{query}“."
+    return fetch_live_info(query)
+
+
+# Registrierte Function-Tools: Name -> Funktion mit den Tool-Argumenten als Keyword-Parametern
+TOOL_FUNCTIONS = {
+    "get_kirchenrecht_info": get_kirchenrecht_info,
+}
+
+
+class ToolResultCache:
+    """Thread-sicherer LRU-Cache für Tool-Ergebnisse mit Ablaufzeit."""
+
+    def __init__(self, ttl=TOOL_CACHE_TTL, max_entries=TOOL_CACHE_SIZE, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def cache_key(name, arguments):
+    """Schlüssel aus Tool-Name und Argumenten; Texte werden normalisiert ("KGO  §12" == "kgo §12")."""
+    normalized = {
+        key: " ".join(normalize(value).split()) if isinstance(value, str) else value
+        for key, value in arguments.items()
+    }
+    return name + ":" + json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+class ToolExecutor:
+    """Führt die Tool-Aufrufe von Runs im Status requires_action aus und reicht die Ausgaben ein."""
+
+    def __init__(self, functions=None, max_workers=TOOL_WORKERS, cache=None):
+        """
+        Args:
+            functions: Dict Tool-Name -> Funktion (Standard: TOOL_FUNCTIONS)
+            max_workers: Größe des Thread-Pools
+            cache: ToolResultCache (Standard: neuer Cache mit TOOL_CACHE_TTL)
+        """
+        self.functions = dict(TOOL_FUNCTIONS if functions is None else functions)
+        self.cache = cache or ToolResultCache()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def _call(self, tool_call):
+        """Führt einen Tool-Aufruf aus; Fehler werden als Ausgabe an den Assistant gemeldet."""
+        name = tool_call.function.name
+        function = self.functions.get(name)
+        if function is None:
+            return {"tool_call_id": tool_call.id, "output": f"Unbekanntes Tool: {name}"}
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            return {"tool_call_id": tool_call.id, "output": f"Ungültige Argumente für {name}: {e}"}
+
+        key = cache_key(name, arguments)
+        output = self.cache.get(key)
+        if output is None:
+            start = time.perf_counter()
+            try:
+                output = str(function(**arguments))[:MAX_OUTPUT_CHARS]
+            except Exception as e:
+                logging.warning(f"Tool {name} fehlgeschlagen: {e}")
+                return {"tool_call_id": tool_call.id, "output": f"Fehler bei der Ausführung von {name}: {e}"}
+            self.cache.put(key, output)
+            logging.info(f"Tool {name} ausgeführt in {time.perf_counter() - start:.2f}s")
+        else:
+            logging.info(f"Tool {name} aus dem Cache beantwortet")
+        return {"tool_call_id": tool_call.id, "output": output}
+
+    def submit(self, run):
+        """
+        Startet alle Tool-Aufrufe eines Runs im Status requires_action parallel.
+
+        Returns:
+            Liste von Futures, die jeweils ein Dict mit "tool_call_id" und "output" liefern
+        """
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        return [self._pool.submit(self._call, tool_call) for tool_call in tool_calls]
+
+    def execute(self, run):
+        """Führt die Tool-Aufrufe eines Runs aus und liefert die Ausgaben (blockierend)."""
+        return [future.result() for future in self.submit(run)]
+
+    def resolve(self, client, thread_id, run, waiter, on_poll=None, timings=None):
+        """
+        Bedient requires_action, bis der Run einen Endstatus erreicht (synchroner Pfad).
+
+        Args:
+            client: OpenAI-Client
+            thread_id: ID des Threads
+            run: Run aus RunWaiter.wait
+            waiter: RunWaiter für das weitere Warten nach dem Einreichen
+            on_poll: Callback für RunWaiter.wait
+            timings: Optionales Dict (z.B. aus RunWaiter.phase_timings), in dem
+                "tool_execution" und die weitere Wartezeit unter "in_progress" summiert werden
+
+        Returns:
+            Den Run nach dem letzten Warten
+        """
+        while run.status == "requires_action":
+            start = time.perf_counter()
+            outputs = self.execute(run)
+            if timings is not None:
+                timings["tool_execution"] = timings.get("tool_execution", 0.0) + time.perf_counter() - start
+            run = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=outputs
+            )
+            run = waiter.wait(thread_id, run, on_poll=on_poll)
+            if timings is not None:
+                timings["in_progress"] = timings.get("in_progress", 0.0) + waiter.stats["elapsed_seconds"]
+        return run
+
+    def stats(self):
+        return {"hits": self.cache.hits, "misses": self.cache.misses}
+
+    def close(self):
+        self._pool.shutdown(wait=False)
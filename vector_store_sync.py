@@ -0,0 +1,380 @@
+"""
+vector_store_sync.py - Abgleich des Vector Stores mit dem lokalen Korpus
+
+Bisher wurde der Vector Store für file_search von Hand angelegt und bei
+Änderungen komplett neu befüllt (app_openai.py erwartet eine eingefügte
+VECTOR_ID). Dieses Werkzeug gleicht den Korpus inkrementell ab:
+
+1. Alle Dokumente werden gehasht (SHA-256; unveränderte Größe und mtime
+   übernehmen den Hash aus dem Manifest, ohne die Datei zu lesen).
+2. Der Vergleich mit dem Manifest (vector_store_manifest.json) ergibt neue,
+   geänderte, entfernte und unveränderte Dateien.
+3. Nur neue und geänderte Dateien werden parallel hochgeladen und in einem
+   File-Batch angehängt; ersetzte und entfernte Dateien werden danach aus
+   dem Vector Store und dem Dateispeicher gelöscht.
+4. Aus den Antwort-Caches (exakt und semantisch) werden nur die Antworten
+   entfernt, die ersetzte oder entfernte Dateien zitieren; das Neubeantworten
+   der FAQ übernimmt faq_warmup.py.
+
+Jeder API-Aufruf wird bei Rate-Limits, Verbindungs- und Serverfehlern
+begrenzt wiederholt (Retry-After wird beachtet). Die Chunking-Parameter
+werden im Manifest festgehalten; ändern sie sich, werden die vorhandenen
+Dateien ohne erneuten Upload neu angehängt.
+
+Verwendung:
+    python vector_store_sync.py corpus/ --dry-run
+    python vector_store_sync.py corpus/ --attach-assistants
+    python vector_store_sync.py corpus/ --chunk-size 600 --chunk-overlap 200
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import APIConnectionError, APIStatusError, NotFoundError, OpenAI, RateLimitError
+
+from answer_cache import DEFAULT_CACHE_PATH, AnswerCache
+from legal_index import DEFAULT_CORPUS_DIR, SUPPORTED_EXTENSIONS
+from resources import CONFIG_FILE, ensure_env, load_assistants
+from run_waiter import server_requested_delay
+
+# Manifest mit dem hochgeladenen Stand
+DEFAULT_MANIFEST = os.getenv("KIRCHENRECHT_VECTOR_MANIFEST", "vector_store_manifest.json")
+
+# Name eines neu angelegten Vector Stores
+VECTOR_STORE_NAME = "EKHN Kirchenrecht"
+
+# Chunking-Parameter (Standardwerte der OpenAI-API)
+CHUNK_SIZE_TOKENS = 800
+CHUNK_OVERLAP_TOKENS = 400
+
+# Parallele Uploads, Versuche pro API-Aufruf und Dateien pro File-Batch
+UPLOAD_WORKERS = int(os.getenv("KIRCHENRECHT_UPLOAD_WORKERS", "8"))
+MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1.0
+BATCH_SIZE = 500
+
+
+def chunking_strategy(size=CHUNK_SIZE_TOKENS, overlap=CHUNK_OVERLAP_TOKENS):
+    return {"type": "static", "static": {"max_chunk_size_tokens": size, "chunk_overlap_tokens": overlap}}
+
+
+def load_manifest(path=DEFAULT_MANIFEST):
+    """Liefert das Manifest oder ein leeres, wenn noch nie synchronisiert wurde."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"vector_store_id": None, "chunking_strategy": None, "files": {}}
+
+
+def save_manifest(manifest, path=DEFAULT_MANIFEST):
+    """Schreibt das Manifest atomar (temporäre Datei + os.replace)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".manifest-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def scan_corpus(corpus_dir, known_files=None):
+    """
+    Hasht alle unterstützten Dokumente des Korpus.
+
+    Args:
+        corpus_dir: Verzeichnis des Korpus
+        known_files: Dateien aus dem Manifest; bei gleicher Größe und mtime wird deren Hash übernommen
+
+    Returns:
+        Dict relativer Pfad -> {"sha256", "size", "mtime_ns"}
+    """
+    known_files = known_files or {}
+    documents = {}
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            source = os.path.relpath(path, corpus_dir).replace(os.sep, "/")
+            stat = os.stat(path)
+            known = known_files.get(source)
+            if known and known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+                digest = known["sha256"]
+            else:
+                sha = hashlib.sha256()
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        sha.update(block)
+                digest = sha.hexdigest()
+            documents[source] = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return documents
+
+
+def plan_sync(documents, manifest, strategy):
+    """
+    Vergleicht den Korpus mit dem Manifest.
+
+    Returns:
+        Dict mit Listen "add", "replace", "delete", "rechunk" und "unchanged" (relative Pfade)
+    """
+    uploaded = manifest.get("files", {})
+    rechunk_all = manifest.get("chunking_strategy") not in (None, strategy)
+    plan = {"add": [], "replace": [], "delete": [], "rechunk": [], "unchanged": []}
+    for source, document in sorted(documents.items()):
+        entry = uploaded.get(source)
+        if entry is None:
+            plan["add"].append(source)
+        elif entry["sha256"] != document["sha256"]:
+            plan["replace"].append(source)
+        elif rechunk_all:
+            plan["rechunk"].append(source)
+        else:
+            plan["unchanged"].append(source)
+    plan["delete"] = sorted(set(uploaded) - set(documents))
+    return plan
+
+
+def with_retries(call, description, attempts=MAX_ATTEMPTS, sleep=time.sleep):
+    """
+    Führt einen API-Aufruf mit begrenzten Wiederholungen aus.
+
+    Wiederholt werden Rate-Limits, Verbindungsfehler und Serverfehler (5xx),
+    mit exponentiellem Backoff und Jitter bzw. der vom Server gewünschten Pause.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return call()
+        except (RateLimitError, APIConnectionError, APIStatusError) as e:
+            status = getattr(e, "status_code", None)
+            retryable = isinstance(e, (RateLimitError, APIConnectionError)) or (status or 0) >= 500
+            if not retryable or attempt == attempts:
+                raise
+            response = getattr(e, "response", None)
+            delay = server_requested_delay(response.headers if response is not None else None)
+            if delay is None:
+                delay = RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.75, 1.25)
+            logging.warning(f"{description}: {e.__class__.__name__}, Versuch {attempt}/{attempts}, "
+                            f"neuer Versuch in {delay:.1f}s")
+            sleep(delay)
+
+
+class VectorStoreSync:
+    """Gleicht einen Vector Store inkrementell mit einem Korpus-Verzeichnis ab."""
+
+    def __init__(self, client, corpus_dir=DEFAULT_CORPUS_DIR, manifest_path=DEFAULT_MANIFEST,
+                 vector_store_id=None, chunk_size=CHUNK_SIZE_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS,
+                 workers=UPLOAD_WORKERS, cache_path=DEFAULT_CACHE_PATH):
+        # Wiederholungen steuert with_retries, nicht das SDK
+        self.client = client.with_options(max_retries=0)
+        self.corpus_dir = corpus_dir
+        self.manifest_path = manifest_path
+        self.manifest = load_manifest(manifest_path)
+        if vector_store_id and vector_store_id != self.manifest.get("vector_store_id"):
+            # Das Manifest beschreibt einen anderen Vector Store: alles neu hochladen
+            self.manifest = {"vector_store_id": vector_store_id, "chunking_strategy": None, "files": {}}
+        self.vector_store_id = vector_store_id or self.manifest.get("vector_store_id")
+        self.strategy = chunking_strategy(chunk_size, chunk_overlap)
+        self.workers = workers
+        # Antwort-Cache, dessen Antworten auf ersetzte Dateien entfernt werden (None = keiner)
+        self.cache_path = cache_path
+
+    def plan(self):
+        documents = scan_corpus(self.corpus_dir, self.manifest.get("files"))
+        return documents, plan_sync(documents, self.manifest, self.strategy)
+
+    def _ensure_vector_store(self):
+        if self.vector_store_id:
+            try:
+                with_retries(lambda: self.client.beta.vector_stores.retrieve(self.vector_store_id),
+                             "Vector Store abrufen")
+                return self.vector_store_id
+            except NotFoundError:
+                logging.warning(f"Vector Store {self.vector_store_id} existiert nicht mehr - lege neu an.")
+                self.manifest["files"] = {}
+        store = with_retries(lambda: self.client.beta.vector_stores.create(name=VECTOR_STORE_NAME),
+                             "Vector Store anlegen")
+        self.vector_store_id = store.id
+        return store.id
+
+    def _upload(self, source):
+        path = os.path.join(self.corpus_dir, source)
+
+        def call():
+            with open(path, "rb") as f:
+                return self.client.files.create(file=(os.path.basename(source), f), purpose="assistants")
+
+        return with_retries(call, f"Upload {source}").id
+
+    def _attach(self, file_ids):
+        """Hängt Dateien in File-Batches an und liefert die IDs der fehlgeschlagenen."""
+        failed = set()
+        for start in range(0, len(file_ids), BATCH_SIZE):
+            chunk = file_ids[start:start + BATCH_SIZE]
+            batch = with_retries(
+                lambda: self.client.beta.vector_stores.file_batches.create(
+                    self.vector_store_id, file_ids=chunk, chunking_strategy=self.strategy
+                ),
+                "File-Batch anlegen"
+            )
+            # Getrennt wiederholen, damit ein Rate-Limit beim Polling keinen zweiten Batch anlegt
+            batch = with_retries(
+                lambda: self.client.beta.vector_stores.file_batches.poll(
+                    batch.id, vector_store_id=self.vector_store_id
+                ),
+                "File-Batch abwarten"
+            )
+            if batch.file_counts.failed or batch.file_counts.cancelled:
+                for status in ("failed", "cancelled"):
+                    failed.update(
+                        item.id for item in self.client.beta.vector_stores.file_batches.list_files(
+                            batch.id, vector_store_id=self.vector_store_id, filter=status
+                        )
+                    )
+        return failed
+
+    def _detach(self, file_id):
+        """Löst eine Datei aus dem Vector Store (bereits gelöste werden ignoriert)."""
+        try:
+            with_retries(
+                lambda: self.client.beta.vector_stores.files.delete(file_id, vector_store_id=self.vector_store_id),
+                "Datei aus Vector Store lösen"
+            )
+        except NotFoundError:
+            pass
+
+    def _remove(self, file_id):
+        """Löst eine Datei aus dem Vector Store und löscht sie aus dem Dateispeicher."""
+        self._detach(file_id)
+        try:
+            with_retries(lambda: self.client.files.delete(file_id), "Datei löschen")
+        except NotFoundError:
+            pass
+
+    def sync(self, dry_run=False):
+        """
+        Führt den Abgleich aus.
+
+        Returns:
+            Dict mit dem Plan (Anzahl je Aktion), "failed", "invalidated" (entfernte
+            Cache-Einträge) und "seconds"
+        """
+        start = time.perf_counter()
+        documents, plan = self.plan()
+        result = {action: len(sources) for action, sources in plan.items()}
+        result.update(failed=0, invalidated=0, vector_store_id=self.vector_store_id)
+        if dry_run or not (plan["add"] or plan["replace"] or plan["delete"] or plan["rechunk"]):
+            result["seconds"] = round(time.perf_counter() - start, 3)
+            return result
+
+        self._ensure_vector_store()
+        files = self.manifest.setdefault("files", {})
+        to_upload = plan["add"] + plan["replace"]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload") as pool:
+            uploads = dict(zip(to_upload, pool.map(self._try_upload, to_upload)))
+            # Neu anzuhängen: hochgeladene Dateien und (bei geänderten Chunking-Parametern) vorhandene
+            rechunk_ids = {source: files[source]["file_id"] for source in plan["rechunk"]}
+            list(pool.map(self._detach, rechunk_ids.values()))
+            new_ids = {source: file_id for source, file_id in uploads.items() if file_id}
+            failed = self._attach(list(new_ids.values()) + list(rechunk_ids.values()))
+
+            obsolete, outdated = [], []
+            now = time.time()
+            for source, file_id in {**new_ids, **rechunk_ids}.items():
+                if file_id in failed:
+                    # Nicht verarbeitete Datei verwerfen; der nächste Lauf lädt sie erneut hoch
+                    obsolete.append(file_id)
+                    if source in rechunk_ids:
+                        files.pop(source)
+                    continue
+                if source in plan["replace"]:
+                    obsolete.append(files[source]["file_id"])
+                    outdated.append(files[source]["file_id"])
+                files[source] = dict(documents[source], file_id=file_id, synced_at=now)
+            for source in plan["delete"]:
+                outdated.append(files[source]["file_id"])
+                obsolete.append(files.pop(source)["file_id"])
+            list(pool.map(self._remove, obsolete))
+
+        result["failed"] = len([source for source in to_upload if not uploads[source]]) + len(failed)
+        for source in plan["unchanged"]:
+            # Aktualisierte mtime übernehmen, damit der nächste Lauf nicht erneut hasht
+            files[source].update(documents[source])
+        self.manifest.update(
+            vector_store_id=self.vector_store_id,
+            chunking_strategy=self.strategy,
+            synced_at=time.time()
+        )
+        save_manifest(self.manifest, self.manifest_path)
+        if self.cache_path and outdated:
+            # Nur Antworten, die sich auf ersetzte oder entfernte Dateien stützen
+            result["invalidated"] = AnswerCache(self.cache_path).invalidate_files(outdated)
+        result.update(vector_store_id=self.vector_store_id, seconds=round(time.perf_counter() - start, 3))
+        return result
+
+    def _try_upload(self, source):
+        try:
+            return self._upload(source)
+        except Exception as e:
+            logging.error(f"Upload von {source} endgültig fehlgeschlagen: {e}")
+            return None
+
+    def attach_assistants(self, config_path=CONFIG_FILE):
+        """Bindet den Vector Store an alle Assistants aus assistant_config.json."""
+        assistants = load_assistants(config_path)
+        for name, config in assistants.items():
+            with_retries(
+                lambda: self.client.beta.assistants.update(
+                    config["id"],
+                    tool_resources={"file_search": {"vector_store_ids": [self.vector_store_id]}}
+                ),
+                f"Assistant {name} aktualisieren"
+            )
+        return list(assistants)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector Store inkrementell mit dem Korpus abgleichen")
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS_DIR, help="Korpus-Verzeichnis")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="Manifest des hochgeladenen Stands")
+    parser.add_argument("--vector-store", default=None, help="ID eines bestehenden Vector Stores")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE_TOKENS, help="max_chunk_size_tokens")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS, help="chunk_overlap_tokens")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help="Parallele Uploads")
+    parser.add_argument("--dry-run", action="store_true", help="Nur den Plan ausgeben")
+    parser.add_argument("--attach-assistants", action="store_true",
+                        help="Vector Store an alle Assistants aus assistant_config.json binden")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    ensure_env()
+    syncer = VectorStoreSync(
+        OpenAI(), args.corpus, args.manifest, args.vector_store,
+        args.chunk_size, args.chunk_overlap, args.workers
+    )
+    result = syncer.sync(dry_run=args.dry_run)
+    print(f"{'🔎 Plan' if args.dry_run else '✅ Abgleich'} in {result['seconds']:.2f}s: "
+          f"{result['add']} neu, {result['replace']} ersetzt, {result['delete']} gelöscht, "
+          f"{result['rechunk']} neu gechunkt, {result['unchanged']} unverändert, {result['failed']} fehlgeschlagen")
+    if result["vector_store_id"]:
+        print(f"📦 Vector Store: {result['vector_store_id']}")
+    if result["invalidated"]:
+        print(f"🗑️  {result['invalidated']} Cache-Einträge invalidiert.")
+    if args.attach_assistants and not args.dry_run:
+        names = syncer.attach_assistants()
+        print(f"🔗 Angebunden an: {', '.join(names)}")
+    if result["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()